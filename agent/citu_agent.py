@@ -1,4 +1,8 @@
 # agent/citu_agent.py
+import asyncio
+import logging
+import threading
+import time
 from typing import Dict, Any, Literal
 from langgraph.graph import StateGraph, END
 from langchain.agents import AgentExecutor, create_openai_tools_agent
@@ -8,13 +12,23 @@ from core.logging import get_agent_logger
 
 from agent.state import AgentState
 from agent.classifier import QuestionClassifier
+from agent.sql_repair_cache import SqlRepairCache
 from agent.tools import TOOLS, generate_sql, execute_sql, generate_summary, general_chat
-from agent.tools.utils import get_compatible_llm
+from agent.tools import agenerate_sql, aexecute_sql, agenerate_summary, ageneral_chat
+from agent.tools.utils import get_compatible_llm, get_tool_executor, run_in_tool_executor
 from app_config import ENABLE_RESULT_SUMMARY
+from common.columnar_result import ColumnarResult
+from common.tracing import span, start_span, trace_node, traced
 
 class CituLangGraphAgent:
     """Citu LangGraph智能助手主类 - 使用@tool装饰器 + Agent工具调用"""
     
+    # SQL执行错误类型 → HTTP状态码
+    _SQL_ERROR_STATUS_CODES = {
+        "database_busy": 503,
+        "sql_statement_timeout": 504,
+    }
+    
     def __init__(self):
         # 初始化日志
         self.logger = get_agent_logger("CituAgent")
@@ -31,14 +45,29 @@ class CituLangGraphAgent:
         self.classifier = QuestionClassifier()
         self.tools = TOOLS
         self.llm = get_compatible_llm()
+        self.repair_cache = self._init_repair_cache()
         
         # 注意：现在使用直接工具调用模式，不再需要预创建Agent执行器
         self.logger.info("使用直接工具调用模式")
         
-        # 不在构造时创建workflow，改为动态创建以支持路由模式参数
-        # self.workflow = self._create_workflow()
+        # 编译后的workflow按路由模式缓存：图结构与请求无关，构造时预编译，请求直接复用
+        self._workflows: Dict[str, Any] = {}
+        self._workflow_lock = threading.Lock()
+        self._get_workflow(None)
         self.logger.info("LangGraph Agent with Direct Tools初始化完成")
     
+    def _get_workflow(self, routing_mode: str = None):
+        """获取已编译的workflow（按路由模式缓存，首次使用时编译）"""
+        cache_key = routing_mode or "default"
+        workflow = self._workflows.get(cache_key)
+        if workflow is None:
+            with self._workflow_lock:
+                workflow = self._workflows.get(cache_key)
+                if workflow is None:
+                    workflow = self._create_workflow(routing_mode)
+                    self._workflows[cache_key] = workflow
+        return workflow
+    
     def _create_workflow(self, routing_mode: str = None) -> StateGraph:
         """创建统一的工作流，所有路由模式都通过classify_question进行分类"""
         self.logger.info(f"🏗️ [WORKFLOW] 创建统一workflow")
@@ -46,11 +75,16 @@ class CituLangGraphAgent:
         workflow = StateGraph(AgentState)
         
         # 统一的工作流结构 - 所有模式都使用相同的节点和路由
-        workflow.add_node("classify_question", self._classify_question_node)
-        workflow.add_node("agent_chat", self._agent_chat_node) 
-        workflow.add_node("agent_sql_generation", self._agent_sql_generation_node)
-        workflow.add_node("agent_sql_execution", self._agent_sql_execution_node)
-        workflow.add_node("format_response", self._format_response_node)
+        nodes = {
+            "classify_question": self._classify_question_node,
+            "agent_chat": self._agent_chat_node,
+            "agent_sql_generation": self._agent_sql_generation_node,
+            "agent_sql_execution": self._agent_sql_execution_node,
+            "format_response": self._format_response_node,
+        }
+        for node_name, node in nodes.items():
+            # 每个节点记录一个 span（未启用链路追踪时为空操作）
+            workflow.add_node(node_name, trace_node(f"citu.node.{node_name}", node))
         
         # 统一入口点
         workflow.set_entry_point("classify_question")
@@ -83,7 +117,7 @@ class CituLangGraphAgent:
         return workflow.compile()
 
     
-    def _classify_question_node(self, state: AgentState) -> AgentState:
+    async def _classify_question_node(self, state: AgentState) -> AgentState:
         """问题分类节点 - 使用混合分类策略（规则+LLM）"""
         try:
             # 从state中获取路由模式，而不是从配置文件读取
@@ -97,7 +131,10 @@ class CituLangGraphAgent:
                 self.logger.info(f"检测到上下文类型: {context_type}")
             
             # 使用混合分类策略（规则+LLM），传递路由模式
-            classification_result = self.classifier.classify(state["question"], context_type, routing_mode)
+            # 分类可能调用LLM，放到工具线程池中执行，不阻塞事件循环
+            classification_result = await run_in_tool_executor(
+                self.classifier.classify, state["question"], context_type, routing_mode
+            )
             
             # 更新状态
             state["question_type"] = classification_result.question_type
@@ -129,7 +166,7 @@ class CituLangGraphAgent:
             
             # 步骤1：生成SQL
             self.logger.info("步骤1：生成SQL")
-            sql_result = generate_sql.invoke({"question": question, "allow_llm_to_see_data": True})
+            sql_result = await agenerate_sql(question, allow_llm_to_see_data=True)
             
             if not sql_result.get("success"):
                 # SQL生成失败的统一处理
@@ -228,11 +265,11 @@ class CituLangGraphAgent:
                         return state
                     
                     elif error_type == "syntax_error" and can_repair and self._is_auto_repair_enabled():
-                        # 语法错误，尝试修复（仅一次）
-                        self.logger.info(f"尝试修复SQL语法错误(仅一次): {error_message}")
+                        # 语法错误，尝试修复（先查修复缓存，再在时间预算内调用LLM）
+                        self.logger.info(f"尝试修复SQL语法错误: {error_message}")
                         state["sql_repair_attempted"] = True
                         
-                        repair_result = await self._attempt_sql_repair_once(sql, error_message)
+                        repair_result = await self._repair_sql(sql, error_message, question)
                         
                         if repair_result.get("success"):
                             # 修复成功
@@ -242,6 +279,8 @@ class CituLangGraphAgent:
                             state["sql_validation_success"] = True
                             state["sql_repair_success"] = True
                             state["current_step"] = "sql_generation_completed"
+                            if repair_result.get("from_cache"):
+                                state["execution_path"].append("sql_repair_cache_hit")
                             state["execution_path"].append("sql_repair_success")
                             self.logger.info(f"SQL修复成功: {repaired_sql}")
                             return state
@@ -294,7 +333,7 @@ class CituLangGraphAgent:
             state["execution_path"].append("agent_sql_generation_error")
             return state
 
-    def _agent_sql_execution_node(self, state: AgentState) -> AgentState:
+    async def _agent_sql_execution_node(self, state: AgentState) -> AgentState:
         """SQL执行节点 - 负责执行已验证的SQL和生成摘要"""
         try:
             self.logger.info(f"开始执行SQL: {state.get('sql', 'N/A')}")
@@ -312,44 +351,34 @@ class CituLangGraphAgent:
             
             # 步骤1：执行SQL
             self.logger.info("步骤1：执行SQL")
-            execute_result = execute_sql.invoke({"sql": sql})
+            execute_result = await aexecute_sql(sql)
             
             if not execute_result.get("success"):
                 self.logger.error(f"SQL执行失败: {execute_result.get('error')}")
                 state["error"] = execute_result.get("error", "SQL执行失败")
-                state["error_code"] = 500
+                # 数据库繁忙/执行超时使用专门的状态码，便于客户端区分重试策略
+                state["error_code"] = self._SQL_ERROR_STATUS_CODES.get(execute_result.get("error_type"), 500)
                 state["current_step"] = "sql_execution_error"
                 state["execution_path"].append("agent_sql_execution_error")
                 return state
             
             query_result = execute_result.get("data_result")
             state["query_result"] = query_result
+            state["query_profile"] = execute_result.get("query_profile")
             self.logger.info(f"SQL执行成功，返回 {query_result.get('row_count', 0)} 行数据")
             
-            # 步骤2：生成摘要（根据配置和数据情况）
-            if ENABLE_RESULT_SUMMARY and query_result.get('row_count', 0) > 0:
-                self.logger.info("步骤2：生成摘要")
-                
-                # 重要：提取原始问题用于摘要生成，避免历史记录循环嵌套
-                original_question = self._extract_original_question(question)
-                self.logger.debug(f"原始问题: {original_question}")
-                
-                summary_result = generate_summary.invoke({
-                    "question": original_question,  # 使用原始问题而不是enhanced_question
-                    "query_result": query_result,
-                    "sql": sql
-                })
-                
-                if not summary_result.get("success"):
-                    self.logger.warning(f"摘要生成失败: {summary_result.get('message')}")
-                    # 摘要生成失败不是致命错误，使用默认摘要
-                    state["summary"] = f"查询执行完成，共返回 {query_result.get('row_count', 0)} 条记录。"
-                else:
-                    state["summary"] = summary_result.get("summary")
-                    self.logger.info("摘要生成成功")
-            else:
-                self.logger.info(f"跳过摘要生成（ENABLE_RESULT_SUMMARY={ENABLE_RESULT_SUMMARY}，数据行数={query_result.get('row_count', 0)}）")
+            # 步骤2：生成摘要（根据配置、请求的摘要模式和数据情况）
+            summary_mode = state.get("summary_mode") or "inline"
+            if not self._should_generate_summary(query_result, summary_mode):
+                self.logger.info(f"跳过摘要生成（ENABLE_RESULT_SUMMARY={ENABLE_RESULT_SUMMARY}，summary_mode={summary_mode}，数据行数={query_result.get('row_count', 0)}）")
                 # 不生成摘要时，不设置summary字段，让格式化响应节点决定如何处理
+            elif summary_mode == "deferred":
+                # 查询结果先返回，摘要由流式处理在结果发出后并发生成
+                self.logger.info("步骤2：摘要延后生成")
+                state["summary_pending"] = True
+            else:
+                self.logger.info("步骤2：生成摘要")
+                state["summary"] = await self._generate_summary(question, query_result, sql)
             
             state["current_step"] = "sql_execution_completed"
             state["execution_path"].append("agent_sql_execution")
@@ -367,6 +396,31 @@ class CituLangGraphAgent:
             state["execution_path"].append("agent_sql_execution_error")
             return state
 
+    def _should_generate_summary(self, query_result, summary_mode: str) -> bool:
+        """是否需要为查询结果生成摘要"""
+        return (ENABLE_RESULT_SUMMARY and summary_mode != "skip"
+                and bool(query_result) and query_result.get('row_count', 0) > 0)
+
+    async def _generate_summary(self, question: str, query_result, sql: str) -> str:
+        """生成查询结果摘要，失败时返回默认摘要"""
+        # 重要：提取原始问题用于摘要生成，避免历史记录循环嵌套
+        original_question = self._extract_original_question(question)
+        self.logger.debug(f"原始问题: {original_question}")
+        
+        summary_result = await agenerate_summary(
+            question=original_question,  # 使用原始问题而不是enhanced_question
+            query_result=query_result,
+            sql=sql
+        )
+        
+        if not summary_result.get("success"):
+            self.logger.warning(f"摘要生成失败: {summary_result.get('message')}")
+            # 摘要生成失败不是致命错误，使用默认摘要
+            return f"查询执行完成，共返回 {query_result.get('row_count', 0)} 条记录。"
+        
+        self.logger.info("摘要生成成功")
+        return summary_result.get("summary")
+
     def _agent_database_node(self, state: AgentState) -> AgentState:
         """
         数据库Agent节点 - 直接工具调用模式 [已废弃]
@@ -424,13 +478,15 @@ class CituLangGraphAgent:
             if not execute_result.get("success"):
                 self.logger.error(f"SQL执行失败: {execute_result.get('error')}")
                 state["error"] = execute_result.get("error", "SQL执行失败")
-                state["error_code"] = 500
+                # 数据库繁忙/执行超时使用专门的状态码，便于客户端区分重试策略
+                state["error_code"] = self._SQL_ERROR_STATUS_CODES.get(execute_result.get("error_type"), 500)
                 state["current_step"] = "database_error"
                 state["execution_path"].append("agent_database_error")
                 return state
             
             query_result = execute_result.get("data_result")
             state["query_result"] = query_result
+            state["query_profile"] = execute_result.get("query_profile")
             self.logger.info(f"SQL执行成功，返回 {query_result.get('row_count', 0)} 行数据")
             
             # 步骤3：生成摘要（可通过配置控制，仅在有数据时生成）
@@ -474,17 +530,18 @@ class CituLangGraphAgent:
             state["execution_path"].append("agent_database_error")
             return state
     
-    def _agent_chat_node(self, state: AgentState) -> AgentState:
+    async def _agent_chat_node(self, state: AgentState) -> AgentState:
         """聊天Agent节点 - 直接工具调用模式"""
         try:
-            # 🔹 添加State调试日志 - 打印agent_chat接收到的完整State内容
-            import json
-            try:
-                state_debug = dict(state)
-                self.logger.debug(f"agent_chat接收到的State内容: {json.dumps(state_debug, ensure_ascii=False, indent=2)}")
-            except Exception as debug_e:
-                self.logger.debug(f"State序列化失败: {debug_e}")
-                self.logger.debug(f"agent_chat接收到的State内容: {state}")
+            # 🔹 添加State调试日志 - 打印agent_chat接收到的完整State内容（仅DEBUG级别时序列化）
+            if self.logger.isEnabledFor(logging.DEBUG):
+                import json
+                try:
+                    state_debug = dict(state)
+                    self.logger.debug(f"agent_chat接收到的State内容: {json.dumps(state_debug, ensure_ascii=False, indent=2)}")
+                except Exception as debug_e:
+                    self.logger.debug(f"State序列化失败: {debug_e}")
+                    self.logger.debug(f"agent_chat接收到的State内容: {state}")
             
             self.logger.info(f"开始处理聊天: {state['question']}")
             
@@ -501,10 +558,7 @@ class CituLangGraphAgent:
             
             # 直接调用general_chat工具
             self.logger.info("调用general_chat工具")
-            chat_result = general_chat.invoke({
-                "question": question,
-                "context": context
-            })
+            chat_result = await ageneral_chat(question=question, context=context)
             
             if chat_result.get("success"):
                 state["chat_response"] = chat_result.get("response", "")
@@ -529,7 +583,7 @@ class CituLangGraphAgent:
             state["execution_path"].append("agent_chat_error")
             return state
     
-    def _format_response_node(self, state: AgentState) -> AgentState:
+    async def _format_response_node(self, state: AgentState) -> AgentState:
         """格式化最终响应节点"""
         try:
             self.logger.info(f"开始格式化响应，问题类型: {state['question_type']}")
@@ -586,6 +640,7 @@ class CituLangGraphAgent:
                         "type": "DATABASE",
                         "sql": state.get("sql"),
                         "query_result": state.get("query_result"),  # 保持内部字段名不变
+                        "query_profile": state.get("query_profile"),
                         "execution_path": state["execution_path"],
                         "classification_info": {
                             "confidence": state["classification_confidence"],
@@ -602,6 +657,7 @@ class CituLangGraphAgent:
                         "response": state["summary"],  # 新增：将summary的值赋给response
                         "sql": state.get("sql"),
                         "query_result": state.get("query_result"),  # 保持内部字段名不变
+                        "query_profile": state.get("query_profile"),
                         "summary": state["summary"],  # 暂时保留summary字段
                         "execution_path": state["execution_path"],
                         "classification_info": {
@@ -611,7 +667,7 @@ class CituLangGraphAgent:
                         }
                     }
                 elif state.get("query_result"):
-                    # 有数据但没有摘要（摘要被配置禁用）
+                    # 有数据但没有摘要（摘要被配置/请求禁用，或deferred模式下摘要尚未生成）
                     query_result = state.get("query_result")
                     row_count = query_result.get("row_count", 0)
                     
@@ -622,6 +678,8 @@ class CituLangGraphAgent:
                         "type": "DATABASE",
                         "sql": state.get("sql"),
                         "query_result": query_result,  # 保持内部字段名不变
+                        "query_profile": state.get("query_profile"),
+                        "summary_pending": state.get("summary_pending", False),
                         "execution_path": state["execution_path"],
                         "classification_info": {
                             "confidence": state["classification_confidence"],
@@ -655,15 +713,16 @@ class CituLangGraphAgent:
             
             self.logger.info("响应格式化完成")
             
-            # 输出完整的 STATE 内容用于调试
-            import json
-            try:
-                # 创建一个可序列化的 state 副本
-                debug_state = dict(state)
-                self.logger.debug(f"format_response_node 完整 STATE 内容: {json.dumps(debug_state, ensure_ascii=False, indent=2)}")
-            except Exception as debug_e:
-                self.logger.debug(f"STATE 序列化失败，使用简单输出: {debug_e}")
-                self.logger.debug(f"format_response_node STATE 内容: {state}")
+            # 输出完整的 STATE 内容用于调试（查询结果可能很大，仅DEBUG级别时序列化，避免占用事件循环）
+            if self.logger.isEnabledFor(logging.DEBUG):
+                import json
+                try:
+                    # 创建一个可序列化的 state 副本
+                    debug_state = dict(state)
+                    self.logger.debug(f"format_response_node 完整 STATE 内容: {json.dumps(debug_state, ensure_ascii=False, indent=2, default=repr)}")
+                except Exception as debug_e:
+                    self.logger.debug(f"STATE 序列化失败，使用简单输出: {debug_e}")
+                    self.logger.debug(f"format_response_node STATE 内容: {state}")
             
             return state
             
@@ -677,13 +736,14 @@ class CituLangGraphAgent:
             }
             
             # 即使在异常情况下也输出 STATE 内容用于调试
-            import json
-            try:
-                debug_state = dict(state)
-                self.logger.debug(f"format_response_node 异常情况下的完整 STATE 内容: {json.dumps(debug_state, ensure_ascii=False, indent=2)}")
-            except Exception as debug_e:
-                self.logger.debug(f"异常情况下 STATE 序列化失败: {debug_e}")
-                self.logger.debug(f"format_response_node 异常情况下的 STATE 内容: {state}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                import json
+                try:
+                    debug_state = dict(state)
+                    self.logger.debug(f"format_response_node 异常情况下的完整 STATE 内容: {json.dumps(debug_state, ensure_ascii=False, indent=2, default=repr)}")
+                except Exception as debug_e:
+                    self.logger.debug(f"异常情况下 STATE 序列化失败: {debug_e}")
+                    self.logger.debug(f"format_response_node 异常情况下的 STATE 内容: {state}")
             
             return state
     
@@ -726,7 +786,8 @@ class CituLangGraphAgent:
             # 聊天Agent可以处理不确定的情况，并在必要时引导用户提供更多信息
             return "CHAT"
     
-    async def process_question(self, question: str, conversation_id: str = None, context_type: str = None, routing_mode: str = None) -> Dict[str, Any]:
+    async def process_question(self, question: str, conversation_id: str = None, context_type: str = None, routing_mode: str = None,
+                               skip_summary: bool = False) -> Dict[str, Any]:
         """
         统一的问题处理入口
         
@@ -735,6 +796,7 @@ class CituLangGraphAgent:
             conversation_id: 对话ID
             context_type: 上下文类型（保留兼容性参数，当前未使用）
             routing_mode: 路由模式，可选，用于覆盖配置文件设置
+            skip_summary: 是否跳过摘要生成（只需要数据的API客户端）
             
         Returns:
             Dict包含完整的处理结果
@@ -746,23 +808,29 @@ class CituLangGraphAgent:
             if routing_mode:
                 self.logger.info(f"使用指定路由模式: {routing_mode}")
             
-            # 动态创建workflow（基于路由模式）
-            self.logger.info(f"🔄 [PROCESS] 调用动态创建workflow")
-            workflow = self._create_workflow(routing_mode)
-            
-            # 初始化状态
-            initial_state = self._create_initial_state(question, conversation_id, context_type, routing_mode)
-            
-            # 执行工作流
-            final_state = await workflow.ainvoke(
-                initial_state,
-                config={
-                    "configurable": {"conversation_id": conversation_id}
-                } if conversation_id else None
-            )
-            
-            # 提取最终结果
-            result = final_state["final_response"]
+            # 复用已编译的workflow（路由模式通过初始状态传递）
+            workflow = self._get_workflow(routing_mode)
+            
+            with span("citu.process_question", conversation_id=conversation_id,
+                      routing_mode=routing_mode) as root_span:
+                # 初始化状态
+                initial_state = self._create_initial_state(
+                    question, conversation_id, context_type, routing_mode,
+                    summary_mode="skip" if skip_summary else "inline",
+                    trace_parent=root_span.context()
+                )
+                
+                # 执行工作流
+                final_state = await workflow.ainvoke(
+                    initial_state,
+                    config={
+                        "configurable": {"conversation_id": conversation_id}
+                    } if conversation_id else None
+                )
+                
+                # 提取最终结果
+                result = final_state["final_response"]
+                root_span.set_attribute("success", result.get("success", False))
             
             self.logger.info(f"问题处理完成: {result.get('success', False)}")
             
@@ -777,7 +845,8 @@ class CituLangGraphAgent:
                 "execution_path": ["error"]
             }
 
-    async def process_question_stream(self, question: str, user_id: str, conversation_id: str = None, context_type: str = None, routing_mode: str = None):
+    async def process_question_stream(self, question: str, user_id: str, conversation_id: str = None, context_type: str = None, routing_mode: str = None,
+                                      summary_mode: str = "inline"):
         """
         流式处理用户问题 - 复用process_question()的所有逻辑
         
@@ -787,10 +856,16 @@ class CituLangGraphAgent:
             conversation_id: 对话ID，可选，不提供则自动生成
             context_type: 上下文类型（保留兼容性参数，当前未使用）
             routing_mode: 路由模式，可选，用于覆盖配置文件设置
+            summary_mode: 摘要生成方式
+                - "inline": 在SQL执行节点内生成摘要（默认）
+                - "deferred": 查询结果就绪后立即发出 result 事件，摘要并发生成，完成后发出 summary 事件
+                - "skip": 不生成摘要
             
         Yields:
-            Dict: 流式状态更新，包含进度信息或最终结果
+            Dict: 流式状态更新，包含进度信息、查询结果、摘要或最终结果
         """
+        summary_task = None
+        root_span = None
         try:
             self.logger.info(f"🌊 [STREAM] 开始流式处理问题: {question}")
             if context_type:
@@ -802,12 +877,17 @@ class CituLangGraphAgent:
             if not conversation_id:
                 conversation_id = self._generate_conversation_id(user_id)
             
-            # 1. 复用现有的初始化逻辑
-            self.logger.info(f"🌊 [STREAM] 动态创建workflow")
-            workflow = self._create_workflow(routing_mode)
+            # 1. 复用已编译的workflow
+            workflow = self._get_workflow(routing_mode)
+            
+            # 根 span 不设为当前 span（生成器在 yield 之间不保持上下文），通过状态传给各节点
+            root_span = start_span("citu.process_question_stream", {
+                "conversation_id": conversation_id, "user_id": user_id, "routing_mode": routing_mode
+            })
             
             # 2. 创建初始状态（复用现有逻辑）
-            initial_state = self._create_initial_state(question, conversation_id, context_type, routing_mode)
+            initial_state = self._create_initial_state(question, conversation_id, context_type, routing_mode, summary_mode,
+                                                       trace_parent=root_span.context())
             
             # 3. 使用astream流式执行
             self.logger.info(f"🌊 [STREAM] 开始流式执行workflow")
@@ -831,12 +911,44 @@ class CituLangGraphAgent:
                             "state_data": self._extract_relevant_state(node_data),
                             "conversation_id": conversation_id
                         }
+                    
+                    # deferred模式：查询结果就绪后立即发出，同时开始生成摘要
+                    if node_name == "agent_sql_execution" and node_data.get("summary_pending"):
+                        summary_task = asyncio.create_task(self._generate_deferred_summary(
+                            node_data["question"], node_data["query_result"], node_data.get("sql"), root_span
+                        ))
+                        yield {
+                            "type": "result",
+                            "result": {
+                                "type": "DATABASE",
+                                "sql": node_data.get("sql"),
+                                "query_result": node_data.get("query_result"),
+                                "query_profile": node_data.get("query_profile"),
+                                "summary_pending": True
+                            },
+                            "conversation_id": conversation_id
+                        }
             
             # 4. 最终结果处理（复用现有的结果提取逻辑）
             # 注意：由于astream的特性，最后一个chunk包含最终状态
             final_result = node_data.get("final_response", {})
             
+            if summary_task is not None:
+                summary = await summary_task
+                summary_task = None
+                yield {
+                    "type": "summary",
+                    "summary": summary,
+                    "conversation_id": conversation_id
+                }
+                if final_result.get("success"):
+                    # 与摘要同步生成时的响应结构保持一致
+                    final_result["summary"] = summary
+                    final_result["response"] = summary
+                    final_result["summary_pending"] = False
+            
             self.logger.info(f"🌊 [STREAM] 流式处理完成: {final_result.get('success', False)}")
+            root_span.set_attribute("success", final_result.get("success", False))
             yield {
                 "type": "completed",
                 "result": final_result,
@@ -845,13 +957,27 @@ class CituLangGraphAgent:
             
         except Exception as e:
             self.logger.error(f"🌊 [STREAM] Agent流式执行异常: {str(e)}")
+            if root_span is not None:
+                root_span.record_error(e)
             yield {
                 "type": "error", 
                 "error": str(e),
                 "conversation_id": conversation_id
             }
+        finally:
+            # 异常或客户端提前断开时，不再需要的摘要生成
+            if summary_task is not None:
+                summary_task.cancel()
+            if root_span is not None:
+                root_span.end()
+    
+    async def _generate_deferred_summary(self, question: str, query_result, sql: str, root_span) -> str:
+        """deferred模式下在独立任务中生成摘要，span 挂在请求根 span 下"""
+        with span("citu.deferred_summary", parent=root_span):
+            return await self._generate_summary(question, query_result, sql)
     
-    def _create_initial_state(self, question: str, conversation_id: str = None, context_type: str = None, routing_mode: str = None) -> AgentState:
+    def _create_initial_state(self, question: str, conversation_id: str = None, context_type: str = None, routing_mode: str = None,
+                              summary_mode: str = "inline", trace_parent: Dict[str, Any] = None) -> AgentState:
         """创建初始状态 - 支持兼容性参数"""
         # 确定使用的路由模式
         if routing_mode:
@@ -880,7 +1006,10 @@ class CituLangGraphAgent:
             # 数据库查询流程状态
             sql=None,
             query_result=None,
+            query_profile=None,
             summary=None,
+            summary_mode=summary_mode or "inline",
+            summary_pending=False,
             
             # SQL验证和修复相关状态
             sql_generation_success=False,
@@ -905,7 +1034,10 @@ class CituLangGraphAgent:
             execution_path=["start"],
             
             # 路由模式
-            routing_mode=effective_routing_mode
+            routing_mode=effective_routing_mode,
+            
+            # 链路追踪
+            trace_parent=trace_parent
         )
     
     # ==================== SQL验证和修复相关方法 ====================
@@ -922,6 +1054,7 @@ class CituLangGraphAgent:
         return (get_nested_config(self.config, "sql_validation.enable_auto_repair", False) and 
                 get_nested_config(self.config, "sql_validation.enable_syntax_validation", False))
 
+    @traced("citu.validate_sql")
     async def _validate_sql_with_custom_priority(self, sql: str) -> Dict[str, Any]:
         """
         按照自定义优先级验证SQL：先禁止词，再语法
@@ -946,7 +1079,18 @@ class CituLangGraphAgent:
                         "can_repair": False  # 禁止词错误不能修复
                     }
             
-            # 2. 再检查语法（EXPLAIN SQL）
+            # 2. 表/字段引用检查（内存Schema目录，无需访问数据库）
+            if get_nested_config(self.config, "sql_validation.enable_schema_reference_check", True):
+                reference_result = await self._check_schema_references(sql)
+                if not reference_result.get("valid"):
+                    return {
+                        "valid": False,
+                        "error_type": "syntax_error",
+                        "error_message": reference_result.get("error"),
+                        "can_repair": True  # 引用错误按语法错误处理，可以尝试修复
+                    }
+            
+            # 3. 再检查语法（EXPLAIN SQL）
             if get_nested_config(self.config, "sql_validation.enable_syntax_validation", True):
                 syntax_result = await self._validate_sql_syntax(sql)
                 if not syntax_result.get("valid"):
@@ -994,11 +1138,31 @@ class CituLangGraphAgent:
                 "error": f"禁止词检查异常: {str(e)}"
             }
 
+    async def _check_schema_references(self, sql: str) -> Dict[str, Any]:
+        """使用内存Schema目录检查表/字段引用，目录不可用时视为通过"""
+        try:
+            from common.schema_catalog import get_schema_catalog
+            
+            # 首次调用可能需要从数据库加载目录，放到线程中执行
+            catalog = await run_in_tool_executor(get_schema_catalog)
+            if catalog is None:
+                return {"valid": True}
+            
+            check = catalog.check_sql_references(sql)
+            if check["missing_tables"]:
+                return {"valid": False, "error": f"表不存在: {', '.join(check['missing_tables'])}"}
+            if check["missing_columns"]:
+                return {"valid": False, "error": f"字段不存在: {', '.join(check['missing_columns'])}"}
+            return {"valid": True}
+            
+        except Exception as e:
+            self.logger.warning(f"Schema目录检查异常，跳过: {str(e)}")
+            return {"valid": True}
+
     async def _validate_sql_syntax(self, sql: str) -> Dict[str, Any]:
         """语法验证 - 使用EXPLAIN SQL"""
         try:
             from common.vanna_instance import get_vanna_instance
-            import asyncio
             
             vn = get_vanna_instance()
             
@@ -1006,7 +1170,7 @@ class CituLangGraphAgent:
             explain_sql = f"EXPLAIN {sql}"
             
             # 异步执行验证
-            result = await asyncio.to_thread(vn.run_sql, explain_sql)
+            result = await run_in_tool_executor(vn.run_sql, explain_sql)
             
             if result is not None:
                 return {"valid": True}
@@ -1022,16 +1186,100 @@ class CituLangGraphAgent:
                 "error": str(e)
             }
 
-    async def _attempt_sql_repair_once(self, sql: str, error_message: str) -> Dict[str, Any]:
+    def _init_repair_cache(self):
+        """根据 AGENT_CONFIG.sql_validation 初始化SQL修复缓存"""
+        from agent.config import get_nested_config
+        if not get_nested_config(self.config, "sql_validation.enable_repair_cache", True):
+            return None
+        return SqlRepairCache(
+            max_size=get_nested_config(self.config, "sql_validation.repair_cache_max_size", 500),
+            ttl_seconds=get_nested_config(self.config, "sql_validation.repair_cache_ttl_seconds", 86400),
+        )
+
+    @traced("citu.repair_sql")
+    async def _repair_sql(self, sql: str, error_message: str, question: str) -> Dict[str, Any]:
+        """
+        在时间预算内修复SQL：先验证缓存的修复结果，再逐次调用LLM修复
+        
+        Args:
+            sql: 验证失败的SQL
+            error_message: 验证错误信息
+            question: 用户问题（修复成功后写入error_sql训练集时使用）
+            
+        Returns:
+            修复结果字典，缓存命中时 from_cache=True
+        """
+        from agent.config import get_nested_config
+        
+        budget = get_nested_config(self.config, "sql_validation.repair_time_budget", 90)
+        max_attempts = max(1, get_nested_config(self.config, "sql_validation.max_repair_attempts", 1))
+        deadline = time.monotonic() + budget
+        
+        # 1. 修复缓存：同样的错误SQL已修复过，验证通过即可直接使用
+        if self.repair_cache is not None:
+            cached_sql = self.repair_cache.get(sql, error_message)
+            if cached_sql:
+                validation_result = await self._validate_sql_syntax(cached_sql)
+                if validation_result.get("valid"):
+                    self.logger.info("使用缓存的SQL修复结果")
+                    return {"success": True, "repaired_sql": cached_sql, "error": None, "from_cache": True}
+                self.logger.info(f"缓存的SQL修复结果已失效: {validation_result.get('error')}")
+                self.repair_cache.invalidate(sql, error_message)
+        
+        # 2. LLM修复：每次尝试基于上一次的修复结果和新的验证错误，共享时间预算
+        current_sql, current_error = sql, error_message
+        repair_result = {"success": False, "repaired_sql": None, "error": "修复时间预算不足"}
+        for attempt in range(1, max_attempts + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.logger.warning(f"SQL修复时间预算（{budget}秒）已用完，停止修复")
+                break
+            self.logger.info(f"SQL修复尝试 {attempt}/{max_attempts}，剩余预算 {remaining:.1f}秒")
+            repair_result = await self._attempt_sql_repair_once(current_sql, current_error, timeout=remaining)
+            if repair_result.get("success"):
+                break
+            if not repair_result.get("repaired_sql"):
+                # LLM没有给出可继续修复的SQL（超时/空响应/异常）
+                break
+            current_sql = repair_result["repaired_sql"]
+            current_error = repair_result.get("validation_error") or current_error
+        
+        if repair_result.get("success"):
+            if self.repair_cache is not None:
+                self.repair_cache.put(sql, error_message, repair_result["repaired_sql"])
+            self._feedback_error_sql(question, sql)
+        return repair_result
+
+    def _feedback_error_sql(self, question: str, sql: str):
+        """把修复成功的原始错误SQL写入error_sql训练集（后台执行，按配置开启）"""
+        from agent.config import get_nested_config
+        if not get_nested_config(self.config, "sql_validation.feedback_repairs_as_error_sql", False):
+            return
+        
+        original_question = self._extract_original_question(question)
+        
+        def train():
+            try:
+                from common.vanna_instance import get_vanna_instance
+                training_id = get_vanna_instance().train_error_sql(question=original_question, sql=sql)
+                self.logger.info(f"修复前的错误SQL已写入error_sql训练集: {training_id}")
+            except Exception as e:
+                self.logger.warning(f"写入error_sql训练集失败: {str(e)}")
+        
+        # 直接提交到工具线程池，不依赖当前事件循环的生命周期
+        get_tool_executor().submit(train)
+
+    async def _attempt_sql_repair_once(self, sql: str, error_message: str, timeout: float = None) -> Dict[str, Any]:
         """
-        使用LLM尝试修复SQL - 只修复一次
+        使用LLM尝试修复SQL - 单次LLM调用
         
         Args:
             sql: 原始SQL
             error_message: 错误信息
+            timeout: 本次调用的超时（秒），不超过 repair_timeout 配置
             
         Returns:
-            修复结果字典
+            修复结果字典；修复后的SQL仍无效时附带 repaired_sql 和 validation_error，供下一次尝试继续修复
         """
         try:
             from common.vanna_instance import get_vanna_instance
@@ -1058,11 +1306,12 @@ class CituLangGraphAgent:
 请直接输出修复后的SQL语句，不要添加其他说明文字。"""
 
             # 获取超时配置
-            timeout = get_nested_config(self.config, "sql_validation.repair_timeout", 60)
+            repair_timeout = get_nested_config(self.config, "sql_validation.repair_timeout", 60)
+            timeout = min(repair_timeout, timeout) if timeout is not None else repair_timeout
             
             # 异步调用LLM修复
             response = await asyncio.wait_for(
-                asyncio.to_thread(
+                run_in_tool_executor(
                     vn.chat_with_llm,
                     question=repair_prompt,
                     system_prompt="你是一个专业的PostgreSQL SQL专家，专门负责修复SQL语句中的语法错误。"
@@ -1085,7 +1334,8 @@ class CituLangGraphAgent:
                 else:
                     return {
                         "success": False,
-                        "repaired_sql": None,
+                        "repaired_sql": repaired_sql,
+                        "validation_error": validation_result.get('error'),
                         "error": f"修复后的SQL仍然无效: {validation_result.get('error')}"
                     }
             else:
@@ -1099,7 +1349,7 @@ class CituLangGraphAgent:
             return {
                 "success": False,
                 "repaired_sql": None,
-                "error": f"修复超时（{get_nested_config(self.config, 'sql_validation.repair_timeout', 60)}秒）"
+                "error": f"修复超时（{timeout:.0f}秒）"
             }
         except Exception as e:
             return {
@@ -1197,7 +1447,7 @@ class CituLangGraphAgent:
             # 特殊处理查询结果：只返回行数统计
             if "query_result" in node_data and node_data["query_result"]:
                 query_result = node_data["query_result"]
-                if isinstance(query_result, dict):
+                if isinstance(query_result, (dict, ColumnarResult)):
                     extracted["query_summary"] = {
                         "row_count": query_result.get("row_count", 0),
                         "column_count": len(query_result.get("columns", []))
@@ -0,0 +1,132 @@
+# agent/classification_cache.py
+"""
+问题分类结果缓存
+- 精确缓存：按 (路由模式, 规范化后的当前问题) 缓存分类结果，LRU + TTL
+- 近似缓存（可选）：对需要LLM分类的问题按embedding余弦相似度查找近似问题的分类结果
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from core.logging import get_agent_logger
+
+logger = get_agent_logger("ClassificationCache")
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = "?？。.!！~～ "
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：全角转半角、小写、合并空白、去掉结尾标点"""
+    if not question:
+        return ""
+    normalized = unicodedata.normalize("NFKC", question).lower()
+    normalized = _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+    return normalized.rstrip(_TRAILING_PUNCTUATION)
+
+
+class ClassificationCache:
+    """分类结果缓存（线程安全）"""
+
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95, max_embedding_entries: int = 500):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_embedding_entries = max_embedding_entries
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        # 近似缓存：(路由模式, 单位化向量, 过期时间, 分类结果)
+        self._embedding_entries: List[Tuple[str, np.ndarray, float, Any]] = []
+        self._stats = {"hits": 0, "similar_hits": 0, "misses": 0}
+
+    # ==================== 精确缓存 ====================
+
+    def get(self, routing_mode: str, normalized_question: str):
+        if not normalized_question:
+            return None
+        key = (routing_mode, normalized_question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return replace(entry[1])
+
+    def put(self, routing_mode: str, normalized_question: str, result: Any):
+        if not normalized_question:
+            return
+        with self._lock:
+            self._entries[(routing_mode, normalized_question)] = (time.time() + self.ttl_seconds, replace(result))
+            self._entries.move_to_end((routing_mode, normalized_question))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # ==================== 近似缓存 ====================
+
+    @staticmethod
+    def _unit_vector(vector) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        if array.ndim != 1 or norm == 0:
+            return None
+        return array / norm
+
+    def get_similar(self, routing_mode: str, vector) -> Optional[Tuple[Any, float]]:
+        """查找相似度不低于阈值的已分类问题，返回 (分类结果, 相似度)"""
+        query = self._unit_vector(vector)
+        if query is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._embedding_entries = [e for e in self._embedding_entries if e[2] >= now]
+            candidates = [e for e in self._embedding_entries
+                          if e[0] == routing_mode and e[1].shape == query.shape]
+            if not candidates:
+                return None
+            similarities = np.stack([e[1] for e in candidates]) @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity_threshold:
+                return None
+            self._stats["similar_hits"] += 1
+            return replace(candidates[best][3]), similarity
+
+    def put_embedding(self, routing_mode: str, vector, result: Any):
+        unit = self._unit_vector(vector)
+        if unit is None:
+            return
+        with self._lock:
+            self._embedding_entries.append((routing_mode, unit, time.time() + self.ttl_seconds, replace(result)))
+            if len(self._embedding_entries) > self.max_embedding_entries:
+                self._embedding_entries = self._embedding_entries[-self.max_embedding_entries:]
+
+    # ==================== 管理 ====================
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._embedding_entries.clear()
+        logger.info("分类结果缓存已清空")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "embedding_entries": len(self._embedding_entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                **self._stats,
+            }
@@ -1,8 +1,17 @@
 # agent/classifier.py
+import os
 import re
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 from core.logging import get_agent_logger
+from agent.dict_loader import NON_BUSINESS_GROUP, QUERY_INTENT_GROUP, CHAT_GROUP, BUSINESS_GROUP_PREFIX
+from agent.classification_cache import ClassificationCache, normalize_question
+
+# 业务上下文文件（LLM分类提示词的一部分）
+BUSINESS_CONTEXT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools", "db_query_decision_prompt.txt")
+
+# 分类失败/降级的结果不写入缓存
+_UNCACHEABLE_METHODS = {"llm_error", "llm_context_error", "llm_parse_error"}
 
 @dataclass
 class ClassificationResult:
@@ -28,6 +37,55 @@ class QuestionClassifier:
         
         # 加载词典配置（新增逻辑）
         self._load_dict_config()
+        
+        # 业务上下文按文件修改时间缓存
+        self._business_context: Optional[str] = None
+        self._business_context_mtime: Optional[float] = None
+        
+        # 分类结果缓存
+        self._init_classification_cache()
+        
+        # 本地意图模型
+        self._init_intent_model()
+
+    def _init_intent_model(self):
+        """根据 AGENT_CONFIG.intent_model 初始化本地意图模型配置（模型文件按需加载）"""
+        try:
+            from agent.config import get_current_config, get_nested_config
+            config = get_current_config()
+        except ImportError:
+            config = {}
+        
+        self.intent_model_path: Optional[str] = None
+        if get_nested_config(config, "intent_model.enabled", True):
+            model_path = get_nested_config(config, "intent_model.model_path", "agent/models/intent_model.npz")
+            if not os.path.isabs(model_path):
+                model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), model_path)
+            self.intent_model_path = model_path
+        self.intent_model_threshold = get_nested_config(config, "intent_model.confidence_threshold", 0.85)
+
+    def _init_classification_cache(self):
+        """根据 AGENT_CONFIG.classification_cache 初始化分类结果缓存"""
+        try:
+            from agent.config import get_current_config, get_nested_config
+            config = get_current_config()
+        except ImportError:
+            config = {}
+        
+        self.classification_cache: Optional[ClassificationCache] = None
+        self.enable_embedding_lookup = False
+        self._embedding_function = None
+        if not get_nested_config(config, "classification_cache.enabled", True):
+            return
+        
+        self.classification_cache = ClassificationCache(
+            max_size=get_nested_config(config, "classification_cache.max_size", 2000),
+            ttl_seconds=get_nested_config(config, "classification_cache.ttl_seconds", 3600),
+            similarity_threshold=get_nested_config(config, "classification_cache.embedding_similarity_threshold", 0.95),
+            max_embedding_entries=get_nested_config(config, "classification_cache.max_embedding_entries", 500),
+        )
+        self.enable_embedding_lookup = get_nested_config(config, "classification_cache.enable_embedding_lookup", False)
+        self.logger.info(f"分类结果缓存已启用，embedding近似查找: {self.enable_embedding_lookup}")
 
     def _load_dict_config(self):
         """加载分类器词典配置"""
@@ -42,6 +100,10 @@ class QuestionClassifier:
             self.sql_patterns = dict_config.sql_patterns
             self.chat_keywords = dict_config.chat_keywords
             
+            # 加载时预编译的匹配器（关键词自动机 + SQL模式）
+            self.keyword_matcher = dict_config.keyword_matcher
+            self.sql_pattern_matcher = dict_config.sql_pattern_matcher
+            
             # 加载权重配置
             self.weights = dict_config.weights
             
@@ -116,13 +178,29 @@ class QuestionClassifier:
                 reason="配置为直接聊天模式",
                 method="direct_chat"
             )
-        elif QUESTION_ROUTING_MODE == "llm_only":
-            return self._enhanced_llm_classify(question)
+        
+        # 查询分类缓存（按规范化后的当前问题）
+        cache_key = normalize_question(self._extract_current_question_for_rule_classification(question))
+        if self.classification_cache:
+            cached_result = self.classification_cache.get(QUESTION_ROUTING_MODE, cache_key)
+            # 带对话上下文的追问只复用不依赖上下文的结果（缓存的LLM结果可能是在无上下文时得出的）
+            if cached_result and self._has_conversation_context(question) \
+                    and not self._is_context_independent(cached_result):
+                cached_result = None
+            if cached_result:
+                self.logger.info(f"分类缓存命中: {cached_result.question_type} ({cached_result.method})")
+                return cached_result
+        
+        if QUESTION_ROUTING_MODE == "llm_only":
+            result = self._llm_classify_with_cache(question, QUESTION_ROUTING_MODE)
         else:
             # hybrid模式：直接使用混合分类策略（规则+LLM）
-            return self._hybrid_classify(question)
+            result = self._hybrid_classify(question, QUESTION_ROUTING_MODE)
+        
+        self._cache_classification(QUESTION_ROUTING_MODE, cache_key, question, result)
+        return result
 
-    def _hybrid_classify(self, question: str) -> ClassificationResult:
+    def _hybrid_classify(self, question: str, routing_mode: str = "hybrid") -> ClassificationResult:
         """
         混合分类模式：规则预筛选 + 增强LLM分类
         这是原来的 classify 方法逻辑
@@ -134,8 +212,13 @@ class QuestionClassifier:
         if rule_result.confidence >= self.high_confidence_threshold:
             return rule_result
         
+        # 第二步：本地意图模型，置信度达到阈值时不再调用LLM
+        local_result = self._local_intent_classify(question)
+        if local_result:
+            return local_result
+        
         # 否则：使用增强的LLM分类
-        llm_result = self._enhanced_llm_classify(question)
+        llm_result = self._llm_classify_with_cache(question, routing_mode)
         
         # 选择置信度更高的结果
         if llm_result.confidence > rule_result.confidence:
@@ -143,6 +226,96 @@ class QuestionClassifier:
         else:
             return rule_result
     
+    def _local_intent_classify(self, question: str) -> Optional[ClassificationResult]:
+        """本地意图模型分类，置信度不足或模型不可用时返回None（升级到LLM）"""
+        if not self.intent_model_path:
+            return None
+        
+        from agent.intent_model import get_intent_model, DATABASE_LABEL
+        model = get_intent_model(self.intent_model_path)
+        if model is None:
+            return None
+        
+        try:
+            current_question = self._extract_current_question_for_rule_classification(question)
+            label, confidence = model.predict(current_question)
+        except Exception as e:
+            self.logger.warning(f"本地意图模型分类失败，升级到LLM: {str(e)}")
+            return None
+        
+        if confidence < self.intent_model_threshold:
+            self.logger.info(f"本地意图模型置信度不足({label}, {confidence:.3f})，升级到LLM分类")
+            return None
+        # 带对话上下文的追问（如"那上个月呢"）只看当前问题容易误判为聊天，交给LLM结合上下文判断
+        if label != DATABASE_LABEL and self._has_conversation_context(question):
+            return None
+        
+        self.logger.info(f"本地意图模型分类: {label} ({confidence:.3f})")
+        return ClassificationResult(
+            question_type=label,
+            confidence=min(confidence, self.max_confidence),
+            reason=f"本地意图模型判断为{label}，置信度{confidence:.3f}",
+            method="local_intent_model"
+        )
+    
+    @staticmethod
+    def _has_conversation_context(question: str) -> bool:
+        """问题是否携带了对话上下文（enhanced_question格式）"""
+        return isinstance(question, str) and "\n[CURRENT]\n" in question
+    
+    def _is_context_independent(self, result: ClassificationResult) -> bool:
+        """分类结果是否只由当前问题决定（有上下文时也会得到相同结果）"""
+        if result.method.startswith("rule_based"):
+            # 低置信度的规则结果是与LLM结果比较后选出的，LLM结果依赖上下文
+            return result.confidence >= self.high_confidence_threshold
+        # 有上下文时本地意图模型只采纳 DATABASE 结果，其他结果交给LLM
+        return result.method == "local_intent_model" and result.question_type == "DATABASE"
+
+    def _cache_classification(self, routing_mode: str, cache_key: str, question: str, result: ClassificationResult):
+        """写入分类缓存：跳过失败结果，以及依赖对话上下文的LLM分类结果"""
+        if not self.classification_cache or result.method in _UNCACHEABLE_METHODS:
+            return
+        if result.method == "enhanced_llm" and self._has_conversation_context(question):
+            return
+        self.classification_cache.put(routing_mode, cache_key, result)
+    
+    def _llm_classify_with_cache(self, question: str, routing_mode: str) -> ClassificationResult:
+        """LLM分类，启用时先按embedding查找近似问题的分类结果"""
+        vector = None
+        if self.classification_cache and self.enable_embedding_lookup and not self._has_conversation_context(question):
+            vector = self._get_question_embedding(self._extract_current_question_for_rule_classification(question))
+            if vector is not None:
+                similar = self.classification_cache.get_similar(routing_mode, vector)
+                if similar:
+                    result, similarity = similar
+                    self.logger.info(f"分类近似缓存命中(相似度={similarity:.3f}): {result.question_type}")
+                    return result
+        
+        result = self._enhanced_llm_classify(question)
+        if vector is not None and result.method == "enhanced_llm":
+            self.classification_cache.put_embedding(routing_mode, vector, result)
+        return result
+    
+    def _get_question_embedding(self, question: str) -> Optional[List[float]]:
+        """获取问题向量（优先使用Redis embedding缓存），失败时返回None"""
+        if not question:
+            return None
+        try:
+            from common.embedding_cache_manager import get_embedding_cache_manager
+            cache_manager = get_embedding_cache_manager()
+            vector = cache_manager.get_cached_embedding(question) if cache_manager.is_available() else None
+            if vector is None:
+                if self._embedding_function is None:
+                    from core.embedding_function import get_embedding_function
+                    self._embedding_function = get_embedding_function()
+                vector = self._embedding_function.generate_embedding(question)
+                if cache_manager.is_available():
+                    cache_manager.cache_embedding(question, vector)
+            return vector
+        except Exception as e:
+            self.logger.warning(f"获取问题向量失败，跳过近似分类缓存: {str(e)}")
+            return None
+    
     def _extract_current_question_for_rule_classification(self, question: str) -> str:
         """
         从enhanced_question中提取[CURRENT]部分用于规则分类
@@ -187,11 +360,11 @@ class QuestionClassifier:
         current_question = self._extract_current_question_for_rule_classification(question)
         question_lower = current_question.lower()
         
+        # 一次扫描得到所有分组命中的关键词（保持词典顺序）
+        keyword_hits = self.keyword_matcher.match(question_lower)
+        
         # 检查非业务实体词
-        non_business_matched = []
-        for keyword in self.non_business_keywords:
-            if keyword in question_lower:
-                non_business_matched.append(keyword)
+        non_business_matched = keyword_hits.get(NON_BUSINESS_GROUP, [])
         
         # 如果包含非业务实体词，直接分类为CHAT
         if non_business_matched:
@@ -206,44 +379,36 @@ class QuestionClassifier:
         business_score = 0
         business_matched = []
         
-        for category, keywords in self.strong_business_keywords.items():
+        for category in self.strong_business_keywords:
             if category == "系统查询指示词":  # 系统指示词单独处理
                 continue
-            for keyword in keywords:
-                if keyword in question_lower:
-                    business_score += self.weights.get('business_entity', 2)  # 使用YAML配置的权重
-                    business_matched.append(f"{category}:{keyword}")
+            for keyword in keyword_hits.get(BUSINESS_GROUP_PREFIX + category, []):
+                business_score += self.weights.get('business_entity', 2)  # 使用YAML配置的权重
+                business_matched.append(f"{category}:{keyword}")
         
         # 检查系统查询指示词
         system_indicator_score = 0
         system_matched = []
-        for keyword in self.strong_business_keywords.get("系统查询指示词", []):
-            if keyword in question_lower:
-                system_indicator_score += self.weights.get('system_indicator', 1)  # 使用YAML配置的权重
-                system_matched.append(f"系统查询指示词:{keyword}")
+        for keyword in keyword_hits.get(BUSINESS_GROUP_PREFIX + "系统查询指示词", []):
+            system_indicator_score += self.weights.get('system_indicator', 1)  # 使用YAML配置的权重
+            system_matched.append(f"系统查询指示词:{keyword}")
         
         # 检查查询意图词
         intent_score = 0
-        intent_matched = []
-        for keyword in self.query_intent_keywords:
-            if keyword in question_lower:
-                intent_score += self.weights.get('query_intent', 1)  # 使用YAML配置的权重
-                intent_matched.append(keyword)
+        intent_matched = keyword_hits.get(QUERY_INTENT_GROUP, [])
+        for keyword in intent_matched:
+            intent_score += self.weights.get('query_intent', 1)  # 使用YAML配置的权重
         
         # 检查SQL模式
-        sql_patterns_matched = []
-        for pattern in self.sql_patterns:
-            if re.search(pattern, question_lower, re.IGNORECASE):
-                business_score += self.weights.get('sql_pattern', 3)  # 使用YAML配置的权重
-                sql_patterns_matched.append(pattern)
+        sql_patterns_matched = self.sql_pattern_matcher.match(question_lower)
+        for pattern in sql_patterns_matched:
+            business_score += self.weights.get('sql_pattern', 3)  # 使用YAML配置的权重
         
         # 检查聊天关键词
         chat_score = 0
-        chat_matched = []
-        for keyword in self.chat_keywords:
-            if keyword in question_lower:
-                chat_score += self.weights.get('chat_keyword', 1)  # 使用YAML配置的权重
-                chat_matched.append(keyword)
+        chat_matched = keyword_hits.get(CHAT_GROUP, [])
+        for keyword in chat_matched:
+            chat_score += self.weights.get('chat_keyword', 1)  # 使用YAML配置的权重
         
         # 系统指示词组合评分逻辑
         if system_indicator_score > 0 and business_score > 0:
@@ -306,17 +471,27 @@ class QuestionClassifier:
             )
     
     def _load_business_context(self) -> str:
-        """从文件中加载数据库业务范围描述"""
+        """从文件中加载数据库业务范围描述（按文件修改时间缓存，文件变化时重新加载）"""
+        prompt_file = BUSINESS_CONTEXT_FILE
         try:
-            import os
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            prompt_file = os.path.join(current_dir, "tools", "db_query_decision_prompt.txt")
+            mtime = os.path.getmtime(prompt_file)
+            if self._business_context is not None and mtime == self._business_context_mtime:
+                return self._business_context
             
             with open(prompt_file, 'r', encoding='utf-8') as f:
                 content = f.read().strip()
                 
             if not content:
                 raise ValueError("业务上下文文件为空")
+            
+            reloaded = self._business_context is not None
+            self._business_context = content
+            self._business_context_mtime = mtime
+            if reloaded:
+                # 业务范围变化后，之前的LLM分类结果不再可靠
+                self.logger.info("业务上下文文件已更新，重新加载并清空分类缓存")
+                if self.classification_cache:
+                    self.classification_cache.clear()
                 
             return content
             
@@ -335,7 +510,7 @@ class QuestionClassifier:
             from common.vanna_instance import get_vanna_instance
             vn = get_vanna_instance()
             
-            # 动态加载业务上下文（如果失败会抛出异常）
+            # 加载业务上下文（按文件修改时间缓存，失败时抛出异常）
             business_context = self._load_business_context()
             
             # 构建包含业务上下文的分类提示词
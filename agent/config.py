@@ -13,6 +13,43 @@ AGENT_CONFIG = {
     # ==================== 问题分类器配置已迁移到 classifier_dict.yaml ====================
     # 注意：问题分类器的所有配置参数已迁移到 agent/classifier_dict.yaml 文件的 weights 部分
     
+    # ==================== 问题分类缓存配置 ====================
+    "classification_cache": {
+        # 是否启用分类结果缓存：按 (路由模式, 规范化后的当前问题) 缓存分类结果
+        # 带对话上下文的问题，LLM分类结果依赖上下文，不会写入缓存
+        "enabled": True,
+        
+        # 精确缓存最大条目数（LRU淘汰）
+        "max_size": 2000,
+        
+        # 缓存有效期（秒），业务上下文文件变化时缓存会被清空
+        "ttl_seconds": 3600,
+        
+        # 是否启用embedding近似问题查找：仅在需要LLM分类时计算问题向量
+        # 命中时省去一次LLM调用，但每次LLM分类前多一次embedding调用（有Redis embedding缓存时开销较小）
+        "enable_embedding_lookup": False,
+        
+        # 近似问题的余弦相似度阈值，建议不低于0.95，过低可能把不同意图的问题归为一类
+        "embedding_similarity_threshold": 0.95,
+        
+        # 近似缓存最大条目数
+        "max_embedding_entries": 500,
+    },
+    
+    # ==================== 本地意图模型配置 ====================
+    "intent_model": {
+        # 是否启用本地意图模型：hybrid模式下规则分类置信度不足时，先用本地模型判断，
+        # 置信度达到阈值直接采用，否则再调用LLM分类；模型文件不存在时自动跳过
+        "enabled": True,
+        
+        # 模型文件路径（相对项目根目录），由 python -m agent.train_intent_model 生成
+        "model_path": "agent/models/intent_model.npz",
+        
+        # 本地模型置信度阈值：低于阈值时升级到LLM分类
+        # 阈值越高越保守（LLM调用越多），可参考训练报告中的 coverage / accuracy_at_threshold 调整
+        "confidence_threshold": 0.85,
+    },
+    
     # ==================== 数据库Agent配置 ====================
     "database_agent": {
         # Agent最大迭代次数：防止无限循环，每次迭代包含一轮工具调用
@@ -62,6 +99,10 @@ AGENT_CONFIG = {
         # 缺点：占用更多内存，可能存在状态污染风险
         # 生产环境建议启用，内存受限环境可关闭
         "enable_agent_reuse": True,
+        
+        # 工具线程池大小：节点中的阻塞调用（LLM、向量检索、DataFrame处理）在此有界线程池中执行，
+        # 事件循环可以同时处理其他请求；数值过大会增加LLM/数据库的并发压力
+        "tool_executor_max_workers": 16,
     },
     
     # ==================== SQL验证配置 ====================
@@ -74,6 +115,10 @@ AGENT_CONFIG = {
         # 语法验证失败时可以尝试LLM修复
         "enable_syntax_validation": True,
         
+        # 是否启用表/字段引用检查：基于内存Schema目录（common/schema_catalog.py）检查引用是否存在
+        # 不访问数据库，失败时按语法错误处理，可以尝试LLM修复
+        "enable_schema_reference_check": True,
+        
         # 是否启用自动修复：当语法验证失败时，调用LLM尝试修复
         # 仅对语法错误有效，禁止词错误不会尝试修复
         "enable_auto_repair": True,
@@ -86,9 +131,26 @@ AGENT_CONFIG = {
         # 超时后将放弃修复，直接返回失败
         "repair_timeout": 60,
         
-        # 修复重试次数：目前固定为1次，不进行多次重试
-        # 这是设计约束，避免无限修复循环
+        # 修复尝试次数：每次尝试把上一次修复结果的验证错误交给LLM继续修复
+        # 所有尝试共享 repair_time_budget 时间预算，预算用完即停止，避免无限修复循环
         "max_repair_attempts": 1,
+        
+        # 单个请求的修复总时间预算（秒）：包括缓存结果验证、LLM修复和修复后验证
+        # 每次LLM调用的超时取 repair_timeout 与剩余预算中的较小值
+        "repair_time_budget": 90,
+        
+        # 是否启用修复结果缓存：按 (规范化后的失败SQL, 错误类别) 缓存验证通过的修复结果，
+        # 相同错误SQL再次出现时先验证缓存的修复结果，通过则不再调用LLM
+        "enable_repair_cache": True,
+        
+        # 修复缓存最大条目数（LRU淘汰）和有效期（秒）
+        "repair_cache_max_size": 500,
+        "repair_cache_ttl_seconds": 86400,
+        
+        # 是否把LLM修复成功的原始错误SQL写入 error_sql 训练集：
+        # 生成SQL时（ENABLE_ERROR_SQL_PROMPT=True）会作为反例提示，减少同类错误再次出现
+        # 写入在后台线程中进行，不影响当前请求；默认关闭，建议人工审核错误SQL后再开启
+        "feedback_repairs_as_error_sql": False,
     },
 }
 
@@ -10,10 +10,17 @@ import re
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 from core.logging import get_agent_logger
+from agent.keyword_matcher import KeywordMatcher, PatternMatcher
 
 # 初始化日志 [[memory:3840221]]
 logger = get_agent_logger("DictLoader")
 
+# KeywordMatcher 中的关键词分组名
+NON_BUSINESS_GROUP = "non_business"
+QUERY_INTENT_GROUP = "query_intent"
+CHAT_GROUP = "chat"
+BUSINESS_GROUP_PREFIX = "business:"
+
 @dataclass
 class ClassifierDictConfig:
     """分类器词典配置数据类"""
@@ -24,6 +31,8 @@ class ClassifierDictConfig:
     chat_keywords: List[str]
     weights: Dict[str, float]
     metadata: Dict[str, Any]
+    keyword_matcher: Optional[KeywordMatcher] = None  # 所有关键词分组编译成的自动机
+    sql_pattern_matcher: Optional[PatternMatcher] = None  # 预编译的SQL模式
 
 class DictLoader:
     """分类器词典配置加载器"""
@@ -165,6 +174,15 @@ class DictLoader:
         # 转换其他关键词列表
         chat_keywords = self._extract_keywords_list(yaml_data['chat_keywords'])
         
+        # 预编译匹配器：关键词一次扫描，SQL模式预编译
+        keyword_groups = {
+            NON_BUSINESS_GROUP: non_business_keywords,
+            QUERY_INTENT_GROUP: query_intent_keywords,
+            CHAT_GROUP: chat_keywords,
+        }
+        for category, keywords in strong_business_keywords.items():
+            keyword_groups[BUSINESS_GROUP_PREFIX + category] = keywords
+        
         return ClassifierDictConfig(
             strong_business_keywords=strong_business_keywords,
             query_intent_keywords=query_intent_keywords,
@@ -172,7 +190,9 @@ class DictLoader:
             sql_patterns=sql_patterns,
             chat_keywords=chat_keywords,
             weights=yaml_data['weights'],
-            metadata=yaml_data.get('metadata', {})
+            metadata=yaml_data.get('metadata', {}),
+            keyword_matcher=KeywordMatcher(keyword_groups),
+            sql_pattern_matcher=PatternMatcher(sql_patterns)
         )
     
     def _flatten_non_business_keywords(self, non_business_data: Dict[str, Any]) -> List[str]:
@@ -0,0 +1,252 @@
+# agent/intent_model.py
+"""
+本地意图分类模型（DATABASE / CHAT）
+- 特征：规范化问题文本的字符 1~3-gram，按 crc32 哈希到固定维度，log(1+tf) 后做L2归一化
+- 模型：二分类逻辑回归（numpy实现，稀疏SGD训练），单次预测为亚毫秒级
+- 模型文件：.npz（权重 + 元数据），按文件修改时间热加载
+训练命令见 agent/train_intent_model.py
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.classification_cache import normalize_question
+from core.logging import get_agent_logger
+
+logger = get_agent_logger("IntentModel")
+
+DATABASE_LABEL = "DATABASE"
+CHAT_LABEL = "CHAT"
+LABELS = (DATABASE_LABEL, CHAT_LABEL)
+
+DEFAULT_N_FEATURES = 2 ** 16
+DEFAULT_NGRAM_RANGE = (1, 3)
+
+
+def extract_features(text: str, n_features: int = DEFAULT_N_FEATURES,
+                     ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    提取哈希字符n-gram特征
+
+    Returns:
+        (特征下标, 特征值)：稀疏表示，特征值已L2归一化
+    """
+    normalized = normalize_question(text)
+    counts: Dict[int, int] = {}
+    min_n, max_n = ngram_range
+    padded = f"^{normalized}$"
+    for n in range(min_n, max_n + 1):
+        for i in range(len(padded) - n + 1):
+            index = zlib.crc32(padded[i:i + n].encode("utf-8")) % n_features
+            counts[index] = counts.get(index, 0) + 1
+
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+class IntentModel:
+    """DATABASE/CHAT 二分类逻辑回归模型"""
+
+    def __init__(self, weights: np.ndarray, bias: float,
+                 ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self.n_features = len(weights)
+        self.ngram_range = tuple(ngram_range)
+        self.metadata = metadata or {}
+
+    def predict_proba(self, text: str) -> float:
+        """返回问题属于 DATABASE 的概率"""
+        indices, values = extract_features(text, self.n_features, self.ngram_range)
+        score = float(np.dot(self.weights[indices], values)) + self.bias
+        return float(1.0 / (1.0 + np.exp(-score)))
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """返回 (标签, 置信度)"""
+        probability = self.predict_proba(text)
+        if probability >= 0.5:
+            return DATABASE_LABEL, probability
+        return CHAT_LABEL, 1.0 - probability
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                weights=self.weights,
+                bias=np.array([self.bias], dtype=np.float32),
+                ngram_range=np.array(self.ngram_range, dtype=np.int64),
+                metadata=np.array(json.dumps(self.metadata, ensure_ascii=False)),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                weights=data["weights"],
+                bias=float(data["bias"][0]),
+                ngram_range=tuple(int(n) for n in data["ngram_range"]),
+                metadata=json.loads(str(data["metadata"])),
+            )
+
+
+# ==================== 训练与评估 ====================
+
+def train_intent_model(samples: Sequence[Tuple[str, str]], n_features: int = DEFAULT_N_FEATURES,
+                       ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE, epochs: int = 20,
+                       learning_rate: float = 0.5, l2: float = 1e-5, seed: int = 42) -> IntentModel:
+    """
+    训练逻辑回归模型（稀疏SGD，按类别频率反比加权以平衡样本）
+
+    Args:
+        samples: [(问题, "DATABASE"/"CHAT")]
+    """
+    if not samples:
+        raise ValueError("训练样本为空")
+
+    features = [extract_features(text, n_features, ngram_range) for text, _ in samples]
+    targets = [1.0 if label == DATABASE_LABEL else 0.0 for _, label in samples]
+    positives = sum(targets)
+    negatives = len(targets) - positives
+    if positives == 0 or negatives == 0:
+        raise ValueError("训练样本必须同时包含 DATABASE 和 CHAT 两类")
+    class_weights = {1.0: len(targets) / (2 * positives), 0.0: len(targets) / (2 * negatives)}
+
+    weights = np.zeros(n_features, dtype=np.float64)
+    bias = 0.0
+    order = list(range(len(samples)))
+    rng = random.Random(seed)
+    step = 0
+    for _ in range(epochs):
+        rng.shuffle(order)
+        for i in order:
+            step += 1
+            lr = learning_rate / (1 + 1e-3 * step)
+            indices, values = features[i]
+            score = float(np.dot(weights[indices], values)) + bias
+            prediction = 1.0 / (1.0 + np.exp(-score))
+            gradient = (prediction - targets[i]) * class_weights[targets[i]]
+            # L2正则只作用于当前样本涉及的特征（稀疏更新）
+            weights[indices] -= lr * (gradient * values + l2 * weights[indices])
+            bias -= lr * gradient
+
+    return IntentModel(
+        weights=weights.astype(np.float32),
+        bias=bias,
+        ngram_range=ngram_range,
+        metadata={
+            "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "samples": len(samples),
+            "database_samples": int(positives),
+            "chat_samples": int(negatives),
+            "epochs": epochs,
+            "n_features": n_features,
+        },
+    )
+
+
+def split_samples(samples: Sequence[Tuple[str, str]], test_ratio: float = 0.2,
+                  seed: int = 42) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """按标签分层划分训练集/测试集"""
+    rng = random.Random(seed)
+    train, test = [], []
+    for label in LABELS:
+        group = [s for s in samples if s[1] == label]
+        rng.shuffle(group)
+        test_size = int(round(len(group) * test_ratio))
+        test.extend(group[:test_size])
+        train.extend(group[test_size:])
+    return train, test
+
+
+def evaluate_intent_model(model: IntentModel, samples: Sequence[Tuple[str, str]],
+                          confidence_threshold: float) -> Dict[str, Any]:
+    """评估准确率、各类别精确率/召回率、阈值覆盖率和单次预测延迟"""
+    latencies = []
+    confusion = {(actual, predicted): 0 for actual in LABELS for predicted in LABELS}
+    confident_total = 0
+    confident_correct = 0
+    for text, label in samples:
+        start = time.perf_counter()
+        predicted, confidence = model.predict(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        confusion[(label, predicted)] += 1
+        if confidence >= confidence_threshold:
+            confident_total += 1
+            confident_correct += int(predicted == label)
+
+    total = len(samples)
+    correct = sum(confusion[(label, label)] for label in LABELS)
+    per_class = {}
+    for label in LABELS:
+        predicted_count = sum(confusion[(actual, label)] for actual in LABELS)
+        actual_count = sum(confusion[(label, predicted)] for predicted in LABELS)
+        per_class[label] = {
+            "support": actual_count,
+            "precision": round(confusion[(label, label)] / predicted_count, 4) if predicted_count else None,
+            "recall": round(confusion[(label, label)] / actual_count, 4) if actual_count else None,
+        }
+
+    latencies.sort()
+    return {
+        "samples": total,
+        "accuracy": round(correct / total, 4) if total else None,
+        "per_class": per_class,
+        "confusion": {f"{actual}->{predicted}": count for (actual, predicted), count in confusion.items()},
+        "confidence_threshold": confidence_threshold,
+        # 置信度达到阈值、无需升级到LLM的比例，以及这部分的准确率
+        "coverage": round(confident_total / total, 4) if total else None,
+        "accuracy_at_threshold": round(confident_correct / confident_total, 4) if confident_total else None,
+        "latency_ms": {
+            "p50": round(latencies[len(latencies) // 2], 4) if latencies else None,
+            "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4) if latencies else None,
+            "max": round(latencies[-1], 4) if latencies else None,
+        },
+    }
+
+
+# ==================== 运行时加载 ====================
+
+_model_cache: Dict[str, Tuple[float, IntentModel]] = {}
+_model_lock = threading.Lock()
+_missing_logged = set()
+
+
+def get_intent_model(path: str) -> Optional[IntentModel]:
+    """加载意图模型（按文件修改时间缓存），文件不存在或加载失败时返回None"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        if path not in _missing_logged:
+            _missing_logged.add(path)
+            logger.info(f"本地意图模型文件不存在，跳过本地分类: {path}")
+        return None
+
+    cached = _model_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _model_lock:
+        cached = _model_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            model = IntentModel.load(path)
+        except Exception as e:
+            logger.error(f"加载本地意图模型失败: {path}, {str(e)}")
+            return None
+        _model_cache[path] = (mtime, model)
+        logger.info(f"本地意图模型已加载: {path}, 训练样本={model.metadata.get('samples')}")
+        return model
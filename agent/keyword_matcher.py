@@ -0,0 +1,146 @@
+# agent/keyword_matcher.py
+"""
+分类器关键词匹配器
+将所有关键词分组编译为一个 Aho-Corasick 自动机（优先使用 pyahocorasick，不可用时使用纯Python实现），
+一次扫描问题文本即可得到各分组命中的关键词；SQL模式预编译为一个合并的正则用于快速预筛。
+匹配语义与逐个 `keyword in text` / `re.search(pattern, text, re.IGNORECASE)` 保持一致：
+各分组返回的命中列表保持词典中的原始顺序（重复配置的关键词会重复出现）。
+"""
+
+import re
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from core.logging import get_agent_logger
+
+logger = get_agent_logger("KeywordMatcher")
+
+try:
+    import ahocorasick  # pyahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class _PyAhoCorasick:
+    """纯Python实现的 Aho-Corasick 自动机（pyahocorasick 不可用时的后备）"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+    def add_word(self, word: str):
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(word)
+
+    def make_automaton(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_words(self, text: str):
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                yield from self._output[state]
+
+
+class KeywordMatcher:
+    """多分组关键词匹配器"""
+
+    def __init__(self, groups: Dict[str, List[str]]):
+        """
+        Args:
+            groups: 分组名 → 关键词列表（列表顺序即命中结果的顺序）
+        """
+        # 关键词 → [(分组名, 在分组中的位置)]
+        self._occurrences: Dict[str, List[Tuple[str, int]]] = {}
+        # 空字符串在 `"" in text` 语义下总是命中，单独处理
+        self._always_matched: List[Tuple[str, int, str]] = []
+
+        for group, keywords in groups.items():
+            for position, keyword in enumerate(keywords or []):
+                keyword = str(keyword)
+                if keyword:
+                    self._occurrences.setdefault(keyword, []).append((group, position))
+                else:
+                    self._always_matched.append((group, position, keyword))
+
+        self.backend = "pyahocorasick" if ahocorasick is not None else "python"
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self._occurrences:
+                self._automaton.add_word(keyword, keyword)
+        else:
+            self._automaton = _PyAhoCorasick()
+            for keyword in self._occurrences:
+                self._automaton.add_word(keyword)
+        if self._occurrences:
+            self._automaton.make_automaton()
+
+        logger.debug(f"关键词自动机构建完成: {len(self._occurrences)} 个关键词, backend={self.backend}")
+
+    def _found_keywords(self, text: str) -> set:
+        if not self._occurrences or not text:
+            return set()
+        if ahocorasick is not None:
+            return {keyword for _, keyword in self._automaton.iter(text)}
+        return set(self._automaton.iter_words(text))
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """
+        扫描文本，返回各分组命中的关键词（保持词典顺序）
+
+        Returns:
+            分组名 → 命中的关键词列表；未命中的分组不出现在结果中
+        """
+        hits: Dict[str, List[Tuple[int, str]]] = {}
+        for group, position, keyword in self._always_matched:
+            hits.setdefault(group, []).append((position, keyword))
+        for keyword in self._found_keywords(text):
+            for group, position in self._occurrences[keyword]:
+                hits.setdefault(group, []).append((position, keyword))
+
+        return {group: [keyword for _, keyword in sorted(items)] for group, items in hits.items()}
+
+
+class PatternMatcher:
+    """SQL模式匹配器：预编译各模式，并用合并后的正则做一次预筛"""
+
+    def __init__(self, patterns: List[str], flags: int = re.IGNORECASE):
+        self.patterns = list(patterns or [])
+        self._compiled = [(pattern, re.compile(pattern, flags)) for pattern in self.patterns]
+        self._combined: Optional[re.Pattern] = None
+        if self._compiled:
+            try:
+                self._combined = re.compile("|".join(f"(?:{p})" for p in self.patterns), flags)
+            except re.error as e:
+                # 含反向引用/局部标志等无法合并的模式时，退化为逐个匹配
+                logger.debug(f"SQL模式无法合并为单个正则，逐个匹配: {e}")
+
+    def match(self, text: str) -> List[str]:
+        """返回命中的模式列表（保持配置顺序）"""
+        if not self._compiled:
+            return []
+        if self._combined is not None and self._combined.search(text) is None:
+            return []
+        return [pattern for pattern, compiled in self._compiled if compiled.search(text)]
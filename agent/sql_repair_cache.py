@@ -0,0 +1,112 @@
+# agent/sql_repair_cache.py
+"""
+SQL修复结果缓存
+- 键：(规范化后的失败SQL, 错误类别)，相同的错误SQL再次出现时直接复用已验证通过的修复结果，省去LLM调用
+- 规范化：去掉注释、合并空白、去掉结尾分号，引号外的内容转小写（字符串字面量和带引号的标识符保持原样）
+- 错误类别：从数据库/Schema检查的错误信息中归类（字段不存在、表不存在、语法错误等）
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from core.logging import get_agent_logger
+
+logger = get_agent_logger("SqlRepairCache")
+
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_QUOTED_OR_PLAIN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|([^'\"]+)")
+_WHITESPACE = re.compile(r"\s+")
+
+# 错误类别：按顺序匹配，先匹配到的生效
+_ERROR_CLASSES = (
+    ("undefined_column", re.compile(r"column .* does not exist|字段不存在", re.IGNORECASE)),
+    ("undefined_table", re.compile(r"relation .* does not exist|表不存在", re.IGNORECASE)),
+    ("undefined_function", re.compile(r"function .* does not exist", re.IGNORECASE)),
+    ("undefined_operator", re.compile(r"operator does not exist", re.IGNORECASE)),
+    ("ambiguous_column", re.compile(r"is ambiguous", re.IGNORECASE)),
+    ("grouping_error", re.compile(r"must appear in the group by|aggregate function", re.IGNORECASE)),
+    ("datatype_mismatch", re.compile(r"invalid input syntax|cannot cast|type mismatch", re.IGNORECASE)),
+    ("syntax_error", re.compile(r"syntax error|语法", re.IGNORECASE)),
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """规范化SQL文本，用作修复缓存的键"""
+    if not sql:
+        return ""
+    text = _BLOCK_COMMENT.sub(" ", _LINE_COMMENT.sub(" ", sql))
+    parts = []
+    for quoted, plain in _QUOTED_OR_PLAIN.findall(text):
+        parts.append(quoted if quoted else _WHITESPACE.sub(" ", plain).lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def classify_sql_error(error_message: str) -> str:
+    """将错误信息归类为稳定的错误类别（错误信息中的位置、行号等细节不参与缓存键）"""
+    for error_class, pattern in _ERROR_CLASSES:
+        if error_message and pattern.search(error_message):
+            return error_class
+    return "other"
+
+
+class SqlRepairCache:
+    """SQL修复结果缓存（线程安全，LRU + TTL）"""
+
+    def __init__(self, max_size: int = 500, ttl_seconds: float = 86400):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evicted_invalid": 0}
+
+    @staticmethod
+    def make_key(sql: str, error_message: str) -> Tuple[str, str]:
+        return normalize_sql(sql), classify_sql_error(error_message)
+
+    def get(self, sql: str, error_message: str) -> Optional[str]:
+        key = self.make_key(sql, error_message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, sql: str, error_message: str, repaired_sql: str):
+        key = self.make_key(sql, error_message)
+        if not key[0] or not repaired_sql:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, repaired_sql)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sql: str, error_message: str):
+        """缓存的修复结果验证不再通过时（如表结构变化）移除"""
+        with self._lock:
+            if self._entries.pop(self.make_key(sql, error_message), None) is not None:
+                self._stats["evicted_invalid"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        logger.info("SQL修复缓存已清空")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                **self._stats,
+            }
@@ -20,8 +20,11 @@ class AgentState(TypedDict):
     
     # 数据库查询流程状态
     sql: Optional[str]
-    query_result: Optional[Dict[str, Any]]
+    query_result: Optional[Any]  # ColumnarResult 或 query_result 字典
+    query_profile: Optional[Dict[str, Any]]  # SQL执行剖析数据（排队/执行/获取耗时等）
     summary: Optional[str]
+    summary_mode: Literal["inline", "deferred", "skip"]  # 摘要生成方式：节点内生成 / 结果先返回、摘要随后生成 / 不生成
+    summary_pending: bool  # deferred模式下查询结果已就绪、摘要尚未生成
     
     # SQL验证和修复相关状态
     sql_generation_success: bool
@@ -46,4 +49,7 @@ class AgentState(TypedDict):
     execution_path: List[str]
     
     # 路由模式相关
-    routing_mode: Optional[str]  # 记录使用的路由模式
\ No newline at end of file
+    routing_mode: Optional[str]  # 记录使用的路由模式
+    
+    # 链路追踪
+    trace_parent: Optional[Dict[str, Any]]  # 请求根 span 的上下文，节点 span 以此为父
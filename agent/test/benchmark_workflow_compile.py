@@ -0,0 +1,54 @@
+"""
+对比每次请求重新编译workflow与复用已编译workflow的开销
+
+用法（项目根目录）:
+    python agent/test/benchmark_workflow_compile.py [迭代次数]
+"""
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from agent.citu_agent import CituLangGraphAgent
+
+
+def _create_bare_agent() -> CituLangGraphAgent:
+    """只构造workflow相关属性，不初始化LLM/分类器，避免依赖外部服务"""
+    import threading
+    from core.logging import get_agent_logger
+
+    agent = CituLangGraphAgent.__new__(CituLangGraphAgent)
+    agent.logger = get_agent_logger("CituAgentBenchmark")
+    agent._workflows = {}
+    agent._workflow_lock = threading.Lock()
+    return agent
+
+
+def _measure(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    agent = _create_bare_agent()
+    routing_modes = [None, "hybrid", "database_direct", "chat_direct", "llm_only"]
+
+    print(f"🧪 workflow获取开销对比（{iterations} 次/模式）")
+    for mode in routing_modes:
+        rebuild_ms = _measure(lambda: agent._create_workflow(mode), iterations)
+        agent._get_workflow(mode)  # 预热缓存
+        cached_ms = _measure(lambda: agent._get_workflow(mode), iterations)
+        print(f"   routing_mode={mode or 'default':<16} 每次编译: {rebuild_ms:8.3f} ms   复用缓存: {cached_ms:8.4f} ms")
+
+    # 同一路由模式返回同一个已编译对象
+    assert agent._get_workflow("hybrid") is agent._get_workflow("hybrid")
+    print("✅ 相同路由模式复用同一个已编译workflow")
+
+
+if __name__ == "__main__":
+    main()
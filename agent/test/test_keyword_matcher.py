@@ -0,0 +1,82 @@
+"""
+KeywordMatcher / PatternMatcher 与原逐个匹配写法的等价性测试
+
+用法（项目根目录）:
+    python -m pytest agent/test/test_keyword_matcher.py -q
+"""
+import os
+import random
+import re
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from agent import keyword_matcher
+from agent.keyword_matcher import KeywordMatcher, PatternMatcher, _PyAhoCorasick
+
+# 小字母表让关键词之间大量重叠（互为前缀/后缀/子串），覆盖自动机的失败跳转
+_ALPHABET = "服务区收入车流ab"
+
+
+def _random_words(rng: random.Random, count: int, max_len: int):
+    return ["".join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, max_len))) for _ in range(count)]
+
+
+def _expected(groups, text):
+    """原分类器的写法：逐个关键词做子串判断"""
+    result = {}
+    for group, keywords in groups.items():
+        matched = [k for k in keywords if k in text]
+        if matched:
+            result[group] = matched
+    return result
+
+
+def _check_random_questions(seed: int, iterations: int = 300):
+    rng = random.Random(seed)
+    for _ in range(iterations):
+        groups = {f"g{i}": _random_words(rng, rng.randint(0, 12), 4) for i in range(rng.randint(1, 4))}
+        if rng.random() < 0.2:
+            # 重复配置的关键词和空关键词
+            groups["g0"] = groups["g0"] + groups["g0"][:2] + [""]
+        matcher = KeywordMatcher(groups)
+        for text in _random_words(rng, 5, 20) + [""]:
+            assert matcher.match(text) == _expected(groups, text), (groups, text)
+
+
+def test_keyword_matcher_matches_substring_loops():
+    _check_random_questions(seed=20250801)
+
+
+def test_python_backend_matches_substring_loops():
+    """pyahocorasick 已安装时也验证纯Python后备实现"""
+    original = keyword_matcher.ahocorasick
+    keyword_matcher.ahocorasick = None
+    try:
+        assert KeywordMatcher({"g": ["服务区"]}).backend == "python"
+        _check_random_questions(seed=20250802)
+    finally:
+        keyword_matcher.ahocorasick = original
+
+
+def test_py_aho_corasick_reports_overlapping_words():
+    automaton = _PyAhoCorasick()
+    for word in ["服务", "服务区", "务区", "区"]:
+        automaton.add_word(word)
+    automaton.make_automaton()
+    assert sorted(automaton.iter_words("服务区")) == sorted(["服务", "服务区", "务区", "区"])
+
+
+def test_pattern_matcher_matches_re_search():
+    patterns = [r"\bselect\b", r"\bfrom\b", r"group\s+by", r"(?i)count\("]  # 最后一个含全局标志，无法合并
+    matcher = PatternMatcher(patterns)
+    for text in ["SELECT * FROM t", "group  by region", "COUNT(1)", "统计收入", ""]:
+        assert matcher.match(text) == [p for p in patterns if re.search(p, text, re.IGNORECASE)]
+
+
+if __name__ == "__main__":
+    test_keyword_matcher_matches_substring_loops()
+    test_python_backend_matches_substring_loops()
+    test_py_aho_corasick_reports_overlapping_words()
+    test_pattern_matcher_matches_re_search()
@@ -4,10 +4,10 @@ Agent工具包 - 使用@tool装饰器定义的工具集合
 """
 
 # 导入所有工具
-from .sql_generation import generate_sql
-from .sql_execution import execute_sql
-from .summary_generation import generate_summary
-from .general_chat import general_chat
+from .sql_generation import generate_sql, agenerate_sql
+from .sql_execution import execute_sql, aexecute_sql
+from .summary_generation import generate_summary, agenerate_summary
+from .general_chat import general_chat, ageneral_chat
 
 # 导出工具列表
 TOOLS = [
@@ -23,5 +23,10 @@ __all__ = [
     'generate_sql',
     'execute_sql',
     'generate_summary', 
-    'general_chat'
+    'general_chat',
+    # 异步版本（供 workflow.ainvoke 中的节点使用，不阻塞事件循环）
+    'agenerate_sql',
+    'aexecute_sql',
+    'agenerate_summary',
+    'ageneral_chat'
 ]
\ No newline at end of file
@@ -3,6 +3,8 @@ from langchain.tools import tool
 from typing import Dict, Any, Optional
 from common.vanna_instance import get_vanna_instance
 from core.logging import get_agent_logger
+from agent.tools.utils import run_in_tool_executor
+from common.tracing import traced
 
 # Initialize logger
 logger = get_agent_logger("GeneralChat")
@@ -83,6 +85,11 @@ def general_chat(question: str, context: Optional[str] = None) -> Dict[str, Any]
             "error": f"聊天服务异常: {str(e)}"
         }
 
+@traced("agent.tool.general_chat")
+async def ageneral_chat(question: str, context: Optional[str] = None) -> Dict[str, Any]:
+    """general_chat 的异步版本：LLM调用为阻塞调用，放到有界线程池中执行"""
+    return await run_in_tool_executor(general_chat.invoke, {"question": question, "context": context})
+
 def _get_fallback_response(question: str) -> str:
     """获取备用响应"""
     question_lower = question.lower()
@@ -3,24 +3,56 @@ from langchain.tools import tool
 from typing import Dict, Any
 import pandas as pd
 import time
+import asyncio
 import functools
-from common.vanna_instance import get_vanna_instance
+from common.business_db import run_business_sql, arun_business_sql, QueryBusyError, QueryTimeoutError
+from common.columnar_result import ColumnarResult
+from common.query_profiler import collect_query_profiles, elapsed_ms
 from app_config import API_MAX_RETURN_ROWS
 from core.logging import get_agent_logger
+from agent.tools.utils import run_in_tool_executor
+from common.tracing import traced
 
 # Initialize logger
 logger = get_agent_logger("SQLExecution")
 
 def retry_on_failure(max_retries: int = 2, delay: float = 1.0, backoff_factor: float = 2.0):
     """
-    重试装饰器
+    重试装饰器（同时支持同步函数和协程函数）
     
     Args:
         max_retries: 最大重试次数
         delay: 初始延迟时间（秒）
         backoff_factor: 退避因子（指数退避）
     """
+    def should_retry(result) -> bool:
+        # 如果函数返回结果包含 can_retry 标识，检查是否需要重试
+        return isinstance(result, dict) and result.get('can_retry', False) and not result.get('success', True)
+    
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                retries = 0
+                while True:
+                    try:
+                        result = await func(*args, **kwargs)
+                        if not should_retry(result) or retries >= max_retries:
+                            return result
+                        retries += 1
+                        wait_time = delay * (backoff_factor ** (retries - 1))
+                        logger.warning(f"{func.__name__} 执行失败，等待 {wait_time:.1f} 秒后重试 ({retries}/{max_retries})")
+                    except Exception as e:
+                        retries += 1
+                        if retries > max_retries:
+                            logger.error(f"{func.__name__} 达到最大重试次数 ({max_retries})，抛出异常")
+                            raise
+                        wait_time = delay * (backoff_factor ** (retries - 1))
+                        logger.warning(f"{func.__name__} 异常: {str(e)}, 等待 {wait_time:.1f} 秒后重试 ({retries}/{max_retries})")
+                    await asyncio.sleep(wait_time)
+            
+            return async_wrapper
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             retries = 0
@@ -28,8 +60,7 @@ def retry_on_failure(max_retries: int = 2, delay: float = 1.0, backoff_factor: f
                 try:
                     result = func(*args, **kwargs)
                     
-                    # 如果函数返回结果包含 can_retry 标识，检查是否需要重试
-                    if isinstance(result, dict) and result.get('can_retry', False) and not result.get('success', True):
+                    if should_retry(result):
                         if retries < max_retries:
                             retries += 1
                             wait_time = delay * (backoff_factor ** (retries - 1))
@@ -55,6 +86,13 @@ def retry_on_failure(max_retries: int = 2, delay: float = 1.0, backoff_factor: f
         return wrapper
     return decorator
 
+def _resolve_max_rows(max_rows: int = None) -> int:
+    """设置默认的最大返回行数，与ask()接口保持一致"""
+    DEFAULT_MAX_RETURN_ROWS = 200
+    if max_rows is None:
+        max_rows = API_MAX_RETURN_ROWS if API_MAX_RETURN_ROWS is not None else DEFAULT_MAX_RETURN_ROWS
+    return max_rows
+
 @tool
 @retry_on_failure(max_retries=2)
 def execute_sql(sql: str, max_rows: int = None) -> Dict[str, Any]:
@@ -69,110 +107,134 @@ def execute_sql(sql: str, max_rows: int = None) -> Dict[str, Any]:
         包含查询结果的字典，格式：
         {
             "success": bool,
-            "data_result": dict或None,  # 注意：工具内部仍使用data_result，但会被Agent重命名为query_result
+            "data_result": ColumnarResult/dict或None,  # 注意：工具内部仍使用data_result，但会被Agent重命名为query_result
             "error": str或None,
-            "can_retry": bool
+            "can_retry": bool,
+            "query_profile": dict或None  # 成功时附带的SQL执行剖析数据
         }
     """
-    # 设置默认的最大返回行数，与ask()接口保持一致
-    DEFAULT_MAX_RETURN_ROWS = 200
-    if max_rows is None:
-        max_rows = API_MAX_RETURN_ROWS if API_MAX_RETURN_ROWS is not None else DEFAULT_MAX_RETURN_ROWS
+    max_rows = _resolve_max_rows(max_rows)
     try:
         logger.info(f"开始执行SQL: {sql[:100]}...")
         
-        vn = get_vanna_instance()
-        df = vn.run_sql(sql)
-        
-        if df is None:
-            return {
-                "success": False,
-                "data_result": None,
-                "error": "SQL执行返回空结果",
-                "error_type": "no_result",
-                "can_retry": False
-            }
+        # 通过业务数据库执行器执行：带statement_timeout和并发限制
+        with collect_query_profiles() as profiles:
+            df = run_business_sql(sql)
         
-        if not isinstance(df, pd.DataFrame):
-            return {
-                "success": False,
-                "data_result": None,
-                "error": f"SQL执行返回非DataFrame类型: {type(df)}",
-                "error_type": "invalid_result_type",
-                "can_retry": False
-            }
+        return _build_execute_result(df, profiles, max_rows)
         
-        if df.empty:
-            return {
-                "success": True,
-                "data_result": {
-                    "rows": [],
-                    "columns": [],
-                    "row_count": 0,
-                    "message": "查询执行成功，但没有找到符合条件的数据"
-                },
-                "message": "查询无结果"
-            }
-        
-        # 处理数据结果
-        total_rows = len(df)
-        limited_df = df.head(max_rows)
+    except Exception as e:
+        return _build_error_result(sql, e)
+
+@traced("agent.tool.execute_sql")
+@retry_on_failure(max_retries=2)
+async def aexecute_sql(sql: str, max_rows: int = None) -> Dict[str, Any]:
+    """execute_sql 的异步版本：排队和执行都不阻塞事件循环，结果格式相同"""
+    max_rows = _resolve_max_rows(max_rows)
+    try:
+        logger.info(f"开始执行SQL: {sql[:100]}...")
         
-        # 转换为字典格式并处理数据类型
-        rows = _process_dataframe_rows(limited_df.to_dict(orient="records"))
-        columns = list(df.columns)
+        with collect_query_profiles() as profiles:
+            df = await arun_business_sql(sql)
         
-        logger.info(f"查询成功，返回 {len(rows)} 行数据")
+        # 列式转换按结果大小可能较耗CPU，放到线程池中执行
+        return await run_in_tool_executor(_build_execute_result, df, profiles, max_rows)
         
-        result = {
+    except Exception as e:
+        return _build_error_result(sql, e)
+
+def _build_execute_result(df, profiles: list, max_rows: int) -> Dict[str, Any]:
+    """将查询返回的DataFrame转换为工具结果"""
+    query_profile = profiles[-1].to_dict() if profiles else None
+    
+    if df is None:
+        return {
+            "success": False,
+            "data_result": None,
+            "error": "SQL执行返回空结果",
+            "error_type": "no_result",
+            "can_retry": False
+        }
+    
+    if not isinstance(df, pd.DataFrame):
+        return {
+            "success": False,
+            "data_result": None,
+            "error": f"SQL执行返回非DataFrame类型: {type(df)}",
+            "error_type": "invalid_result_type",
+            "can_retry": False
+        }
+    
+    if df.empty:
+        return {
             "success": True,
             "data_result": {
-                "rows": rows,
-                "columns": columns,
-                "row_count": len(rows),
-                "total_row_count": total_rows,
-                "is_limited": total_rows > max_rows
+                "rows": [],
+                "columns": [],
+                "row_count": 0,
+                "message": "查询执行成功，但没有找到符合条件的数据"
             },
-            "message": f"查询成功，共 {total_rows} 行数据"
+            "message": "查询无结果",
+            "query_profile": query_profile
         }
-        
-        if total_rows > max_rows:
-            result["message"] += f"，已限制显示前 {max_rows} 行"
-        
-        return result
-        
-    except Exception as e:
-        error_msg = str(e)
-        logger.error(f"SQL执行异常: {error_msg}")
-        
+    
+    # 处理数据结果：保持列式结构，JSON转换推迟到API边界
+    total_rows = len(df)
+    start = time.perf_counter()
+    data_result = ColumnarResult.from_dataframe(df, max_rows=max_rows)
+    if query_profile is not None:
+        query_profile["columnar_ms"] = elapsed_ms(start)
+    
+    logger.info(f"查询成功，返回 {data_result.row_count} 行数据 (backend={data_result.backend})")
+    
+    result = {
+        "success": True,
+        "data_result": data_result,
+        "message": f"查询成功，共 {total_rows} 行数据",
+        "query_profile": query_profile
+    }
+    
+    if total_rows > max_rows:
+        result["message"] += f"，已限制显示前 {max_rows} 行"
+    
+    return result
+
+def _build_error_result(sql: str, e: Exception) -> Dict[str, Any]:
+    """将SQL执行异常转换为工具结果"""
+    if isinstance(e, QueryBusyError):
+        # 繁忙时快速失败，不做重试以免加剧排队
+        logger.warning(f"业务数据库繁忙({e.reason}): {str(e)}")
         return {
             "success": False,
             "data_result": None,
-            "error": f"SQL执行失败: {error_msg}",
-            "error_type": _analyze_sql_error(error_msg),
-            "can_retry": "timeout" in error_msg.lower() or "connection" in error_msg.lower(),
+            "error": str(e),
+            "error_type": "database_busy",
+            "can_retry": False,
             "sql": sql
         }
-
-def _process_dataframe_rows(rows: list) -> list:
-    """处理DataFrame行数据，确保JSON序列化兼容"""
-    processed_rows = []
     
-    for row in rows:
-        processed_row = {}
-        for key, value in row.items():
-            if pd.isna(value):
-                processed_row[key] = None
-            elif isinstance(value, (pd.Timestamp, pd.Timedelta)):
-                processed_row[key] = str(value)
-            elif isinstance(value, (int, float, str, bool)):
-                processed_row[key] = value
-            else:
-                processed_row[key] = str(value)
-        
-        processed_rows.append(processed_row)
+    if isinstance(e, QueryTimeoutError):
+        logger.warning(f"SQL执行超时: {str(e)}")
+        return {
+            "success": False,
+            "data_result": None,
+            "error": f"SQL执行超时，请缩小查询范围后重试: {str(e)}",
+            "error_type": "sql_statement_timeout",
+            "can_retry": False,
+            "sql": sql
+        }
+    
+    error_msg = str(e)
+    logger.error(f"SQL执行异常: {error_msg}")
     
-    return processed_rows
+    return {
+        "success": False,
+        "data_result": None,
+        "error": f"SQL执行失败: {error_msg}",
+        "error_type": _analyze_sql_error(error_msg),
+        "can_retry": "timeout" in error_msg.lower() or "connection" in error_msg.lower(),
+        "sql": sql
+    }
 
 def _analyze_sql_error(error_msg: str) -> str:
     """分析SQL错误类型"""
@@ -3,6 +3,8 @@ from langchain.tools import tool
 from typing import Dict, Any
 from common.vanna_instance import get_vanna_instance
 from core.logging import get_agent_logger
+from agent.tools.utils import run_in_tool_executor
+from common.tracing import traced
 
 # Initialize logger
 logger = get_agent_logger("SQLGeneration")
@@ -78,4 +80,11 @@ def generate_sql(question: str, allow_llm_to_see_data: bool = True) -> Dict[str,
             "error": f"SQL生成过程异常: {str(e)}",
             "error_type": "exception",
             "can_retry": True
-        }
\ No newline at end of file
+        }
+
+@traced("agent.tool.generate_sql")
+async def agenerate_sql(question: str, allow_llm_to_see_data: bool = True) -> Dict[str, Any]:
+    """generate_sql 的异步版本：向量检索和LLM调用为阻塞调用，放到有界线程池中执行"""
+    return await run_in_tool_executor(
+        generate_sql.invoke, {"question": question, "allow_llm_to_see_data": allow_llm_to_see_data}
+    )
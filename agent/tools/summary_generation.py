@@ -3,19 +3,22 @@ from langchain.tools import tool
 from typing import Dict, Any
 import pandas as pd
 from common.vanna_instance import get_vanna_instance
+from common.columnar_result import ColumnarResult
 from core.logging import get_agent_logger
+from agent.tools.utils import run_in_tool_executor
+from common.tracing import traced
 
 # Initialize logger
 logger = get_agent_logger("SummaryGeneration")
 
 @tool
-def generate_summary(question: str, query_result: Dict[str, Any], sql: str) -> Dict[str, Any]:
+def generate_summary(question: str, query_result: Any, sql: str) -> Dict[str, Any]:
     """
     为查询结果生成自然语言摘要。
     
     Args:
         question: 原始问题
-        query_result: 查询结果数据
+        query_result: 查询结果数据（ColumnarResult 或 query_result 字典）
         sql: 执行的SQL语句
         
     Returns:
@@ -29,7 +32,7 @@ def generate_summary(question: str, query_result: Dict[str, Any], sql: str) -> D
     try:
         logger.info(f"开始生成摘要，问题: {question}")
         
-        if not query_result or not query_result.get("rows"):
+        if not query_result or not (query_result.get("row_count") or query_result.get("rows")):
             return {
                 "success": True,
                 "summary": "查询执行完成，但没有找到符合条件的数据。",
@@ -74,9 +77,20 @@ def generate_summary(question: str, query_result: Dict[str, Any], sql: str) -> D
             "message": f"使用备用摘要生成: {str(e)}"
         }
 
-def _reconstruct_dataframe(query_result: Dict[str, Any]) -> pd.DataFrame:
+@traced("agent.tool.generate_summary")
+async def agenerate_summary(question: str, query_result: Any, sql: str) -> Dict[str, Any]:
+    """generate_summary 的异步版本：LLM调用为阻塞调用，放到有界线程池中执行"""
+    return await run_in_tool_executor(
+        generate_summary.invoke, {"question": question, "query_result": query_result, "sql": sql}
+    )
+
+def _reconstruct_dataframe(query_result: Any) -> pd.DataFrame:
     """从查询结果重构DataFrame"""
     try:
+        if isinstance(query_result, ColumnarResult):
+            # 列式结果直接转换，无需经过逐行字典
+            return query_result.to_dataframe()
+        
         rows = query_result.get("rows", [])
         columns = query_result.get("columns", [])
         
@@ -2,8 +2,12 @@
 """
 Agent相关的工具函数
 """
+import asyncio
+import contextvars
 import functools
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Callable, List, Optional
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.tools import BaseTool
@@ -29,6 +33,38 @@ def handle_tool_errors(func: Callable) -> Callable:
             }
     return wrapper
 
+# 工具阻塞调用（LLM/向量检索/DataFrame处理）使用的有界线程池
+_tool_executor: Optional[ThreadPoolExecutor] = None
+_tool_executor_lock = threading.Lock()
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """获取工具线程池（大小由 AGENT_CONFIG['performance']['tool_executor_max_workers'] 控制）"""
+    global _tool_executor
+    if _tool_executor is None:
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                try:
+                    from agent.config import get_current_config, get_nested_config
+                    max_workers = get_nested_config(get_current_config(), "performance.tool_executor_max_workers", 16)
+                except ImportError:
+                    max_workers = 16
+                _tool_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-tool")
+                logger.info(f"Agent工具线程池已创建: max_workers={max_workers}")
+    return _tool_executor
+
+async def run_in_tool_executor(func: Callable, *args, **kwargs) -> Any:
+    """
+    在有界线程池中执行阻塞调用，不阻塞事件循环
+    
+    与 asyncio.to_thread 一样复制当前 contextvars（查询用户绑定、SQL剖析收集等在线程中仍然有效），
+    但线程数有上限，避免大量并发请求时无限制地占用线程。
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_tool_executor(), functools.partial(context.run, func, *args, **kwargs)
+    )
+
 class LLMWrapper:
     """自定义LLM的LangChain兼容包装器，支持工具调用"""
     
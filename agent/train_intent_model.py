@@ -0,0 +1,181 @@
+# agent/train_intent_model.py
+"""
+本地意图模型训练命令行工具
+
+训练数据来源：
+- DATABASE：Data Pipeline 生成的问答对文件（*_pair.json）、向量库中的 question-sql 训练数据、qa_feedback 中点赞的问题
+- CHAT：agent/intent_chat_corpus.txt 聊天语料
+- 额外标注数据：JSONL 文件，每行 {"question": "...", "label": "DATABASE"|"CHAT"}
+
+用法（项目根目录）:
+    python -m agent.train_intent_model
+    python -m agent.train_intent_model --from-feedback --from-vector-store --labeled-file logs/labeled.jsonl
+    python -m agent.train_intent_model --eval-only
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import List, Tuple
+
+from agent.intent_model import (
+    CHAT_LABEL, DATABASE_LABEL, LABELS, DEFAULT_N_FEATURES, IntentModel,
+    evaluate_intent_model, split_samples, train_intent_model,
+)
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(AGENT_DIR)
+DEFAULT_PAIR_GLOB = os.path.join(PROJECT_ROOT, "data_pipeline", "training_data", "*", "*_pair.json")
+DEFAULT_CHAT_CORPUS = os.path.join(AGENT_DIR, "intent_chat_corpus.txt")
+
+
+def load_pair_files(pattern: str) -> List[str]:
+    questions = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                questions.extend(item["question"] for item in json.load(f) if item.get("question"))
+        except Exception as e:
+            print(f"⚠️  跳过问答对文件 {path}: {e}")
+    return questions
+
+
+def load_chat_corpus(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def load_labeled_file(path: str) -> List[Tuple[str, str]]:
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            label = str(item.get("label", "")).upper()
+            if item.get("question") and label in LABELS:
+                samples.append((item["question"], label))
+    return samples
+
+
+def load_feedback_questions(limit: int) -> List[str]:
+    """qa_feedback 中点赞的问题（需要业务数据库连接）"""
+    from common.qa_feedback_manager import QAFeedbackManager
+
+    manager = QAFeedbackManager()
+    records, _ = manager.query_feedback(page=1, page_size=limit, is_thumb_up=True)
+    return [record["question"] for record in records if record.get("question")]
+
+
+def load_vector_store_questions() -> List[str]:
+    """向量库中的 question-sql 训练数据（需要向量数据库连接）"""
+    from common.vanna_instance import get_vanna_instance
+
+    training_data = get_vanna_instance().get_training_data()
+    if training_data is None or training_data.empty:
+        return []
+    sql_rows = training_data[training_data["training_data_type"] == "sql"]
+    return [q for q in sql_rows["question"].tolist() if q]
+
+
+def collect_samples(args) -> List[Tuple[str, str]]:
+    samples: List[Tuple[str, str]] = []
+    pair_questions = load_pair_files(args.pair_glob)
+    print(f"📄 问答对文件: {len(pair_questions)} 条 DATABASE 样本")
+    samples.extend((q, DATABASE_LABEL) for q in pair_questions)
+
+    if args.from_vector_store:
+        vector_questions = load_vector_store_questions()
+        print(f"🗄️  向量库训练数据: {len(vector_questions)} 条 DATABASE 样本")
+        samples.extend((q, DATABASE_LABEL) for q in vector_questions)
+
+    if args.from_feedback:
+        feedback_questions = load_feedback_questions(args.feedback_limit)
+        print(f"👍 qa_feedback 点赞问题: {len(feedback_questions)} 条 DATABASE 样本")
+        samples.extend((q, DATABASE_LABEL) for q in feedback_questions)
+
+    chat_questions = load_chat_corpus(args.chat_corpus)
+    print(f"💬 聊天语料: {len(chat_questions)} 条 CHAT 样本")
+    samples.extend((q, CHAT_LABEL) for q in chat_questions)
+
+    for path in args.labeled_file or []:
+        labeled = load_labeled_file(path)
+        print(f"🏷️  标注数据 {path}: {len(labeled)} 条")
+        samples.extend(labeled)
+
+    # 去重（同一问题保留最后出现的标签，标注数据优先）
+    deduplicated = {}
+    for question, label in samples:
+        deduplicated[question.strip()] = label
+    return list(deduplicated.items())
+
+
+def print_report(title: str, report: dict):
+    print(f"\n📊 {title}")
+    print(f"   样本数: {report['samples']}, 准确率: {report['accuracy']}")
+    for label, metrics in report["per_class"].items():
+        print(f"   {label:<8} support={metrics['support']:<5} precision={metrics['precision']} recall={metrics['recall']}")
+    print(f"   置信度阈值 {report['confidence_threshold']}: 覆盖率={report['coverage']}, "
+          f"覆盖部分准确率={report['accuracy_at_threshold']}")
+    latency = report["latency_ms"]
+    print(f"   单次预测延迟(ms): p50={latency['p50']}, p95={latency['p95']}, max={latency['max']}")
+
+
+def setup_argument_parser():
+    from agent.config import get_current_config, get_nested_config
+
+    config = get_current_config()
+    default_model_path = os.path.join(PROJECT_ROOT, get_nested_config(config, "intent_model.model_path", "agent/models/intent_model.npz"))
+    default_threshold = get_nested_config(config, "intent_model.confidence_threshold", 0.85)
+
+    parser = argparse.ArgumentParser(description="训练本地意图分类模型（DATABASE/CHAT）")
+    parser.add_argument("--output", default=default_model_path, help="模型输出路径")
+    parser.add_argument("--pair-glob", default=DEFAULT_PAIR_GLOB, help="问答对文件通配符")
+    parser.add_argument("--chat-corpus", default=DEFAULT_CHAT_CORPUS, help="CHAT语料文件（每行一个问题）")
+    parser.add_argument("--labeled-file", action="append", help="额外标注数据JSONL文件，可重复指定")
+    parser.add_argument("--from-feedback", action="store_true", help="加入 qa_feedback 中点赞的问题")
+    parser.add_argument("--feedback-limit", type=int, default=5000, help="读取的点赞反馈上限")
+    parser.add_argument("--from-vector-store", action="store_true", help="加入向量库中的 question-sql 训练数据")
+    parser.add_argument("--test-ratio", type=float, default=0.2, help="测试集比例")
+    parser.add_argument("--threshold", type=float, default=default_threshold, help="评估使用的置信度阈值")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--n-features", type=int, default=DEFAULT_N_FEATURES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--eval-only", action="store_true", help="只评估已有模型，不重新训练")
+    return parser
+
+
+def main():
+    args = setup_argument_parser().parse_args()
+    samples = collect_samples(args)
+    train_samples, test_samples = split_samples(samples, args.test_ratio, args.seed)
+
+    if args.eval_only:
+        if not os.path.exists(args.output):
+            print(f"❌ 模型文件不存在: {args.output}")
+            sys.exit(1)
+        model = IntentModel.load(args.output)
+        print_report("已有模型在全部样本上的评估", evaluate_intent_model(model, samples, args.threshold))
+        return
+
+    print(f"\n🏋️ 训练: {len(train_samples)} 条, 测试: {len(test_samples)} 条")
+    holdout_model = train_intent_model(train_samples, n_features=args.n_features, epochs=args.epochs, seed=args.seed)
+    holdout_report = evaluate_intent_model(holdout_model, test_samples, args.threshold)
+    print_report("留出测试集评估", holdout_report)
+
+    # 评估后使用全部样本训练最终模型
+    model = train_intent_model(samples, n_features=args.n_features, epochs=args.epochs, seed=args.seed)
+    model.metadata["holdout_report"] = holdout_report
+    model.save(args.output)
+
+    report_path = os.path.splitext(args.output)[0] + "_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"metadata": model.metadata, "holdout": holdout_report}, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 模型已保存: {args.output}")
+    print(f"✅ 评估报告已保存: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -98,6 +98,35 @@ APP_DB_CONFIG = {
     "password": os.getenv("APP_DB_PASSWORD")
 }
 
+# 业务数据库查询保护配置（作用于 execute_sql / run_sql / citu_run_sql）
+BUSINESS_DB_STATEMENT_TIMEOUT = 30          # 单条SQL的 statement_timeout（秒），0 或 None 表示不限制
+BUSINESS_DB_CONNECT_TIMEOUT = 10            # 建立连接超时时间（秒）
+BUSINESS_DB_MAX_CONCURRENT_QUERIES = 8      # 进程内同时执行的业务SQL上限
+BUSINESS_DB_MAX_QUEUE_DEPTH = 16            # 排队等待的SQL上限，超过时立即返回"繁忙"
+BUSINESS_DB_QUEUE_TIMEOUT = 15              # 排队等待执行槽位的最长时间（秒），超时返回"繁忙"
+BUSINESS_DB_MAX_QUERIES_PER_USER = 2        # 单个用户（user_id）同时执行+排队的SQL上限，0 或 None 表示不限制；
+                                            # 匿名用户（DEFAULT_ANONYMOUS_USER）不受此限制，只受全局并发和排队限制
+
+# 业务数据库只读副本配置（生成的只读 SELECT/WITH 查询优先路由到副本，写操作和SQL验证仍走主库）
+# 每个副本只需填写与 APP_DB_CONFIG 不同的字段，例如:
+# APP_DB_REPLICAS = [{"name": "replica-1", "host": "192.168.67.2", "port": 6432}]
+APP_DB_REPLICAS = []
+BUSINESS_DB_REPLICA_MAX_LAG = 30            # 副本允许的最大复制延迟（秒），超过时该副本不参与路由
+BUSINESS_DB_REPLICA_CHECK_INTERVAL = 15     # 副本健康检查间隔（秒）
+
+# 业务SQL执行剖析配置（排队/连接/执行/获取/DataFrame转换耗时，附加到Agent响应并汇总为慢SQL报告）
+ENABLE_QUERY_PROFILING = True
+QUERY_PROFILE_EXPLAIN_SAMPLE_RATE = 0.0     # 对只读查询额外执行 EXPLAIN ANALYZE 的采样比例（0~1），会再执行一次SQL，生产环境建议≤0.01
+SLOW_QUERY_THRESHOLD_MS = 3000              # 慢SQL阈值（毫秒，包含排队等待时间），超过时记录到慢SQL报告
+SLOW_QUERY_REPORT_SIZE = 200                # 慢SQL报告保留的SQL指纹数量上限
+
+# 业务数据库Schema目录配置（内存中的表/字段索引，用于SQL表/字段引用校验和DDL召回兜底）
+ENABLE_SCHEMA_CATALOG = True
+SCHEMA_CATALOG_REFRESH_INTERVAL = 600       # 定时刷新间隔（秒），0 表示只在首次使用和手动刷新时加载
+SCHEMA_CATALOG_SCHEMAS = []                 # 需要加载的schema，空列表表示除系统schema外全部加载
+# 向量召回的DDL为空（或全部被阈值过滤）时，是否用Schema目录按问题匹配表结构作为兜底
+ENABLE_SCHEMA_CATALOG_DDL_FALLBACK = True
+
 # ChromaDB配置
 # CHROMADB_PATH = "."  
 
@@ -126,6 +155,12 @@ REWRITE_QUESTION_ENABLED = False
 # False: 只返回SQL执行结果，跳过摘要生成，节省LLM调用
 ENABLE_RESULT_SUMMARY = True
 
+# 流式接口（ask_agent_stream）是否延后生成摘要
+# True: 查询结果就绪后立即以 result 事件返回，摘要并发生成后以 summary 事件返回
+# False: 摘要生成完成后才返回结果（与非流式接口一致）
+# 请求参数 defer_summary 可覆盖此配置；skip_summary=true 时不生成摘要
+AGENT_STREAM_DEFER_SUMMARY = True
+
 # 是否在返回结果中显示thinking过程
 # True: 显示 <think></think> 内容
 # False: 隐藏 <think></think> 内容，只显示最终答案
@@ -146,6 +181,14 @@ RESULT_VECTOR_ERROR_SQL_SCORE_THRESHOLD = 0.8
 # 接口返回查询记录的最大行数
 API_MAX_RETURN_ROWS = 1000
 
+# Agent 链路追踪：记录每个节点、工具调用、向量检索、LLM调用和SQL执行的耗时 span
+# "none": 不记录（默认，几乎无开销）
+# "jsonl": 每个 span 一行JSON写入 TRACING_JSONL_PATH
+# "otel": 交给 OpenTelemetry SDK（需安装 opentelemetry-api/sdk 并配置导出器）
+TRACING_EXPORTER = "none"
+TRACING_JSONL_PATH = "logs/agent_traces.jsonl"
+TRACING_SERVICE_NAME = "vanna-agent"
+
 
 # 仅LLM分类:"llm_only", 直接数据库查询："database_direct", 直接聊天对话: "chat_direct", 混合模式: "hybrid"
 # 混合模式 hybrid（推荐）
@@ -172,6 +215,23 @@ ENABLE_CONVERSATION_CONTEXT = True      # 是否启用对话上下文
 ENABLE_QUESTION_ANSWER_CACHE = False     # 是否启用问答结果缓存
 ENABLE_EMBEDDING_CACHE = True           # 是否启用embedding向量缓存
 
+# ask_agent 答案缓存（替代按 md5(question) 的问答缓存）：
+# 按 路由模式 + 规范化问题 缓存无上下文请求的 DATABASE 答案（CHAT 答案不缓存），按答案SQL涉及表的数据版本
+# 判断是否失效（有表取不到版本时按 FRESH_TTL 时间分桶失效），过了新鲜期的答案先返回再后台刷新
+ENABLE_AGENT_ANSWER_CACHE = True
+AGENT_ANSWER_CACHE_FRESH_TTL = 300              # 新鲜期（秒）：期间直接返回缓存答案
+AGENT_ANSWER_CACHE_STALE_TTL = 3600             # 过期可用期（秒）：返回旧答案并在后台刷新
+AGENT_ANSWER_CACHE_VERSION_CHECK_INTERVAL = 30  # 表数据版本快照刷新间隔（秒）
+AGENT_ANSWER_CACHE_SINGLE_FLIGHT_TIMEOUT = 120  # 等待相同问题执行结果的最长时间（秒）
+
+# ask_agent 请求合并：相同 问题+上下文+路由模式 的并发请求只执行一次Agent流程（进程内 + Redis跨进程），
+# 对话记录仍按用户各自保存；只共享成功的结果，领头请求失败时等待中的请求各自执行
+ENABLE_AGENT_REQUEST_COALESCING = True
+AGENT_COALESCING_LOCK_TTL = 180          # Redis执行锁过期时间（秒），防止领头进程异常退出后锁不释放
+AGENT_COALESCING_RESULT_TTL = 10         # 共享结果在Redis中保留的时间（秒），只供等待中的请求读取
+AGENT_COALESCING_WAIT_TIMEOUT = 120      # 等待相同请求结果的最长时间（秒），超时后自行执行
+AGENT_COALESCING_POLL_INTERVAL = 0.2     # 等待其他进程结果时的轮询间隔（秒）
+
 # TTL配置（单位：秒）
 CONVERSATION_TTL = 7 * 24 * 3600        # 对话保存7天
 USER_CONVERSATIONS_TTL = 7 * 24 * 3600  # 用户对话列表保存7天（所有用户统一）
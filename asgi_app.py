@@ -5,12 +5,102 @@ ASGI应用启动文件
 启动方式：
 1. 开发环境：python unified_api.py (直接Flask)
 2. 生产环境：uvicorn asgi_app:asgi_app (ASGI服务器)
+
+React Agent 流式接口（/api/v0/ask_react_agent_stream）不经过 WsgiToAsgi，直接在服务器事件循环上执行：
+流式 Agent（Redis 连接、checkpointer、LLM 客户端、已编译的图）在启动时初始化一次，所有流式请求共享。
 """
+import asyncio
+from urllib.parse import parse_qs
+
 from asgiref.wsgi import WsgiToAsgi
-from unified_api import app
+from unified_api import (
+    app, logger, REACT_AGENT_STREAM_PATH, bind_stream_agent_loop, get_stream_react_agent,
+    close_stream_react_agent, parse_react_stream_args, react_agent_stream_events, format_sse_error,
+)
 
 # 将Flask WSGI应用转换为ASGI应用
-asgi_app = WsgiToAsgi(app)
+flask_asgi_app = WsgiToAsgi(app)
+
+
+async def _lifespan(receive, send):
+    """启动时预热流式 React Agent，关闭时释放其资源"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            bind_stream_agent_loop(asyncio.get_running_loop())
+            try:
+                await get_stream_react_agent()
+            except Exception as e:
+                # 预热失败不阻止服务启动，首个流式请求时会再次初始化
+                logger.warning(f"⚠️ 流式 React Agent 预热失败: {e}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                await close_stream_react_agent()
+            except Exception as e:
+                logger.warning(f"⚠️ 流式 React Agent 关闭失败: {e}")
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _react_agent_stream(scope, receive, send):
+    """在服务器事件循环上处理 React Agent 流式请求（SSE）"""
+    query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    args = {key: values[0] for key, values in query.items()}
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+        ],
+    })
+
+    async def stream():
+        try:
+            validated_data = parse_react_stream_args(args)
+        except ValueError as ve:
+            await send({"type": "http.response.body", "body": format_sse_error(str(ve)).encode("utf-8"),
+                        "more_body": True})
+            return
+
+        logger.info(f"📨 收到React Agent流式请求 - User: {validated_data['user_id']}, Question: {validated_data['question'][:50]}...")
+        async for event in react_agent_stream_events(validated_data):
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    # 客户端断开时取消Agent执行
+    stream_task = asyncio.create_task(stream())
+    disconnect_task = asyncio.create_task(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait({stream_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+        if stream_task in done:
+            stream_task.result()
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            logger.info("客户端已断开，取消React Agent流式处理")
+    except Exception as e:
+        logger.error(f"React Agent流式API异常: {str(e)}")
+        await send({"type": "http.response.body", "body": format_sse_error(f"服务异常: {str(e)}").encode("utf-8"),
+                    "more_body": False})
+    finally:
+        for task in (stream_task, disconnect_task):
+            if not task.done():
+                task.cancel()
+
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif (scope["type"] == "http" and scope["path"] == REACT_AGENT_STREAM_PATH
+          and scope["method"] == "GET"):
+        await _react_agent_stream(scope, receive, send)
+    else:
+        await flask_asgi_app(scope, receive, send)
 
 # 启动方式示例：
 # 开发环境（单进程 + 重载）：
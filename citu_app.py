@@ -19,6 +19,9 @@ import sqlparse  # 用于SQL语法检查
 from common.redis_conversation_manager import RedisConversationManager  # 添加Redis对话管理器导入
 
 from common.qa_feedback_manager import QAFeedbackManager
+from common.columnar_result import to_jsonable
+from common.business_db import run_business_sql, QueryBusyError, QueryTimeoutError
+from common.messages import ErrorType
 from common.result import (  # 统一导入所有需要的响应函数
     success_response, bad_request_response, not_found_response, internal_error_response,
     error_response, service_unavailable_response, 
@@ -190,7 +193,8 @@ def citu_run_sql():
         )), 400
     
     try:
-        df = vn.run_sql(sql)
+        # 带statement_timeout和并发限制执行
+        df = run_business_sql(sql, user_id=req.get('user_id'))
         
         # 处理返回数据 - 使用新的query_result结构
         query_result = {
@@ -221,6 +225,21 @@ def citu_run_sql():
             }
         ))
         
+    except QueryBusyError as e:
+        logger.warning(f"citu_run_sql数据库繁忙({e.reason}): {str(e)}")
+        return jsonify(service_unavailable_response(
+            response_text=str(e),
+            can_retry=True
+        )), 503
+        
+    except QueryTimeoutError as e:
+        logger.warning(f"citu_run_sql执行超时: {str(e)}")
+        return jsonify(error_response(
+            response_text="SQL执行超时，请缩小查询范围后重试",
+            error_type=ErrorType.SQL_STATEMENT_TIMEOUT,
+            code=504
+        )), 504
+        
     except Exception as e:
         logger.error(f"citu_run_sql执行失败: {str(e)}")
         from common.result import internal_error_response
@@ -637,6 +656,8 @@ def ask_agent():
             context_type=context_type,  # 传递上下文类型
             routing_mode=effective_routing_mode  # 新增：传递路由模式
         ))
+        # 列式查询结果在响应边界统一转换为JSON结构
+        agent_result = to_jsonable(agent_result)
         
         # 8. 处理Agent结果
         if agent_result.get("success", False):
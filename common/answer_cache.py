@@ -0,0 +1,285 @@
+"""
+ask_agent 答案缓存
+
+- 缓存键：路由模式 + 规范化后的问题（只缓存/使用无对话上下文的请求）
+- 只缓存 DATABASE 类型的答案；CHAT 答案由LLM直接生成（可能与时间相关），不缓存
+- 数据新鲜度：缓存条目记录答案SQL涉及的表及其数据版本（pg_stat_user_tables 的增删改计数），
+  读取时版本不一致即视为失效；无法获取版本、或有表不在 pg_stat_user_tables 中（视图、带引号的
+  大小写混合表名等）时退化为按时间分桶（最长 fresh_ttl 后失效）
+- stale-while-revalidate：超过新鲜期但仍在可用期内的答案直接返回，同时在后台刷新；
+  后台刷新按问题单飞（SingleFlight），同一问题同时只有一个刷新在执行。
+  前台相同请求的合并由 common.request_coalescer 负责
+"""
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import app_config
+from common.columnar_result import json_default
+from core.logging import get_app_logger
+
+logger = get_app_logger("AnswerCache")
+
+# 数据版本：每张用户表的增删改累计次数
+_TABLE_VERSION_SQL = """
+SELECT schemaname, relname, n_tup_ins + n_tup_upd + n_tup_del
+FROM pg_stat_user_tables
+"""
+
+# 缓存中不保留的字段（与具体一次执行相关）
+_VOLATILE_FIELDS = ("query_profile", "conversation_id", "user_id")
+
+
+class DataVersionTracker:
+    """业务表数据版本快照（按间隔刷新）"""
+
+    def __init__(self, refresh_interval: float = 30):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._versions: Optional[Dict[str, int]] = None
+        self._loaded_at = 0.0
+
+    def _load(self) -> Optional[Dict[str, int]]:
+        from common.business_db import run_business_sql
+
+        try:
+            # 主库的统计信息才反映最新写入
+            df = run_business_sql(_TABLE_VERSION_SQL, prefer_primary=True)
+        except Exception as e:
+            logger.warning(f"获取表数据版本失败，答案缓存退化为按时间分桶: {e}")
+            return None
+        versions = {}
+        if df is not None:
+            for schema, table, version in df.itertuples(index=False):
+                version = int(version or 0)
+                versions[f"{schema}.{table}".lower()] = version
+                # 未限定schema的引用按表名匹配（多个schema同名表时取版本和）
+                versions[str(table).lower()] = versions.get(str(table).lower(), 0) + version
+        return versions
+
+    def get_versions(self) -> Optional[Dict[str, int]]:
+        now = time.time()
+        if self._versions is not None and now - self._loaded_at < self.refresh_interval:
+            return self._versions
+        with self._lock:
+            if self._versions is None or now - self._loaded_at >= self.refresh_interval:
+                self._versions = self._load()
+                self._loaded_at = now
+            return self._versions
+
+
+class SingleFlight:
+    """同一key的并发调用只执行一次，其余调用等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._inflight
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (结果, 是否共享了其他调用的结果)
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            return future.result(timeout=timeout), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class AgentAnswerCache:
+    """ask_agent 答案缓存"""
+
+    def __init__(self, redis_client, fresh_ttl: float, stale_ttl: float,
+                 version_check_interval: float = 30, single_flight_timeout: float = 120):
+        self.redis_client = redis_client
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.single_flight_timeout = single_flight_timeout
+        self.versions = DataVersionTracker(version_check_interval)
+        self.single_flight = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "invalidated": 0,
+                       "shared_results": 0, "revalidations": 0}
+
+    # ==================== 键与新鲜度 ====================
+
+    @staticmethod
+    def make_key(question: str, routing_mode: str) -> str:
+        from agent.classification_cache import normalize_question
+
+        question_hash = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()[:20]
+        return f"agent_answer:{routing_mode}:{question_hash}"
+
+    @staticmethod
+    def _referenced_tables(answer: Dict[str, Any]) -> List[str]:
+        sql = answer.get("sql")
+        if not sql:
+            return []
+        try:
+            from common.schema_catalog import extract_sql_references
+            references = extract_sql_references(sql)
+        except Exception:
+            return []
+        tables = set()
+        for schema, table in references["tables"]:
+            if table in references["ctes"]:
+                continue
+            tables.add(f"{schema}.{table}" if schema else table)
+        return sorted(tables)
+
+    def freshness_token(self, tables: List[str]) -> str:
+        """根据表数据版本生成新鲜度标记；不涉及表、版本不可用或有表没有版本时按时间分桶"""
+        versions = self.versions.get_versions() if tables else None
+        if versions is None or any(t.lower() not in versions for t in tables):
+            return f"t:{int(time.time() // self.fresh_ttl)}"
+        fingerprint = ",".join(f"{t}={versions[t.lower()]}" for t in tables)
+        return "v:" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    # ==================== 读写 ====================
+
+    def lookup(self, question: str, routing_mode: str) -> Optional[Tuple[Dict[str, Any], bool]]:
+        """
+        查找缓存答案
+
+        Returns:
+            (答案, 是否已过新鲜期)；未命中或数据已变化时返回None
+        """
+        key = self.make_key(question, routing_mode)
+        try:
+            raw = self.redis_client.get(key)
+        except Exception as e:
+            logger.warning(f"读取答案缓存失败: {e}")
+            return None
+        if not raw:
+            self._count("misses")
+            return None
+
+        entry = json.loads(raw)
+        if self.freshness_token(entry.get("tables", [])) != entry.get("freshness_token"):
+            # 相关表数据已变化，答案不可再用
+            self._count("invalidated")
+            try:
+                self.redis_client.delete(key)
+            except Exception:
+                pass
+            return None
+
+        stale = time.time() - entry.get("cached_at", 0) > self.fresh_ttl
+        self._count("stale_hits" if stale else "hits")
+        return entry["answer"], stale
+
+    def store(self, question: str, routing_mode: str, answer: Dict[str, Any]):
+        """缓存成功的 DATABASE 答案"""
+        if not answer or not answer.get("success") or answer.get("type") != "DATABASE":
+            return
+        tables = self._referenced_tables(answer)
+        entry = {
+            "answer": {k: v for k, v in answer.items() if k not in _VOLATILE_FIELDS},
+            "tables": tables,
+            "freshness_token": self.freshness_token(tables),
+            "cached_at": time.time(),
+            "original_question": question,
+        }
+        try:
+            self.redis_client.setex(
+                self.make_key(question, routing_mode),
+                int(self.fresh_ttl + self.stale_ttl),
+                json.dumps(entry, ensure_ascii=False, default=json_default)
+            )
+        except Exception as e:
+            logger.warning(f"写入答案缓存失败: {e}")
+
+    # ==================== 计算 ====================
+
+    def compute(self, question: str, routing_mode: str, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """单飞执行Agent流程，成功时写入缓存；等待其他请求的结果时返回其浅拷贝"""
+        key = self.make_key(question, routing_mode)
+
+        def run():
+            answer = fn()
+            self.store(question, routing_mode, answer)
+            return answer
+
+        answer, shared = self.single_flight.do(key, run, timeout=self.single_flight_timeout)
+        if shared:
+            self._count("shared_results")
+            logger.info(f"相同问题正在处理中，共享其结果: {question[:50]}")
+            return dict(answer)
+        return answer
+
+    def revalidate_in_background(self, question: str, routing_mode: str, fn: Callable[[], Dict[str, Any]]):
+        """后台刷新过期答案（同一问题已有刷新或计算在进行时跳过）"""
+        key = self.make_key(question, routing_mode)
+        if self.single_flight.in_flight(key):
+            return
+
+        def worker():
+            try:
+                self.compute(question, routing_mode, fn)
+            except Exception as e:
+                logger.warning(f"后台刷新答案缓存失败: {e}")
+
+        self._count("revalidations")
+        threading.Thread(target=worker, name="answer-cache-revalidate", daemon=True).start()
+
+    def clear(self) -> int:
+        """清空所有答案缓存，返回删除的键数量"""
+        deleted = 0
+        for key in self.redis_client.scan_iter(match="agent_answer:*", count=500):
+            deleted += self.redis_client.delete(key)
+        return deleted
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"fresh_ttl": self.fresh_ttl, "stale_ttl": self.stale_ttl, **self._stats}
+
+
+_answer_cache: Optional[AgentAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(redis_client) -> Optional[AgentAnswerCache]:
+    """获取答案缓存；未启用或Redis不可用时返回None"""
+    global _answer_cache
+
+    if not getattr(app_config, 'ENABLE_AGENT_ANSWER_CACHE', False) or redis_client is None:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AgentAnswerCache(
+                    redis_client,
+                    fresh_ttl=getattr(app_config, 'AGENT_ANSWER_CACHE_FRESH_TTL', 300),
+                    stale_ttl=getattr(app_config, 'AGENT_ANSWER_CACHE_STALE_TTL', 3600),
+                    version_check_interval=getattr(app_config, 'AGENT_ANSWER_CACHE_VERSION_CHECK_INTERVAL', 30),
+                    single_flight_timeout=getattr(app_config, 'AGENT_ANSWER_CACHE_SINGLE_FLIGHT_TIMEOUT', 120),
+                )
+    return _answer_cache
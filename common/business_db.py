@@ -0,0 +1,484 @@
+"""
+业务数据库查询执行器
+
+为生成的业务SQL提供统一的执行入口：
+- 每条SQL通过 SET LOCAL statement_timeout 限制执行时间（兼容pgbouncer事务池模式）
+- 进程级并发限制（同步/异步共用同一个信号量），排队深度超限或等待超时时快速返回"繁忙"
+- 按 user_id 的并发上限，以及排队等待时间等指标
+- 只读的 SELECT/WITH 查询按 db_replica_router 路由到健康的只读副本
+- 按 query_profiler 记录排队/连接/执行/获取/DataFrame转换耗时
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+import app_config
+from common.db_replica_router import get_replica_router, is_read_only_sql
+from common.query_profiler import (
+    QueryProfile, apply_explain_analyze, elapsed_ms, estimate_result_bytes,
+    get_slow_query_report, is_profiling_enabled, record_profile, should_sample_explain,
+)
+from common.tracing import current_span, traced
+from core.logging import get_app_logger
+
+logger = get_app_logger("BusinessDB")
+
+# 当前请求所属用户，供无法直接传递 user_id 的工具调用链使用
+_current_query_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "business_db_query_user", default=None
+)
+
+# 异步等待执行槽位时的轮询间隔（秒）
+_ASYNC_POLL_INTERVAL = 0.02
+
+
+class QueryBusyError(Exception):
+    """业务数据库繁忙（排队已满、用户并发超限或等待超时）"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class QueryTimeoutError(Exception):
+    """SQL执行超过 statement_timeout 被数据库取消"""
+
+
+@contextmanager
+def bind_query_user(user_id: Optional[str]):
+    """在当前上下文中绑定发起查询的用户，供并发限制按用户计数"""
+    token = _current_query_user.set(user_id)
+    try:
+        yield
+    finally:
+        try:
+            _current_query_user.reset(token)
+        except ValueError:
+            # 生成器在其他上下文中被关闭时无法reset，直接清空
+            _current_query_user.set(None)
+
+
+def get_query_user() -> Optional[str]:
+    """获取当前上下文绑定的用户"""
+    return _current_query_user.get()
+
+
+class QueryConcurrencyLimiter:
+    """业务SQL并发限制器（同步和异步调用共享同一组槽位）"""
+
+    def __init__(self, max_concurrent: int, max_queue_depth: int, queue_timeout: float,
+                 max_per_user: Optional[int] = None, metrics_window: int = 1000,
+                 user_limit_exempt: Optional[set] = None):
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        # 不受单用户上限约束的用户（匿名用户共用一个ID，按用户计数会让所有匿名请求共享一个上限）
+        self.user_limit_exempt = set(user_limit_exempt or ())
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._user_inflight: Dict[str, int] = {}
+        self._wait_times = deque(maxlen=metrics_window)
+        self._counters = {
+            "total_acquired": 0,
+            "rejected_queue_full": 0,
+            "rejected_user_limit": 0,
+            "rejected_wait_timeout": 0,
+        }
+
+    # ==================== 内部计数 ====================
+
+    def _limit_key(self, user_id: Optional[str]) -> Optional[str]:
+        """单用户上限的计数键；匿名等豁免用户返回None（只受全局并发和排队限制）"""
+        if not user_id or user_id in self.user_limit_exempt:
+            return None
+        return user_id
+
+    def _reserve(self, user_id: Optional[str]):
+        """登记一个排队请求；超出排队深度或用户上限时直接拒绝"""
+        with self._lock:
+            if self.max_per_user and user_id:
+                if self._user_inflight.get(user_id, 0) >= self.max_per_user:
+                    self._counters["rejected_user_limit"] += 1
+                    raise QueryBusyError(
+                        f"当前用户同时执行的查询已达上限({self.max_per_user})，请稍后重试",
+                        reason="user_limit"
+                    )
+            if self._active >= self.max_concurrent and self._waiting >= self.max_queue_depth:
+                self._counters["rejected_queue_full"] += 1
+                raise QueryBusyError("数据库繁忙，查询排队已满，请稍后重试", reason="queue_full")
+
+            self._waiting += 1
+            if user_id:
+                self._user_inflight[user_id] = self._user_inflight.get(user_id, 0) + 1
+
+    def _on_acquired(self, wait_seconds: float):
+        with self._lock:
+            self._waiting -= 1
+            self._active += 1
+            self._counters["total_acquired"] += 1
+            self._wait_times.append(wait_seconds)
+
+    def _on_wait_failed(self, user_id: Optional[str], timed_out: bool):
+        with self._lock:
+            self._waiting -= 1
+            self._release_user(user_id)
+            if timed_out:
+                self._counters["rejected_wait_timeout"] += 1
+
+    def _on_released(self, user_id: Optional[str]):
+        with self._lock:
+            self._active -= 1
+            self._release_user(user_id)
+        self._semaphore.release()
+
+    def _release_user(self, user_id: Optional[str]):
+        if not user_id or user_id not in self._user_inflight:
+            return
+        self._user_inflight[user_id] -= 1
+        if self._user_inflight[user_id] <= 0:
+            del self._user_inflight[user_id]
+
+    def _busy_timeout_error(self) -> QueryBusyError:
+        return QueryBusyError(
+            f"数据库繁忙，等待执行超过 {self.queue_timeout} 秒，请稍后重试",
+            reason="wait_timeout"
+        )
+
+    # ==================== 槽位获取 ====================
+
+    @contextmanager
+    def slot(self, user_id: Optional[str] = None):
+        """同步获取执行槽位，yield 排队等待时间（秒）"""
+        user_id = self._limit_key(user_id)
+        self._reserve(user_id)
+        start = time.perf_counter()
+        try:
+            acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+        except BaseException:
+            self._on_wait_failed(user_id, timed_out=False)
+            raise
+        if not acquired:
+            self._on_wait_failed(user_id, timed_out=True)
+            raise self._busy_timeout_error()
+
+        wait_seconds = time.perf_counter() - start
+        self._on_acquired(wait_seconds)
+        try:
+            yield wait_seconds
+        finally:
+            self._on_released(user_id)
+
+    async def aacquire(self, user_id: Optional[str] = None) -> Tuple[float, Callable[[], None]]:
+        """
+        异步获取执行槽位（不阻塞事件循环）
+
+        Returns:
+            (排队等待时间（秒）, 释放槽位的函数)；释放函数可以在任意线程调用，重复调用只释放一次
+        """
+        user_id = self._limit_key(user_id)
+        self._reserve(user_id)
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        try:
+            while not self._semaphore.acquire(blocking=False):
+                if time.perf_counter() >= deadline:
+                    self._on_wait_failed(user_id, timed_out=True)
+                    raise self._busy_timeout_error()
+                await asyncio.sleep(_ASYNC_POLL_INTERVAL)
+        except asyncio.CancelledError:
+            self._on_wait_failed(user_id, timed_out=False)
+            raise
+
+        wait_seconds = time.perf_counter() - start
+        self._on_acquired(wait_seconds)
+        release_lock = threading.Lock()
+        released = False
+
+        def release():
+            nonlocal released
+            with release_lock:
+                if released:
+                    return
+                released = True
+            self._on_released(user_id)
+
+        return wait_seconds, release
+
+    @asynccontextmanager
+    async def aslot(self, user_id: Optional[str] = None):
+        """
+        异步获取执行槽位，yield 排队等待时间（秒）
+
+        退出时即释放槽位；在线程中执行查询时使用 aacquire，由线程结束时释放
+        （等待的任务被取消后查询仍在线程中运行，不能提前释放）
+        """
+        wait_seconds, release = await self.aacquire(user_id)
+        try:
+            yield wait_seconds
+        finally:
+            release()
+
+    # ==================== 指标 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发和排队等待指标"""
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            stats = {
+                "max_concurrent": self.max_concurrent,
+                "max_queue_depth": self.max_queue_depth,
+                "queue_timeout": self.queue_timeout,
+                "max_per_user": self.max_per_user,
+                "active": self._active,
+                "waiting": self._waiting,
+                "active_users": len(self._user_inflight),
+                **self._counters,
+            }
+
+        if wait_times:
+            stats["queue_wait_ms"] = {
+                "samples": len(wait_times),
+                "avg": round(sum(wait_times) / len(wait_times) * 1000, 2),
+                "p50": round(wait_times[len(wait_times) // 2] * 1000, 2),
+                "p95": round(wait_times[min(len(wait_times) - 1, int(len(wait_times) * 0.95))] * 1000, 2),
+                "max": round(wait_times[-1] * 1000, 2),
+            }
+        else:
+            stats["queue_wait_ms"] = {"samples": 0}
+        return stats
+
+
+# 全局限制器（懒加载单例，线程安全）
+_query_limiter: Optional[QueryConcurrencyLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_query_limiter() -> QueryConcurrencyLimiter:
+    """获取进程级业务SQL并发限制器"""
+    global _query_limiter
+
+    if _query_limiter is None:
+        with _limiter_lock:
+            if _query_limiter is None:
+                _query_limiter = QueryConcurrencyLimiter(
+                    max_concurrent=getattr(app_config, 'BUSINESS_DB_MAX_CONCURRENT_QUERIES', 8),
+                    max_queue_depth=getattr(app_config, 'BUSINESS_DB_MAX_QUEUE_DEPTH', 16),
+                    queue_timeout=getattr(app_config, 'BUSINESS_DB_QUEUE_TIMEOUT', 15),
+                    max_per_user=getattr(app_config, 'BUSINESS_DB_MAX_QUERIES_PER_USER', 2),
+                    user_limit_exempt={getattr(app_config, 'DEFAULT_ANONYMOUS_USER', 'guest')},
+                )
+                logger.info(f"业务SQL并发限制器初始化: 并发={_query_limiter.max_concurrent}, "
+                            f"排队={_query_limiter.max_queue_depth}, 单用户={_query_limiter.max_per_user}")
+    return _query_limiter
+
+
+def _execute_query(sql: str, statement_timeout: Optional[float],
+                   db_config: Optional[Dict[str, Any]] = None,
+                   profile: Optional[QueryProfile] = None) -> Optional[pd.DataFrame]:
+    """在业务数据库上执行SQL（独立连接，执行后回滚并关闭）"""
+    import psycopg2
+    from psycopg2 import errors as pg_errors
+
+    start = time.perf_counter()
+    conn = psycopg2.connect(
+        **(db_config or app_config.APP_DB_CONFIG),
+        connect_timeout=getattr(app_config, 'BUSINESS_DB_CONNECT_TIMEOUT', 10)
+    )
+    if profile:
+        profile.connect_ms = elapsed_ms(start)
+    try:
+        with conn.cursor() as cursor:
+            if statement_timeout:
+                # SET LOCAL 只在当前事务内生效，不会污染pgbouncer复用的服务端连接
+                cursor.execute("SET LOCAL statement_timeout = %s", (int(statement_timeout * 1000),))
+            start = time.perf_counter()
+            try:
+                cursor.execute(sql)
+            except pg_errors.QueryCanceled as e:
+                raise QueryTimeoutError(f"SQL执行超过 {statement_timeout} 秒被取消: {e}") from e
+            if profile:
+                # psycopg2 默认客户端游标：execute 包含服务端执行和结果集传输
+                profile.execute_ms = elapsed_ms(start)
+
+            if cursor.description is None:
+                return None
+            columns = [desc[0] for desc in cursor.description]
+            start = time.perf_counter()
+            rows = cursor.fetchall()
+            if profile:
+                profile.fetch_ms = elapsed_ms(start)
+
+            start = time.perf_counter()
+            df = pd.DataFrame(rows, columns=columns)
+            if profile:
+                profile.dataframe_ms = elapsed_ms(start)
+                profile.row_count = len(rows)
+                profile.result_bytes = estimate_result_bytes(rows)
+                _sample_explain(cursor, sql, profile)
+            return df
+    finally:
+        try:
+            conn.rollback()
+        finally:
+            conn.close()
+
+
+def _sample_explain(cursor, sql: str, profile: QueryProfile):
+    """按采样比例对只读查询执行 EXPLAIN ANALYZE，获取服务端规划/执行时间（失败不影响查询结果）"""
+    if not should_sample_explain() or not is_read_only_sql(sql):
+        return
+    try:
+        cursor.execute("SAVEPOINT query_profile_explain")
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql.strip().rstrip(';')}")
+        apply_explain_analyze(profile, cursor.fetchone()[0])
+        cursor.execute("RELEASE SAVEPOINT query_profile_explain")
+    except Exception as e:
+        logger.debug(f"EXPLAIN ANALYZE 采样失败: {e}")
+        try:
+            cursor.execute("ROLLBACK TO SAVEPOINT query_profile_explain")
+        except Exception:
+            pass
+
+
+def _execute_routed(sql: str, statement_timeout: Optional[float],
+                    prefer_primary: bool = False,
+                    profile: Optional[QueryProfile] = None) -> Optional[pd.DataFrame]:
+    """按只读副本路由执行SQL，副本连接失败时回退到主库"""
+    import psycopg2
+
+    router = get_replica_router()
+    db_config, replica = router.choose(sql, prefer_primary=prefer_primary)
+    if replica is None:
+        return _execute_query(sql, statement_timeout, db_config, profile)
+
+    if profile:
+        profile.target = replica.name
+    try:
+        return _execute_query(sql, statement_timeout, db_config, profile)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        # 连接类错误说明副本不可用，标记后回退主库；SQL本身的错误（语法、超时等）直接抛出
+        logger.warning(f"副本 {replica.name} 执行失败，回退到主库: {e}")
+        router.record_failover(replica, e)
+        if profile:
+            profile.target = "primary"
+            profile.extra["replica_failover"] = replica.name
+        return _execute_query(sql, statement_timeout, app_config.APP_DB_CONFIG, profile)
+
+
+def _start_profile(sql: str, user_id: Optional[str], wait_seconds: float) -> Optional[QueryProfile]:
+    if not is_profiling_enabled():
+        return None
+    profile = QueryProfile(sql, user_id)
+    profile.queue_wait_ms = round(wait_seconds * 1000, 2)
+    return profile
+
+
+def _finish_profile(profile: Optional[QueryProfile], start: float, error: Optional[Exception] = None):
+    if profile is None:
+        return
+    profile.total_ms = round(elapsed_ms(start) + (profile.queue_wait_ms or 0), 2)
+    if error is not None:
+        profile.error = type(error).__name__
+    record_profile(profile)
+
+
+def _resolve_timeout(statement_timeout: Optional[float]) -> Optional[float]:
+    if statement_timeout is None:
+        return getattr(app_config, 'BUSINESS_DB_STATEMENT_TIMEOUT', None)
+    return statement_timeout
+
+
+@traced("db.business_sql")
+def run_business_sql(sql: str, user_id: Optional[str] = None,
+                     statement_timeout: Optional[float] = None,
+                     prefer_primary: bool = False) -> Optional[pd.DataFrame]:
+    """
+    在并发限制和 statement_timeout 保护下执行业务SQL
+
+    Args:
+        sql: 要执行的SQL
+        user_id: 发起查询的用户，默认使用当前上下文绑定的用户
+        statement_timeout: 执行超时（秒），默认使用 BUSINESS_DB_STATEMENT_TIMEOUT
+        prefer_primary: 强制在主库执行；否则只读SELECT/WITH会路由到健康的只读副本
+
+    Returns:
+        查询结果DataFrame；语句不返回结果集时为None
+
+    Raises:
+        QueryBusyError: 数据库繁忙
+        QueryTimeoutError: SQL执行超时
+    """
+    user_id = user_id or get_query_user()
+    with get_query_limiter().slot(user_id) as wait_seconds:
+        if wait_seconds > 1:
+            logger.info(f"业务SQL排队等待 {wait_seconds:.2f}s (user={user_id})")
+        current_span().set_attribute("db.queue_wait_ms", round(wait_seconds * 1000, 3))
+        profile = _start_profile(sql, user_id, wait_seconds)
+        start = time.perf_counter()
+        try:
+            result = _execute_routed(sql, _resolve_timeout(statement_timeout), prefer_primary, profile)
+        except Exception as e:
+            _finish_profile(profile, start, e)
+            raise
+        _finish_profile(profile, start)
+        return result
+
+
+@traced("db.business_sql")
+async def arun_business_sql(sql: str, user_id: Optional[str] = None,
+                            statement_timeout: Optional[float] = None,
+                            prefer_primary: bool = False) -> Optional[pd.DataFrame]:
+    """run_business_sql 的异步版本：排队不阻塞事件循环，执行放到线程中"""
+    user_id = user_id or get_query_user()
+    wait_seconds, release = await get_query_limiter().aacquire(user_id)
+    try:
+        if wait_seconds > 1:
+            logger.info(f"业务SQL排队等待 {wait_seconds:.2f}s (user={user_id})")
+        current_span().set_attribute("db.queue_wait_ms", round(wait_seconds * 1000, 3))
+        profile = _start_profile(sql, user_id, wait_seconds)
+        timeout = _resolve_timeout(statement_timeout)
+
+        def execute():
+            # 槽位在查询线程结束时释放：调用方被取消（客户端断开、超时）时查询仍在运行，仍占用并发配额
+            try:
+                return _execute_routed(sql, timeout, prefer_primary, profile)
+            finally:
+                release()
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, execute)
+    except BaseException:
+        release()
+        raise
+    # 调用方被取消时不再读取结果，避免线程中的异常被报告为未读取
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    try:
+        # shield：取消等待不会取消已提交但尚未开始的查询，保证 execute 一定运行并释放槽位
+        result = await asyncio.shield(future)
+    except Exception as e:
+        _finish_profile(profile, start, e)
+        raise
+    _finish_profile(profile, start)
+    return result
+
+
+def get_business_db_stats() -> Dict[str, Any]:
+    """获取业务数据库查询保护的统计信息"""
+    return {
+        "statement_timeout": _resolve_timeout(None),
+        "limiter": get_query_limiter().get_stats(),
+        "replica_routing": get_replica_router().get_status(),
+        "slow_queries": get_slow_query_report().get_summary(),
+    }
@@ -0,0 +1,232 @@
+"""
+列式查询结果对象
+
+SQL执行结果以列式结构（优先使用 pyarrow.Table，不可用时退化为 NumPy 数组）在
+执行 → 摘要 → 响应格式化之间传递，避免逐行构建 Python 字典。
+只有在API边界（Flask jsonify / SSE / 缓存写入）才统一转换为JSON兼容的 rows 结构，
+客户端也可以通过 Accept: application/vnd.apache.arrow.stream 直接获取 Arrow IPC 流。
+"""
+
+import datetime
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.logging import get_app_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+    pa_ipc = None
+
+logger = get_app_logger("ColumnarResult")
+
+# Arrow IPC 流的MIME类型
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+
+
+def to_json_value(value: Any) -> Any:
+    """将单个单元格值转换为JSON兼容的值"""
+    if value is None:
+        return None
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        # pyarrow duration 列返回 datetime.timedelta，保持与 pandas 一致的字符串格式
+        return str(pd.Timedelta(value))
+    if isinstance(value, (int, float, str, bool)):
+        return value
+    return str(value)
+
+
+class ColumnarResult:
+    """
+    列式查询结果
+
+    兼容原 data_result/query_result 字典的读取方式（get / [] / in），
+    rows 只在首次访问时才物化为JSON兼容的行列表。
+    """
+
+    _KEYS = ("rows", "columns", "row_count", "total_row_count", "is_limited")
+
+    def __init__(self, columns: List[Any], table=None, arrays: Optional[List[np.ndarray]] = None,
+                 row_count: int = 0, total_row_count: Optional[int] = None, message: Optional[str] = None):
+        self.columns = list(columns)
+        self._table = table
+        self._arrays = arrays
+        self.row_count = row_count
+        self.total_row_count = total_row_count if total_row_count is not None else row_count
+        self.is_limited = self.total_row_count > self.row_count
+        self.message = message
+        self._rows_cache: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, max_rows: Optional[int] = None,
+                       message: Optional[str] = None) -> "ColumnarResult":
+        """从DataFrame构建列式结果，超出 max_rows 的部分被截断"""
+        total_rows = len(df)
+        limited_df = df.head(max_rows) if max_rows is not None else df
+        columns = list(df.columns)
+
+        table = None
+        arrays = None
+        if pa is not None:
+            try:
+                table = pa.Table.from_pandas(limited_df, preserve_index=False)
+            except Exception as e:
+                # 混合类型列、重复列名等情况无法转换为Arrow，退化为NumPy数组
+                logger.debug(f"DataFrame转换为Arrow失败，使用NumPy数组: {e}")
+                table = None
+        if table is None:
+            arrays = [limited_df.iloc[:, i].to_numpy() for i in range(limited_df.shape[1])]
+
+        return cls(
+            columns=columns,
+            table=table,
+            arrays=arrays,
+            row_count=len(limited_df),
+            total_row_count=total_rows,
+            message=message,
+        )
+
+    @classmethod
+    def from_query_result(cls, query_result: Dict[str, Any]) -> "ColumnarResult":
+        """
+        从JSON形式的 query_result 字典（答案缓存、跨进程共享的结果）重建列式结果
+
+        单元格已是JSON值（时间等类型为字符串），列类型按JSON值推断。
+        """
+        columns = list(query_result.get("columns") or [])
+        df = pd.DataFrame(query_result.get("rows") or [], columns=columns)
+        result = cls.from_dataframe(df, message=query_result.get("message"))
+        result.total_row_count = query_result.get("total_row_count", result.row_count)
+        result.is_limited = result.total_row_count > result.row_count
+        return result
+
+    @property
+    def backend(self) -> str:
+        """当前的列式存储后端: arrow 或 numpy"""
+        return "arrow" if self._table is not None else "numpy"
+
+    # ==================== 字典兼容接口 ====================
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "rows":
+            return self.rows
+        if key == "message":
+            return self.message if self.message is not None else default
+        if key in self._KEYS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS or (key == "message" and self.message is not None)
+
+    def __repr__(self) -> str:
+        return (f"ColumnarResult(backend={self.backend}, columns={len(self.columns)}, "
+                f"row_count={self.row_count}, total_row_count={self.total_row_count})")
+
+    # ==================== 数据访问 ====================
+
+    def _column_values(self, index: int) -> list:
+        """获取单列的Python值列表"""
+        if self._table is not None:
+            return self._table.column(index).to_pylist()
+        # 通过pandas转换，保证datetime64等类型得到Timestamp而不是整数
+        return pd.Series(self._arrays[index], copy=False).tolist()
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        """JSON兼容的行列表（按需物化，只转换一次）"""
+        if self._rows_cache is None:
+            if self.row_count == 0 or not self.columns:
+                self._rows_cache = []
+            else:
+                converted_columns = [
+                    [to_json_value(v) for v in self._column_values(i)]
+                    for i in range(len(self.columns))
+                ]
+                self._rows_cache = [
+                    dict(zip(self.columns, values)) for values in zip(*converted_columns)
+                ]
+        return self._rows_cache
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """转换为DataFrame（供摘要生成等使用，不经过逐行字典）"""
+        if self.row_count == 0 or not self.columns:
+            return pd.DataFrame()
+        if self._table is not None:
+            return self._table.to_pandas()
+        df = pd.DataFrame({i: arr for i, arr in enumerate(self._arrays)}, copy=False)
+        df.columns = self.columns
+        return df
+
+    def to_query_result(self) -> Dict[str, Any]:
+        """转换为原有的JSON兼容 query_result 字典"""
+        result = {
+            "rows": self.rows,
+            "columns": self.columns,
+            "row_count": self.row_count,
+            "total_row_count": self.total_row_count,
+            "is_limited": self.is_limited,
+        }
+        if self.message is not None:
+            result["message"] = self.message
+        return result
+
+    def to_arrow_ipc(self, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+        """
+        序列化为 Arrow IPC 流
+
+        Args:
+            metadata: 附加到schema上的元数据（值会被JSON编码）
+
+        Raises:
+            RuntimeError: pyarrow 不可用或结果无法转换为Arrow
+        """
+        if pa is None:
+            raise RuntimeError("pyarrow未安装，无法输出Arrow IPC流")
+
+        table = self._table
+        if table is None:
+            table = pa.Table.from_pandas(self.to_dataframe(), preserve_index=False)
+
+        if metadata:
+            schema_metadata = dict(table.schema.metadata or {})
+            for key, value in metadata.items():
+                schema_metadata[str(key)] = json.dumps(value, ensure_ascii=False, default=json_default)
+            table = table.replace_schema_metadata(schema_metadata)
+
+        sink = pa.BufferOutputStream()
+        with pa_ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def json_default(obj: Any) -> Any:
+    """json.dumps 的 default 钩子，在边界处把列式结果转换为JSON结构"""
+    if isinstance(obj, ColumnarResult):
+        return obj.to_query_result()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def to_jsonable(obj: Any) -> Any:
+    """递归地把包含 ColumnarResult 的结构转换为纯JSON结构"""
+    if isinstance(obj, ColumnarResult):
+        return obj.to_query_result()
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    return obj
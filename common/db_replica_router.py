@@ -0,0 +1,236 @@
+"""
+业务数据库只读副本路由
+
+只读的 SELECT/WITH 查询优先路由到健康且复制延迟在阈值内的副本，
+写操作、SQL验证以及无可用副本时仍然使用主库（APP_DB_CONFIG）。
+副本状态由后台线程定期检查（连通性 + pg_is_in_recovery + 复制延迟）。
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import app_config
+from core.logging import get_app_logger
+
+logger = get_app_logger("DBReplicaRouter")
+
+# 只读判断：SELECT/WITH 中可能产生写入的写法（数据修改CTE、SELECT INTO、行锁、序列函数），
+# 出现任一关键字都路由到主库（宁可误判到主库）
+_WRITE_PATTERN = re.compile(
+    r"\b(insert|update|delete|merge|into|nextval|setval|pg_advisory_lock|pg_advisory_xact_lock)\b"
+    r"|\bfor\s+(no\s+key\s+)?(update|share|key\s+share)\b",
+    re.IGNORECASE
+)
+_LINE_COMMENT_PATTERN = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+# 复制延迟查询：WAL已全部回放时延迟为0，否则按最后回放事务时间计算
+_REPLICA_STATUS_SQL = """
+SELECT pg_is_in_recovery(),
+       CASE WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())), 0)
+       END
+"""
+
+
+def is_read_only_sql(sql: str) -> bool:
+    """判断SQL是否为可以路由到副本的只读查询（SELECT/WITH 且不含写操作）"""
+    if not sql:
+        return False
+    cleaned = _BLOCK_COMMENT_PATTERN.sub(" ", sql)
+    cleaned = _LINE_COMMENT_PATTERN.sub(" ", cleaned).strip().rstrip(";").strip()
+    if not cleaned:
+        return False
+    # 多语句一律走主库
+    if ";" in cleaned:
+        return False
+    first_word = cleaned.split(None, 1)[0].lower()
+    if first_word not in ("select", "with"):
+        return False
+    return _WRITE_PATTERN.search(cleaned) is None
+
+
+class ReplicaState:
+    """单个副本的健康状态"""
+
+    def __init__(self, name: str, db_config: Dict[str, Any]):
+        self.name = name
+        self.db_config = db_config
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.consecutive_failures = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class ReplicaRouter:
+    """只读副本路由器"""
+
+    def __init__(self, primary_config: Dict[str, Any], replica_configs: List[Dict[str, Any]],
+                 max_lag_seconds: float = 30, check_interval: float = 15, connect_timeout: int = 5):
+        self.primary_config = primary_config
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.connect_timeout = connect_timeout
+
+        self.replicas: List[ReplicaState] = []
+        for i, replica_config in enumerate(replica_configs or []):
+            # 副本只需配置与主库不同的字段（通常是host/port），其余继承主库配置
+            merged = {**primary_config, **replica_config}
+            merged.pop("name", None)
+            name = replica_config.get("name") or f"replica-{i}@{merged.get('host')}:{merged.get('port')}"
+            self.replicas.append(ReplicaState(name, merged))
+
+        self._lock = threading.Lock()
+        self._rr_index = 0
+        self._checker_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._counters = {"routed_primary": 0, "routed_replica": 0, "replica_unavailable": 0, "replica_failover": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    # ==================== 健康检查 ====================
+
+    def check_replica(self, replica: ReplicaState):
+        """检查单个副本的连通性和复制延迟"""
+        import psycopg2
+
+        try:
+            conn = psycopg2.connect(**replica.db_config, connect_timeout=self.connect_timeout)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(_REPLICA_STATUS_SQL)
+                    in_recovery, lag = cursor.fetchone()
+            finally:
+                conn.close()
+
+            lag = float(lag or 0)
+            with self._lock:
+                replica.lag_seconds = lag
+                replica.last_check = time.time()
+                replica.last_error = None if in_recovery else "节点不处于recovery状态（可能已被提升为主库）"
+                replica.healthy = bool(in_recovery) and lag <= self.max_lag_seconds
+                replica.consecutive_failures = 0
+            if not replica.healthy:
+                logger.warning(f"副本 {replica.name} 不可用于读路由: in_recovery={in_recovery}, lag={lag:.1f}s")
+        except Exception as e:
+            self.mark_unhealthy(replica, str(e))
+
+    def mark_unhealthy(self, replica: ReplicaState, error: str):
+        with self._lock:
+            replica.healthy = False
+            replica.last_check = time.time()
+            replica.last_error = error
+            replica.consecutive_failures += 1
+        logger.warning(f"副本 {replica.name} 健康检查失败: {error}")
+
+    def check_all(self):
+        for replica in self.replicas:
+            self.check_replica(replica)
+
+    def _checker_loop(self):
+        # 启动后立即检查一次，之后按间隔检查；首次检查完成前所有查询走主库
+        while True:
+            try:
+                self.check_all()
+            except Exception as e:
+                logger.error(f"副本健康检查异常: {e}")
+            if self._stop_event.wait(self.check_interval):
+                break
+
+    def start(self):
+        """启动后台健康检查线程"""
+        if not self.enabled or self._checker_thread is not None:
+            return
+        self._checker_thread = threading.Thread(
+            target=self._checker_loop, name="db-replica-health", daemon=True
+        )
+        self._checker_thread.start()
+        logger.info(f"只读副本路由已启用: {[r.name for r in self.replicas]}, 最大延迟={self.max_lag_seconds}s")
+
+    def stop(self):
+        self._stop_event.set()
+
+    # ==================== 路由 ====================
+
+    def choose(self, sql: str, prefer_primary: bool = False):
+        """
+        选择执行SQL的目标库
+
+        Returns:
+            (db_config, replica)：replica为None表示主库
+        """
+        if prefer_primary or not self.enabled or not is_read_only_sql(sql):
+            with self._lock:
+                self._counters["routed_primary"] += 1
+            return self.primary_config, None
+
+        with self._lock:
+            candidates = [
+                r for r in self.replicas
+                if r.healthy and r.lag_seconds is not None and r.lag_seconds <= self.max_lag_seconds
+            ]
+            if not candidates:
+                self._counters["replica_unavailable"] += 1
+                self._counters["routed_primary"] += 1
+                return self.primary_config, None
+
+            replica = candidates[self._rr_index % len(candidates)]
+            self._rr_index += 1
+            self._counters["routed_replica"] += 1
+            return replica.db_config, replica
+
+    def record_failover(self, replica: ReplicaState, error: Exception):
+        """副本执行出现连接错误时标记不健康，由调用方回退到主库"""
+        self.mark_unhealthy(replica, str(error))
+        with self._lock:
+            self._counters["replica_failover"] += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_lag_seconds": self.max_lag_seconds,
+                "check_interval": self.check_interval,
+                "replicas": [r.to_dict() for r in self.replicas],
+                **self._counters,
+            }
+
+
+# 全局路由器（懒加载单例，线程安全）
+_replica_router: Optional[ReplicaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_replica_router() -> ReplicaRouter:
+    """获取业务数据库只读副本路由器"""
+    global _replica_router
+
+    if _replica_router is None:
+        with _router_lock:
+            if _replica_router is None:
+                router = ReplicaRouter(
+                    primary_config=app_config.APP_DB_CONFIG,
+                    replica_configs=getattr(app_config, 'APP_DB_REPLICAS', []),
+                    max_lag_seconds=getattr(app_config, 'BUSINESS_DB_REPLICA_MAX_LAG', 30),
+                    check_interval=getattr(app_config, 'BUSINESS_DB_REPLICA_CHECK_INTERVAL', 15),
+                    connect_timeout=getattr(app_config, 'BUSINESS_DB_CONNECT_TIMEOUT', 10),
+                )
+                router.start()
+                _replica_router = router
+    return _replica_router
@@ -28,6 +28,7 @@ class ErrorType:
     # SQL相关错误
     SQL_GENERATION_FAILED = "sql_generation_failed"
     SQL_EXECUTION_FAILED = "sql_execution_failed"
+    SQL_STATEMENT_TIMEOUT = "sql_statement_timeout"
     
     # 参数相关错误
     MISSING_REQUIRED_PARAMS = "missing_required_params"
@@ -38,4 +39,5 @@ class ErrorType:
     
     # 系统错误
     DATABASE_ERROR = "database_error"
+    DATABASE_BUSY = "database_busy"
     NETWORK_ERROR = "network_error" 
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+业务SQL执行剖析
+
+记录每条业务SQL的耗时分布：排队等待、建立连接、执行（服务端执行+网络传输）、
+结果获取、DataFrame转换，以及结果大小估算；按采样比例对只读查询额外执行
+EXPLAIN (ANALYZE) 获取服务端规划/执行时间。
+剖析结果一方面附加到Agent响应的元数据中，另一方面按SQL指纹聚合为慢SQL报告。
+"""
+
+import contextvars
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import app_config
+from core.logging import get_app_logger
+
+logger = get_app_logger("QueryProfiler")
+
+# 当前请求的剖析结果收集器（列表对象在复制的上下文中共享，线程池/异步任务中同样可见）
+_profile_sink: contextvars.ContextVar[Optional[List["QueryProfile"]]] = contextvars.ContextVar(
+    "query_profile_sink", default=None
+)
+
+_NUMBER_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def fingerprint_sql(sql: str) -> str:
+    """SQL指纹：去掉字面量并规整空白，用于聚合同类查询"""
+    normalized = _STRING_PATTERN.sub("?", sql or "")
+    normalized = _NUMBER_PATTERN.sub("?", normalized)
+    return _WHITESPACE_PATTERN.sub(" ", normalized).strip().rstrip(";").lower()
+
+
+class QueryProfile:
+    """单次SQL执行的剖析数据（耗时单位：毫秒）"""
+
+    def __init__(self, sql: str, user_id: Optional[str] = None):
+        self.sql = sql
+        self.user_id = user_id
+        self.target = "primary"
+        self.queue_wait_ms: Optional[float] = None
+        self.connect_ms: Optional[float] = None
+        self.execute_ms: Optional[float] = None
+        self.fetch_ms: Optional[float] = None
+        self.dataframe_ms: Optional[float] = None
+        self.total_ms: Optional[float] = None
+        self.row_count: Optional[int] = None
+        self.result_bytes: Optional[int] = None
+        self.explain_sampled = False
+        self.server_planning_ms: Optional[float] = None
+        self.server_execution_ms: Optional[float] = None
+        self.shared_blocks_hit: Optional[int] = None
+        self.shared_blocks_read: Optional[int] = None
+        self.error: Optional[str] = None
+        self.timestamp = time.time()
+        self.extra: Dict[str, Any] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "target": self.target,
+            "queue_wait_ms": self.queue_wait_ms,
+            "connect_ms": self.connect_ms,
+            "execute_ms": self.execute_ms,
+            "fetch_ms": self.fetch_ms,
+            "dataframe_ms": self.dataframe_ms,
+            "total_ms": self.total_ms,
+            "row_count": self.row_count,
+            "result_bytes": self.result_bytes,
+            "explain_sampled": self.explain_sampled,
+        }
+        if self.explain_sampled:
+            result.update({
+                "server_planning_ms": self.server_planning_ms,
+                "server_execution_ms": self.server_execution_ms,
+                "shared_blocks_hit": self.shared_blocks_hit,
+                "shared_blocks_read": self.shared_blocks_read,
+            })
+        if self.error:
+            result["error"] = self.error
+        result.update(self.extra)
+        return result
+
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def estimate_result_bytes(rows: list) -> int:
+    """按文本协议粗略估算结果集大小（字节）"""
+    total = 0
+    for row in rows:
+        for value in row:
+            if value is not None:
+                total += len(str(value).encode("utf-8")) if isinstance(value, str) else len(str(value))
+    return total
+
+
+def apply_explain_analyze(profile: QueryProfile, explain_result: Any):
+    """解析 EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) 的结果"""
+    plan_root = explain_result[0] if isinstance(explain_result, list) else explain_result
+    profile.explain_sampled = True
+    profile.server_planning_ms = plan_root.get("Planning Time")
+    profile.server_execution_ms = plan_root.get("Execution Time")
+    plan = plan_root.get("Plan", {})
+    profile.shared_blocks_hit = plan.get("Shared Hit Blocks")
+    profile.shared_blocks_read = plan.get("Shared Read Blocks")
+
+
+class SlowQueryReport:
+    """按SQL指纹聚合的慢SQL统计（内存中，容量受限）"""
+
+    def __init__(self, threshold_ms: float = 3000, max_entries: int = 200):
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_recorded = 0
+
+    def record(self, profile: QueryProfile):
+        if profile.total_ms is None:
+            return
+        with self._lock:
+            self._total_recorded += 1
+            if profile.total_ms < self.threshold_ms:
+                return
+
+            key = fingerprint_sql(profile.sql)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "fingerprint": key,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "last_seen": None,
+                    "slowest": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + profile.total_ms, 2)
+            entry["last_seen"] = profile.timestamp
+            if profile.total_ms >= entry["max_ms"]:
+                entry["max_ms"] = profile.total_ms
+                entry["slowest"] = {"sql": profile.sql, "user_id": profile.user_id, **profile.to_dict()}
+            self._entries.move_to_end(key)
+
+            # 超出容量时淘汰最久未出现的指纹
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def top(self, top_n: int = 20, order_by: str = "max_ms") -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        for entry in entries:
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 2) if entry["count"] else 0
+        if order_by not in ("max_ms", "total_ms", "avg_ms", "count"):
+            order_by = "max_ms"
+        entries.sort(key=lambda e: e[order_by], reverse=True)
+        return entries[:top_n]
+
+    def get_summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold_ms,
+                "fingerprints": len(self._entries),
+                "total_recorded": self._total_recorded,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_recorded = 0
+
+
+_slow_query_report: Optional[SlowQueryReport] = None
+_report_lock = threading.Lock()
+
+
+def get_slow_query_report() -> SlowQueryReport:
+    """获取全局慢SQL报告（懒加载单例）"""
+    global _slow_query_report
+
+    if _slow_query_report is None:
+        with _report_lock:
+            if _slow_query_report is None:
+                _slow_query_report = SlowQueryReport(
+                    threshold_ms=getattr(app_config, 'SLOW_QUERY_THRESHOLD_MS', 3000),
+                    max_entries=getattr(app_config, 'SLOW_QUERY_REPORT_SIZE', 200),
+                )
+    return _slow_query_report
+
+
+def is_profiling_enabled() -> bool:
+    return getattr(app_config, 'ENABLE_QUERY_PROFILING', False)
+
+
+def should_sample_explain() -> bool:
+    """按 QUERY_PROFILE_EXPLAIN_SAMPLE_RATE 决定是否额外执行 EXPLAIN ANALYZE"""
+    rate = getattr(app_config, 'QUERY_PROFILE_EXPLAIN_SAMPLE_RATE', 0) or 0
+    return rate > 0 and random.random() < rate
+
+
+def record_profile(profile: QueryProfile):
+    """记录一次剖析结果：写入当前请求的收集器，并计入慢SQL报告"""
+    sink = _profile_sink.get()
+    if sink is not None:
+        sink.append(profile)
+    get_slow_query_report().record(profile)
+    if profile.total_ms is not None and profile.total_ms >= get_slow_query_report().threshold_ms:
+        logger.warning(f"慢SQL ({profile.total_ms}ms, target={profile.target}): {profile.sql[:200]}")
+
+
+@contextmanager
+def collect_query_profiles():
+    """收集当前上下文中执行的SQL剖析结果，yield 一个列表"""
+    profiles: List[QueryProfile] = []
+    token = _profile_sink.set(profiles)
+    try:
+        yield profiles
+    finally:
+        _profile_sink.reset(token)
+
+
+# ==================== 按线程（会话）暂存 ====================
+# React Agent 的工具结果以消息形式返回给LLM，剖析数据按 thread_id 暂存，在生成API响应时取出
+
+_thread_profiles: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+_thread_profiles_lock = threading.Lock()
+_MAX_THREAD_ENTRIES = 1000
+
+
+def remember_thread_profiles(thread_id: Optional[str], profiles: List[QueryProfile]):
+    if not thread_id or not profiles:
+        return
+    with _thread_profiles_lock:
+        _thread_profiles.setdefault(thread_id, []).extend(p.to_dict() for p in profiles)
+        _thread_profiles.move_to_end(thread_id)
+        while len(_thread_profiles) > _MAX_THREAD_ENTRIES:
+            _thread_profiles.popitem(last=False)
+
+
+def pop_thread_profiles(thread_id: Optional[str]) -> List[Dict[str, Any]]:
+    if not thread_id:
+        return []
+    with _thread_profiles_lock:
+        return _thread_profiles.pop(thread_id, [])
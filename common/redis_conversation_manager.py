@@ -13,6 +13,7 @@ from app_config import (
     DEFAULT_ANONYMOUS_USER
 )
 from core.logging import get_app_logger
+from common.columnar_result import json_default
 
 class RedisConversationManager:
     """Redis对话管理器 - 修正版"""
@@ -432,7 +433,7 @@ class RedisConversationManager:
             self.redis_client.setex(
                 cache_key, 
                 QUESTION_ANSWER_TTL,
-                json.dumps(answer_with_meta)
+                json.dumps(answer_with_meta, default=json_default)
             )
             
             self.logger.debug(f"缓存答案成功: {cache_key}")
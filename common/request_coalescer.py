@@ -0,0 +1,205 @@
+"""
+Agent 请求合并（single-flight）
+
+相同的 (路由模式, 上下文类型, 对话上下文, 规范化问题) 的并发请求只执行一次 Agent 流程：
+- 进程内：同一进程的并发请求等待领头请求的结果（复用 SingleFlight）；
+  等待超过 wait_timeout 时自行执行
+- 跨进程：领头进程通过 Redis SET NX 持有执行锁，执行成功后把结果写入短期结果键；
+  其他进程轮询结果键，锁消失而没有结果（领头进程异常退出/执行失败）或等待超时时自行执行
+- 只共享成功的结果（success 为 True）：失败结果可能只针对领头请求的用户（如单用户SQL并发上限
+  导致的 database_busy、超时），领头请求失败或抛出异常时，每个等待者各自执行
+对话记录（保存消息、conversation_id 等）仍由各请求按用户各自完成，这里只共享 Agent 结果。
+
+跨进程共享的结果经过JSON往返，query_result 是字典而不是 ColumnarResult；
+需要 Arrow 响应时由 unified_api._arrow_stream_response 重建列式结果。
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import app_config
+from common.answer_cache import SingleFlight
+from common.columnar_result import json_default
+from core.logging import get_app_logger
+
+logger = get_app_logger("RequestCoalescer")
+
+# 只删除自己持有的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RequestCoalescer:
+    """进程内 + Redis 的 Agent 请求合并"""
+
+    def __init__(self, redis_client=None, lock_ttl: float = 180, result_ttl: float = 10,
+                 wait_timeout: float = 120, poll_interval: float = 0.2):
+        self.redis_client = redis_client
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.single_flight = SingleFlight()
+        self._release_lock = redis_client.register_script(_RELEASE_LOCK_SCRIPT) if redis_client else None
+        self._stats_lock = threading.Lock()
+        self._stats = {"executions": 0, "local_shared": 0, "remote_shared": 0,
+                       "local_fallbacks": 0, "failed_not_shared": 0, "remote_fallbacks": 0}
+
+    @staticmethod
+    def make_key(question: str, routing_mode: str, context: Optional[str] = None,
+                 context_type: Optional[str] = None) -> str:
+        from agent.classification_cache import normalize_question
+
+        material = "\x00".join([routing_mode or "", context_type or "", context or "", normalize_question(question)])
+        return hashlib.sha1(material.encode("utf-8")).hexdigest()[:24]
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def run(self, question: str, routing_mode: str, fn: Callable[[], Dict[str, Any]],
+            context: Optional[str] = None, context_type: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        执行或等待相同请求的 Agent 结果
+
+        Returns:
+            (Agent结果, 是否共享了其他请求的结果)；共享结果为浅拷贝，调用方可以自由修改
+        """
+        key = self.make_key(question, routing_mode, context, context_type)
+        led = []
+
+        def lead():
+            led.append(True)
+            return self._run_across_processes(key, fn)
+
+        try:
+            (result, remote_shared), local_shared = self.single_flight.do(key, lead, timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            if led:
+                raise
+            # 领头请求本身可能在等待其他进程后才开始执行，等待超时时不再等待，自行执行
+            self._count("local_fallbacks")
+            logger.warning(f"等待本进程相同请求超时，自行执行: {key}")
+            return self._execute(fn), False
+        except Exception as e:
+            if led:
+                raise
+            self._count("failed_not_shared")
+            logger.warning(f"本进程相同请求执行失败，自行执行: {key}, 错误: {e}")
+            return self._execute(fn), False
+
+        if local_shared and not _is_shareable(result):
+            self._count("failed_not_shared")
+            logger.info(f"本进程相同请求返回失败结果，不共享，自行执行: {key}")
+            return self._execute(fn), False
+        if local_shared:
+            self._count("local_shared")
+            logger.info(f"相同请求正在本进程处理中，共享其结果: {question[:50]}")
+        if local_shared or remote_shared:
+            return copy.copy(result), True
+        return result, False
+
+    def _run_across_processes(self, key: str, fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        if self.redis_client is None:
+            return self._execute(fn), False
+
+        lock_key = f"agent_inflight:{key}"
+        result_key = f"agent_inflight_result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.time() + self.wait_timeout
+        try:
+            acquired = self.redis_client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.warning(f"Redis请求合并不可用，直接执行: {e}")
+            return self._execute(fn), False
+        if not acquired:
+            return self._wait_for_remote(key, lock_key, result_key, deadline, fn)
+
+        try:
+            # 清掉上一轮残留的结果，等待者只读取本轮结果
+            self.redis_client.delete(result_key)
+            result = self._execute(fn)
+            if _is_shareable(result):
+                try:
+                    self.redis_client.setex(result_key, int(self.result_ttl),
+                                            json.dumps(result, ensure_ascii=False, default=json_default))
+                except Exception as e:
+                    logger.warning(f"写入请求合并结果失败: {e}")
+            return result, False
+        finally:
+            try:
+                self._release_lock(keys=[lock_key], args=[token])
+            except Exception as e:
+                logger.warning(f"释放请求合并锁失败: {e}")
+
+    def _wait_for_remote(self, key: str, lock_key: str, result_key: str, deadline: float,
+                         fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """等待其他进程的领头请求：有结果时共享；锁消失而没有结果（领头请求失败）或超时时自行执行"""
+        while True:
+            try:
+                raw = self.redis_client.get(result_key)
+                if not raw and not self.redis_client.exists(lock_key):
+                    # 领头进程写入结果后才释放锁，锁消失时再读一次结果
+                    raw = self.redis_client.get(result_key) or ""
+            except Exception as e:
+                logger.warning(f"Redis请求合并不可用，直接执行: {e}")
+                return self._execute(fn), False
+            if raw == "":
+                self._count("failed_not_shared")
+                logger.info(f"其他进程的相同请求未产生可共享的结果，自行执行: {key}")
+                return self._execute(fn), False
+            if raw:
+                self._count("remote_shared")
+                logger.info(f"相同请求正在其他进程处理中，共享其结果: {key}")
+                return json.loads(raw), True
+            if time.time() >= deadline:
+                self._count("remote_fallbacks")
+                logger.warning(f"等待其他进程的相同请求超时，自行执行: {key}")
+                return self._execute(fn), False
+            time.sleep(self.poll_interval)
+
+    def _execute(self, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        self._count("executions")
+        return fn()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"redis_enabled": self.redis_client is not None, **self._stats}
+
+
+def _is_shareable(result: Any) -> bool:
+    """只有成功的结果可以共享给其他请求"""
+    return isinstance(result, dict) and result.get("success") is True
+
+
+_coalescer: Optional[RequestCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_request_coalescer(redis_client=None) -> Optional[RequestCoalescer]:
+    """获取请求合并器；未启用时返回None，Redis不可用时只做进程内合并"""
+    global _coalescer
+
+    if not getattr(app_config, 'ENABLE_AGENT_REQUEST_COALESCING', False):
+        return None
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = RequestCoalescer(
+                    redis_client,
+                    lock_ttl=getattr(app_config, 'AGENT_COALESCING_LOCK_TTL', 180),
+                    result_ttl=getattr(app_config, 'AGENT_COALESCING_RESULT_TTL', 10),
+                    wait_timeout=getattr(app_config, 'AGENT_COALESCING_WAIT_TIMEOUT', 120),
+                    poll_interval=getattr(app_config, 'AGENT_COALESCING_POLL_INTERVAL', 0.2),
+                )
+    return _coalescer
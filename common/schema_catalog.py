@@ -0,0 +1,418 @@
+"""
+业务数据库Schema目录（内存索引）
+
+从 pg_catalog 一次性加载 schema/表/视图/物化视图的字段和类型（以及表和字段注释），
+并按定时器或显式调用刷新。用于：
+- SQL验证时按哈希查找检查表、字段引用，无需访问数据库
+- 向量召回DDL为空时，作为 get_related_ddl 的兜底来源
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import app_config
+from core.logging import get_app_logger
+
+logger = get_app_logger("SchemaCatalog")
+
+# 首次加载失败后的重试间隔（秒）
+_LOAD_RETRY_INTERVAL = 60
+
+# 从 pg_catalog 加载：information_schema.columns 不包含物化视图；
+# relkind: r=表 v=视图 m=物化视图 f=外部表 p=分区表；只加载当前用户可以查询的表（与 information_schema 一致）
+_CATALOG_SQL = """
+SELECT n.nspname AS table_schema,
+       cl.relname AS table_name,
+       a.attname AS column_name,
+       format_type(a.atttypid, a.atttypmod) AS data_type,
+       CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END AS is_nullable,
+       col_description(cl.oid, a.attnum) AS column_comment,
+       obj_description(cl.oid, 'pg_class') AS table_comment
+FROM pg_catalog.pg_class cl
+JOIN pg_catalog.pg_namespace n ON n.oid = cl.relnamespace
+JOIN pg_catalog.pg_attribute a ON a.attrelid = cl.oid
+WHERE cl.relkind IN ('r', 'v', 'm', 'f', 'p')
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+  AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%'
+  AND n.nspname NOT LIKE 'pg_temp%'
+  AND has_any_column_privilege(cl.oid, 'SELECT')
+ORDER BY n.nspname, cl.relname, a.attnum
+"""
+
+# ==================== SQL引用解析 ====================
+
+_BLOCK_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+_LINE_COMMENT_PATTERN = re.compile(r"--[^\n]*")
+_STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+# 参数中带 FROM 关键字的函数和运算符，需要先移除，避免被识别为表引用
+_FROM_FUNCTION_PATTERN = re.compile(r"\b(extract|substring|trim|overlay|position)\s*\([^()]*\)", re.IGNORECASE)
+_DISTINCT_FROM_PATTERN = re.compile(r"\bdistinct\s+from\b", re.IGNORECASE)
+
+_IDENT = r'(?:"[^"]+"|[a-zA-Z_][\w$]*(?![\w$]))'
+_CTE_PATTERN = re.compile(
+    rf"(?:\bwith\s+(?:recursive\s+)?|,)\s*({_IDENT})\s*(?:\([^)]*\))?\s+as\s+(?:not\s+)?(?:materialized\s+)?\(",
+    re.IGNORECASE
+)
+_TABLE_REF_PATTERN = re.compile(
+    rf"\b(?:from|join)\s+(?:only\s+)?({_IDENT}(?:\s*\.\s*{_IDENT})?)(?!\s*[\(\.])",
+    re.IGNORECASE
+)
+# 别名单独匹配且不消耗文本，避免吞掉紧随其后的 JOIN
+_ALIAS_PATTERN = re.compile(rf"\s+(?:as\s+)?({_IDENT})", re.IGNORECASE)
+_QUALIFIED_COLUMN_PATTERN = re.compile(rf"({_IDENT})\s*\.\s*({_IDENT})(?!\s*\()")
+
+# 不能作为表别名的关键字
+_NON_ALIAS_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "limit", "offset", "having", "union", "intersect", "except", "window",
+    "for", "fetch", "tablesample", "lateral", "returning", "and", "or",
+}
+
+
+def _normalize_ident(ident: str) -> str:
+    ident = ident.strip()
+    if ident.startswith('"') and ident.endswith('"'):
+        return ident[1:-1]
+    return ident.lower()
+
+
+def _clean_sql(sql: str) -> str:
+    cleaned = _BLOCK_COMMENT_PATTERN.sub(" ", sql)
+    cleaned = _LINE_COMMENT_PATTERN.sub(" ", cleaned)
+    cleaned = _STRING_LITERAL_PATTERN.sub("''", cleaned)
+    cleaned = _FROM_FUNCTION_PATTERN.sub(" 0 ", cleaned)
+    cleaned = _DISTINCT_FROM_PATTERN.sub(" = ", cleaned)
+    return cleaned
+
+
+def extract_sql_references(sql: str) -> Dict[str, Any]:
+    """
+    从SQL中提取表引用、别名和限定字段引用（只做保守解析，无法确定的引用不返回）
+
+    Returns:
+        {
+            "ctes": set,                      # CTE名称
+            "tables": [(schema或None, table)], # FROM/JOIN中的表
+            "aliases": {alias: (schema或None, table)},
+            "qualified_columns": [(qualifier, column)]
+        }
+    """
+    cleaned = _clean_sql(sql or "")
+
+    ctes = {_normalize_ident(m.group(1)) for m in _CTE_PATTERN.finditer(cleaned)}
+
+    tables: List[Tuple[Optional[str], str]] = []
+    aliases: Dict[str, Tuple[Optional[str], str]] = {}
+    for match in _TABLE_REF_PATTERN.finditer(cleaned):
+        parts = [_normalize_ident(p) for p in re.split(r"\s*\.\s*", match.group(1).strip())]
+        schema, table = (parts[0], parts[1]) if len(parts) == 2 else (None, parts[0])
+        ref = (schema, table)
+        tables.append(ref)
+        aliases[table] = ref
+
+        alias_match = _ALIAS_PATTERN.match(cleaned, match.end())
+        if alias_match and _normalize_ident(alias_match.group(1)) not in _NON_ALIAS_KEYWORDS:
+            aliases[_normalize_ident(alias_match.group(1))] = ref
+
+    qualified_columns = [
+        (_normalize_ident(m.group(1)), _normalize_ident(m.group(2)))
+        for m in _QUALIFIED_COLUMN_PATTERN.finditer(cleaned)
+    ]
+
+    return {
+        "ctes": ctes,
+        "tables": tables,
+        "aliases": aliases,
+        "qualified_columns": qualified_columns,
+    }
+
+
+# ==================== Schema目录 ====================
+
+class TableInfo:
+    """单张表（或视图）的结构信息"""
+
+    __slots__ = ("schema", "name", "comment", "columns", "column_comments", "nullable")
+
+    def __init__(self, schema: str, name: str, comment: Optional[str] = None):
+        self.schema = schema
+        self.name = name
+        self.comment = comment
+        self.columns: Dict[str, str] = {}          # 字段名 -> 数据类型（保持定义顺序）
+        self.column_comments: Dict[str, str] = {}
+        self.nullable: Dict[str, bool] = {}
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.schema}.{self.name}"
+
+    def to_ddl(self) -> str:
+        """生成近似的 CREATE TABLE 语句（含注释），用于DDL召回兜底"""
+        lines = []
+        if self.comment:
+            lines.append(f"-- {self.comment}")
+        lines.append(f"CREATE TABLE {self.qualified_name} (")
+        last_index = len(self.columns) - 1
+        for i, (column, data_type) in enumerate(self.columns.items()):
+            line = f"    {column} {data_type}"
+            if not self.nullable.get(column, True):
+                line += " NOT NULL"
+            if i < last_index:
+                line += ","
+            if self.column_comments.get(column):
+                line += f"  -- {self.column_comments[column]}"
+            lines.append(line)
+        lines.append(");")
+        return "\n".join(lines)
+
+
+class SchemaCatalog:
+    """业务数据库Schema目录"""
+
+    def __init__(self, refresh_interval: float = 600, schemas: Optional[List[str]] = None):
+        self.refresh_interval = refresh_interval
+        self.schemas = {s.lower() for s in schemas} if schemas else None
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._last_attempt: Optional[float] = None
+        self._tables: Dict[str, TableInfo] = {}          # "schema.table" -> TableInfo
+        self._tables_by_name: Dict[str, List[str]] = {}  # "table" -> ["schema.table", ...]
+        self._loaded_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    # ==================== 加载与刷新 ====================
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def refresh(self) -> bool:
+        """从业务数据库重新加载Schema目录，成功后原子替换索引"""
+        from common.business_db import run_business_sql
+
+        start = time.perf_counter()
+        try:
+            df = run_business_sql(_CATALOG_SQL)
+        except Exception as e:
+            self._last_error = str(e)
+            logger.error(f"加载Schema目录失败: {e}")
+            return False
+
+        tables: Dict[str, TableInfo] = {}
+        if df is not None:
+            for row in df.itertuples(index=False):
+                schema = row.table_schema
+                if self.schemas and schema.lower() not in self.schemas:
+                    continue
+                key = f"{schema}.{row.table_name}"
+                table = tables.get(key)
+                if table is None:
+                    table = tables[key] = TableInfo(schema, row.table_name, row.table_comment)
+                table.columns[row.column_name] = row.data_type
+                table.nullable[row.column_name] = row.is_nullable == "YES"
+                if row.column_comment:
+                    table.column_comments[row.column_name] = row.column_comment
+
+        tables_by_name: Dict[str, List[str]] = {}
+        for key, table in tables.items():
+            tables_by_name.setdefault(table.name, []).append(key)
+
+        with self._lock:
+            self._tables = tables
+            self._tables_by_name = tables_by_name
+            self._loaded_at = time.time()
+            self._last_error = None
+
+        logger.info(f"Schema目录加载完成: {len(tables)} 张表, "
+                    f"{sum(len(t.columns) for t in tables.values())} 个字段, "
+                    f"耗时 {time.perf_counter() - start:.2f}s")
+        return True
+
+    def ensure_loaded(self) -> bool:
+        """首次使用时加载目录并启动定时刷新；加载失败时按间隔重试，避免每次验证都访问数据库"""
+        if not self.is_loaded:
+            with self._load_lock:
+                now = time.time()
+                if not self.is_loaded and (self._last_attempt is None
+                                           or now - self._last_attempt >= _LOAD_RETRY_INTERVAL):
+                    self._last_attempt = now
+                    self.refresh()
+            self.start()
+        return self.is_loaded
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            self.refresh()
+
+    def start(self):
+        """启动后台定时刷新线程"""
+        if not self.refresh_interval or self._refresh_thread is not None:
+            return
+        with self._lock:
+            if self._refresh_thread is not None:
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop, name="schema-catalog-refresh", daemon=True
+            )
+            self._refresh_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    # ==================== 查找 ====================
+
+    def get_table(self, table: str, schema: Optional[str] = None) -> Optional[TableInfo]:
+        """按名称查找表；未指定schema时优先public"""
+        tables = self._tables
+        if schema:
+            return tables.get(f"{schema}.{table}")
+        keys = self._tables_by_name.get(table)
+        if not keys:
+            return None
+        public_key = f"public.{table}"
+        return tables[public_key] if public_key in keys else tables[keys[0]]
+
+    def table_exists(self, table: str, schema: Optional[str] = None) -> bool:
+        return self.get_table(table, schema) is not None
+
+    def column_exists(self, table: str, column: str, schema: Optional[str] = None) -> bool:
+        info = self.get_table(table, schema)
+        return info is not None and column in info.columns
+
+    def _is_schema_in_scope(self, schema: Optional[str]) -> bool:
+        if schema is None:
+            return True
+        if schema in ("pg_catalog", "information_schema"):
+            return False
+        if self.schemas is not None:
+            return schema in self.schemas
+        return any(key.startswith(f"{schema}.") for key in self._tables)
+
+    def check_sql_references(self, sql: str) -> Dict[str, Any]:
+        """
+        检查SQL中的表、字段引用是否存在（纯内存查找，不访问数据库）
+
+        目录未加载时视为通过；无法确定的引用（子查询别名、函数、系统表等）不做判断。
+
+        Returns:
+            {"valid": bool, "missing_tables": [...], "missing_columns": [...], "checked": bool}
+        """
+        if not self.is_loaded:
+            return {"valid": True, "missing_tables": [], "missing_columns": [], "checked": False}
+
+        refs = extract_sql_references(sql)
+        ctes = refs["ctes"]
+
+        missing_tables = []
+        for schema, table in refs["tables"]:
+            if schema is None and (table in ctes or table.startswith("pg_")):
+                continue
+            if not self._is_schema_in_scope(schema):
+                continue
+            if not self.table_exists(table, schema):
+                name = f"{schema}.{table}" if schema else table
+                if name not in missing_tables:
+                    missing_tables.append(name)
+
+        missing_columns = []
+        schema_names = {schema for schema, _ in refs["tables"] if schema}
+        for qualifier, column in refs["qualified_columns"]:
+            if qualifier in schema_names or column == "*":
+                continue
+            ref = refs["aliases"].get(qualifier)
+            if ref is None:
+                continue
+            schema, table = ref
+            if schema is None and table in ctes:
+                continue
+            info = self.get_table(table, schema)
+            if info is not None and column not in info.columns:
+                name = f"{qualifier}.{column}"
+                if name not in missing_columns:
+                    missing_columns.append(name)
+
+        return {
+            "valid": not missing_tables and not missing_columns,
+            "missing_tables": missing_tables,
+            "missing_columns": missing_columns,
+            "checked": True,
+        }
+
+    def find_related_tables(self, question: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        按问题文本粗略匹配相关的表（用于DDL召回兜底）
+
+        匹配规则：英文标识符命中表名/字段名，或中文二元组命中表/字段注释。
+        """
+        if not self.is_loaded or not question:
+            return []
+
+        question_lower = question.lower()
+        words = set(re.findall(r"[a-z_][a-z0-9_]{2,}", question_lower))
+        chinese = "".join(re.findall(r"[一-鿿]+", question))
+        bigrams = {chinese[i:i + 2] for i in range(len(chinese) - 1)}
+
+        scored = []
+        for table in self._tables.values():
+            score = 0
+            if table.name.lower() in words:
+                score += 5
+            score += sum(1 for column in table.columns if column.lower() in words)
+            if bigrams:
+                comment_text = (table.comment or "") + "".join(table.column_comments.values())
+                score += sum(1 for bigram in bigrams if bigram in comment_text)
+            if score >= 2:
+                scored.append((score, table))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [
+            {"table": table.qualified_name, "score": score, "ddl": table.to_ddl()}
+            for score, table in scored[:limit]
+        ]
+
+    def get_status(self) -> Dict[str, Any]:
+        tables = self._tables
+        return {
+            "loaded": self.is_loaded,
+            "loaded_at": self._loaded_at,
+            "table_count": len(tables),
+            "column_count": sum(len(t.columns) for t in tables.values()),
+            "refresh_interval": self.refresh_interval,
+            "schemas": sorted(self.schemas) if self.schemas else "all",
+            "last_error": self._last_error,
+        }
+
+
+# 全局Schema目录（懒加载单例，线程安全）
+_schema_catalog: Optional[SchemaCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_schema_catalog() -> Optional[SchemaCatalog]:
+    """
+    获取Schema目录，首次调用时从数据库加载
+
+    Returns:
+        SchemaCatalog实例；ENABLE_SCHEMA_CATALOG 关闭时返回None
+    """
+    global _schema_catalog
+
+    if not getattr(app_config, 'ENABLE_SCHEMA_CATALOG', False):
+        return None
+
+    if _schema_catalog is None:
+        with _catalog_lock:
+            if _schema_catalog is None:
+                _schema_catalog = SchemaCatalog(
+                    refresh_interval=getattr(app_config, 'SCHEMA_CATALOG_REFRESH_INTERVAL', 600),
+                    schemas=getattr(app_config, 'SCHEMA_CATALOG_SCHEMAS', None),
+                )
+    _schema_catalog.ensure_loaded()
+    return _schema_catalog
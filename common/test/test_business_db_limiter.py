@@ -0,0 +1,89 @@
+"""
+业务SQL并发限制测试（单用户上限、匿名用户豁免、异步调用被取消时槽位随查询线程释放）
+
+用法（项目根目录）:
+    python -m pytest common/test/test_business_db_limiter.py -q
+"""
+import asyncio
+import os
+import sys
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from common import business_db
+from common.business_db import QueryBusyError, QueryConcurrencyLimiter
+
+
+def _limiter(**kwargs):
+    options = dict(max_concurrent=2, max_queue_depth=2, queue_timeout=0.2, max_per_user=1,
+                   user_limit_exempt={"guest"})
+    options.update(kwargs)
+    return QueryConcurrencyLimiter(**options)
+
+
+def test_per_user_limit_and_anonymous_exemption():
+    limiter = _limiter()
+    with limiter.slot("wang1"):
+        with pytest.raises(QueryBusyError) as exc_info:
+            with limiter.slot("wang1"):
+                pass
+        assert exc_info.value.reason == "user_limit"
+        # 匿名用户只受全局并发限制
+        with limiter.slot("guest"):
+            pass
+    assert limiter.get_stats()["active"] == 0
+
+
+def test_release_is_idempotent():
+    limiter = _limiter()
+
+    async def acquire():
+        return await limiter.aacquire("wang1")
+
+    _, release = asyncio.run(acquire())
+    release()
+    release()
+    stats = limiter.get_stats()
+    assert stats["active"] == 0 and stats["active_users"] == 0
+    with limiter.slot("wang1"), limiter.slot("wang2"):
+        pass
+
+
+def test_cancelled_query_keeps_slot_until_thread_finishes(monkeypatch):
+    limiter = _limiter()
+    finish = threading.Event()
+    finished = threading.Event()
+
+    def slow_query(sql, timeout, prefer_primary, profile):
+        finish.wait(5)
+        finished.set()
+
+    monkeypatch.setattr(business_db, "get_query_limiter", lambda: limiter)
+    monkeypatch.setattr(business_db, "_execute_routed", slow_query)
+
+    async def scenario():
+        task = asyncio.ensure_future(business_db.arun_business_sql("SELECT 1", user_id="wang1"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # 查询仍在线程中运行：槽位和用户配额仍被占用
+        assert limiter.get_stats()["active"] == 1
+        with pytest.raises(QueryBusyError):
+            await limiter.aacquire("wang1")
+
+        finish.set()
+        await asyncio.get_running_loop().run_in_executor(None, finished.wait, 5)
+        for _ in range(50):
+            if limiter.get_stats()["active"] == 0:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    stats = limiter.get_stats()
+    assert stats["active"] == 0 and stats["active_users"] == 0
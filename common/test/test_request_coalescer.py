@@ -0,0 +1,216 @@
+"""
+RequestCoalescer 请求合并测试（进程内合并、等待超时、失败结果不共享、跨进程共享）
+
+用法（项目根目录）:
+    python -m pytest common/test/test_request_coalescer.py -q
+"""
+import os
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from common.request_coalescer import RequestCoalescer
+
+
+class _FakeRedis:
+    """只实现请求合并用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def register_script(self, script):
+        def release(keys, args):
+            with self._lock:
+                if self.data.get(keys[0]) == args[0]:
+                    del self.data[keys[0]]
+                    return 1
+                return 0
+        return release
+
+    def set(self, key, value, nx=False, px=None):
+        with self._lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+
+def _run_concurrently(coalescer, fns, question="统计服务区收入"):
+    """同时发起多个请求，第一个请求先进入成为领头请求"""
+    results = [None] * len(fns)
+    errors = [None] * len(fns)
+
+    def worker(i):
+        try:
+            results[i] = coalescer.run(question, "hybrid", fns[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(fns))]
+    threads[0].start()
+    time.sleep(0.05)
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_requests_execute_once():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"success": True, "response": "ok"}
+
+    coalescer = RequestCoalescer()
+    results, errors = _run_concurrently(coalescer, [fn] * 4)
+    assert errors == [None] * 4
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    # 共享结果是副本，修改不影响其他请求
+    results[1][0]["conversation_id"] = "u1:1"
+    assert "conversation_id" not in results[0][0]
+
+
+def test_follower_executes_itself_after_wait_timeout():
+    def slow():
+        time.sleep(0.5)
+        return {"success": True, "by": "leader"}
+
+    def own():
+        return {"success": True, "by": "follower"}
+
+    coalescer = RequestCoalescer(wait_timeout=0.1)
+    results, errors = _run_concurrently(coalescer, [slow, own])
+    assert errors == [None, None]
+    assert results[1] == ({"success": True, "by": "follower"}, False)
+    assert coalescer.get_stats()["local_fallbacks"] == 1
+
+
+def test_follower_executes_itself_when_leader_raises():
+    calls = []
+
+    def failing():
+        calls.append("leader")
+        time.sleep(0.2)
+        raise RuntimeError("LLM调用失败")
+
+    def succeeding():
+        calls.append("follower")
+        return {"success": True}
+
+    coalescer = RequestCoalescer()
+    results, errors = _run_concurrently(coalescer, [failing, succeeding])
+    assert isinstance(errors[0], RuntimeError)
+    assert errors[1] is None
+    assert results[1] == ({"success": True}, False)
+    assert calls == ["leader", "follower"]
+
+
+def test_failed_result_not_shared_in_process():
+    calls = []
+
+    def busy():
+        calls.append("leader")
+        time.sleep(0.2)
+        return {"success": False, "error_type": "database_busy", "code": 503}
+
+    def succeeding():
+        calls.append("follower")
+        return {"success": True}
+
+    coalescer = RequestCoalescer()
+    results, errors = _run_concurrently(coalescer, [busy, succeeding, succeeding])
+    assert errors == [None] * 3
+    assert results[0] == ({"success": False, "error_type": "database_busy", "code": 503}, False)
+    assert results[1:] == [({"success": True}, False)] * 2
+    assert calls.count("follower") == 2
+    assert coalescer.get_stats()["failed_not_shared"] == 2
+
+
+def test_failed_result_not_shared_across_processes():
+    redis_client = _FakeRedis()
+    other_process = RequestCoalescer(redis_client, poll_interval=0.01)
+    this_process = RequestCoalescer(redis_client, poll_interval=0.01)
+
+    def busy():
+        time.sleep(0.2)
+        return {"success": False, "error_type": "database_busy"}
+
+    leader = threading.Thread(target=lambda: other_process.run("问题", "hybrid", busy))
+    leader.start()
+    time.sleep(0.05)
+    result, shared = this_process.run("问题", "hybrid", lambda: {"success": True})
+    leader.join()
+
+    assert (result, shared) == ({"success": True}, False)
+    assert not any(k.startswith("agent_inflight_result:") for k in redis_client.data)
+    assert this_process.get_stats()["failed_not_shared"] == 1
+
+
+def test_leader_exception_propagates_without_retry():
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        RequestCoalescer().run("问题", "hybrid", failing)
+    assert len(calls) == 1
+
+
+def test_result_shared_across_processes():
+    redis_client = _FakeRedis()
+    other_process = RequestCoalescer(redis_client, poll_interval=0.01)
+    this_process = RequestCoalescer(redis_client, poll_interval=0.01)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"success": True, "query_result": {"rows": [{"a": 1}], "columns": ["a"]}}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(other_process.run("问题", "hybrid", fn)))
+    leader.start()
+    time.sleep(0.05)
+    result, shared = this_process.run("问题", "hybrid", fn)
+    leader.join()
+
+    assert len(calls) == 1
+    assert shared is True
+    assert result["query_result"]["rows"] == [{"a": 1}]
+    assert not any(k.startswith("agent_inflight:") for k in redis_client.data)
+
+
+def test_lock_released_without_result_falls_back_to_execution():
+    redis_client = _FakeRedis()
+    coalescer = RequestCoalescer(redis_client, wait_timeout=0.2, poll_interval=0.01)
+    key = coalescer.make_key("问题", "hybrid")
+    # 其他进程持有锁但一直不写结果
+    redis_client.set(f"agent_inflight:{key}", "other-process")
+
+    result, shared = coalescer.run("问题", "hybrid", lambda: {"success": True})
+    assert (result, shared) == ({"success": True}, False)
+    assert coalescer.get_stats()["remote_fallbacks"] == 1
@@ -0,0 +1,313 @@
+"""
+Agent 链路追踪（span）
+
+为 Agent 节点、工具调用、向量检索、LLM 调用和业务SQL执行记录耗时 span，定位慢回答的时间花在哪一步。
+span 模型与 OpenTelemetry 一致（trace_id / span_id / parent_span_id、属性、状态），导出方式由
+TRACING_EXPORTER 配置：
+- "none"：不记录（默认），span 为共享的空对象，开销可以忽略
+- "jsonl"：每个结束的 span 以一行JSON追加到 TRACING_JSONL_PATH，离线环境可直接分析
+- "otel"：交给 OpenTelemetry SDK（需安装 opentelemetry-api，导出器由 OTel 自身配置决定）
+
+父子关系通过 contextvars 传递（工具线程池会复制上下文）；LangGraph 流式执行时节点之间不共享上下文，
+因此请求入口把根 span 的上下文（Span.context()）写入 Agent 状态的 trace_parent 字段，节点据此挂到同一条链路上。
+conversation_id / thread_id / user_id 属性会自动传递给所有子 span。
+"""
+
+import functools
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Union
+
+import app_config
+from core.logging import get_app_logger
+
+logger = get_app_logger("Tracing")
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# 从父 span 继承到子 span 的属性
+_INHERITED_ATTRIBUTES = ("conversation_id", "thread_id", "user_id")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_trace_span", default=None)
+
+
+class Span:
+    """一次操作的耗时记录"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "attributes",
+                 "start_ns", "end_ns", "status", "error", "_tracer", "_otel_span")
+
+    def __init__(self, tracer, name: str, trace_id: str, span_id: str,
+                 parent_span_id: Optional[str], attributes: Dict[str, Any], otel_span=None):
+        self._tracer = tracer
+        self._otel_span = otel_span
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "OK"
+        self.error: Optional[str] = None
+
+    @property
+    def recording(self) -> bool:
+        return self._tracer is not None
+
+    def set_attribute(self, key: str, value: Any):
+        if self._tracer is None or value is None:
+            return
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, _otel_value(value))
+
+    def record_error(self, error: BaseException):
+        if self._tracer is None:
+            return
+        self.status = "ERROR"
+        self.error = f"{type(error).__name__}: {error}"
+        if self._otel_span is not None:
+            self._otel_span.record_exception(error)
+            self._otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(error)))
+
+    def end(self):
+        if self._tracer is None or self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self._tracer.on_end(self)
+
+    def context(self) -> Optional[Dict[str, Any]]:
+        """可序列化的 span 上下文（写入Agent状态，供节点作为父 span 使用）"""
+        if self._tracer is None:
+            return None
+        context = {"trace_id": self.trace_id, "span_id": self.span_id}
+        for key in _INHERITED_ATTRIBUTES:
+            if key in self.attributes:
+                context[key] = self.attributes[key]
+        return context
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+_NOOP_SPAN = Span(None, "", "", "", None, {})
+
+
+def _otel_value(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+class _NoopTracer:
+    enabled = False
+
+    def start_span(self, name, attributes, parent) -> Span:
+        return _NOOP_SPAN
+
+
+class _JsonlTracer:
+    """把结束的 span 追加写入本地JSONL文件"""
+
+    enabled = True
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def start_span(self, name, attributes, parent) -> Span:
+        trace_id = parent["trace_id"] if parent else secrets.token_hex(16)
+        return Span(self, name, trace_id, secrets.token_hex(8),
+                    parent["span_id"] if parent else None, attributes)
+
+    def on_end(self, span: Span):
+        record = span.to_dict()
+        record["service.name"] = self.service_name
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                self._file.write(line + "\n")
+        except Exception as e:
+            logger.warning(f"写入trace文件失败: {e}")
+
+
+class _OTelTracer:
+    """使用 OpenTelemetry SDK 记录 span"""
+
+    enabled = True
+
+    def __init__(self, service_name: str):
+        self._tracer = otel_trace.get_tracer(service_name)
+
+    def start_span(self, name, attributes, parent) -> Span:
+        otel_context = None
+        if parent:
+            parent_context = otel_trace.SpanContext(
+                trace_id=int(parent["trace_id"], 16),
+                span_id=int(parent["span_id"], 16),
+                is_remote=False,
+                trace_flags=otel_trace.TraceFlags(otel_trace.TraceFlags.SAMPLED),
+            )
+            otel_context = otel_trace.set_span_in_context(otel_trace.NonRecordingSpan(parent_context))
+        otel_span = self._tracer.start_span(
+            name, context=otel_context,
+            attributes={k: _otel_value(v) for k, v in attributes.items() if v is not None}
+        )
+        span_context = otel_span.get_span_context()
+        return Span(self, name, format(span_context.trace_id, "032x"), format(span_context.span_id, "016x"),
+                    parent["span_id"] if parent else None, attributes, otel_span=otel_span)
+
+    def on_end(self, span: Span):
+        span._otel_span.end(end_time=span.end_ns)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """根据 TRACING_EXPORTER 配置创建追踪器（进程内单例）"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = _create_tracer()
+    return _tracer
+
+
+def _create_tracer():
+    exporter = getattr(app_config, "TRACING_EXPORTER", "none")
+    service_name = getattr(app_config, "TRACING_SERVICE_NAME", "vanna-agent")
+    try:
+        if exporter == "jsonl":
+            path = getattr(app_config, "TRACING_JSONL_PATH", "logs/agent_traces.jsonl")
+            logger.info(f"链路追踪已启用: jsonl → {path}")
+            return _JsonlTracer(path, service_name)
+        if exporter == "otel":
+            if otel_trace is None:
+                logger.warning("TRACING_EXPORTER=otel 但未安装 opentelemetry-api，链路追踪不启用")
+                return _NoopTracer()
+            logger.info("链路追踪已启用: OpenTelemetry")
+            return _OTelTracer(service_name)
+    except Exception as e:
+        logger.warning(f"链路追踪初始化失败，不启用: {e}")
+    return _NoopTracer()
+
+
+def current_span() -> Span:
+    """当前上下文中的 span（未追踪时返回空 span）"""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None,
+               parent: Union[Span, Dict[str, Any], None] = None) -> Span:
+    """
+    创建 span（不设为当前 span），需要调用 end() 结束
+
+    Args:
+        parent: 父 span 或其 context()；默认使用当前上下文中的 span
+    """
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return _NOOP_SPAN
+
+    if parent is None:
+        parent = _current_span.get()
+    if isinstance(parent, Span):
+        parent = parent.context()
+
+    merged = {}
+    if parent:
+        merged.update({k: parent[k] for k in _INHERITED_ATTRIBUTES if parent.get(k) is not None})
+    merged.update({k: v for k, v in (attributes or {}).items() if v is not None})
+    try:
+        return tracer.start_span(name, merged, parent)
+    except Exception as e:
+        logger.debug(f"创建span失败: {e}")
+        return _NOOP_SPAN
+
+
+@contextmanager
+def span(name: str, parent: Union[Span, Dict[str, Any], None] = None, **attributes):
+    """在 with 块内记录一个 span，并作为块内的当前 span"""
+    current = start_span(name, attributes, parent)
+    if not current.recording:
+        yield current
+        return
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: str, **attributes) -> Callable:
+    """为函数/协程函数记录 span 的装饰器（可放在 @tool 之下）"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_node(name: str, node: Callable) -> Callable:
+    """
+    包装 LangGraph 节点函数：以状态中的 trace_parent（请求根 span）为父 span 记录节点耗时
+
+    包装后的函数签名与原函数一致（LangGraph 据此决定是否传入 config）。
+    """
+    def node_span(state):
+        parent = state.get("trace_parent") if isinstance(state, dict) else None
+        attributes = {}
+        if isinstance(state, dict):
+            attributes = {k: state.get(k) for k in _INHERITED_ATTRIBUTES}
+        return span(name, parent=parent, **attributes)
+
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(state, *args, **kwargs):
+            with node_span(state):
+                return await node(state, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(state, *args, **kwargs):
+        with node_span(state):
+            return node(state, *args, **kwargs)
+    return wrapper
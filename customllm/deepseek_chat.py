@@ -1,6 +1,7 @@
 import os
 from openai import OpenAI
 from .base_llm_chat import BaseLLMChat
+from common.tracing import traced
 
 
 class DeepSeekChat(BaseLLMChat):
@@ -22,6 +23,7 @@ class DeepSeekChat(BaseLLMChat):
                 base_url=base_url
             )
 
+    @traced("llm.submit_prompt", provider="deepseek")
     def submit_prompt(self, prompt, **kwargs) -> str:
         if prompt is None:
             raise Exception("Prompt is None")
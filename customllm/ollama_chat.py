@@ -3,6 +3,7 @@ import json
 import re
 from typing import List, Dict, Any, Optional
 from .base_llm_chat import BaseLLMChat
+from common.tracing import traced
 
 
 class OllamaChat(BaseLLMChat):
@@ -40,6 +41,7 @@ class OllamaChat(BaseLLMChat):
             self.logger.error(f"Ollama 服务连接失败: {e}")
             return False
 
+    @traced("llm.submit_prompt", provider="ollama")
     def submit_prompt(self, prompt, **kwargs) -> str:
         if prompt is None:
             raise Exception("Prompt is None")
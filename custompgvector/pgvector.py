@@ -15,6 +15,7 @@ from vanna.types import TrainingPlan, TrainingPlanItem
 
 # 导入embedding缓存管理器
 from common.embedding_cache_manager import get_embedding_cache_manager
+from common.tracing import traced
 
 
 class PG_VectorStore(VannaBase):
@@ -114,6 +115,7 @@ class PG_VectorStore(VannaBase):
     #     return [ast.literal_eval(document.page_content) for document in documents]
 
     # 在原来的基础之上，增加相似度的值。
+    @traced("vector.similar_question_sql")
     def get_similar_question_sql(self, question: str) -> list:
         # 尝试使用embedding缓存
         embedding_cache = get_embedding_cache_manager()
@@ -174,6 +176,7 @@ class PG_VectorStore(VannaBase):
 
         return filtered_results
 
+    @traced("vector.related_ddl")
     def get_related_ddl(self, question: str, **kwargs) -> list:
         # 尝试使用embedding缓存
         embedding_cache = get_embedding_cache_manager()
@@ -231,8 +234,36 @@ class PG_VectorStore(VannaBase):
         if results and not filtered_results:
             self.logger.warning(f"向量查询找到了 {len(results)} 条DDL表结构，但全部被阈值过滤掉，问题: {question}")
 
+        # 向量召回为空时，使用Schema目录按问题匹配表结构作为兜底
+        if not filtered_results:
+            filtered_results = self._get_schema_catalog_ddl_fallback(question)
+
         return filtered_results
 
+    def _get_schema_catalog_ddl_fallback(self, question: str) -> list:
+        """从内存Schema目录中匹配与问题相关的表结构（DDL召回兜底）"""
+        try:
+            import app_config
+            if not getattr(app_config, 'ENABLE_SCHEMA_CATALOG_DDL_FALLBACK', False):
+                return []
+
+            from common.schema_catalog import get_schema_catalog
+            catalog = get_schema_catalog()
+            if catalog is None:
+                return []
+
+            matches = catalog.find_related_tables(question, limit=self.n_results)
+            if matches:
+                self.logger.info(f"使用Schema目录兜底召回 {len(matches)} 张表: {[m['table'] for m in matches]}")
+            return [
+                {"content": match["ddl"], "similarity": 0.0, "source": "schema_catalog"}
+                for match in matches
+            ]
+        except Exception as e:
+            self.logger.warning(f"Schema目录DDL兜底失败: {e}")
+            return []
+
+    @traced("vector.related_documentation")
     def get_related_documentation(self, question: str, **kwargs) -> list:
         # 尝试使用embedding缓存
         embedding_cache = get_embedding_cache_manager()
@@ -607,6 +638,7 @@ class PG_VectorStore(VannaBase):
         return id
     
     # 3. 获取相关的错误SQL示例
+    @traced("vector.related_error_sql")
     def get_related_error_sql(self, question: str, **kwargs) -> list:
         """
         获取相关的错误SQL示例
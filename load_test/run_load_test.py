@@ -0,0 +1,322 @@
+"""
+单个 asgi_app 进程的负载测试
+
+逐级提高并发，依次压测 ask_agent、ask_react_agent 及两个流式接口，每个并发级别报告：
+吞吐量、延迟 p50/p95/max、流式接口首个事件的 p95 延迟、服务事件循环延迟 p95/max、每个会话的内存增长。
+
+默认启动 stub_server.py（LLM/embedding/业务库均为替身，需要本地 Redis Stack），
+也可以用 --base-url 压测已启动的服务（事件循环延迟和内存只在替身服务上可用）。
+
+用法（项目根目录）:
+    python load_test/run_load_test.py
+    python load_test/run_load_test.py --concurrency 1,10,50 --turns 3 --llm-latency 1.0
+    python load_test/run_load_test.py --endpoints ask_react_agent_stream --json-output output/load_test.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ["ask_agent", "ask_react_agent", "ask_agent_stream", "ask_react_agent_stream"]
+STATS_PATH = "/__load_test__/stats"
+CLEANUP_PATH = "/__load_test__/cleanup"
+
+
+@dataclass
+class RequestResult:
+    latency: float
+    ok: bool
+    first_event: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class StageReport:
+    endpoint: str
+    concurrency: int
+    conversations: int
+    results: List[RequestResult] = field(default_factory=list)
+    duration: float = 0.0
+    loop_lag: Optional[Dict[str, Any]] = None
+    rss_before: Optional[int] = None
+    rss_after: Optional[int] = None
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = [r.latency for r in self.results if r.ok]
+        first_events = [r.first_event for r in self.results if r.ok and r.first_event is not None]
+        errors = [r for r in self.results if not r.ok]
+        memory_per_conversation = None
+        if self.rss_before is not None and self.rss_after is not None and self.conversations:
+            memory_per_conversation = (self.rss_after - self.rss_before) / self.conversations
+        return {
+            "endpoint": self.endpoint,
+            "concurrency": self.concurrency,
+            "requests": len(self.results),
+            "errors": len(errors),
+            "error_samples": sorted({e.error for e in errors if e.error})[:5],
+            "throughput_rps": round(len(latencies) / self.duration, 2) if self.duration else 0.0,
+            "latency_p50_s": round(_percentile(latencies, 50), 3),
+            "latency_p95_s": round(_percentile(latencies, 95), 3),
+            "latency_max_s": round(max(latencies), 3) if latencies else 0.0,
+            "first_event_p95_s": round(_percentile(first_events, 95), 3) if first_events else None,
+            "loop_lag_p95_ms": (self.loop_lag or {}).get("p95_ms"),
+            "loop_lag_max_ms": (self.loop_lag or {}).get("max_ms"),
+            "memory_per_conversation_kb": (round(memory_per_conversation / 1024, 1)
+                                           if memory_per_conversation is not None else None),
+        }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _question(conversation: int, turn: int) -> str:
+    # 每个问题都不同，避免问答缓存和相同请求合并让结果失真
+    month = (conversation + turn) % 12 + 1
+    return f"统计{month}月各服务区的营业收入排名（负载测试会话{conversation}第{turn + 1}轮）"
+
+
+def _conversation_id(data: Dict[str, Any]) -> Optional[str]:
+    """从响应中取出会话ID（ask_agent 为 conversation_id，React Agent 为 thread_id）"""
+    payload = data.get("data") if isinstance(data.get("data"), dict) else {}
+    for source in (payload, data):
+        for key in ("thread_id", "conversation_id"):
+            if source.get(key):
+                return source[key]
+    return None
+
+
+class LoadTester:
+    def __init__(self, client: httpx.AsyncClient, args, marker: str):
+        self.client = client
+        self.args = args
+        self.marker = marker
+
+    def _params(self, endpoint: str, question: str, user_id: str, conversation_id: Optional[str]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"question": question, "user_id": user_id}
+        if endpoint.startswith("ask_react_agent"):
+            if conversation_id:
+                params["thread_id"] = conversation_id
+        else:
+            if conversation_id:
+                params["conversation_id"] = conversation_id
+                params["continue_conversation"] = True
+            if self.args.routing_mode:
+                params["routing_mode"] = self.args.routing_mode
+        return params
+
+    async def _post(self, endpoint: str, params: Dict[str, Any]):
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(f"/api/v0/{endpoint}", json=params)
+            data = response.json()
+        except Exception as e:
+            return RequestResult(time.perf_counter() - start, False, error=type(e).__name__), None
+        latency = time.perf_counter() - start
+        if response.status_code != 200 or not data.get("success", False):
+            error = f"HTTP {response.status_code}: {str(data.get('message') or data.get('error'))[:80]}"
+            return RequestResult(latency, False, error=error), None
+        return RequestResult(latency, True), _conversation_id(data)
+
+    async def _stream(self, endpoint: str, params: Dict[str, Any]):
+        start = time.perf_counter()
+        first_event = None
+        completed = None
+        error = None
+        query = {k: (str(v).lower() if isinstance(v, bool) else v) for k, v in params.items()}
+        try:
+            async with self.client.stream("GET", f"/api/v0/{endpoint}", params=query) as response:
+                if response.status_code != 200:
+                    return RequestResult(time.perf_counter() - start, False, error=f"HTTP {response.status_code}"), None
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    if first_event is None:
+                        first_event = time.perf_counter() - start
+                    event = json.loads(line[5:].strip())
+                    event_data = event.get("data") or {}
+                    if not event.get("success", True) or event_data.get("type") == "error":
+                        error = str(event_data.get("error") or event.get("message"))[:80]
+                    elif event_data.get("type") == "completed":
+                        completed = event
+        except Exception as e:
+            return RequestResult(time.perf_counter() - start, False, first_event, type(e).__name__), None
+        latency = time.perf_counter() - start
+        if error or completed is None:
+            return RequestResult(latency, False, first_event, error or "未收到completed事件"), None
+        return RequestResult(latency, True, first_event), _conversation_id(completed)
+
+    async def _virtual_user(self, endpoint: str, user_index: int, results: List[RequestResult]):
+        user_id = f"{self.marker}u{user_index}"
+        for c in range(self.args.conversations_per_user):
+            conversation_id = None
+            conversation = user_index * self.args.conversations_per_user + c
+            for turn in range(self.args.turns):
+                params = self._params(endpoint, _question(conversation, turn), user_id, conversation_id)
+                if endpoint.endswith("_stream"):
+                    result, new_id = await self._stream(endpoint, params)
+                else:
+                    result, new_id = await self._post(endpoint, params)
+                results.append(result)
+                conversation_id = new_id or conversation_id
+                if not result.ok and conversation_id is None:
+                    break
+
+    async def server_stats(self, reset: bool = False) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self.client.get(STATS_PATH, params={"reset": "1" if reset else "0"})
+            return response.json() if response.status_code == 200 else None
+        except Exception:
+            return None
+
+    async def run_stage(self, endpoint: str, concurrency: int) -> StageReport:
+        report = StageReport(endpoint, concurrency, concurrency * self.args.conversations_per_user)
+        before = await self.server_stats(reset=True)
+        start = time.perf_counter()
+        await asyncio.gather(*(self._virtual_user(endpoint, i, report.results) for i in range(concurrency)))
+        report.duration = time.perf_counter() - start
+        after = await self.server_stats(reset=True)
+        if before and after:
+            report.loop_lag = after["loop_lag"]
+            report.rss_before = before["rss_bytes"]
+            report.rss_after = after["rss_bytes"]
+        return report
+
+    async def cleanup(self) -> Optional[int]:
+        try:
+            response = await self.client.post(CLEANUP_PATH, params={"marker": self.marker})
+            return response.json().get("deleted") if response.status_code == 200 else None
+        except Exception:
+            return None
+
+
+def _start_stub_server(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(PROJECT_ROOT, "load_test", "stub_server.py"),
+        "--port", str(args.port), "--redis-url", args.redis_url,
+        "--llm-latency", str(args.llm_latency), "--db-latency", str(args.db_latency),
+        "--embedding-latency", str(args.embedding_latency), "--result-rows", str(args.result_rows),
+    ]
+    print(f"🚀 启动替身服务: {' '.join(command)}")
+    return subprocess.Popen(command, cwd=PROJECT_ROOT)
+
+
+async def _wait_for_server(client: httpx.AsyncClient, server: Optional[subprocess.Popen], timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"替身服务启动失败，退出码 {server.returncode}")
+        try:
+            await client.get(STATS_PATH)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"等待服务启动超时（{timeout}秒）")
+
+
+def _format_value(value, fmt: str) -> str:
+    return "-" if value is None else format(value, fmt)
+
+
+def _print_report(summaries: List[Dict[str, Any]]):
+    header = (f"{'endpoint':<24}{'conc':>5}{'reqs':>6}{'err':>5}{'req/s':>8}{'p50(s)':>8}{'p95(s)':>8}"
+              f"{'max(s)':>8}{'首事件p95':>10}{'lag p95(ms)':>12}{'lag max(ms)':>12}{'内存/会话(KB)':>14}")
+    print("\n📊 负载测试结果")
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        print(f"{s['endpoint']:<24}{s['concurrency']:>5}{s['requests']:>6}{s['errors']:>5}"
+              f"{s['throughput_rps']:>8.2f}{s['latency_p50_s']:>8.2f}{s['latency_p95_s']:>8.2f}{s['latency_max_s']:>8.2f}"
+              f"{_format_value(s['first_event_p95_s'], '.2f'):>10}{_format_value(s['loop_lag_p95_ms'], '.1f'):>12}"
+              f"{_format_value(s['loop_lag_max_ms'], '.1f'):>12}{_format_value(s['memory_per_conversation_kb'], '.1f'):>14}")
+    for s in summaries:
+        if s["error_samples"]:
+            print(f"⚠️ {s['endpoint']} 并发{s['concurrency']} 错误示例: {s['error_samples']}")
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    server = None if args.base_url else _start_stub_server(args)
+    base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+    marker = f"lt{uuid.uuid4().hex[:8]}"
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10, max_keepalive_connections=max(args.concurrency))
+    summaries = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await _wait_for_server(client, server, args.startup_timeout)
+            tester = LoadTester(client, args, marker)
+            if await tester.server_stats() is None:
+                print("⚠️ 服务不是替身服务，不统计事件循环延迟和内存")
+
+            for endpoint in args.endpoints:
+                # 预热：初始化Agent实例、Redis连接等，不计入结果
+                await tester.run_stage(endpoint, 1)
+                for concurrency in args.concurrency:
+                    summary = (await tester.run_stage(endpoint, concurrency)).summary()
+                    summaries.append(summary)
+                    print(f"   ✅ {endpoint} 并发{concurrency}: {summary['throughput_rps']} req/s, "
+                          f"p95 {summary['latency_p95_s']}s, 错误 {summary['errors']}/{summary['requests']}")
+
+            if not args.keep_data:
+                deleted = await tester.cleanup()
+                if deleted is not None:
+                    print(f"🧹 已清理测试数据: {deleted} 个Redis key（标记 {marker}）")
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asgi_app 单进程负载测试")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"逗号分隔，可选: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,5,10,20", help="逗号分隔的并发级别（同时进行的会话数）")
+    parser.add_argument("--conversations-per-user", type=int, default=2, help="每个虚拟用户依次进行的会话数")
+    parser.add_argument("--turns", type=int, default=2, help="每个会话的轮数")
+    parser.add_argument("--routing-mode", default=None, help="ask_agent 的 routing_mode（默认使用服务端配置）")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时（秒）")
+    parser.add_argument("--base-url", default=None, help="压测已启动的服务，不启动替身服务")
+    parser.add_argument("--port", type=int, default=8099, help="替身服务端口")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="等待替身服务启动的时间（秒）")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0", help="替身服务使用的 Redis Stack")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="替身LLM每次调用的平均延迟（秒）")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="替身业务库每条SQL的平均延迟（秒）")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="替身embedding每次调用的平均延迟（秒）")
+    parser.add_argument("--result-rows", type=int, default=50, help="每次查询返回的行数")
+    parser.add_argument("--keep-data", action="store_true", help="保留测试产生的Redis数据")
+    parser.add_argument("--json-output", default=None, help="结果另存为JSON文件")
+    args = parser.parse_args()
+
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in args.endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"未知接口: {unknown}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    summaries = asyncio.run(run(args))
+    _print_report(summaries)
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "results": summaries}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
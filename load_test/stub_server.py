@@ -0,0 +1,174 @@
+"""
+负载测试服务：安装外部依赖替身后，用 uvicorn 单进程启动 asgi_app
+
+在应用外层增加两个只供负载测试使用的路径：
+- GET  /__load_test__/stats[?reset=1]  服务事件循环延迟（自上次重置以来）、进程RSS、线程数
+- POST /__load_test__/cleanup?marker=xxx  删除 Redis 中 key 包含 marker 的测试数据
+
+需要本地 Redis Stack（LangGraph checkpoint 依赖 RedisJSON/RediSearch），例如：
+    docker run -d -p 6379:6379 redis/redis-stack-server
+
+用法（项目根目录，通常由 run_load_test.py 自动启动）:
+    python load_test/stub_server.py --port 8099 --llm-latency 0.5 --db-latency 0.05
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+STATS_PATH = "/__load_test__/stats"
+CLEANUP_PATH = "/__load_test__/cleanup"
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class LoopLagMonitor:
+    """定时 sleep 并记录实际唤醒时间与预期的差值，即事件循环被阻塞的时间"""
+
+    def __init__(self, interval: float = 0.05, max_samples: int = 100000):
+        self.interval = interval
+        self._samples = deque(maxlen=max_samples)
+        self._task = None
+
+    def ensure_started(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._samples.append(max(0.0, time.perf_counter() - start - self.interval) * 1000)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        samples = list(self._samples)
+        if reset:
+            self._samples.clear()
+        return {
+            "samples": len(samples),
+            "p50_ms": round(_percentile(samples, 50), 2),
+            "p95_ms": round(_percentile(samples, 95), 2),
+            "p99_ms": round(_percentile(samples, 99), 2),
+            "max_ms": round(max(samples), 2) if samples else 0.0,
+        }
+
+
+def _rss_bytes() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        # 未安装 psutil 时读取 /proc（Linux）
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class LoadTestApp:
+    """包装 asgi_app，处理负载测试专用路径，其余请求原样转发"""
+
+    def __init__(self, app, redis_urls):
+        self.app = app
+        self.redis_urls = redis_urls
+        self.lag_monitor = LoopLagMonitor()
+
+    async def __call__(self, scope, receive, send):
+        self.lag_monitor.ensure_started()
+        if scope["type"] == "http" and scope["path"] == STATS_PATH:
+            query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+            reset = query.get("reset", ["0"])[0] == "1"
+            # 先回收垃圾再读取RSS，减少统计抖动
+            gc.collect()
+            await self._send_json(send, {
+                "loop_lag": self.lag_monitor.snapshot(reset=reset),
+                "rss_bytes": _rss_bytes(),
+                "threads": threading.active_count(),
+            })
+        elif scope["type"] == "http" and scope["path"] == CLEANUP_PATH and scope["method"] == "POST":
+            query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+            marker = query.get("marker", [""])[0]
+            if len(marker) < 6:
+                await self._send_json(send, {"error": "marker 至少6个字符"}, status=400)
+                return
+            deleted = await asyncio.to_thread(self._cleanup, marker)
+            await self._send_json(send, {"deleted": deleted})
+        else:
+            await self.app(scope, receive, send)
+
+    def _cleanup(self, marker: str) -> int:
+        import redis
+        deleted = 0
+        for url in self.redis_urls:
+            client = redis.Redis.from_url(url)
+            try:
+                keys = list(client.scan_iter(match=f"*{marker}*", count=1000))
+                for i in range(0, len(keys), 500):
+                    deleted += client.unlink(*keys[i:i + 500])
+            finally:
+                client.close()
+        return deleted
+
+    @staticmethod
+    async def _send_json(send, data: dict, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json; charset=utf-8")]})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+def _configure_redis(redis_url: str) -> list:
+    """让 React Agent 和对话管理使用指定的 Redis，返回两者的连接URL"""
+    import app_config
+    from react_agent import config as react_agent_config
+
+    parsed = urlparse(redis_url)
+    react_agent_config.REDIS_URL = redis_url
+    app_config.REDIS_HOST = parsed.hostname or "localhost"
+    app_config.REDIS_PORT = parsed.port or 6379
+    app_config.REDIS_PASSWORD = parsed.password
+    auth = f":{parsed.password}@" if parsed.password else ""
+    app_redis_url = f"redis://{auth}{app_config.REDIS_HOST}:{app_config.REDIS_PORT}/{app_config.REDIS_DB}"
+    return [redis_url, app_redis_url]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="负载测试服务（外部依赖使用替身）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0", help="Redis Stack 地址")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="每次LLM调用的平均延迟（秒）")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="每条业务SQL的平均延迟（秒）")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="每次embedding调用的平均延迟（秒）")
+    parser.add_argument("--result-rows", type=int, default=50, help="每次查询返回的行数")
+    args = parser.parse_args()
+
+    from load_test.stubs import install_stubs
+    redis_urls = _configure_redis(args.redis_url)
+    db_path = install_stubs(llm_latency=args.llm_latency, db_latency=args.db_latency,
+                            embedding_latency=args.embedding_latency, result_rows=args.result_rows)
+    print(f"🧪 替身业务库: {db_path}", flush=True)
+
+    import uvicorn
+    from asgi_app import asgi_app
+    try:
+        uvicorn.run(LoadTestApp(asgi_app, redis_urls), host=args.host, port=args.port,
+                    lifespan="on", log_level="warning")
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
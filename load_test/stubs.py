@@ -0,0 +1,272 @@
+"""
+负载测试用的外部依赖替身
+
+- ScriptedChatModel：替代 React Agent 的 ChatOpenAI，按固定脚本返回工具调用
+  （generate_sql → valid_sql → run_sql → 最终回答），每次调用按配置的延迟等待
+- StubVanna：替代 Vanna 实例（generate_sql / chat_with_llm / generate_summary / run_sql），同步方法按延迟阻塞，
+  与真实 SDK 一样占用线程池
+- StubEmbedding：替代 embedding 函数，按文本哈希生成固定维度的单位向量
+- SQLite 替身：替代 common.business_db 中的 psycopg2 连接，在本地 SQLite 文件上执行生成的SQL，
+  业务SQL的并发限制、排队、指标等逻辑保持不变
+
+install_stubs() 必须在导入 unified_api / asgi_app 之前调用。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+STUB_TABLE = "load_test_orders"
+_REGIONS = ["华东", "华南", "华北", "华中", "西南", "西北", "东北", "沿海"]
+_SERVICE_AREAS_PER_REGION = 30
+
+_MONTH_PATTERN = re.compile(r"(\d{1,2})月")
+
+
+def _sleep_seconds(latency: float) -> float:
+    """在配置的平均延迟上加 ±50% 的随机抖动"""
+    return random.uniform(latency * 0.5, latency * 1.5) if latency > 0 else 0
+
+
+def build_stub_sql(question: str, result_rows: int) -> str:
+    """按问题中的月份生成查询替身表的SQL"""
+    match = _MONTH_PATTERN.search(question or "")
+    month = int(match.group(1)) if match and 1 <= int(match.group(1)) <= 12 else 1
+    return (f"SELECT region, service_area, SUM(amount) AS revenue FROM {STUB_TABLE} "
+            f"WHERE month = {month} GROUP BY region, service_area ORDER BY revenue DESC LIMIT {result_rows}")
+
+
+# --- SQLite 替身 ---
+
+def create_stub_database(path: Optional[str] = None) -> str:
+    """创建替身业务库（各区域/服务区12个月的营业收入），返回数据库文件路径"""
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="load_test_", suffix=".sqlite3")
+        os.close(fd)
+    rng = random.Random(42)
+    rows = [
+        (region, f"{region}服务区{i:02d}", month, round(rng.uniform(1e4, 5e5), 2))
+        for region in _REGIONS
+        for i in range(_SERVICE_AREAS_PER_REGION)
+        for month in range(1, 13)
+    ]
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {STUB_TABLE}")
+        conn.execute(f"CREATE TABLE {STUB_TABLE} (region TEXT, service_area TEXT, month INTEGER, amount REAL)")
+        conn.executemany(f"INSERT INTO {STUB_TABLE} VALUES (?, ?, ?, ?)", rows)
+    return path
+
+
+def execute_stub_sql(db_path: str, sql: str, latency: float) -> Optional[pd.DataFrame]:
+    """在替身库上执行SQL（每次独立连接，与 psycopg2 执行方式一致），先按延迟阻塞模拟网络和服务端耗时"""
+    time.sleep(_sleep_seconds(latency))
+    statement = sql.strip().rstrip(";")
+    # PostgreSQL 专有的验证语句（PREPARE/DEALLOCATE、SET）在替身库上视为成功
+    if re.match(r"^(PREPARE|DEALLOCATE|SET)\b", statement, re.IGNORECASE):
+        return None
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        cursor = conn.execute(statement)
+        if cursor.description is None:
+            return None
+        columns = [desc[0] for desc in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=columns)
+    finally:
+        conn.close()
+
+
+# --- Vanna / embedding 替身 ---
+
+class StubVanna:
+    """Vanna 实例替身，只实现应用在问答链路上用到的方法"""
+
+    def __init__(self, db_path: str, llm_latency: float, db_latency: float, result_rows: int):
+        self.db_path = db_path
+        self.llm_latency = llm_latency
+        self.db_latency = db_latency
+        self.result_rows = result_rows
+        self.last_llm_explanation = None
+
+    def _wait(self):
+        time.sleep(_sleep_seconds(self.llm_latency))
+
+    def generate_sql(self, question: str, *args, **kwargs) -> str:
+        self._wait()
+        return build_stub_sql(question, self.result_rows)
+
+    def chat_with_llm(self, question: str, system_prompt: Optional[str] = None, **kwargs) -> str:
+        self._wait()
+        if "分类:" in question:
+            return "分类: DATABASE\n理由: 负载测试问题涉及服务区营业收入数据\n置信度: 0.95"
+        return "这是负载测试的模拟回答。"
+
+    def generate_summary(self, question: str, df: pd.DataFrame, **kwargs) -> str:
+        self._wait()
+        return f"查询共返回 {len(df)} 行数据（负载测试模拟摘要）。"
+
+    def run_sql(self, sql: str, **kwargs) -> Optional[pd.DataFrame]:
+        return execute_stub_sql(self.db_path, sql, self.db_latency)
+
+    def train(self, *args, **kwargs) -> str:
+        return f"load-test-{uuid.uuid4().hex[:8]}"
+
+    def train_error_sql(self, *args, **kwargs) -> str:
+        return self.train()
+
+    def get_training_data(self, *args, **kwargs) -> pd.DataFrame:
+        return pd.DataFrame(columns=["id", "question", "content", "training_data_type"])
+
+    def remove_training_data(self, *args, **kwargs) -> bool:
+        return True
+
+
+class StubEmbedding:
+    """embedding 函数替身：相同文本得到相同的单位向量"""
+
+    def __init__(self, embedding_dimension: int = 1024, latency: float = 0.0):
+        self.embedding_dimension = embedding_dimension
+        self.latency = latency
+
+    def generate_embedding(self, text: str, **kwargs) -> List[float]:
+        time.sleep(_sleep_seconds(self.latency))
+        seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:4], "big")
+        vector = np.random.default_rng(seed).standard_normal(self.embedding_dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def __call__(self, input) -> List[List[float]]:
+        texts = [input] if isinstance(input, str) else list(input)
+        return [self.generate_embedding(text) for text in texts]
+
+
+# --- React Agent LLM 替身 ---
+
+def _find_tool_call_args(messages: List[BaseMessage], tool_call_id: str) -> Dict[str, Any]:
+    for message in reversed(messages):
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            if tool_call.get("id") == tool_call_id:
+                return tool_call.get("args") or {}
+    return {}
+
+
+def _row_count(content: Any) -> Optional[int]:
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict):
+        return data.get("total_row_count")
+    return None
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    按固定脚本应答的聊天模型
+
+    根据最后一条非系统消息决定下一步：用户问题 → generate_sql；generate_sql 返回SQL → valid_sql；
+    验证通过 → run_sql；run_sql 结果 → 最终回答。未绑定工具时（如生成会话摘要）直接返回文本。
+    """
+
+    latency: float = 0.5
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "load-test-scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return ScriptedChatModel(latency=self.latency, tool_names=[getattr(t, "name", str(t)) for t in tools])
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        if not self.tool_names:
+            return AIMessage(content="负载测试会话摘要：用户查询了服务区营业收入。")
+
+        last = next((m for m in reversed(messages) if not isinstance(m, SystemMessage)), None)
+        if isinstance(last, HumanMessage):
+            return self._tool_call("generate_sql", {"question": str(last.content)})
+        if isinstance(last, ToolMessage):
+            content = str(last.content)
+            if last.name == "generate_sql" and content.lstrip().upper().startswith(("SELECT", "WITH")):
+                return self._tool_call("valid_sql", {"sql": content.strip()})
+            if last.name == "valid_sql" and "验证通过" in content:
+                sql = _find_tool_call_args(messages, last.tool_call_id).get("sql", "")
+                return self._tool_call("run_sql", {"sql": sql})
+            if last.name == "run_sql":
+                rows = _row_count(content)
+                if rows is not None:
+                    return AIMessage(content=f"根据查询结果，共返回 {rows} 行服务区营业收入数据。")
+            return AIMessage(content=f"工具 {last.name} 未返回可用结果：{content[:200]}")
+        return AIMessage(content="这是负载测试的模拟回答。")
+
+    def _tool_call(self, name: str, args: Dict[str, Any]) -> AIMessage:
+        if name not in self.tool_names:
+            return AIMessage(content=f"负载测试脚本需要的工具 {name} 未绑定。")
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:24]}"}])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(_sleep_seconds(self.latency))
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(_sleep_seconds(self.latency))
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+
+# --- 安装替身 ---
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install_stubs(llm_latency: float = 0.5, db_latency: float = 0.05, embedding_latency: float = 0.0,
+                  result_rows: int = 50, db_path: Optional[str] = None) -> str:
+    """
+    用替身替换 LLM、Vanna、embedding 和业务数据库连接（进程内只安装一次）
+
+    Returns:
+        替身业务库文件路径
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            raise RuntimeError("负载测试替身已安装")
+        db_path = create_stub_database(db_path)
+
+        import app_config
+        # 依赖真实 PostgreSQL 元数据的功能在替身库上不可用
+        app_config.ENABLE_SCHEMA_CATALOG = False
+        app_config.ENABLE_AGENT_ANSWER_CACHE = False
+        app_config.APP_DB_REPLICAS = []
+
+        from common import business_db
+        business_db._execute_query = (
+            lambda sql, statement_timeout, db_config=None, profile=None:
+            execute_stub_sql(db_path, sql, db_latency)
+        )
+
+        stub_vanna = StubVanna(db_path, llm_latency, db_latency, result_rows)
+        from core import vanna_llm_factory, embedding_function
+        vanna_llm_factory.create_vanna_instance = lambda config_module=None: stub_vanna
+        stub_embedding = StubEmbedding(latency=embedding_latency)
+        embedding_function.get_embedding_function = lambda *args, **kwargs: stub_embedding
+
+        from react_agent import agent as react_agent_module
+        react_agent_module.ChatOpenAI = lambda **kwargs: ScriptedChatModel(latency=llm_latency)
+
+        _installed = True
+        return db_path
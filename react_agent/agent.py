@@ -1,6 +1,7 @@
 """
 基于 StateGraph 的、具备上下文感知能力的 React Agent 核心实现
 """
+import asyncio
 import json
 import pandas as pd
 import httpx
@@ -42,12 +43,27 @@ try:
     from . import config
     from .state import AgentState
     from .sql_tools import sql_tools
+    from .conversation_index import ConversationIndex
+    from .checkpoint_retention import CheckpointRetention
+    from . import memory
+    from .result_store import aload_records, is_result_ref
+    from .retry_budget import get_retry_budget, jittered_backoff
+    from . import prompts
+    from .tool_dispatch import ToolDispatcher
 except ImportError:
     # 如果相对导入失败，尝试绝对导入（直接运行时）
     import config
     from state import AgentState
     from sql_tools import sql_tools
-from langchain_core.runnables import RunnablePassthrough
+    from conversation_index import ConversationIndex
+    from checkpoint_retention import CheckpointRetention
+    import memory
+    from result_store import aload_records, is_result_ref
+    from retry_budget import get_retry_budget, jittered_backoff
+    import prompts
+    from tool_dispatch import ToolDispatcher
+from langchain_core.runnables import RunnablePassthrough, RunnableConfig
+from common.tracing import span, start_span, trace_node
 
 logger = get_react_agent_logger("CustomReactAgent")
 
@@ -63,6 +79,12 @@ class CustomReactAgent:
         self.checkpointer = None
         self._exit_stack = None
         self.redis_client = None
+        self.conversation_index = None
+        self.checkpoint_retention = None
+        self._compactor_task = None
+        self._backfill_task = None
+        self._http_client = None
+        self._http_async_client = None
 
     @classmethod
     async def create(cls):
@@ -83,8 +105,23 @@ class CustomReactAgent:
         except Exception as e:
             logger.error(f"   ❌ Redis连接失败: {e}")
             raise
+        self.conversation_index = ConversationIndex(self.redis_client)
 
         # 2. 初始化 LLM
+        # 异步节点通过 http_async_client 调用LLM；连接池大小按预期并发放大
+        limits = httpx.Limits(
+            max_connections=max(config.HTTP_MAX_CONNECTIONS, config.LLM_EXPECTED_CONCURRENCY),
+            max_keepalive_connections=max(config.HTTP_MAX_KEEPALIVE_CONNECTIONS, config.LLM_EXPECTED_CONCURRENCY // 2),
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,  # 30秒keep-alive过期
+        )
+        timeout = httpx.Timeout(
+            connect=config.HTTP_CONNECT_TIMEOUT,   # 连接超时
+            read=config.NETWORK_TIMEOUT,           # 读取超时
+            write=config.HTTP_CONNECT_TIMEOUT,     # 写入超时
+            pool=config.HTTP_POOL_TIMEOUT          # 连接池超时
+        )
+        self._http_client = httpx.Client(limits=limits, timeout=timeout)
+        self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
         self.llm = ChatOpenAI(
             api_key=config.QWEN_API_KEY,
             base_url=config.QWEN_BASE_URL,
@@ -93,28 +130,18 @@ class CustomReactAgent:
             timeout=config.NETWORK_TIMEOUT,  # 添加超时配置
             max_retries=0,  # 禁用OpenAI客户端重试，改用Agent层统一重试
             streaming=True,
+            stream_usage=True,  # 流式调用时也返回token用量（用于统计前缀缓存命中率）
             extra_body={
                 "enable_thinking": True,  # False by wxq
                 "misc": {
                     "ensure_ascii": False
                 }
             },
-            # 新增：优化HTTP连接配置
-            http_client=httpx.Client(
-                limits=httpx.Limits(
-                    max_connections=config.HTTP_MAX_CONNECTIONS,
-                    max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
-                    keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,  # 30秒keep-alive过期
-                ),
-                timeout=httpx.Timeout(
-                    connect=config.HTTP_CONNECT_TIMEOUT,   # 连接超时
-                    read=config.NETWORK_TIMEOUT,           # 读取超时
-                    write=config.HTTP_CONNECT_TIMEOUT,     # 写入超时
-                    pool=config.HTTP_POOL_TIMEOUT          # 连接池超时
-                )
-            )
+            # 新增：优化HTTP连接配置（同步调用使用 http_client，异步调用使用 http_async_client）
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
         )
-        logger.info(f"   ReactAgent LLM 已初始化，模型: {config.QWEN_MODEL}")
+        logger.info(f"   ReactAgent LLM 已初始化，模型: {config.QWEN_MODEL}，连接池上限: {limits.max_connections}")
 
         # 3. 绑定工具
         self.tools = sql_tools
@@ -137,12 +164,22 @@ class CustomReactAgent:
         else:
             logger.warning("   Redis 持久化功能已禁用。")
 
+        if self.checkpointer and config.CHECKPOINT_INLINE_RETENTION_ENABLED:
+            self.checkpoint_retention = CheckpointRetention(
+                self.redis_client, self.checkpointer,
+                keep_count=config.CHECKPOINT_KEEP_COUNT,
+                idle_ttl=config.CHECKPOINT_IDLE_TTL
+            )
+            logger.info(f"   Checkpoint内联保留已启用: 每个thread保留 {config.CHECKPOINT_KEEP_COUNT} 个")
+
         # 5. 构建 StateGraph
         self.agent_executor = self._create_graph()
         logger.info("   StateGraph 已构建并编译。")
         
         # 6. 显示消息裁剪配置状态
-        if config.MESSAGE_TRIM_ENABLED:
+        if config.MEMORY_TOKEN_BUDGET_ENABLED:
+            logger.info(f"   对话记忆按token预算管理: 预算={config.MEMORY_TOKEN_BUDGET}, 工具输出上限={config.MEMORY_TOOL_OUTPUT_MAX_TOKENS}")
+        elif config.MESSAGE_TRIM_ENABLED:
             logger.info(f"   消息裁剪已启用: 保留消息数={config.MESSAGE_TRIM_COUNT}, 搜索限制={config.MESSAGE_TRIM_SEARCH_LIMIT}")
         else:
             logger.info("   消息裁剪已禁用")
@@ -174,14 +211,59 @@ class CustomReactAgent:
             logger.error(f"❌ Checkpointer重新初始化失败: {e}")
             self.checkpointer = None
 
+    def start_checkpoint_compactor(self):
+        """
+        在当前事件循环上启动checkpoint后台压缩任务（只应在长期运行的事件循环上调用）
+        """
+        if (self._compactor_task is not None or not self.checkpoint_retention
+                or not config.CHECKPOINT_COMPACTOR_ENABLED):
+            return
+        self._compactor_task = asyncio.get_running_loop().create_task(
+            self.checkpoint_retention.run_compactor(
+                config.CHECKPOINT_COMPACTOR_INTERVAL, config.CHECKPOINT_COMPACTOR_BATCH_SIZE
+            )
+        )
+        logger.info(f"✅ Checkpoint后台压缩已启动，间隔 {config.CHECKPOINT_COMPACTOR_INTERVAL}s")
+
+    def start_conversation_index_backfill(self):
+        """
+        在当前事件循环上启动会话索引的一次性补录任务（索引已就绪或其他进程正在补录时立即结束）
+        """
+        if self._backfill_task is not None or not self.checkpointer or not self.conversation_index:
+            return
+
+        async def backfill():
+            try:
+                await self.conversation_index.backfill(self._load_thread_messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 会话索引补录失败: {e}")
+
+        self._backfill_task = asyncio.get_running_loop().create_task(backfill())
+
     async def close(self):
         """清理资源，关闭 Redis 连接。"""
+        if self._compactor_task is not None:
+            self._compactor_task.cancel()
+            self._compactor_task = None
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            self._backfill_task = None
+        
         if self._exit_stack:
             await self._exit_stack.aclose()
             self._exit_stack = None
             self.checkpointer = None
             logger.info("✅ RedisSaver 资源已通过 AsyncExitStack 释放。")
         
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+
         if self.redis_client:
             await self.redis_client.aclose()
             logger.info("✅ Redis客户端已关闭。")
@@ -272,23 +354,97 @@ class CustomReactAgent:
         
         return {**state, "messages": final_messages}
 
+    async def _async_memory_node(self, state: AgentState) -> Dict[str, Any]:
+        """
+        对话记忆节点：未摘要的历史轮次超出token预算时，将最早的轮次并入滚动摘要
+
+        state 中的 messages 不做删除（checkpoint 中保留完整历史），只更新 conversation_summary 和
+        summarized_message_count；实际发送给 LLM 的消息由 _build_llm_messages 按预算构建。
+        """
+        thread_id = state.get("thread_id", "unknown")
+        messages = state.get("messages", [])
+        summarized_count = state.get("summarized_message_count") or 0
+        if summarized_count > len(messages):
+            summarized_count = 0
+
+        turns = memory.select_turns_to_summarize(
+            messages, summarized_count, config.MEMORY_TOKEN_BUDGET, config.MEMORY_TOOL_OUTPUT_MAX_TOKENS
+        )
+        if not turns:
+            return {}
+
+        summary = await self._summarize_turns(state.get("conversation_summary"), turns)
+        new_count = summarized_count + sum(len(turn) for turn in turns)
+        logger.info(f"🧠 [{thread_id}] {len(turns)} 个历史轮次并入滚动摘要，已摘要消息数: {summarized_count} → {new_count}")
+        return {"conversation_summary": summary, "summarized_message_count": new_count}
+
+    async def _summarize_turns(self, previous_summary: Optional[str], turns: List[List[BaseMessage]]) -> str:
+        """生成新的滚动摘要（LLM 摘要失败时退回提取式摘要）"""
+        max_tokens = config.MEMORY_SUMMARY_MAX_TOKENS
+        if config.MEMORY_SUMMARY_USE_LLM:
+            try:
+                prompt = (
+                    f"请将以下对话内容合并到已有摘要中，输出更新后的摘要（不超过{max_tokens}个token）。"
+                    "保留用户关注的业务对象、查询条件和关键数据结论，不要输出SQL语句。"
+                )
+                content = (f"已有摘要：\n{previous_summary or '无'}\n\n新的对话内容：\n"
+                           f"{memory.format_turns_for_summary(turns, config.MEMORY_TOOL_OUTPUT_MAX_TOKENS)}")
+                with span("react.memory.summarize", turn_count=len(turns)):
+                    response = await self.llm.ainvoke([SystemMessage(content=prompt), HumanMessage(content=content)])
+                if response.content:
+                    return str(response.content).strip()
+            except Exception as e:
+                logger.warning(f"⚠️ LLM生成滚动摘要失败，改用提取式摘要: {e}")
+        return memory.extractive_summary(previous_summary, turns, max_tokens)
+
+    def _build_llm_messages(self, state: AgentState) -> List[BaseMessage]:
+        """构建发送给LLM的对话消息（不含系统提示词）"""
+        if not config.MEMORY_TOKEN_BUDGET_ENABLED:
+            return state["messages"].copy()
+
+        messages, tokens = memory.build_llm_messages(
+            state["messages"],
+            state.get("conversation_summary"),
+            state.get("summarized_message_count") or 0,
+            config.MEMORY_TOKEN_BUDGET,
+            config.MEMORY_TOOL_OUTPUT_MAX_TOKENS,
+        )
+        logger.info(f"   对话记忆: {len(state['messages'])} 条消息 → {len(messages)} 条，估算 {tokens} tokens")
+        return messages
+
     def _create_graph(self):
         """定义并编译最终的、正确的 StateGraph 结构。"""
         builder = StateGraph(AgentState)
 
-        # 添加消息裁剪节点（如果启用）
-        if config.MESSAGE_TRIM_ENABLED:
-            builder.add_node("trim_messages", self._trim_messages_node)
+        self._tool_node = ToolNode(self.tools)
+        from app_config import BUSINESS_DB_MAX_QUERIES_PER_USER
+        self._tool_dispatcher = ToolDispatcher(
+            self.tools,
+            max_concurrency=config.TOOL_MAX_CONCURRENCY_PER_REQUEST,
+            merge_validate_and_run=config.TOOL_MERGE_VALIDATE_AND_RUN,
+            db_concurrency=BUSINESS_DB_MAX_QUERIES_PER_USER,
+        )
+
+        # 添加对话记忆/消息裁剪节点（如果启用）；每个节点记录一个 span（未启用链路追踪时为空操作）
+        if config.MEMORY_TOKEN_BUDGET_ENABLED:
+            builder.add_node("memory", trace_node("react.node.memory", self._async_memory_node))
+        elif config.MESSAGE_TRIM_ENABLED:
+            builder.add_node("trim_messages", trace_node("react.node.trim_messages", self._trim_messages_node))
         
         # 定义所有需要的节点 - 全部改为异步
-        builder.add_node("agent", self._async_agent_node)
-        builder.add_node("prepare_tool_input", self._async_prepare_tool_input_node)
-        builder.add_node("tools", ToolNode(self.tools))
-        builder.add_node("update_state_after_tool", self._async_update_state_after_tool_node)
-        builder.add_node("format_final_response", self._async_format_final_response_node)
+        builder.add_node("agent", trace_node("react.node.agent", self._async_agent_node))
+        builder.add_node("prepare_tool_input", trace_node("react.node.prepare_tool_input", self._async_prepare_tool_input_node))
+        builder.add_node("tools", trace_node("react.node.tools", self._async_tools_node))
+        builder.add_node("update_state_after_tool", trace_node("react.node.update_state_after_tool", self._async_update_state_after_tool_node))
+        builder.add_node("format_final_response", trace_node("react.node.format_final_response", self._async_format_final_response_node))
 
         # 建立正确的边连接
-        if config.MESSAGE_TRIM_ENABLED:
+        if config.MEMORY_TOKEN_BUDGET_ENABLED:
+            # 按token预算管理记忆：START → memory → agent
+            builder.set_entry_point("memory")
+            builder.add_edge("memory", "agent")
+            logger.info("   ✅ 对话记忆节点已启用，工作流: START → memory → agent")
+        elif config.MESSAGE_TRIM_ENABLED:
             # 启用裁剪：START → trim_messages → agent
             builder.set_entry_point("trim_messages")
             builder.add_edge("trim_messages", "agent")
@@ -373,15 +529,15 @@ class CustomReactAgent:
         # 获取建议的下一步操作
         next_step = state.get("suggested_next_step")
         
-        # 构建发送给LLM的消息列表
-        messages_for_llm = state["messages"].copy()
+        # 构建发送给LLM的消息列表（按token预算压缩历史）
+        messages_for_llm = self._build_llm_messages(state)
         
-        # 🎯 添加数据库范围系统提示词（每次用户提问时添加）
-        if isinstance(state["messages"][-1], HumanMessage):
-            db_scope_prompt = self._get_database_scope_prompt()
-            if db_scope_prompt:
-                messages_for_llm.insert(0, SystemMessage(content=db_scope_prompt))
-                logger.info("   ✅ 已添加数据库范围判断提示词")
+        # 🎯 固定的系统前缀（数据库范围 + 防幻觉规则）放在最前面，每次调用内容相同，便于服务商前缀缓存命中；
+        # 随请求变化的指令都追加在消息末尾
+        system_prefix = prompts.get_system_prefix()
+        if system_prefix:
+            messages_for_llm.insert(0, SystemMessage(content=system_prefix))
+            logger.info("   ✅ 已添加系统前缀（数据库范围判断 + 防幻觉规则）")
         
         # 检查是否需要分析验证错误
         
@@ -464,8 +620,14 @@ class CustomReactAgent:
                 
                 # 使用异步调用
                 logger.info("🔄 开始调用LLM...")
-                response = await self.llm_with_tools.ainvoke(messages_for_llm)
+                with span("react.llm.invoke", attempt=attempt + 1, message_count=len(messages_for_llm)) as llm_span:
+                    response = await self.llm_with_tools.ainvoke(messages_for_llm)
+                    prompt_tokens, cached_tokens = prompts.record_prompt_usage(state.get("thread_id"), response)
+                    llm_span.set_attribute("llm.prompt_tokens", prompt_tokens)
+                    llm_span.set_attribute("llm.cached_tokens", cached_tokens)
                 logger.info("✅ LLM调用完成")
+                if prompt_tokens:
+                    logger.info(f"   前缀缓存命中: {cached_tokens}/{prompt_tokens} tokens ({cached_tokens / prompt_tokens:.1%})")
                 
                 # 🔍 【调试】详细的响应检查和日志
                 logger.info(f"   响应类型: {type(response)}")
@@ -488,10 +650,10 @@ class CustomReactAgent:
                 # 检查空响应情况 - 将空响应也视为需要重试的情况
                 if not response.content and not (hasattr(response, 'tool_calls') and response.tool_calls):
                     logger.warning("   ⚠️ LLM返回空响应且无工具调用")
-                    if attempt < max_retries - 1:
+                    wait_time = self._retry_delay(attempt, max_retries)
+                    if wait_time is not None:
                         # 空响应也进行重试
-                        wait_time = config.RETRY_BASE_DELAY * (2 ** attempt)
-                        logger.info(f"   🔄 空响应重试，{wait_time}秒后重试...")
+                        logger.info(f"   🔄 空响应重试，{wait_time:.1f}秒后重试...")
                         await asyncio.sleep(wait_time)
                         continue
                     else:
@@ -503,10 +665,10 @@ class CustomReactAgent:
                         
                 elif response.content and response.content.strip() == "":
                     logger.warning("   ⚠️ LLM返回只包含空白字符的内容")
-                    if attempt < max_retries - 1:
+                    wait_time = self._retry_delay(attempt, max_retries)
+                    if wait_time is not None:
                         # 空白字符也进行重试
-                        wait_time = config.RETRY_BASE_DELAY * (2 ** attempt)
-                        logger.info(f"   🔄 空白字符重试，{wait_time}秒后重试...")
+                        logger.info(f"   🔄 空白字符重试，{wait_time:.1f}秒后重试...")
                         await asyncio.sleep(wait_time)
                         continue
                     else:
@@ -523,13 +685,14 @@ class CustomReactAgent:
                 if ((response.content and response.content.strip()) or 
                     (hasattr(response, 'tool_calls') and response.tool_calls)):
                     logger.info(f"   ✅ 异步LLM调用成功，返回有效响应")
+                    get_retry_budget().record_success()
                     return {"messages": [response]}
                 else:
                     # 这种情况理论上不应该发生，但作为最后的保障
                     logger.error(f"   ❌ 意外的响应格式，进行重试")
-                    if attempt < max_retries - 1:
-                        wait_time = config.RETRY_BASE_DELAY * (2 ** attempt)
-                        logger.info(f"   🔄 意外响应格式重试，{wait_time}秒后重试...")
+                    wait_time = self._retry_delay(attempt, max_retries)
+                    if wait_time is not None:
+                        logger.info(f"   🔄 意外响应格式重试，{wait_time:.1f}秒后重试...")
                         await asyncio.sleep(wait_time)
                         continue
                     else:
@@ -586,11 +749,11 @@ class CustomReactAgent:
                 
                 # 处理可重试的错误
                 if is_network_error or is_parameter_error:
-                    if attempt < max_retries - 1:
-                        # 渐进式重试间隔：3, 6, 12秒
-                        wait_time = config.RETRY_BASE_DELAY * (2 ** attempt)
+                    # 带抖动的指数退避，受进程级重试预算限制
+                    wait_time = self._retry_delay(attempt, max_retries)
+                    if wait_time is not None:
                         error_type_desc = "网络错误" if is_network_error else "参数格式错误"
-                        logger.info(f"   🔄 {error_type_desc}，{wait_time}秒后重试...")
+                        logger.info(f"   🔄 {error_type_desc}，{wait_time:.1f}秒后重试...")
                         
                         # 🎯 对于参数错误，修复消息历史后重试
                         if is_parameter_error:
@@ -624,6 +787,20 @@ class CustomReactAgent:
                     logger.error(f"   ❌ LLM调用出现非可重试错误: {error_type}: {error_msg}")
                     raise e
     
+    def _retry_delay(self, attempt: int, max_retries: int) -> Optional[float]:
+        """
+        计算第 attempt 次失败后的重试等待时间
+
+        Returns:
+            等待秒数；已达最大重试次数或进程级重试预算耗尽时返回None（调用方返回降级回答）
+        """
+        if attempt >= max_retries - 1:
+            return None
+        if not get_retry_budget().try_acquire():
+            logger.warning("   ⚠️ LLM重试预算已耗尽（上游可能正在故障），不再重试")
+            return None
+        return jittered_backoff(attempt, config.RETRY_BASE_DELAY, config.RETRY_MAX_DELAY)
+
     def _print_state_info(self, state: AgentState, node_name: str) -> None:
         """
         打印 state 的全部信息，用于调试
@@ -679,6 +856,13 @@ class CustomReactAgent:
         
         logger.info(" ~" * 10 + " State Print End" + " ~" * 10)
 
+    async def _async_tools_node(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        """执行工具调用：同一消息中的多个调用并发执行，同一SQL的验证和执行合并（见 tool_dispatch）"""
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, AIMessage) or not last_message.tool_calls:
+            return await self._tool_node.ainvoke(state, config)
+        return {"messages": await self._tool_dispatcher.dispatch(last_message.tool_calls, config)}
+
     async def _async_prepare_tool_input_node(self, state: AgentState) -> Dict[str, Any]:
         """异步准备工具输入节点：为generate_sql工具注入history_messages。"""
         # 增加递归计数
@@ -915,20 +1099,28 @@ class CustomReactAgent:
                         sql_query = content.strip()
                         
                 elif msg.name == 'run_sql':
-                    # 提取SQL执行结果
+                    # 提取SQL执行结果（外部存储的大结果按引用取回）
                     try:
-                        import json
-                        parsed_data = json.loads(msg.content)
-                        if isinstance(parsed_data, list) and len(parsed_data) > 0:
-                            # DataFrame.to_json(orient='records') 格式
+                        parsed_data = await aload_records(self.redis_client, msg.content)
+                        if is_result_ref(parsed_data):
+                            # 完整结果已过期，只能返回预览
+                            sql_data = {
+                                "columns": parsed_data.get("columns", []),
+                                "rows": parsed_data.get("preview", []),
+                                "total_row_count": parsed_data.get("total_row_count", 0),
+                                "is_limited": True
+                            }
+                        elif isinstance(parsed_data, list) and len(parsed_data) > 0:
+                            # DataFrame.to_json(orient='records') 格式，按 API_MAX_RETURN_ROWS 限制返回行数
+                            max_rows = self._get_max_return_rows()
                             columns = list(parsed_data[0].keys()) if parsed_data else []
                             sql_data = {
                                 "columns": columns,
-                                "rows": parsed_data,
+                                "rows": parsed_data[:max_rows] if max_rows else parsed_data,
                                 "total_row_count": len(parsed_data),
-                                "is_limited": False  # 当前版本没有实现限制
+                                "is_limited": bool(max_rows) and len(parsed_data) > max_rows
                             }
-                    except (json.JSONDecodeError, Exception) as e:
+                    except Exception as e:
                         logger.warning(f"   解析SQL结果失败: {e}")
         
         if sql_query:
@@ -938,6 +1130,15 @@ class CustomReactAgent:
             
         return result
 
+    @staticmethod
+    def _get_max_return_rows() -> Optional[int]:
+        """API返回的最大行数（与其他API一致，使用 app_config.API_MAX_RETURN_ROWS）"""
+        try:
+            from app_config import API_MAX_RETURN_ROWS
+            return API_MAX_RETURN_ROWS
+        except ImportError:
+            return None
+
     async def _async_collect_agent_metadata(self, state: AgentState) -> Dict[str, Any]:
         """收集Agent元数据"""
         messages = state['messages']
@@ -974,7 +1175,7 @@ class CustomReactAgent:
             execution_path.extend(["prepare_tool_input", "tools"])
         execution_path.append("format_final_response")
         
-        return {
+        metadata = {
             "thread_id": state['thread_id'],
             "conversation_rounds": conversation_rounds,
             "tools_used": tools_used,
@@ -984,6 +1185,19 @@ class CustomReactAgent:
             "context_injected": context_injected,
             "agent_version": "custom_react_v1"
         }
+        
+        # 本轮run_sql的执行剖析数据（排队/执行/获取/序列化耗时）
+        from common.query_profiler import pop_thread_profiles
+        query_profiles = pop_thread_profiles(state['thread_id'])
+        if query_profiles:
+            metadata["query_profiles"] = query_profiles
+
+        # 本轮LLM调用的前缀缓存命中情况
+        prompt_cache = prompts.pop_thread_prompt_usage(state['thread_id'])
+        if prompt_cache:
+            metadata["prompt_cache"] = prompt_cache
+        
+        return metadata
 
     async def _async_extract_latest_sql_data(self, messages: List[BaseMessage]) -> Optional[str]:
         """从消息历史中提取最近的run_sql执行结果，但仅限于当前对话轮次。"""
@@ -1008,18 +1222,20 @@ class CustomReactAgent:
             if isinstance(msg, ToolMessage) and msg.name == 'run_sql':
                 logger.info(f"   找到当前对话轮次的run_sql结果: {msg.content[:100]}...")
                 
-                # 🎯 处理Unicode转义序列，将其转换为正常的中文字符
-                try:
-                    # 先尝试解析JSON以验证格式
-                    parsed_data = json.loads(msg.content)
-                    # 重新序列化，确保中文字符正常显示
-                    formatted_content = json.dumps(parsed_data, ensure_ascii=False, separators=(',', ':'))
-                    logger.info(f"   已转换Unicode转义序列为中文字符")
-                    return formatted_content
-                except json.JSONDecodeError:
+                # 🎯 处理Unicode转义序列，将其转换为正常的中文字符（外部存储的大结果按引用取回）
+                # 先尝试解析JSON以验证格式
+                parsed_data = await aload_records(self.redis_client, msg.content)
+                if parsed_data is None:
                     # 如果不是有效JSON，直接返回原内容
                     logger.warning(f"   SQL结果不是有效JSON格式，返回原始内容")
                     return msg.content
+                max_rows = self._get_max_return_rows()
+                if isinstance(parsed_data, list) and max_rows:
+                    parsed_data = parsed_data[:max_rows]
+                # 重新序列化，确保中文字符正常显示
+                formatted_content = json.dumps(parsed_data, ensure_ascii=False, separators=(',', ':'))
+                logger.info(f"   已转换Unicode转义序列为中文字符")
+                return formatted_content
         
         logger.info("   当前对话轮次中未找到run_sql执行结果")
         return None
@@ -1046,11 +1262,14 @@ class CustomReactAgent:
         
         logger.info(f"🔢 递归限制设置: {config.RECURSION_LIMIT}")
         
+        # 请求根 span，通过状态传给各节点
+        root_span = start_span("react.chat", {"thread_id": thread_id, "user_id": user_id})
         inputs = {
             "messages": [HumanMessage(content=message)],
             "user_id": user_id,
             "thread_id": thread_id,
             "suggested_next_step": None,
+            "trace_parent": root_span.context(),
         }
 
         try:
@@ -1073,6 +1292,7 @@ class CustomReactAgent:
                         logger.warning(f"⚠️ Checkpointer测试失败，但继续执行: {checkpoint_error}")
             
             final_state = await self.agent_executor.ainvoke(inputs, run_config)
+            await self._record_conversation(user_id, thread_id, final_state["messages"])
             
             # 🔍 调试：打印 final_state 的所有 keys
             logger.info(f"🔍 Final state keys: {list(final_state.keys())}")
@@ -1104,6 +1324,7 @@ class CustomReactAgent:
             return result
             
         except Exception as e:
+            root_span.record_error(e)
             # 特殊处理Redis相关的Event loop错误
             if "Event loop is closed" in str(e):
                 logger.error(f"❌ Redis Event loop已关闭 - Thread: {thread_id}: {e}")
@@ -1124,6 +1345,8 @@ class CustomReactAgent:
             else:
                 logger.error(f"❌ 处理过程中发生严重错误 - Thread: {thread_id}: {e}", exc_info=True)
                 return {"success": False, "error": str(e), "thread_id": thread_id}
+        finally:
+            root_span.end()
 
     async def chat_stream(self, message: str, user_id: str, thread_id: Optional[str] = None):
         """
@@ -1162,11 +1385,14 @@ class CustomReactAgent:
         
         logger.info(f"🔢 流式处理 - 递归限制设置: {config.RECURSION_LIMIT}")
         
+        # 请求根 span（生成器在 yield 之间不保持上下文，通过状态传给各节点）
+        root_span = start_span("react.chat_stream", {"thread_id": thread_id, "user_id": user_id})
         inputs = {
             "messages": [HumanMessage(content=message)],
             "user_id": user_id,
             "thread_id": thread_id,
             "suggested_next_step": None,
+            "trace_parent": root_span.context(),
         }
 
         try:
@@ -1211,6 +1437,8 @@ class CustomReactAgent:
             
             # 5. 复用现有的结果处理逻辑
             if final_state and "messages" in final_state:
+                await self._record_conversation(user_id, thread_id, final_state["messages"])
+                
                 # 🔍 调试：打印 final_state 的所有 keys
                 logger.info(f"🔍 流式处理 - Final state keys: {list(final_state.keys())}")
                 
@@ -1253,6 +1481,7 @@ class CustomReactAgent:
             
         except Exception as e:
             logger.error(f"❌ 流式处理异常 - Thread: {thread_id}: {e}", exc_info=True)
+            root_span.record_error(e)
             
             # 特殊处理Redis相关的Event loop错误
             if "Event loop is closed" in str(e):
@@ -1280,6 +1509,8 @@ class CustomReactAgent:
                     "error": str(e),
                     "thread_id": thread_id
                 }
+        finally:
+            root_span.end()
     
     async def get_conversation_history(self, thread_id: str, include_tools: bool = False) -> Dict[str, Any]:
         """
@@ -1409,14 +1640,66 @@ class CustomReactAgent:
         
         return message_timestamps 
 
+    async def _record_conversation(self, user_id: str, thread_id: str, messages: List[BaseMessage]):
+        """问答完成后更新用户会话索引并裁剪checkpoint（失败不影响问答结果）"""
+        if not self.checkpointer or not self.conversation_index:
+            return
+        try:
+            await self.conversation_index.record(user_id, thread_id, messages)
+        except Exception as e:
+            logger.warning(f"⚠️ 更新会话索引失败 - Thread: {thread_id}: {e}")
+        
+        # 只保留该thread最近的checkpoint，并刷新闲置过期时间
+        if self.checkpoint_retention:
+            try:
+                await self.checkpoint_retention.trim_thread(thread_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Checkpoint裁剪失败 - Thread: {thread_id}: {e}")
+
+    async def _load_thread_messages(self, thread_id: str):
+        """读取会话最新checkpoint中的消息和更新时间（用于补录会话索引）"""
+        state = await self.checkpointer.aget({"configurable": {"thread_id": thread_id}})
+        if not state:
+            return None, None
+        messages = state.get('channel_values', {}).get('messages', [])
+        updated_epoch = None
+        if state.get('ts'):
+            from datetime import datetime
+            updated_epoch = datetime.fromisoformat(state['ts'].replace('Z', '+00:00')).timestamp()
+        return messages, updated_epoch
+
     async def get_user_recent_conversations(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
         获取指定用户的最近聊天记录列表
-        利用thread_id格式 'user_id:timestamp' 来查询
+        优先读取用户会话索引（开销与 limit 成正比）；索引尚未就绪时退回扫描checkpoint
         """
         if not self.checkpointer:
             return []
         
+        try:
+            # 索引由启动时的后台任务补录（见 start_conversation_index_backfill），补录完成前退回扫描
+            if await self.conversation_index.is_ready():
+                summaries = await self.conversation_index.list_recent(user_id, limit)
+                return [{
+                    "conversation_id": summary["thread_id"],
+                    "thread_id": summary["thread_id"],
+                    "user_id": user_id,
+                    "message_count": summary["message_count"],
+                    "last_message": summary.get("last_message") or None,
+                    "updated_at": summary.get("updated_at"),
+                    "conversation_title": summary.get("title"),
+                    "created_at": summary.get("created_at") or self._format_timestamp(summary.get("timestamp", ""))
+                } for summary in summaries]
+        except Exception as e:
+            logger.warning(f"⚠️ 会话索引不可用，退回扫描checkpoint: {e}")
+        
+        return await self._scan_user_recent_conversations(user_id, limit)
+
+    async def _scan_user_recent_conversations(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        扫描checkpoint获取用户最近聊天记录（会话索引就绪前的兼容方式）
+        利用thread_id格式 'user_id:timestamp' 来查询
+        """
         try:
             # 使用统一的异步Redis客户端
             redis_client = self.redis_client
@@ -1582,47 +1865,8 @@ class CustomReactAgent:
             return utc_time_str 
 
     def _get_database_scope_prompt(self) -> str:
-        """Get database scope prompt for intelligent query decision making"""
-        try:
-            import os
-            # Read local db_query_decision_prompt.txt
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            db_scope_file = os.path.join(current_dir, "db_query_decision_prompt.txt")
-            
-            with open(db_scope_file, 'r', encoding='utf-8') as f:
-                db_scope_content = f.read().strip()
-            
-            prompt = f"""You are an intelligent database query assistant. When deciding whether to use database query tools, please follow these rules:
-
-=== DATABASE BUSINESS SCOPE ===
-{db_scope_content}
-
-=== DECISION RULES ===
-1. If the question involves data within the above business scope (service areas, branches, revenue, traffic flow, etc.), use the generate_sql tool
-2. If the question is about general knowledge (like "when do lychees ripen?", weather, historical events, etc.), answer directly based on your knowledge WITHOUT using database tools
-3. When answering general knowledge questions, provide clear and helpful answers without any special prefixes
-
-=== FALLBACK STRATEGY ===
-When generate_sql returns an error message or when queries return no results:
-1. First, check if the question is within the database scope described above
-2. For questions clearly OUTSIDE the database scope (world events, general knowledge, etc.):
-   - Provide the answer based on your knowledge immediately
-   - Give a direct, natural answer without any prefixes or disclaimers
-3. For questions within database scope but queries return no results:
-   - If it's a reasonable question that might have a general answer, provide it naturally
-4. For questions that definitely require specific database data:
-   - Acknowledge the limitation and suggest the data may not be available
-   - Do not attempt to guess or fabricate specific data
-
-Please intelligently choose whether to query the database based on the nature of the user's question,
-not on explaining your decision-making process.
-"""
-            
-            return prompt
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Unable to read database scope description file: {e}")
-            return ""
+        """Get database scope prompt for intelligent query decision making（按文件mtime缓存）"""
+        return prompts.get_database_scope_prompt()
 
     def _generate_validation_error_guidance(self, validation_error: str) -> str:
         """根据验证错误类型生成具体的修复指导"""
@@ -1907,7 +2151,7 @@ not on explaining your decision-making process.
 
     def _get_anti_hallucination_prompt(self, state: AgentState) -> str:
         """
-        生成防幻觉提示词，专注于保持参数原样传递
+        生成防幻觉提示词中随问题变化的部分（固定规则已在系统前缀中，见 prompts.get_system_prefix）
         """
         # 获取当前用户的最新问题
         last_user_message = None
@@ -1919,19 +2163,4 @@ not on explaining your decision-making process.
         if not last_user_message:
             return ""
         
-        prompt = f"""🛡️ 关键指令：工具调用参数必须完全准确
-
-用户当前问题：「{last_user_message}」
-
-调用工具时的严格要求：
-1. **原样传递原则**：question 参数必须与用户问题完全一致，一字不差
-2. **禁止任何改写**：不得进行同义词替换、语言优化或任何形式的修改
-
-❌ 错误示例：
-- 用户问"充电桩"，不得改为"充电栋"
-✅ 正确做法：
-- 完全复制用户的原始问题作为question参数
-
-请严格遵守此要求，确保工具调用的准确性。"""
-        
-        return prompt
\ No newline at end of file
+        return prompts.get_anti_hallucination_question_prompt(last_user_message)
@@ -21,11 +21,13 @@ import redis.asyncio as redis
 try:
     # 尝试相对导入（当作为模块导入时）
     from .agent import CustomReactAgent
+    from .conversation_index import list_recent_sync
     from . import config
     from core.logging import get_react_agent_logger
 except ImportError:
     # 如果相对导入失败，尝试绝对导入（直接运行时）
     from agent import CustomReactAgent
+    from conversation_index import list_recent_sync
     import config
     from core.logging import get_react_agent_logger
 
@@ -426,6 +428,20 @@ def get_user_conversations_simple_sync(user_id: str, limit: int = 10):
         )
         redis_client.ping()
         
+        # 优先读取用户会话索引；索引尚未就绪时扫描checkpoint keys
+        summaries = list_recent_sync(redis_client, user_id, limit)
+        if summaries is not None:
+            conversations = [{
+                "thread_id": summary["thread_id"],
+                "user_id": user_id,
+                "timestamp": summary.get("timestamp"),
+                "message_count": summary["message_count"],
+                "conversation_preview": summary.get("title")
+            } for summary in summaries]
+            redis_client.close()
+            logger.info(f"✅ 从会话索引返回 {len(conversations)} 个对话")
+            return conversations
+        
         # 扫描用户的checkpoint keys
         pattern = f"checkpoint:{user_id}:*"
         logger.info(f"🔍 扫描模式: {pattern}")
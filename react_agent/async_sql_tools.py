@@ -4,16 +4,23 @@
 """
 import json
 import asyncio
+import time
 from typing import List, Dict, Any
 from concurrent.futures import ThreadPoolExecutor
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from pydantic import BaseModel, Field
 from core.logging import get_react_agent_logger
 
+try:
+    from . import config
+except ImportError:
+    import config
+
 logger = get_react_agent_logger("AsyncSQLTools")
 
-# 创建线程池执行器
-_executor = ThreadPoolExecutor(max_workers=3)
+# 创建线程池执行器（进程内所有请求共享；数据库并发由 business_db 的查询限流控制）
+_executor = ThreadPoolExecutor(max_workers=config.TOOL_EXECUTOR_MAX_WORKERS)
 
 class GenerateSqlArgs(BaseModel):
     question: str = Field(description="The user's question in natural language")
@@ -134,7 +141,7 @@ async def valid_sql(sql: str) -> str:
     return await _run_in_executor(_sync_validate)
 
 @tool
-async def run_sql(sql: str) -> str:
+async def run_sql(sql: str, config: RunnableConfig) -> str:
     """
     异步执行 SQL 查询并返回结果
     执行SQL查询并以JSON字符串格式返回结果。
@@ -148,12 +155,15 @@ async def run_sql(sql: str) -> str:
     logger.info(f"🔧 [Async Tool] run_sql - 待执行SQL:")
     logger.info(f"   {sql}")
     
-    def _sync_run():
-        from common.vanna_instance import get_vanna_instance
-        
+    from common.business_db import arun_business_sql
+    from common.query_profiler import collect_query_profiles, elapsed_ms, remember_thread_profiles
+    from react_agent.sql_tools import _get_thread_id_from_config, _get_user_id_from_config, _format_run_sql_error
+    from react_agent.result_store import compact_records_payload
+    
+    with collect_query_profiles() as profiles:
         try:
-            vn = get_vanna_instance()
-            df = vn.run_sql(sql)
+            # 排队等待不阻塞事件循环，SQL本身在线程中执行
+            df = await arun_business_sql(sql, user_id=_get_user_id_from_config(config))
             
             logger.debug(f"SQL执行结果：\n{df}")
             
@@ -163,15 +173,20 @@ async def run_sql(sql: str) -> str:
                 return json.dumps(result, ensure_ascii=False)
             
             logger.info(f"   ✅ SQL执行成功，返回 {len(df)} 条记录。")
-            # 将DataFrame转换为JSON，并妥善处理datetime等特殊类型
-            return df.to_json(orient='records', date_format='iso')
+            # 将DataFrame转换为JSON，并妥善处理datetime等特殊类型（在线程池中完成，避免阻塞事件循环）
+            start = time.perf_counter()
+            payload = await _run_in_executor(lambda: df.to_json(orient='records', date_format='iso'))
+            if profiles:
+                profiles[-1].extra["serialize_ms"] = elapsed_ms(start)
+            # 大结果存入Redis，消息（及checkpoint）中只保留预览和引用
+            return await _run_in_executor(compact_records_payload, df, payload)
             
         except Exception as e:
             logger.error(f"   SQL执行过程中发生异常: {e}", exc_info=True)
-            error_result = {"status": "error", "error_message": str(e)}
-            return json.dumps(error_result, ensure_ascii=False)
-    
-    return await _run_in_executor(_sync_run)
+            return _format_run_sql_error(e)
+        finally:
+            # 剖析数据按 thread_id 暂存，由 Agent 在生成响应元数据时取出
+            remember_thread_profiles(_get_thread_id_from_config(config), profiles)
 
 # 将所有异步工具函数收集到一个列表中
 async_sql_tools = [generate_sql, valid_sql, run_sql]
@@ -0,0 +1,255 @@
+"""
+React Agent checkpoint 保留策略
+
+- 内联保留：每次问答完成后，只保留该 thread 最近 CHECKPOINT_KEEP_COUNT 个 checkpoint，
+  同时删除被删 checkpoint 的 writes，以及不再被保留的 checkpoint 引用的 channel blob；
+  通过 AsyncRedisSaver 自身的 RediSearch 索引按 thread 查找 key（只返回 key 和少量索引字段，不加载内容），
+  删除和刷新过期时间在一次管道中完成，开销只与该 thread 的 checkpoint 数有关
+- 闲置过期：保留下来的 key 和会话索引设置 CHECKPOINT_IDLE_TTL，每次问答后刷新
+- 后台压缩：低优先级任务按小批量 SCAN 处理没有新问答的旧 thread（同一时间只有一个进程执行）；
+  裁剪过的 thread 记录标记（有效期同 CHECKPOINT_IDLE_TTL，每次问答刷新），之后的压缩直接跳过；
+  后台压缩不刷新已有的过期时间（EXPIRE NX，只给没有过期时间的旧 key 补上），闲置 thread 照常过期
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    from . import config
+    from .conversation_index import THREAD_SUMMARY_KEY, USER_THREADS_KEY
+except ImportError:
+    import config
+    from conversation_index import THREAD_SUMMARY_KEY, USER_THREADS_KEY
+from core.logging import get_react_agent_logger
+
+logger = get_react_agent_logger("CheckpointRetention")
+
+# AsyncRedisSaver 的索引名（saver 上没有对应属性时使用）
+_DEFAULT_INDEX_NAMES = {
+    "checkpoints_index": "checkpoints",
+    "checkpoint_blobs_index": "checkpoints_blobs",
+    "checkpoint_writes_index": "checkpoint_writes",
+}
+
+RETAINED_MARKER_KEY = "react:checkpoint_retained:{thread_id}"
+COMPACTOR_LOCK_KEY = "react:checkpoint_compactor:lock"
+
+_TAG_SPECIAL_CHARS = re.compile(r"([,.<>{}\[\]\\\"':;!@#$%^&*()\-+=~/ |?])")
+_SEARCH_LIMIT = 10000
+
+
+def _escape_tag(value: str) -> str:
+    """转义 RediSearch TAG 查询中的特殊字符"""
+    return _TAG_SPECIAL_CHARS.sub(r"\\\1", value)
+
+
+def _version_key(version: str):
+    """channel 版本排序键（默认版本格式为 "00000000000000000000000000000005.0.123"，也兼容整数版本）"""
+    try:
+        return float(version.split(".", 1)[0]), version
+    except ValueError:
+        return float("inf"), version
+
+
+def _parse_search_result(result) -> List[Tuple[str, Dict[str, str]]]:
+    """FT.SEARCH 返回 [total, key1, [field, value, ...], key2, ...]（NOCONTENT 时没有字段列表）"""
+    items = []
+    entries = list(result[1:]) if result else []
+    i = 0
+    while i < len(entries):
+        key = entries[i]
+        fields = {}
+        if i + 1 < len(entries) and isinstance(entries[i + 1], (list, tuple)):
+            raw = entries[i + 1]
+            fields = {raw[j]: raw[j + 1] for j in range(0, len(raw) - 1, 2)}
+            i += 2
+        else:
+            i += 1
+        items.append((key, fields))
+    return items
+
+
+class CheckpointRetention:
+    """按 thread 裁剪 checkpoint 并刷新闲置过期时间（redis.asyncio 客户端，decode_responses=True）"""
+
+    def __init__(self, redis_client, checkpointer=None, keep_count: int = 10, idle_ttl: int = 0):
+        self.redis_client = redis_client
+        self.keep_count = keep_count
+        self.idle_ttl = idle_ttl
+        self.index_names = {
+            attr: getattr(getattr(checkpointer, attr, None), "name", None) or default
+            for attr, default in _DEFAULT_INDEX_NAMES.items()
+        }
+
+    async def _search(self, index_attr: str, query: str, return_fields: List[str]) -> List[Tuple[str, Dict[str, str]]]:
+        args = ["FT.SEARCH", self.index_names[index_attr], query]
+        if return_fields:
+            args += ["RETURN", len(return_fields), *return_fields]
+        else:
+            args.append("NOCONTENT")
+        args += ["LIMIT", 0, _SEARCH_LIMIT]
+        return _parse_search_result(await self.redis_client.execute_command(*args))
+
+    async def trim_thread(self, thread_id: str, keep_count: Optional[int] = None,
+                          refresh_ttl: bool = True) -> Dict[str, int]:
+        """
+        只保留 thread 最近 keep_count 个 checkpoint（每个 checkpoint_ns 分别计算），并刷新闲置过期时间
+
+        Args:
+            refresh_ttl: 是否刷新闲置过期时间；后台压缩时为False，只给没有过期时间的 key 设置
+                         （EXPIRE NX），不延长闲置 thread 的寿命
+
+        Returns:
+            删除统计 {"checkpoints": n, "writes": n, "blobs": n}
+        """
+        keep_count = keep_count or self.keep_count
+        thread_filter = f"@thread_id:{{{_escape_tag(thread_id)}}}"
+
+        checkpoints = await self._search("checkpoints_index", thread_filter, ["checkpoint_ns", "checkpoint_id"])
+        by_namespace: Dict[str, List[Tuple[str, str]]] = {}
+        for key, fields in checkpoints:
+            by_namespace.setdefault(fields.get("checkpoint_ns", ""), []).append((fields.get("checkpoint_id", ""), key))
+
+        kept_keys, old_keys, old_ids = [], [], []
+        for items in by_namespace.values():
+            # checkpoint_id 为 UUIDv6，按字符串排序即按时间排序
+            items.sort()
+            split = max(len(items) - keep_count, 0)
+            old_ids.extend(cid for cid, _ in items[:split])
+            old_keys.extend(key for _, key in items[:split])
+            kept_keys.extend(key for _, key in items[split:])
+
+        if not old_keys and not refresh_ttl and not self.idle_ttl:
+            # 未超过保留数量且不设置过期时间：不再查询 writes/blob
+            await self._mark_retained(thread_id)
+            return {"checkpoints": 0, "writes": 0, "blobs": 0}
+
+        old_id_set = set(old_ids)
+        writes = await self._search("checkpoint_writes_index", thread_filter, ["checkpoint_id"])
+        old_writes = [key for key, fields in writes if fields.get("checkpoint_id") in old_id_set]
+        kept_writes = [key for key, fields in writes if fields.get("checkpoint_id") not in old_id_set]
+
+        blobs = await self._search("checkpoint_blobs_index", thread_filter, ["channel", "version"])
+        if old_keys:
+            kept_blobs, old_blobs = await self._partition_blobs(blobs, kept_keys)
+        else:
+            kept_blobs, old_blobs = [key for key, _ in blobs], []
+        deleted = old_keys + old_writes + old_blobs
+
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            if deleted:
+                pipe.unlink(*deleted)
+            if self.idle_ttl:
+                # 后台压缩只给没有过期时间的 key（如启用闲置过期之前写入的 checkpoint）设置过期时间
+                nx = not refresh_ttl
+                for key in kept_keys + kept_writes + kept_blobs:
+                    pipe.expire(key, self.idle_ttl, nx=nx)
+                pipe.expire(THREAD_SUMMARY_KEY.format(thread_id=thread_id), self.idle_ttl, nx=nx)
+                pipe.expire(USER_THREADS_KEY.format(user_id=thread_id.split(":", 1)[0]), self.idle_ttl, nx=nx)
+            self._mark_retained(thread_id, pipe)
+            await pipe.execute()
+
+        stats = {"checkpoints": len(old_keys), "writes": len(old_writes), "blobs": len(old_blobs)}
+        if deleted:
+            logger.info(f"🧹 Thread {thread_id}: 删除 {stats['checkpoints']} 个checkpoint、"
+                        f"{stats['writes']} 个writes、{stats['blobs']} 个blob")
+        return stats
+
+    def _mark_retained(self, thread_id: str, client=None):
+        """
+        记录 thread 已裁剪，后台压缩跳过有标记的 thread
+
+        新的 checkpoint 只由问答产生，而每次问答都会内联裁剪并刷新标记，因此标记有效期与闲置过期时间一致；
+        未设置闲置过期时间时退化为压缩间隔（到期后重新检查，未超过保留数量的 thread 只需一次索引查询）。
+        """
+        ttl = self.idle_ttl or int(getattr(config, "CHECKPOINT_COMPACTOR_INTERVAL", 3600))
+        return (client or self.redis_client).set(RETAINED_MARKER_KEY.format(thread_id=thread_id),
+                                                 str(time.time()), ex=ttl)
+
+    async def _partition_blobs(self, blobs: List[Tuple[str, Dict[str, str]]],
+                               kept_keys: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        划分 blob：被保留的 checkpoint 引用的、以及比引用版本更新的（可能属于正在执行的问答）保留，其余删除
+
+        Returns:
+            (保留的blob key, 可删除的blob key)；无法读取保留 checkpoint 的版本信息时全部保留
+        """
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for key in kept_keys:
+                pipe.execute_command("JSON.GET", key, "$.checkpoint.channel_versions")
+            raw_versions = await pipe.execute()
+
+        referenced: Set[Tuple[str, str]] = set()
+        latest: Dict[str, str] = {}
+        for raw in raw_versions:
+            if not raw:
+                return [key for key, _ in blobs], []
+            for channel, version in (json.loads(raw)[0] or {}).items():
+                version = str(version)
+                referenced.add((channel, version))
+                if channel not in latest or _version_key(version) > _version_key(latest[channel]):
+                    latest[channel] = version
+
+        kept, old = [], []
+        for key, fields in blobs:
+            channel, version = fields.get("channel"), fields.get("version")
+            if channel is None or version is None:
+                kept.append(key)
+            elif ((channel, version) in referenced or channel not in latest
+                  or _version_key(version) > _version_key(latest[channel])):
+                kept.append(key)
+            else:
+                old.append(key)
+        return kept, old
+
+    async def compact_once(self, batch_size: int = 200) -> int:
+        """
+        后台压缩一轮：小批量扫描 checkpoint key，裁剪还没有裁剪标记的 thread
+
+        Returns:
+            实际删除了 checkpoint 的 thread 数；其他进程正在压缩时返回0
+        """
+        interval = int(getattr(config, "CHECKPOINT_COMPACTOR_INTERVAL", 3600))
+        if not await self.redis_client.set(COMPACTOR_LOCK_KEY, "1", nx=True, ex=interval):
+            return 0
+
+        seen: Set[str] = set()
+        compacted = 0
+        scanned = 0
+        async for key in self.redis_client.scan_iter(match="checkpoint:*", count=batch_size):
+            scanned += 1
+            if scanned % batch_size == 0:
+                # 低优先级：每批之间让出事件循环
+                await asyncio.sleep(0.05)
+            parts = key.split(":")
+            # key格式: checkpoint:user_id:timestamp:checkpoint_ns:checkpoint_id
+            if len(parts) < 4:
+                continue
+            thread_id = f"{parts[1]}:{parts[2]}"
+            if thread_id in seen:
+                continue
+            seen.add(thread_id)
+            if await self.redis_client.exists(RETAINED_MARKER_KEY.format(thread_id=thread_id)):
+                continue
+            try:
+                stats = await self.trim_thread(thread_id, refresh_ttl=False)
+                if stats["checkpoints"]:
+                    compacted += 1
+            except Exception as e:
+                logger.warning(f"⚠️ 压缩thread失败 {thread_id}: {e}")
+
+        logger.info(f"✅ checkpoint后台压缩完成: 扫描 {len(seen)} 个thread，裁剪 {compacted} 个")
+        return compacted
+
+    async def run_compactor(self, interval: float, batch_size: int = 200):
+        """周期性执行后台压缩，直到任务被取消"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.compact_once(batch_size)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ checkpoint后台压缩失败: {e}")
@@ -48,12 +48,17 @@ RECURSION_LIMIT = 100  # StateGraph递归限制
 
 # --- 网络重试配置 ---
 MAX_RETRIES = 3                    # 最大重试次数（减少以避免与OpenAI客户端冲突）
-RETRY_BASE_DELAY = 3               # 重试基础延迟（秒）
+RETRY_BASE_DELAY = 3               # 重试基础延迟（秒），实际等待时间在 [0, 基础延迟 * 2^attempt] 内随机
+RETRY_MAX_DELAY = 30               # 单次重试最大等待时间（秒）
+RETRY_BUDGET_RATIO = 0.2           # 重试预算：每次成功的LLM调用允许之后重试的次数（进程内所有请求共享）
+RETRY_BUDGET_MIN_PER_SECOND = 0.2  # 重试预算每秒最少补充的次数（故障期间仍允许少量重试）
+RETRY_BUDGET_MAX_TOKENS = 10       # 重试预算上限（允许的突发重试次数）
 NETWORK_TIMEOUT = 60               # 网络超时时间（秒）- 增加到60秒以应对长上下文处理
 
 # --- HTTP连接管理配置 ---
-HTTP_MAX_CONNECTIONS = 10          # 最大连接数
-HTTP_MAX_KEEPALIVE_CONNECTIONS = 5 # 最大保持连接数
+LLM_EXPECTED_CONCURRENCY = 20      # 预期同时调用LLM的请求数，连接池大小按此放大
+HTTP_MAX_CONNECTIONS = 10          # 最大连接数（下限，实际取 max(此值, LLM_EXPECTED_CONCURRENCY)）
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 5 # 最大保持连接数（下限，实际取 max(此值, LLM_EXPECTED_CONCURRENCY // 2)）
 HTTP_KEEPALIVE_EXPIRY = 30.0       # Keep-Alive过期时间（秒）- 设置为30秒避免服务器断开
 HTTP_CONNECT_TIMEOUT = 10.0        # 连接超时（秒）
 HTTP_POOL_TIMEOUT = 5.0            # 连接池超时（秒）
@@ -67,5 +72,37 @@ MESSAGE_TRIM_ENABLED = True        # 是否启用消息裁剪
 MESSAGE_TRIM_COUNT = 100          # 消息数量超过此值时触发裁剪，裁剪后保留此数量的消息
 MESSAGE_TRIM_SEARCH_LIMIT = 20    # 向前搜索HumanMessage的最大条数
 
+# --- 提示词配置 ---
+PROMPT_RELOAD_CHECK_INTERVAL = 5      # 检查提示词文件（db_query_decision_prompt.txt）是否修改的最小间隔（秒）
+
+# --- 对话记忆配置（按token预算） ---
+# 启用后代替按消息数量裁剪：历史轮次的工具输出压缩为摘要，超出预算的早期轮次并入滚动摘要
+MEMORY_TOKEN_BUDGET_ENABLED = True
+MEMORY_TOKEN_BUDGET = 12000           # 每次调用LLM时历史消息的token预算（含滚动摘要和当前轮次，不含系统提示词）
+MEMORY_TOOL_OUTPUT_MAX_TOKENS = 300   # 历史轮次中单个工具输出压缩后的最大token数
+MEMORY_SUMMARY_MAX_TOKENS = 1000      # 滚动摘要的最大token数，超出时丢弃最早的条目
+MEMORY_SUMMARY_USE_LLM = False        # 是否调用LLM生成滚动摘要（False=直接提取每轮的问题和回答，不增加LLM调用）
+
+# --- 工具执行配置 ---
+TOOL_MAX_CONCURRENCY_PER_REQUEST = 4  # 同一条消息中多个工具调用的并发上限（每个请求）；
+                                      # run_sql/valid_sql 另外不超过 app_config.BUSINESS_DB_MAX_QUERIES_PER_USER
+TOOL_EXECUTOR_MAX_WORKERS = 16        # 异步工具执行同步操作（Vanna、SQL验证、结果序列化）的线程池大小（进程内共享）
+TOOL_MERGE_VALIDATE_AND_RUN = True    # 同一条消息中valid_sql和run_sql针对同一SQL时只执行run_sql，验证结果由执行结果得出
+
+# --- 工具结果外部存储配置 ---
+# run_sql结果超过阈值时完整JSON按内容哈希存入Redis，消息和checkpoint中只保留预览和引用
+TOOL_RESULT_OFFLOAD_ENABLED = True
+TOOL_RESULT_OFFLOAD_THRESHOLD = 8000  # 结果JSON超过此字符数时外部存储
+TOOL_RESULT_PREVIEW_ROWS = 20         # 消息中保留的预览行数
+TOOL_RESULT_TTL = 30 * 24 * 3600      # 外部存储结果的过期时间（秒），与CHECKPOINT_IDLE_TTL保持一致
+
+# --- 用户会话索引配置 ---
+CONVERSATION_INDEX_MAX_THREADS = 1000  # 每个用户索引中保留的最近会话数，0表示不限制
+
 # --- Checkpoint管理配置 ---
-CHECKPOINT_KEEP_COUNT = 10         # 每个thread保留的checkpoint数量（API默认值） 
\ No newline at end of file
+CHECKPOINT_KEEP_COUNT = 10         # 每个thread保留的checkpoint数量（API默认值）
+CHECKPOINT_INLINE_RETENTION_ENABLED = True  # 每次问答完成后只保留该thread最近 CHECKPOINT_KEEP_COUNT 个checkpoint
+CHECKPOINT_IDLE_TTL = 30 * 24 * 3600        # thread闲置多久后过期（秒），每次问答后刷新，0表示不过期
+CHECKPOINT_COMPACTOR_ENABLED = True         # 是否启用后台压缩（处理没有新问答的旧thread，裁剪后标记，标记有效期同CHECKPOINT_IDLE_TTL）
+CHECKPOINT_COMPACTOR_INTERVAL = 3600        # 后台压缩间隔（秒）
+CHECKPOINT_COMPACTOR_BATCH_SIZE = 200       # 后台压缩每批扫描的key数量，批次之间让出事件循环
@@ -0,0 +1,273 @@
+"""
+React Agent 用户会话索引
+
+代替按 `checkpoint:{user_id}:*` SCAN 整个键空间并解析每个会话最新 checkpoint 的做法：
+- react:user_threads:{user_id}    有序集合，成员为 thread_id，分数为最后更新时间（epoch秒）
+- react:thread_summary:{thread_id} 哈希，保存列表展示需要的摘要（标题、最后一条用户消息、消息数、创建/更新时间）
+每次 chat / chat_stream 完成时写入，列出最近会话只需 ZREVRANGE + limit 次 HGETALL（一次管道往返），
+开销与 limit 成正比，与 Redis 中 checkpoint 总量无关。
+超出 CONVERSATION_INDEX_MAX_THREADS 被移出索引的会话同时删除其摘要；摘要已过期的成员在列出时移除。
+
+索引上线前已存在的会话由 backfill 在服务启动后的后台任务中一次性补录，完成后写入
+react:conversation_index:ready 标记；标记不存在时调用方退回原来的 SCAN 方式。
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from . import config
+except ImportError:
+    import config
+from core.logging import get_react_agent_logger
+
+logger = get_react_agent_logger("ConversationIndex")
+
+USER_THREADS_KEY = "react:user_threads:{user_id}"
+THREAD_SUMMARY_KEY = "react:thread_summary:{thread_id}"
+INDEX_READY_KEY = "react:conversation_index:ready"
+BACKFILL_LOCK_KEY = "react:conversation_index:backfill_lock"
+
+_CHINA_TZ = timezone(timedelta(hours=8))
+_TITLE_LENGTH = 50
+_BACKFILL_LOCK_TTL = 600
+# 补录时每处理这么多个会话让出一次事件循环并续期补录锁
+_BACKFILL_BATCH_SIZE = 100
+
+
+def _preview(content: Any) -> str:
+    content = str(content)
+    return content[:_TITLE_LENGTH] + "..." if len(content) > _TITLE_LENGTH else content
+
+
+def _message_type(message: Any) -> Optional[str]:
+    """消息类型（BaseMessage 对象或序列化后的字典）"""
+    if isinstance(message, dict):
+        kwargs = message.get("kwargs")
+        if isinstance(kwargs, dict) and kwargs.get("type"):
+            return kwargs["type"]
+        return message.get("type")
+    return getattr(message, "type", None)
+
+
+def _message_content(message: Any) -> Any:
+    if isinstance(message, dict):
+        kwargs = message.get("kwargs")
+        if isinstance(kwargs, dict) and "content" in kwargs:
+            return kwargs["content"]
+        return message.get("content", "")
+    return getattr(message, "content", "")
+
+
+def format_thread_timestamp(thread_id: str) -> Optional[str]:
+    """从 thread_id（user_id:YYYYmmddHHMMSSmmm）解析创建时间，格式 2025-07-10 12:31:37.984"""
+    timestamp = thread_id.split(":", 1)[1] if ":" in thread_id else ""
+    if len(timestamp) < 14 or not timestamp[:14].isdigit():
+        return None
+    millisecond = timestamp[14:17] if len(timestamp) > 14 else "000"
+    return (f"{timestamp[:4]}-{timestamp[4:6]}-{timestamp[6:8]} "
+            f"{timestamp[8:10]}:{timestamp[10:12]}:{timestamp[12:14]}.{millisecond}")
+
+
+def format_epoch(epoch: float) -> str:
+    """epoch秒 → 中国时区时间，格式 2025-07-17 21:12:02.456"""
+    return datetime.fromtimestamp(epoch, _CHINA_TZ).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def build_thread_summary(user_id: str, thread_id: str, messages: Iterable[Any],
+                         updated_at: Optional[float] = None) -> Dict[str, str]:
+    """根据会话消息生成摘要（Redis 哈希字段，值均为字符串）"""
+    messages = list(messages or [])
+    updated_at = updated_at if updated_at is not None else time.time()
+
+    title = "空对话" if not messages else "系统消息"
+    last_message = ""
+    for message in messages:
+        if _message_type(message) == "human":
+            title = _preview(_message_content(message))
+            break
+    for message in reversed(messages):
+        if _message_type(message) == "human":
+            last_message = str(_message_content(message))
+            break
+
+    return {
+        "thread_id": thread_id,
+        "user_id": user_id,
+        "title": title,
+        "last_message": last_message,
+        "message_count": str(len(messages)),
+        "timestamp": thread_id.split(":", 1)[1] if ":" in thread_id else "",
+        "created_at": format_thread_timestamp(thread_id) or "",
+        "updated_at": format_epoch(updated_at),
+        "updated_epoch": repr(updated_at),
+    }
+
+
+def _decode_summary(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    summary = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+    summary["message_count"] = int(summary.get("message_count") or 0)
+    return summary
+
+
+def _max_threads() -> int:
+    return getattr(config, "CONVERSATION_INDEX_MAX_THREADS", 1000)
+
+
+def _record_commands(pipe, user_id: str, thread_id: str, summary: Dict[str, str], score: float):
+    user_key = USER_THREADS_KEY.format(user_id=user_id)
+    pipe.zadd(user_key, {thread_id: score})
+    pipe.hset(THREAD_SUMMARY_KEY.format(thread_id=thread_id), mapping=summary)
+    # 只保留最近的若干会话（更早的会话仍可通过 thread_id 直接访问），先取出超出的成员，再连同摘要一起删除
+    if _max_threads():
+        pipe.zrange(user_key, 0, -_max_threads() - 1)
+
+
+def _remove_commands(pipe, user_id: str, thread_ids: List[Any]):
+    """从用户索引中移除会话并删除其摘要"""
+    pipe.zrem(USER_THREADS_KEY.format(user_id=user_id), *thread_ids)
+    pipe.unlink(*(THREAD_SUMMARY_KEY.format(thread_id=_as_str(t)) for t in thread_ids))
+
+
+class ConversationIndex:
+    """用户会话索引（redis.asyncio 客户端）"""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    async def record(self, user_id: str, thread_id: str, messages: Iterable[Any]):
+        """会话完成一轮问答后更新索引"""
+        summary = build_thread_summary(user_id, thread_id, messages)
+        await self._record(user_id, thread_id, summary)
+
+    async def _record(self, user_id: str, thread_id: str, summary: Dict[str, str]):
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            _record_commands(pipe, user_id, thread_id, summary, float(summary["updated_epoch"]))
+            results = await pipe.execute()
+        evicted = results[2] if len(results) > 2 else None
+        if evicted:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                _remove_commands(pipe, user_id, evicted)
+                await pipe.execute()
+
+    async def is_ready(self) -> bool:
+        return bool(await self.redis_client.exists(INDEX_READY_KEY))
+
+    async def list_recent(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """按最后更新时间倒序返回最近 limit 个会话摘要（跳过并移除摘要已不存在的成员）"""
+        user_key = USER_THREADS_KEY.format(user_id=user_id)
+        summaries: List[Dict[str, Any]] = []
+        start = 0
+        while len(summaries) < limit:
+            thread_ids = await self.redis_client.zrevrange(user_key, start, start + limit - 1)
+            if not thread_ids:
+                break
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for thread_id in thread_ids:
+                    pipe.hgetall(THREAD_SUMMARY_KEY.format(thread_id=_as_str(thread_id)))
+                raw_summaries = await pipe.execute()
+            dangling = _collect_summaries(thread_ids, raw_summaries, summaries, limit)
+            if dangling:
+                await self.redis_client.zrem(user_key, *dangling)
+            # 移除的成员不再占用排名
+            start += len(thread_ids) - len(dangling)
+            if len(thread_ids) < limit:
+                break
+        return summaries
+
+    async def backfill(self, load_thread_messages) -> int:
+        """
+        一次性补录索引上线前的会话（多进程下只有一个进程执行）
+
+        Args:
+            load_thread_messages: async (thread_id) -> (messages, updated_epoch)，会话不存在时返回 (None, None)
+
+        Returns:
+            补录的会话数；索引已就绪或其他进程正在补录时返回0
+        """
+        if await self.is_ready():
+            return 0
+        if not await self.redis_client.set(BACKFILL_LOCK_KEY, "1", nx=True, ex=_BACKFILL_LOCK_TTL):
+            return 0
+
+        try:
+            thread_ids = set()
+            async for key in self.redis_client.scan_iter(match="checkpoint:*", count=1000):
+                parts = _as_str(key).split(":")
+                # key格式: checkpoint:user_id:timestamp:...
+                if len(parts) >= 4:
+                    thread_ids.add(f"{parts[1]}:{parts[2]}")
+
+            recorded = 0
+            for i, thread_id in enumerate(thread_ids, 1):
+                if i % _BACKFILL_BATCH_SIZE == 0:
+                    # 后台低优先级：让出事件循环，并续期补录锁
+                    await self.redis_client.expire(BACKFILL_LOCK_KEY, _BACKFILL_LOCK_TTL)
+                    await asyncio.sleep(0.05)
+                try:
+                    messages, updated_epoch = await load_thread_messages(thread_id)
+                    if messages is None:
+                        continue
+                    user_id = thread_id.split(":", 1)[0]
+                    await self._record(user_id, thread_id,
+                                       build_thread_summary(user_id, thread_id, messages, updated_epoch))
+                    recorded += 1
+                except Exception as e:
+                    logger.warning(f"⚠️ 补录会话索引失败 {thread_id}: {e}")
+
+            await self.redis_client.set(INDEX_READY_KEY, str(time.time()))
+            logger.info(f"✅ 会话索引补录完成: {recorded}/{len(thread_ids)} 个会话")
+            return recorded
+        finally:
+            await self.redis_client.delete(BACKFILL_LOCK_KEY)
+
+
+def _collect_summaries(thread_ids: List[Any], raw_summaries: List[Any],
+                       summaries: List[Dict[str, Any]], limit: int) -> List[Any]:
+    """把有效摘要追加到 summaries（最多 limit 个），返回摘要已不存在（过期或被删除）的成员"""
+    dangling = []
+    for thread_id, raw in zip(thread_ids, raw_summaries):
+        summary = _decode_summary(raw)
+        if summary is None:
+            dangling.append(thread_id)
+        elif len(summaries) < limit:
+            summaries.append(summary)
+    return dangling
+
+
+def list_recent_sync(redis_client, user_id: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    同步版本的 list_recent（redis-py 同步客户端）
+
+    Returns:
+        会话摘要列表；索引尚未就绪时返回None（调用方退回 SCAN 方式）
+    """
+    if not redis_client.exists(INDEX_READY_KEY):
+        return None
+    user_key = USER_THREADS_KEY.format(user_id=user_id)
+    summaries: List[Dict[str, Any]] = []
+    start = 0
+    while len(summaries) < limit:
+        thread_ids = redis_client.zrevrange(user_key, start, start + limit - 1)
+        if not thread_ids:
+            break
+        pipe = redis_client.pipeline(transaction=False)
+        for thread_id in thread_ids:
+            pipe.hgetall(THREAD_SUMMARY_KEY.format(thread_id=_as_str(thread_id)))
+        dangling = _collect_summaries(thread_ids, pipe.execute(), summaries, limit)
+        if dangling:
+            redis_client.zrem(user_key, *dangling)
+        start += len(thread_ids) - len(dangling)
+        if len(thread_ids) < limit:
+            break
+    return summaries
+
+
+def _as_str(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
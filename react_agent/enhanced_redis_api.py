@@ -1,10 +1,18 @@
 """
 enhanced_redis_api.py - 完整的Redis直接访问API
 支持include_tools开关参数，可以控制是否包含工具调用信息
+
+读取方式（每次请求固定2次管道往返，与checkpoint数量无关）：
+1. 一次管道读取该thread所有checkpoint的 ts 和消息ID（JSON路径投影，不读取消息内容），
+   同时读取最新checkpoint的消息类名和消息数，用于构建消息时间戳映射
+2. 只从最新checkpoint读取需要的消息：include_tools=False 时按消息类名只取 human/ai 消息，
+   工具消息的内容（如大查询结果）既不传输也不解析
+非RedisJSON格式（旧版本string类型）的checkpoint退回读取并解析完整数据
 """
 import redis
 import json
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
 
@@ -16,6 +24,146 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+_CHECKPOINT_TS_PATH = "$.checkpoint.ts"
+_MESSAGES_PATH = "$.checkpoint.channel_values.messages"
+_MESSAGE_IDS_PATH = _MESSAGES_PATH + "[*].kwargs.id"
+_MESSAGE_CLASSES_PATH = _MESSAGES_PATH + "[*].id"
+# 简化模式（include_tools=False）需要读取内容的消息类
+_SIMPLE_MODE_MESSAGE_CLASSES = {"HumanMessage", "AIMessage"}
+
+_redis_client = None
+_redis_client_lock = threading.Lock()
+
+
+def _get_redis_client():
+    """同步Redis客户端（单例，复用连接池）"""
+    global _redis_client
+    if _redis_client is None:
+        with _redis_client_lock:
+            if _redis_client is None:
+                _redis_client = redis.Redis(
+                    host=config.REDIS_HOST,
+                    port=config.REDIS_PORT,
+                    db=config.REDIS_DB,
+                    password=config.REDIS_PASSWORD,
+                    decode_responses=True
+                )
+    return _redis_client
+
+
+def _to_china_time(ts_value: Any) -> Optional[str]:
+    """checkpoint的ISO时间戳转换为中国时区格式 2025-07-10 12:31:37.984"""
+    if not isinstance(ts_value, str):
+        return None
+    import pytz
+    dt = datetime.fromisoformat(ts_value.replace('Z', '+00:00'))
+    china_tz = pytz.timezone('Asia/Shanghai')
+    return dt.astimezone(china_tz).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def _scan_checkpoint_keys(redis_client, thread_id: str) -> List[str]:
+    pattern = f"checkpoint:{thread_id}:*"
+    return list(redis_client.scan_iter(match=pattern, count=1000))
+
+
+def _fetch_checkpoint_index(redis_client, keys: List[str], latest_key: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    一次管道读取所有checkpoint的 ts 和消息ID，以及最新checkpoint的消息类名和消息数
+
+    Returns:
+        (checkpoint列表 [{key, raw_ts, message_ids, data}], 最新checkpoint信息 {classes, count, data})
+        data 只在非RedisJSON格式的checkpoint中存在（完整解析后的数据）
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.execute_command('JSON.GET', key, _CHECKPOINT_TS_PATH, _MESSAGE_IDS_PATH)
+    pipe.execute_command('JSON.GET', latest_key, _MESSAGE_CLASSES_PATH)
+    pipe.execute_command('JSON.ARRLEN', latest_key, _MESSAGES_PATH)
+    results = pipe.execute(raise_on_error=False)
+
+    entries = []
+    legacy_keys = []
+    for key, raw in zip(keys, results[:len(keys)]):
+        if isinstance(raw, Exception):
+            legacy_keys.append(key)
+            continue
+        if not raw:
+            continue
+        projected = json.loads(raw)
+        ts_values = projected.get(_CHECKPOINT_TS_PATH) or [None]
+        entries.append({
+            "key": key,
+            "raw_ts": ts_values[0],
+            "message_ids": projected.get(_MESSAGE_IDS_PATH) or [],
+            "data": None
+        })
+
+    raw_classes, raw_count = results[-2], results[-1]
+    latest = {"classes": None, "count": None, "data": None}
+    if not isinstance(raw_classes, Exception) and raw_classes:
+        latest["classes"] = json.loads(raw_classes)
+    if not isinstance(raw_count, Exception) and raw_count:
+        latest["count"] = raw_count[0] if isinstance(raw_count, list) else raw_count
+
+    if legacy_keys:
+        # 非RedisJSON格式：读取完整数据
+        logger.info(f"🔍 {len(legacy_keys)} 个checkpoint不是RedisJSON格式，读取完整数据")
+        pipe = redis_client.pipeline(transaction=False)
+        for key in legacy_keys:
+            pipe.get(key)
+        for key, raw in zip(legacy_keys, pipe.execute(raise_on_error=False)):
+            if isinstance(raw, Exception) or not raw:
+                continue
+            try:
+                checkpoint_data = json.loads(raw)
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠️ 处理checkpoint失败 {key}: {e}")
+                continue
+            checkpoint = checkpoint_data.get('checkpoint') if isinstance(checkpoint_data.get('checkpoint'), dict) else {}
+            entries.append({
+                "key": key,
+                "raw_ts": checkpoint.get('ts'),
+                "message_ids": [m['kwargs'].get('id') for m in extract_messages_from_checkpoint(checkpoint_data)
+                                if isinstance(m, dict) and isinstance(m.get('kwargs'), dict)],
+                "data": checkpoint_data
+            })
+            if key == latest_key:
+                latest["data"] = checkpoint_data
+
+    return entries, latest
+
+
+def _fetch_latest_messages(redis_client, latest_key: str, latest: Dict[str, Any], include_tools: bool) -> List[Any]:
+    """
+    读取最新checkpoint中需要的消息
+
+    include_tools=False 时只读取 human/ai 消息（按消息类名选择下标，工具消息不传输不解析）；
+    消息类名与消息数对不上（如存在非LangChain序列化格式的消息）时读取全部消息。
+    """
+    if latest["data"] is not None:
+        return extract_messages_from_checkpoint(latest["data"])
+
+    classes, count = latest["classes"], latest["count"]
+    if include_tools or classes is None or count is None or len(classes) != count:
+        raw = redis_client.execute_command('JSON.GET', latest_key, _MESSAGES_PATH)
+        matches = json.loads(raw) if raw else []
+        return matches[0] if matches else []
+
+    indices = [i for i, cls in enumerate(classes)
+               if not isinstance(cls, list) or (cls and cls[-1] in _SIMPLE_MODE_MESSAGE_CLASSES)]
+    if not indices:
+        return []
+    paths = [f"{_MESSAGES_PATH}[{i}]" for i in indices]
+    raw = redis_client.execute_command('JSON.GET', latest_key, *paths)
+    if not raw:
+        return []
+    projected = json.loads(raw)
+    if len(paths) == 1:
+        # 单个路径时返回匹配结果数组
+        return projected[:1]
+    return [projected[path][0] for path in paths if projected.get(path)]
+
+
 def get_conversation_detail_from_redis(thread_id: str, include_tools: bool = False) -> Dict[str, Any]:
     """
     直接从Redis获取对话详细信息
@@ -30,32 +178,14 @@ def get_conversation_detail_from_redis(thread_id: str, include_tools: bool = Fal
         包含对话详细信息的字典
     """
     try:
-        # 创建Redis连接
-        redis_client = redis.Redis(
-            host=config.REDIS_HOST,
-            port=config.REDIS_PORT,
-            db=config.REDIS_DB,
-            password=config.REDIS_PASSWORD,
-            decode_responses=True
-        )
-        redis_client.ping()
+        redis_client = _get_redis_client()
         
         # 扫描该thread的所有checkpoint keys
-        pattern = f"checkpoint:{thread_id}:*"
-        logger.info(f"🔍 扫描模式: {pattern}, include_tools: {include_tools}")
-        
-        keys = []
-        cursor = 0
-        while True:
-            cursor, batch = redis_client.scan(cursor=cursor, match=pattern, count=1000)
-            keys.extend(batch)
-            if cursor == 0:
-                break
-        
+        logger.info(f"🔍 扫描模式: checkpoint:{thread_id}:*, include_tools: {include_tools}")
+        keys = _scan_checkpoint_keys(redis_client, thread_id)
         logger.info(f"📋 找到 {len(keys)} 个keys")
         
         if not keys:
-            redis_client.close()
             return {
                 "success": False,
                 "error": f"未找到对话 {thread_id}",
@@ -66,80 +196,32 @@ def get_conversation_detail_from_redis(thread_id: str, include_tools: bool = Fal
         latest_key = max(keys)
         logger.info(f"🔍 使用最新key: {latest_key}")
         
-        # 检查key类型并获取数据
-        key_type = redis_client.type(latest_key)
-        logger.info(f"🔍 Key类型: {key_type}")
-        
-        data = None
-        if key_type == 'string':
-            data = redis_client.get(latest_key)
-        elif key_type == 'ReJSON-RL':
-            # RedisJSON类型
-            try:
-                data = redis_client.execute_command('JSON.GET', latest_key)
-            except Exception as json_error:
-                logger.error(f"❌ JSON.GET 失败: {json_error}")
-                redis_client.close()
-                return {
-                    "success": False,
-                    "error": f"无法读取RedisJSON数据: {json_error}",
-                    "data": None
-                }
-        else:
-            redis_client.close()
-            return {
-                "success": False,
-                "error": f"不支持的key类型: {key_type}",
-                "data": None
-            }
-        
-        if not data:
-            redis_client.close()
+        # 一次管道读取所有checkpoint的时间戳和消息ID
+        entries, latest = _fetch_checkpoint_index(redis_client, keys, latest_key)
+        latest_entry = next((e for e in entries if e["key"] == latest_key), None)
+        if latest_entry is None:
             return {
                 "success": False,
                 "error": "没有找到有效数据",
                 "data": None
             }
         
-        # 解析JSON数据
-        try:
-            checkpoint_data = json.loads(data)
-            logger.info(f"🔍 JSON顶级keys: {list(checkpoint_data.keys())}")
-        except json.JSONDecodeError as e:
-            redis_client.close()
-            return {
-                "success": False,
-                "error": f"JSON解析失败: {e}",
-                "data": None
-            }
-        
-        # 提取消息数据
-        messages = extract_messages_from_checkpoint(checkpoint_data)
-        logger.info(f"🔍 找到 {len(messages)} 条原始消息")
+        # 只读取最新checkpoint中需要的消息
+        messages = _fetch_latest_messages(redis_client, latest_key, latest, include_tools)
+        total_raw_messages = latest["count"] if latest["count"] is not None else len(messages)
+        logger.info(f"🔍 读取 {len(messages)}/{total_raw_messages} 条原始消息")
         
         # 🔑 关键改进：构建消息ID到时间戳的映射（模仿LangGraph API）
         logger.debug(f"🔍 开始构建消息时间戳映射...")
-        message_timestamps = _build_message_timestamp_map_from_redis(redis_client, thread_id)
+        message_timestamps = _build_message_timestamp_map(entries)
         
         # 提取最新checkpoint时间戳作为备用
         checkpoint_ts = None
-        if ('checkpoint' in checkpoint_data and 
-            isinstance(checkpoint_data['checkpoint'], dict) and 
-            'ts' in checkpoint_data['checkpoint']):
-            
-            ts_value = checkpoint_data['checkpoint']['ts']
-            if isinstance(ts_value, str):
-                try:
-                    # 转换为中国时区格式
-                    from datetime import datetime
-                    import pytz
-                    dt = datetime.fromisoformat(ts_value.replace('Z', '+00:00'))
-                    china_tz = pytz.timezone('Asia/Shanghai')
-                    china_dt = dt.astimezone(china_tz)
-                    checkpoint_ts = china_dt.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-                    logger.debug(f"🕒 备用checkpoint时间戳: {checkpoint_ts}")
-                except Exception as e:
-                    logger.warning(f"⚠️ 时间戳转换失败: {e}")
+        try:
+            checkpoint_ts = _to_china_time(latest_entry["raw_ts"])
+            logger.debug(f"🕒 备用checkpoint时间戳: {checkpoint_ts}")
+        except Exception as e:
+            logger.warning(f"⚠️ 时间戳转换失败: {e}")
         
         # 解析并过滤消息 - 使用消息时间戳映射
         parsed_messages = parse_and_filter_messages(messages, include_tools, checkpoint_ts, message_timestamps)
@@ -153,7 +235,6 @@ def get_conversation_detail_from_redis(thread_id: str, include_tools: bool = Fal
             try:
                 timestamp_str = thread_id.split(':')[1]
                 # 转换为中国时区格式
-                from datetime import datetime
                 import pytz
                 # 假设timestamp是YYYYMMDDHHmmssSSS格式
                 dt = datetime.strptime(timestamp_str, '%Y%m%d%H%M%S%f')
@@ -167,8 +248,6 @@ def get_conversation_detail_from_redis(thread_id: str, include_tools: bool = Fal
         # 生成对话统计信息
         stats = generate_conversation_stats(parsed_messages, include_tools)
         
-        redis_client.close()
-        
         return {
             "success": True,
             "data": {
@@ -182,7 +261,7 @@ def get_conversation_detail_from_redis(thread_id: str, include_tools: bool = Fal
                 "stats": stats,
                 "metadata": {
                     "latest_checkpoint_key": latest_key,
-                    "total_raw_messages": len(messages),
+                    "total_raw_messages": total_raw_messages,
                     "filtered_message_count": len(parsed_messages),
                     "filter_mode": "full_conversation" if include_tools else "human_ai_only"
                 }
@@ -221,102 +300,29 @@ def extract_messages_from_checkpoint(checkpoint_data: Dict[str, Any]) -> List[An
     
     return messages
 
-def _build_message_timestamp_map_from_redis(redis_client, thread_id: str) -> Dict[str, str]:
+def _build_message_timestamp_map(entries: List[Dict[str, Any]]) -> Dict[str, str]:
     """
     构建消息ID到时间戳的映射，模仿LangGraph API的逻辑
-    遍历所有历史checkpoint，为每条消息记录其首次出现的时间戳
+    按时间顺序遍历所有历史checkpoint（只用到 ts 和消息ID），为每条消息记录其首次出现的时间戳
     """
     message_timestamps = {}
     
     try:
-        # 获取所有checkpoint keys
-        pattern = f"checkpoint:{thread_id}:*"
-        keys = []
-        cursor = 0
-        while True:
-            cursor, batch = redis_client.scan(cursor=cursor, match=pattern, count=1000)
-            keys.extend(batch)
-            if cursor == 0:
-                break
-        
-        if not keys:
-            logger.warning(f"⚠️ 未找到任何checkpoint keys: {pattern}")
-            return message_timestamps
-        
-        # 获取所有checkpoint数据并按时间戳排序
-        checkpoints_with_ts = []
-        
-        for key in keys:
-            try:
-                # 检查key类型并获取数据
-                key_type = redis_client.type(key)
-                data = None
-                
-                if key_type == 'string':
-                    data = redis_client.get(key)
-                elif key_type == 'ReJSON-RL':
-                    data = redis_client.execute_command('JSON.GET', key)
-                else:
-                    continue
-                
-                if not data:
-                    continue
-                
-                # 解析checkpoint数据
-                checkpoint_data = json.loads(data)
-                
-                # 提取时间戳
-                checkpoint_ts = None
-                if ('checkpoint' in checkpoint_data and 
-                    isinstance(checkpoint_data['checkpoint'], dict) and 
-                    'ts' in checkpoint_data['checkpoint']):
-                    
-                    ts_value = checkpoint_data['checkpoint']['ts']
-                    if isinstance(ts_value, str):
-                        try:
-                            # 转换为中国时区格式
-                            from datetime import datetime
-                            import pytz
-                            dt = datetime.fromisoformat(ts_value.replace('Z', '+00:00'))
-                            china_tz = pytz.timezone('Asia/Shanghai')
-                            china_dt = dt.astimezone(china_tz)
-                            checkpoint_ts = china_dt.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-                        except Exception as e:
-                            logger.warning(f"⚠️ 解析时间戳失败 {key}: {e}")
-                            continue
-                
-                if checkpoint_ts:
-                    checkpoints_with_ts.append({
-                        'key': key,
-                        'timestamp': checkpoint_ts,
-                        'data': checkpoint_data,
-                        'raw_ts': ts_value  # 用于排序
-                    })
-                    
-            except Exception as e:
-                logger.warning(f"⚠️ 处理checkpoint失败 {key}: {e}")
-                continue
-        
         # 按时间戳排序（最早的在前）
-        checkpoints_with_ts.sort(key=lambda x: x['raw_ts'])
-        
+        checkpoints_with_ts = sorted((e for e in entries if isinstance(e["raw_ts"], str)), key=lambda e: e["raw_ts"])
         logger.debug(f"🔍 找到 {len(checkpoints_with_ts)} 个有效checkpoint，按时间排序")
         
         # 遍历每个checkpoint，为新消息分配时间戳
-        for checkpoint_info in checkpoints_with_ts:
-            checkpoint_data = checkpoint_info['data']
-            checkpoint_ts = checkpoint_info['timestamp']
-            
-            # 提取消息
-            messages = extract_messages_from_checkpoint(checkpoint_data)
+        for entry in checkpoints_with_ts:
+            try:
+                checkpoint_ts = _to_china_time(entry["raw_ts"])
+            except Exception as e:
+                logger.warning(f"⚠️ 解析时间戳失败 {entry['key']}: {e}")
+                continue
             
-            # 为这个checkpoint中的新消息分配时间戳
-            for msg in messages:
-                if isinstance(msg, dict) and 'kwargs' in msg:
-                    msg_id = msg['kwargs'].get('id')
-                    if msg_id and msg_id not in message_timestamps:
-                        message_timestamps[msg_id] = checkpoint_ts
-                        logger.debug(f"🕒 消息 {msg_id} 分配时间戳: {checkpoint_ts}")
+            for msg_id in entry["message_ids"]:
+                if msg_id and msg_id not in message_timestamps:
+                    message_timestamps[msg_id] = checkpoint_ts
         
         logger.debug(f"✅ 成功构建消息时间戳映射，包含 {len(message_timestamps)} 条消息")
         
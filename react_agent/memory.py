@@ -0,0 +1,212 @@
+"""
+React Agent 按 token 预算管理的对话记忆
+
+- 历史轮次（当前 HumanMessage 之前的轮次）中的工具输出替换为紧凑摘要（如 run_sql 只保留行数、字段和前几行），
+  当前轮次的消息原样发送，保证 LLM 能看到刚执行的工具结果
+- 未摘要的历史超过 MEMORY_TOKEN_BUDGET 时，最早的完整轮次（从 HumanMessage 开始）并入滚动摘要，
+  摘要和已摘要的消息数保存在 state 中（conversation_summary / summarized_message_count），随 checkpoint 持久化
+- 每次发送给 LLM 的消息 = 滚动摘要 + 未摘要的历史轮次（工具输出已压缩）+ 当前轮次
+
+token 数按字符估算（中日韩字符约 1 token/字，其他约 4 字符/token），只用于预算控制，不追求精确。
+"""
+import json
+import re
+from typing import Any, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+# 每条消息的固定开销（角色、分隔符等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+# 压缩后的 run_sql 输出中保留的示例行数
+_SAMPLE_ROWS = 2
+# 触发摘要后，未摘要历史压到预算的这个比例以下，避免每轮都重新摘要
+_EVICT_TARGET_RATIO = 0.6
+
+SUMMARY_PREFIX = "以下是本次会话较早内容的摘要（更早的原始消息已省略）：\n"
+
+
+def estimate_tokens(text: Any) -> int:
+    """估算文本的 token 数"""
+    text = text if isinstance(text, str) else str(text or "")
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """估算单条消息的 token 数（含工具调用参数）"""
+    tokens = _MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.content)
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(tool_call.get("name", "")) + estimate_tokens(
+            json.dumps(tool_call.get("args", {}), ensure_ascii=False))
+    return tokens
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = max_tokens * 4
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.8)
+    return text[:cut] + f"...（已截断，原长度 {len(text)} 字符）"
+
+
+def summarize_tool_output(name: Optional[str], content: Any, max_tokens: int) -> str:
+    """
+    生成工具输出的紧凑摘要
+
+    run_sql 的 JSON 结果只保留行数、字段名和前几行，其他工具输出按 token 数截断。
+    """
+    text = content if isinstance(content, str) else str(content)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    if name == "run_sql":
+        try:
+            data = json.loads(text)
+        except (TypeError, ValueError):
+            data = None
+        if isinstance(data, dict) and "result_ref" in data:
+            # 外部存储结果的引用：只保留行数、字段和预览的前几行
+            summary = (f"[历史查询结果已压缩] 共 {data.get('total_row_count')} 行，"
+                       f"字段: {', '.join(data.get('columns', []))}；"
+                       f"前几行: {json.dumps(data.get('preview', [])[:_SAMPLE_ROWS], ensure_ascii=False)}")
+            return _truncate(summary, max_tokens)
+        if isinstance(data, list):
+            columns = list(data[0].keys()) if data and isinstance(data[0], dict) else []
+            sample = json.dumps(data[:_SAMPLE_ROWS], ensure_ascii=False)
+            summary = (f"[历史查询结果已压缩] 共 {len(data)} 行，字段: {', '.join(columns)}；"
+                       f"前 {min(len(data), _SAMPLE_ROWS)} 行: {sample}")
+            return _truncate(summary, max_tokens)
+
+    return f"[历史工具输出已压缩] {_truncate(text, max_tokens)}"
+
+
+def compact_message(message: BaseMessage, tool_output_max_tokens: int) -> BaseMessage:
+    """历史轮次中的工具输出替换为紧凑摘要，其他消息原样返回"""
+    if not isinstance(message, ToolMessage):
+        return message
+    content = summarize_tool_output(message.name, message.content, tool_output_max_tokens)
+    if content == message.content:
+        return message
+    return ToolMessage(content=content, tool_call_id=message.tool_call_id, name=message.name, id=message.id)
+
+
+def _valid_count(messages: Sequence[BaseMessage], summarized_count: Optional[int]) -> int:
+    """已摘要消息数超出消息总数（如会话被外部裁剪）时视为没有摘要"""
+    count = summarized_count or 0
+    return count if count <= len(messages) else 0
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """按 HumanMessage 将消息划分为轮次（第一条 HumanMessage 之前的消息归入第一轮）"""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _turns_tokens(turns: Sequence[Sequence[BaseMessage]], tool_output_max_tokens: int) -> List[int]:
+    return [sum(message_tokens(compact_message(m, tool_output_max_tokens)) for m in turn) for turn in turns]
+
+
+def select_turns_to_summarize(messages: Sequence[BaseMessage], summarized_count: int, budget: int,
+                              tool_output_max_tokens: int) -> List[List[BaseMessage]]:
+    """
+    未摘要的历史轮次（压缩后）超过预算时，从最早的轮次开始选出需要并入摘要的轮次
+
+    当前轮次（最后一轮）永远不会被选中。
+
+    Returns:
+        需要并入摘要的轮次列表；未超过预算时为空列表
+    """
+    turns = split_turns(messages[_valid_count(messages, summarized_count):])
+    if len(turns) <= 1:
+        return []
+    history = turns[:-1]
+    tokens = _turns_tokens(history, tool_output_max_tokens)
+    total = sum(tokens)
+    if total <= budget:
+        return []
+
+    target = int(budget * _EVICT_TARGET_RATIO)
+    selected = []
+    for turn, turn_tokens in zip(history, tokens):
+        if total <= target:
+            break
+        selected.append(turn)
+        total -= turn_tokens
+    return selected
+
+
+def extractive_summary(previous_summary: Optional[str], turns: Sequence[Sequence[BaseMessage]],
+                       max_tokens: int) -> str:
+    """
+    不调用 LLM 的滚动摘要：每轮保留用户问题和最终回答的开头，超出 max_tokens 时丢弃最早的条目
+    """
+    lines = [line for line in (previous_summary or "").splitlines() if line.strip()]
+    for turn in turns:
+        question = next((str(m.content) for m in turn if isinstance(m, HumanMessage)), "")
+        answer = ""
+        for message in reversed(turn):
+            if message.type == "ai" and message.content and not getattr(message, "tool_calls", None):
+                answer = str(message.content)
+                break
+        line = f"- 用户: {_truncate(question, 100)}"
+        if answer:
+            line += f" | 回答: {_truncate(answer, 150)}"
+        lines.append(line.replace("\n", " "))
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def format_turns_for_summary(turns: Sequence[Sequence[BaseMessage]], tool_output_max_tokens: int) -> str:
+    """将轮次格式化为文本，供 LLM 生成摘要"""
+    parts = []
+    for turn in turns:
+        for message in turn:
+            message = compact_message(message, tool_output_max_tokens)
+            if message.content:
+                parts.append(f"{message.type}: {message.content}")
+    return "\n".join(parts)
+
+
+def build_llm_messages(messages: Sequence[BaseMessage], summary: Optional[str], summarized_count: int,
+                       budget: int, tool_output_max_tokens: int) -> Tuple[List[BaseMessage], int]:
+    """
+    构建发送给 LLM 的消息列表：滚动摘要 + 未摘要的历史轮次（工具输出已压缩）+ 当前轮次（原样）
+
+    同一轮次内多次工具调用可能使历史超过预算，此时从最早的历史轮次开始丢弃（当前轮次始终完整保留，
+    保证 tool_call 与 ToolMessage 配对）。
+
+    Returns:
+        (消息列表, 估算的 token 数)
+    """
+    turns = split_turns(messages[_valid_count(messages, summarized_count):])
+    if not turns:
+        return [], 0
+    current = list(turns[-1])
+    history = [[compact_message(m, tool_output_max_tokens) for m in turn] for turn in turns[:-1]]
+    history_tokens = [sum(message_tokens(m) for m in turn) for turn in history]
+    current_tokens = sum(message_tokens(m) for m in current)
+
+    prefix: List[BaseMessage] = []
+    used = current_tokens
+    if summary:
+        prefix.append(SystemMessage(content=SUMMARY_PREFIX + summary))
+        used += message_tokens(prefix[0])
+
+    start = 0
+    remaining = budget - used
+    while start < len(history) and sum(history_tokens[start:]) > remaining:
+        start += 1
+
+    result = prefix + [m for turn in history[start:] for m in turn] + current
+    return result, used + sum(history_tokens[start:])
@@ -0,0 +1,190 @@
+"""
+React Agent 系统提示词缓存与前缀缓存命中统计
+
+- 数据库范围提示词（读取 db_query_decision_prompt.txt）和防幻觉规则只渲染一次，
+  按文件 mtime 热加载（最多每 PROMPT_RELOAD_CHECK_INTERVAL 秒检查一次）
+- 静态部分合并为一条固定的 SystemMessage 放在每次 LLM 调用的最前面，作为稳定前缀，
+  便于服务商的上下文缓存（Qwen 上下文缓存、DeepSeek 硬盘缓存）命中；随请求变化的内容放在消息末尾
+- 记录每次调用的输入 token 和缓存命中 token，按 thread 暂存（响应元数据）并累计进程级命中率
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from . import config
+except ImportError:
+    import config
+from core.logging import get_react_agent_logger
+
+logger = get_react_agent_logger("Prompts")
+
+DB_SCOPE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_query_decision_prompt.txt")
+
+DATABASE_SCOPE_TEMPLATE = """You are an intelligent database query assistant. When deciding whether to use database query tools, please follow these rules:
+
+=== DATABASE BUSINESS SCOPE ===
+{db_scope_content}
+
+=== DECISION RULES ===
+1. If the question involves data within the above business scope (service areas, branches, revenue, traffic flow, etc.), use the generate_sql tool
+2. If the question is about general knowledge (like "when do lychees ripen?", weather, historical events, etc.), answer directly based on your knowledge WITHOUT using database tools
+3. When answering general knowledge questions, provide clear and helpful answers without any special prefixes
+
+=== FALLBACK STRATEGY ===
+When generate_sql returns an error message or when queries return no results:
+1. First, check if the question is within the database scope described above
+2. For questions clearly OUTSIDE the database scope (world events, general knowledge, etc.):
+   - Provide the answer based on your knowledge immediately
+   - Give a direct, natural answer without any prefixes or disclaimers
+3. For questions within database scope but queries return no results:
+   - If it's a reasonable question that might have a general answer, provide it naturally
+4. For questions that definitely require specific database data:
+   - Acknowledge the limitation and suggest the data may not be available
+   - Do not attempt to guess or fabricate specific data
+
+Please intelligently choose whether to query the database based on the nature of the user's question,
+not on explaining your decision-making process.
+"""
+
+ANTI_HALLUCINATION_RULES = """🛡️ 关键指令：工具调用参数必须完全准确
+
+调用工具时的严格要求：
+1. **原样传递原则**：question 参数必须与用户问题完全一致，一字不差
+2. **禁止任何改写**：不得进行同义词替换、语言优化或任何形式的修改
+
+❌ 错误示例：
+- 用户问"充电桩"，不得改为"充电栋"
+✅ 正确做法：
+- 完全复制用户的原始问题作为question参数
+
+请严格遵守此要求，确保工具调用的准确性。"""
+
+ANTI_HALLUCINATION_QUESTION_TEMPLATE = "🛡️ 用户当前问题：「{question}」（调用工具时 question 参数必须与此完全一致）"
+
+
+class FilePrompt:
+    """读取文件渲染的提示词，按文件 mtime 热加载"""
+
+    def __init__(self, path: str, template: str, placeholder: str, check_interval: float):
+        self.path = path
+        self.template = template
+        self.placeholder = placeholder
+        self.check_interval = check_interval
+        self._mtime = None
+        self._rendered = ""
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        """返回渲染后的提示词；文件不存在或读取失败时返回空字符串（保留上次成功的结果）"""
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return self._rendered
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        content = f.read().strip()
+                    self._rendered = self.template.format(**{self.placeholder: content})
+                    if self._mtime is not None:
+                        logger.info(f"🔄 提示词文件已更新，重新加载: {self.path}")
+                    self._mtime = mtime
+            except Exception as e:
+                logger.warning(f"⚠️ 无法读取提示词文件 {self.path}: {e}")
+            return self._rendered
+
+
+_db_scope_prompt = FilePrompt(DB_SCOPE_FILE, DATABASE_SCOPE_TEMPLATE, "db_scope_content",
+                              getattr(config, "PROMPT_RELOAD_CHECK_INTERVAL", 5))
+_system_prefix_cache: Tuple[Optional[str], str] = (None, "")
+
+
+def get_database_scope_prompt() -> str:
+    return _db_scope_prompt.get()
+
+
+def get_system_prefix() -> str:
+    """每次LLM调用最前面的固定系统提示词（数据库范围 + 防幻觉规则），内容不变时返回同一字符串"""
+    global _system_prefix_cache
+    db_scope = _db_scope_prompt.get()
+    if _system_prefix_cache[0] is not db_scope:
+        parts = [p for p in (db_scope, ANTI_HALLUCINATION_RULES) if p]
+        _system_prefix_cache = (db_scope, "\n\n".join(parts))
+    return _system_prefix_cache[1]
+
+
+def get_anti_hallucination_question_prompt(question: str) -> str:
+    return ANTI_HALLUCINATION_QUESTION_TEMPLATE.format(question=question)
+
+
+# --- 前缀缓存命中统计 ---
+_MAX_THREAD_ENTRIES = 1000
+_stats_lock = threading.Lock()
+_totals = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+_thread_usage: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+
+def extract_prompt_usage(response: Any) -> Tuple[int, int]:
+    """
+    从LLM响应中提取 (输入token数, 缓存命中token数)
+
+    兼容 langchain 的 usage_metadata（input_token_details.cache_read）、
+    OpenAI/Qwen 的 prompt_tokens_details.cached_tokens 和 DeepSeek 的 prompt_cache_hit_tokens。
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens") or 0
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or 0
+
+    if not cached_tokens:
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens = prompt_tokens or token_usage.get("prompt_tokens") or 0
+        cached_tokens = ((token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+                         or token_usage.get("prompt_cache_hit_tokens") or 0)
+    return int(prompt_tokens), int(cached_tokens)
+
+
+def _ratio(prompt_tokens: int, cached_tokens: int) -> float:
+    return round(cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0
+
+
+def record_prompt_usage(thread_id: Optional[str], response: Any) -> Tuple[int, int]:
+    """记录一次LLM调用的缓存命中情况，返回 (输入token数, 缓存命中token数)"""
+    prompt_tokens, cached_tokens = extract_prompt_usage(response)
+    if not prompt_tokens:
+        return 0, 0
+    with _stats_lock:
+        _totals["calls"] += 1
+        _totals["prompt_tokens"] += prompt_tokens
+        _totals["cached_tokens"] += cached_tokens
+        if thread_id:
+            usage = _thread_usage.setdefault(thread_id, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["cached_tokens"] += cached_tokens
+            _thread_usage.move_to_end(thread_id)
+            while len(_thread_usage) > _MAX_THREAD_ENTRIES:
+                _thread_usage.popitem(last=False)
+    return prompt_tokens, cached_tokens
+
+
+def pop_thread_prompt_usage(thread_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """取出某个 thread 本轮累计的缓存命中情况（用于响应元数据）"""
+    if not thread_id:
+        return None
+    with _stats_lock:
+        usage = _thread_usage.pop(thread_id, None)
+    if not usage:
+        return None
+    return {**usage, "cached_ratio": _ratio(usage["prompt_tokens"], usage["cached_tokens"])}
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """进程级前缀缓存命中统计"""
+    with _stats_lock:
+        totals = dict(_totals)
+    return {**totals, "cached_ratio": _ratio(totals["prompt_tokens"], totals["cached_tokens"])}
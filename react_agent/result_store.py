@@ -0,0 +1,103 @@
+"""
+React Agent 大查询结果的外部存储
+
+run_sql 的结果会作为 ToolMessage 写入之后的每个 checkpoint。结果较大时，完整 JSON 按内容哈希存入
+Redis（react:tool_result:{sha256}，带过期时间），ToolMessage 中只保留行数、字段、前几行预览和引用；
+生成最终响应和 api_data 时再按引用取回完整数据（按 API_MAX_RETURN_ROWS 限制行数）。
+
+写入使用同步 Redis 客户端（工具在线程池中执行），读取使用 Agent 自身的 redis.asyncio 客户端。
+Redis 不可用时退回把完整结果放在消息中。
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Optional
+
+import redis
+
+try:
+    from . import config
+except ImportError:
+    import config
+from core.logging import get_react_agent_logger
+
+logger = get_react_agent_logger("ResultStore")
+
+RESULT_KEY = "react:tool_result:{digest}"
+
+_redis_client = None
+_redis_lock = threading.Lock()
+
+
+def _get_redis_client():
+    """同步 Redis 客户端（单例）"""
+    global _redis_client
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                _redis_client = redis.from_url(config.REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+def is_result_ref(data: Any) -> bool:
+    """是否为外部存储结果的引用（ToolMessage 中的紧凑格式）"""
+    return isinstance(data, dict) and "result_ref" in data
+
+
+def compact_records_payload(df, payload: str) -> str:
+    """
+    结果超过 TOOL_RESULT_OFFLOAD_THRESHOLD 字符时存入 Redis，返回预览加引用；否则原样返回
+
+    Args:
+        df: 查询结果 DataFrame（用于生成预览）
+        payload: df.to_json(orient='records') 的完整结果
+    """
+    if (not config.TOOL_RESULT_OFFLOAD_ENABLED or not config.REDIS_ENABLED
+            or len(payload) <= config.TOOL_RESULT_OFFLOAD_THRESHOLD):
+        return payload
+
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    try:
+        # 相同结果只存一份，重复写入时刷新过期时间
+        _get_redis_client().set(RESULT_KEY.format(digest=digest), payload, ex=config.TOOL_RESULT_TTL)
+    except Exception as e:
+        logger.warning(f"⚠️ 查询结果外部存储失败，保留完整结果: {e}")
+        return payload
+
+    preview_rows = config.TOOL_RESULT_PREVIEW_ROWS
+    reference = {
+        "status": "success",
+        "result_ref": digest,
+        "total_row_count": len(df),
+        "columns": [str(c) for c in df.columns],
+        "preview": json.loads(df.head(preview_rows).to_json(orient='records', date_format='iso')),
+        "message": f"查询返回 {len(df)} 行，结果较大，以下仅为前 {min(len(df), preview_rows)} 行预览",
+    }
+    logger.info(f"   📦 查询结果已外部存储: {len(payload)} 字符 → 引用 {digest[:12]}")
+    return json.dumps(reference, ensure_ascii=False)
+
+
+async def aload_records(redis_client, content: str) -> Optional[Any]:
+    """
+    解析 run_sql 的 ToolMessage 内容，引用格式时从 Redis 取回完整结果
+
+    Returns:
+        解析后的数据（记录列表或结果字典）；不是有效 JSON 时返回None。
+        完整结果已过期或无法读取时返回引用本身（调用方可使用其中的预览）
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not is_result_ref(data) or redis_client is None:
+        return data
+
+    try:
+        payload = await redis_client.get(RESULT_KEY.format(digest=data["result_ref"]))
+    except Exception as e:
+        logger.warning(f"⚠️ 读取外部存储的查询结果失败: {e}")
+        return data
+    if payload is None:
+        logger.warning(f"⚠️ 外部存储的查询结果已过期: {data['result_ref'][:12]}")
+        return data
+    return json.loads(payload)
@@ -0,0 +1,78 @@
+"""
+LLM 调用重试控制：带抖动的指数退避 + 进程级重试预算
+
+上游故障恢复时，如果所有并发请求都按相同的固定间隔（3、6、12秒）重试，会同时涌向服务商。
+- 退避时间使用 full jitter：在 [0, min(上限, 基础延迟 * 2^attempt)] 内随机，分散重试时刻
+- 重试预算为令牌桶：每次成功调用存入 RETRY_BUDGET_RATIO 个令牌，每次重试消耗 1 个，
+  另外按 RETRY_BUDGET_MIN_PER_SECOND 的速率缓慢补充（保证故障期间仍能少量重试探测恢复）；
+  令牌不足时不再重试，直接返回降级回答
+"""
+import random
+import threading
+import time
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+
+def jittered_backoff(attempt: int, base_delay: float, max_delay: float) -> float:
+    """第 attempt 次重试（从0开始）的等待秒数（full jitter）"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class RetryBudget:
+    """进程级重试预算（线程安全，多个事件循环共享）"""
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def record_success(self):
+        """成功调用后存入令牌"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """申请一次重试；预算不足时返回False"""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+_retry_budget = None
+_retry_budget_lock = threading.Lock()
+
+
+def get_retry_budget() -> RetryBudget:
+    """获取进程级重试预算（单例）"""
+    global _retry_budget
+    if _retry_budget is None:
+        with _retry_budget_lock:
+            if _retry_budget is None:
+                _retry_budget = RetryBudget(
+                    ratio=config.RETRY_BUDGET_RATIO,
+                    min_per_second=config.RETRY_BUDGET_MIN_PER_SECOND,
+                    max_tokens=config.RETRY_BUDGET_MAX_TOKENS,
+                )
+    return _retry_budget
@@ -4,11 +4,13 @@
 import re
 import json
 import sys
+import time
 import os
 from pathlib import Path
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from pydantic.v1 import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import pandas as pd
 
 # 添加项目根目录到sys.path以解决common模块导入问题
@@ -27,6 +29,8 @@ except ImportError:
     # 如果相对导入失败，尝试绝对导入（直接运行时）
     from core.logging import get_react_agent_logger
 
+from common.tracing import traced
+
 logger = get_react_agent_logger("SQLTools")
 
 # --- Pydantic Schema for Tool Arguments ---
@@ -42,6 +46,7 @@ class GenerateSqlArgs(BaseModel):
 # --- Tool Functions ---
 
 @tool(args_schema=GenerateSqlArgs)
+@traced("react.tool.generate_sql")
 def generate_sql(question: str, history_messages: List[Dict[str, Any]] = None) -> str:
     """
     Generates an SQL query based on the user's question and the conversation history.
@@ -126,6 +131,44 @@ def _check_security(sql: str) -> tuple[bool, str]:
     return True, ""
 
 
+def _get_schema_reference_check(sql: str) -> dict:
+    """使用内存Schema目录检查SQL的表/字段引用，目录不可用时返回None"""
+    try:
+        from common.schema_catalog import get_schema_catalog
+        catalog = get_schema_catalog()
+        if catalog is None:
+            return None
+        return catalog.check_sql_references(sql)
+    except Exception as e:
+        logger.warning(f"   Schema目录检查异常，跳过: {e}")
+        return None
+
+
+def _check_schema_references(sql: str) -> tuple[bool, str]:
+    """规则2.5: 使用内存Schema目录检查表/字段引用（无数据库往返）
+    
+    Returns:
+        tuple: (是否通过, 错误信息)；Schema目录未启用或未加载时视为通过
+    """
+    check = _get_schema_reference_check(sql)
+    if not check:
+        return True, ""
+    
+    if check["missing_tables"]:
+        tables = ", ".join(check["missing_tables"])
+        return False, f"SQL验证失败：表不存在。详细错误：表 {tables} 不存在于数据库中"
+    if check["missing_columns"]:
+        columns = ", ".join(check["missing_columns"])
+        return False, f"SQL验证失败：字段不存在。详细错误：字段 {columns} 不存在于对应的表中"
+    return True, ""
+
+
+def _check_table_existence(sql: str) -> bool:
+    """检查SQL中引用的表是否都存在（基于内存Schema目录，目录不可用时视为存在）"""
+    check = _get_schema_reference_check(sql)
+    return not check or not check["missing_tables"]
+
+
 def _has_limit_clause(sql: str) -> bool:
     """检测SQL是否包含LIMIT子句"""
     # 使用正则表达式检测LIMIT关键词，支持多种格式
@@ -220,7 +263,34 @@ def _format_validation_error(error_msg: str) -> str:
         return f"SQL验证失败：执行失败。详细错误：{error_msg}"
 
 
+def _precheck_sql(sql: str) -> Optional[str]:
+    """
+    不访问数据库的验证规则（基础语法、安全、表/字段引用），valid_sql 和合并执行共用
+
+    Returns:
+        验证失败信息；通过时返回None
+    """
+    # 规则1: 基础语法检查
+    if not _check_basic_syntax(sql):
+        logger.warning("   SQL验证失败：SQL语句为空或不是有效的查询语句")
+        return "SQL验证失败：SQL语句为空或不是有效的查询语句"
+
+    # 规则2: 安全检查
+    is_safe, security_error = _check_security(sql)
+    if not is_safe:
+        logger.error(f"   SQL验证失败：{security_error}")
+        return f"SQL验证失败：{security_error}"
+
+    # 规则2.5: 表/字段引用检查（内存Schema目录，引用不存在时无需访问数据库）
+    references_ok, reference_error = _check_schema_references(sql)
+    if not references_ok:
+        logger.warning(f"   {reference_error}")
+        return reference_error
+    return None
+
+
 @tool
+@traced("react.tool.valid_sql")
 def valid_sql(sql: str) -> str:
     """
     验证SQL语句的正确性和安全性，使用四规则递进验证：
@@ -238,16 +308,9 @@ def valid_sql(sql: str) -> str:
     logger.info(f"🔧 [Tool] valid_sql - 待验证SQL:")
     logger.info(f"   {sql}")
 
-    # 规则1: 基础语法检查
-    if not _check_basic_syntax(sql):
-        logger.warning("   SQL验证失败：SQL语句为空或不是有效的查询语句")
-        return "SQL验证失败：SQL语句为空或不是有效的查询语句"
-
-    # 规则2: 安全检查
-    is_safe, security_error = _check_security(sql)
-    if not is_safe:
-        logger.error(f"   SQL验证失败：{security_error}")
-        return f"SQL验证失败：{security_error}"
+    precheck_error = _precheck_sql(sql)
+    if precheck_error:
+        return precheck_error
 
     # 规则3/4: 语义验证（二选一）
     if _has_limit_clause(sql):
@@ -257,8 +320,29 @@ def valid_sql(sql: str) -> str:
         logger.info("   未检测到LIMIT子句，使用LIMIT 0验证")
         return _validate_with_limit_zero(sql)
 
+def _get_thread_id_from_config(config: RunnableConfig) -> str:
+    """从运行配置中获取 thread_id"""
+    return ((config or {}).get("configurable") or {}).get("thread_id") or ""
+
+def _get_user_id_from_config(config: RunnableConfig) -> Optional[str]:
+    """从运行配置的 thread_id（格式 user_id:timestamp）中解析用户ID"""
+    thread_id = _get_thread_id_from_config(config)
+    return thread_id.split(":", 1)[0] if ":" in thread_id else None
+
+def _format_run_sql_error(e: Exception) -> str:
+    """将SQL执行异常格式化为工具返回的错误JSON"""
+    from common.business_db import QueryBusyError, QueryTimeoutError
+    
+    error_result = {"status": "error", "error_message": str(e)}
+    if isinstance(e, QueryBusyError):
+        error_result["error_type"] = "database_busy"
+    elif isinstance(e, QueryTimeoutError):
+        error_result["error_type"] = "sql_statement_timeout"
+    return json.dumps(error_result, ensure_ascii=False)
+
 @tool
-def run_sql(sql: str) -> str:
+@traced("react.tool.run_sql")
+def run_sql(sql: str, config: RunnableConfig) -> str:
     """
     执行SQL查询并以JSON字符串格式返回结果。
 
@@ -271,26 +355,37 @@ def run_sql(sql: str) -> str:
     logger.info(f"🔧 [Tool] run_sql - 待执行SQL:")
     logger.info(f"   {sql}")
 
-    try:
-        from common.vanna_instance import get_vanna_instance
-        vn = get_vanna_instance()
-        df = vn.run_sql(sql)
+    from common.query_profiler import collect_query_profiles, elapsed_ms, remember_thread_profiles
 
-        logger.debug(f"SQL执行结果：\n{df}")
-
-        if df is None:
-            logger.warning("   SQL执行成功，但查询结果为空。")
-            result = {"status": "success", "data": [], "message": "查询无结果"}
-            return json.dumps(result, ensure_ascii=False)
-
-        logger.info(f"   ✅ SQL执行成功，返回 {len(df)} 条记录。")
-        # 将DataFrame转换为JSON，并妥善处理datetime等特殊类型
-        return df.to_json(orient='records', date_format='iso')
+    with collect_query_profiles() as profiles:
+        try:
+            from common.business_db import run_business_sql
+            # 带statement_timeout和并发限制执行，按thread_id中的用户计数
+            df = run_business_sql(sql, user_id=_get_user_id_from_config(config))
+
+            logger.debug(f"SQL执行结果：\n{df}")
+
+            if df is None:
+                logger.warning("   SQL执行成功，但查询结果为空。")
+                result = {"status": "success", "data": [], "message": "查询无结果"}
+                return json.dumps(result, ensure_ascii=False)
+
+            logger.info(f"   ✅ SQL执行成功，返回 {len(df)} 条记录。")
+            # 将DataFrame转换为JSON，并妥善处理datetime等特殊类型
+            start = time.perf_counter()
+            payload = df.to_json(orient='records', date_format='iso')
+            if profiles:
+                profiles[-1].extra["serialize_ms"] = elapsed_ms(start)
+            # 大结果存入Redis，消息（及checkpoint）中只保留预览和引用
+            from react_agent.result_store import compact_records_payload
+            return compact_records_payload(df, payload)
 
-    except Exception as e:
-        logger.error(f"   SQL执行过程中发生异常: {e}", exc_info=True)
-        error_result = {"status": "error", "error_message": str(e)}
-        return json.dumps(error_result, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"   SQL执行过程中发生异常: {e}", exc_info=True)
+            return _format_run_sql_error(e)
+        finally:
+            # 剖析数据按 thread_id 暂存，由 Agent 在生成响应元数据时取出
+            remember_thread_profiles(_get_thread_id_from_config(config), profiles)
     
 
 
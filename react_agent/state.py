@@ -14,8 +14,14 @@ class AgentState(TypedDict):
         user_id: 当前用户ID。
         thread_id: 当前会话的线程ID。
         suggested_next_step: 用于引导LLM下一步行动的建议指令。
+        trace_parent: 请求根 span 的上下文，节点 span 以此为父（未启用追踪时为None）。
+        conversation_summary: 较早轮次的滚动摘要（按token预算管理对话记忆时使用）。
+        summarized_message_count: 已并入滚动摘要的消息数（messages 的前 N 条）。
     """
     messages: Annotated[List[BaseMessage], add_messages]
     user_id: str
     thread_id: str
-    suggested_next_step: Optional[str] 
\ No newline at end of file
+    suggested_next_step: Optional[str]
+    trace_parent: Optional[Dict[str, Any]]
+    conversation_summary: Optional[str]
+    summarized_message_count: Optional[int]
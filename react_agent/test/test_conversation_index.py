@@ -0,0 +1,110 @@
+"""
+用户会话索引测试（超出上限的会话连同摘要删除、列出时跳过并移除摘要已过期的成员）
+
+用法（项目根目录）:
+    python -m pytest react_agent/test/test_conversation_index.py -q
+"""
+import asyncio
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from react_agent import conversation_index
+from react_agent.conversation_index import (
+    THREAD_SUMMARY_KEY, USER_THREADS_KEY, ConversationIndex, build_thread_summary,
+)
+
+
+class _FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis_client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class _FakeRedis:
+    """只实现会话索引用到的命令（redis.asyncio，decode_responses=True）"""
+
+    def __init__(self):
+        self.zsets = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+    def _ordered(self, key, reverse=False):
+        return [m for m, _ in sorted(self.zsets.get(key, {}).items(), key=lambda x: x[1], reverse=reverse)]
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zrange(self, key, start, stop):
+        members = self._ordered(key)
+        stop = len(members) + stop if stop < 0 else stop
+        return members[start:stop + 1] if stop >= 0 else []
+
+    async def zrevrange(self, key, start, stop):
+        return self._ordered(key, reverse=True)[start:stop + 1]
+
+    async def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    async def hset(self, key, mapping):
+        self.hashes[key] = dict(mapping)
+
+    async def hgetall(self, key):
+        return self.hashes.get(key, {})
+
+    async def unlink(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+
+def _record_threads(index, count):
+    async def record():
+        for i in range(count):
+            thread_id = f"wang1:2025080112000000{i}"
+            await index._record("wang1", thread_id, build_thread_summary("wang1", thread_id, [], updated_at=1000 + i))
+    asyncio.run(record())
+
+
+def test_evicted_threads_lose_their_summaries(monkeypatch):
+    monkeypatch.setattr(conversation_index.config, "CONVERSATION_INDEX_MAX_THREADS", 3)
+    redis_client = _FakeRedis()
+    _record_threads(ConversationIndex(redis_client), 5)
+
+    kept = [f"wang1:2025080112000000{i}" for i in (2, 3, 4)]
+    assert sorted(redis_client.zsets[USER_THREADS_KEY.format(user_id="wang1")]) == kept
+    assert sorted(redis_client.hashes) == sorted(THREAD_SUMMARY_KEY.format(thread_id=t) for t in kept)
+
+
+def test_list_recent_skips_and_removes_dangling_members(monkeypatch):
+    monkeypatch.setattr(conversation_index.config, "CONVERSATION_INDEX_MAX_THREADS", 0)
+    redis_client = _FakeRedis()
+    index = ConversationIndex(redis_client)
+    _record_threads(index, 6)
+    # 最新的两个会话摘要已过期
+    for i in (4, 5):
+        del redis_client.hashes[THREAD_SUMMARY_KEY.format(thread_id=f"wang1:2025080112000000{i}")]
+
+    summaries = asyncio.run(index.list_recent("wang1", limit=3))
+    assert [s["thread_id"] for s in summaries] == [f"wang1:2025080112000000{i}" for i in (3, 2, 1)]
+    assert summaries[0]["message_count"] == 0
+    assert len(redis_client.zsets[USER_THREADS_KEY.format(user_id="wang1")]) == 4
+
+    assert len(asyncio.run(index.list_recent("wang1", limit=10))) == 4
+    assert asyncio.run(index.list_recent("nobody", limit=3)) == []
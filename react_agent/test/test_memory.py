@@ -0,0 +1,129 @@
+"""
+按 token 预算管理的对话记忆测试（token估算、工具输出压缩、轮次划分、滚动摘要选择、LLM消息构建）
+
+用法（项目根目录）:
+    python -m pytest react_agent/test/test_memory.py -q
+"""
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from react_agent import memory
+
+
+def _turn(index, rows=50):
+    """一轮完整问答：问题 → 调用 run_sql → 查询结果 → 回答"""
+    call_id = f"call_{index}"
+    data = [{"服务区": f"服务区{i}", "收入": i * 100} for i in range(rows)]
+    return [
+        HumanMessage(content=f"第{index}个问题：统计各服务区收入", id=f"h{index}"),
+        AIMessage(content="", tool_calls=[{"name": "run_sql", "args": {"sql": "SELECT 1"}, "id": call_id}],
+                  id=f"a{index}"),
+        ToolMessage(content=json.dumps(data, ensure_ascii=False), name="run_sql", tool_call_id=call_id,
+                    id=f"t{index}"),
+        AIMessage(content=f"第{index}个回答：共 {rows} 个服务区", id=f"f{index}"),
+    ]
+
+
+def test_estimate_tokens():
+    assert memory.estimate_tokens("") == 0
+    assert memory.estimate_tokens(None) == 0
+    assert memory.estimate_tokens("服务区") == 3
+    assert memory.estimate_tokens("abcdefgh") == 2
+    assert memory.estimate_tokens("收入abcd") == 3
+    assert memory.estimate_tokens(12345) == 2
+
+
+def test_summarize_tool_output_keeps_short_output():
+    assert memory.summarize_tool_output("run_sql", "[]", 50) == "[]"
+
+
+def test_summarize_run_sql_rows():
+    data = [{"服务区": f"服务区{i}", "收入": i} for i in range(100)]
+    summary = memory.summarize_tool_output("run_sql", json.dumps(data, ensure_ascii=False), 200)
+    assert summary.startswith("[历史查询结果已压缩] 共 100 行，字段: 服务区, 收入")
+    assert "服务区1" in summary and "服务区2" not in summary
+    assert memory.estimate_tokens(summary) <= 200 + memory.estimate_tokens("...（已截断，原长度 0000 字符）")
+
+
+def test_summarize_run_sql_result_ref():
+    payload = {"result_ref": "react:tool_result:abc", "total_row_count": 5000, "columns": ["a", "b"],
+               "preview": [{"a": i, "b": i} for i in range(20)], "padding": "x" * 2000}
+    summary = memory.summarize_tool_output("run_sql", json.dumps(payload), 100)
+    assert summary.startswith("[历史查询结果已压缩] 共 5000 行，字段: a, b")
+
+
+def test_summarize_other_tool_output_truncated():
+    summary = memory.summarize_tool_output("generate_sql", "SELECT " + "x, " * 1000, 20)
+    assert summary.startswith("[历史工具输出已压缩] SELECT")
+    assert "已截断" in summary
+
+
+def test_split_turns():
+    leading = SystemMessage(content="系统提示")
+    messages = [leading] + _turn(1) + _turn(2)
+    turns = memory.split_turns(messages)
+    # 第一条 HumanMessage 之前的消息单独作为第一轮
+    assert [len(turn) for turn in turns] == [1, 4, 4]
+    assert turns[0][0] is leading
+    assert [turn[0].id for turn in turns[1:]] == ["h1", "h2"]
+    assert [len(turn) for turn in memory.split_turns([AIMessage(content="a"), AIMessage(content="b")])] == [2]
+    assert memory.split_turns([]) == []
+
+
+def test_select_turns_within_budget_selects_nothing():
+    messages = _turn(1, rows=2) + _turn(2, rows=2)
+    assert memory.select_turns_to_summarize(messages, 0, budget=10000, tool_output_max_tokens=100) == []
+
+
+def test_select_turns_never_selects_current_turn():
+    messages = _turn(1, rows=500)
+    assert memory.select_turns_to_summarize(messages, 0, budget=1, tool_output_max_tokens=100) == []
+
+
+def test_select_turns_evicts_oldest_first():
+    messages = [m for i in range(1, 7) for m in _turn(i)]
+    selected = memory.select_turns_to_summarize(messages, 0, budget=400, tool_output_max_tokens=100)
+    assert selected
+    assert [turn[0].id for turn in selected] == [f"h{i}" for i in range(1, len(selected) + 1)]
+    assert len(selected) < 5
+
+    # 已摘要的消息不会被再次选中；已摘要数超过消息总数时视为没有摘要
+    again = memory.select_turns_to_summarize(messages, 4, budget=400, tool_output_max_tokens=100)
+    assert all(turn[0].id != "h1" for turn in again)
+    assert memory.select_turns_to_summarize(messages, 999, budget=400, tool_output_max_tokens=100) == selected
+
+
+def test_build_llm_messages_compacts_history_and_keeps_current_turn():
+    messages = _turn(1) + _turn(2)
+    result, tokens = memory.build_llm_messages(messages, None, 0, budget=100000, tool_output_max_tokens=100)
+    assert [m.id for m in result] == [m.id for m in messages]
+    assert result[2].content.startswith("[历史查询结果已压缩]")
+    assert result[6] is messages[6]
+    assert tokens == sum(memory.message_tokens(m) for m in result)
+
+
+def test_build_llm_messages_with_summary_and_budget():
+    messages = [m for i in range(1, 5) for m in _turn(i)]
+    result, _ = memory.build_llm_messages(messages, "- 用户: 早期问题", 4, budget=10, tool_output_max_tokens=100)
+    assert isinstance(result[0], SystemMessage)
+    assert result[0].content == memory.SUMMARY_PREFIX + "- 用户: 早期问题"
+    # 超出预算时丢弃历史轮次，当前轮次完整保留（tool_call 与 ToolMessage 配对）
+    assert [m.id for m in result[1:]] == ["h4", "a4", "t4", "f4"]
+    assert memory.build_llm_messages([], None, 0, budget=100, tool_output_max_tokens=100) == ([], 0)
+
+
+def test_extractive_summary_drops_oldest_lines():
+    summary = memory.extractive_summary("- 用户: 旧问题", [_turn(1), _turn(2)], max_tokens=1000)
+    lines = summary.splitlines()
+    assert lines[0] == "- 用户: 旧问题"
+    assert lines[1].startswith("- 用户: 第1个问题") and "回答: 第1个回答" in lines[1]
+
+    short = memory.extractive_summary(summary, [_turn(3)], max_tokens=30)
+    assert short.splitlines()[-1].startswith("- 用户: 第3个问题")
+    assert "旧问题" not in short
@@ -0,0 +1,95 @@
+"""
+LLM 重试控制测试（带抖动的指数退避、进程级重试预算令牌桶）
+
+用法（项目根目录）:
+    python -m pytest react_agent/test/test_retry_budget.py -q
+"""
+import os
+import random
+import sys
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from react_agent import retry_budget
+from react_agent.retry_budget import RetryBudget, jittered_backoff
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _budget(monkeypatch, ratio=0.1, min_per_second=0.5, max_tokens=3):
+    clock = _FakeClock()
+    monkeypatch.setattr(retry_budget.time, "monotonic", clock)
+    return RetryBudget(ratio=ratio, min_per_second=min_per_second, max_tokens=max_tokens), clock
+
+
+def test_jittered_backoff_bounds():
+    random.seed(20250801)
+    for attempt in range(8):
+        cap = min(30.0, 2.0 * (2 ** attempt))
+        delays = [jittered_backoff(attempt, base_delay=2.0, max_delay=30.0) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        # full jitter：等待时间分散在整个区间，而不是集中在固定值
+        assert max(delays) - min(delays) > cap * 0.5
+
+
+def test_acquire_until_exhausted(monkeypatch):
+    budget, _ = _budget(monkeypatch)
+    assert [budget.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert budget.available == 0
+
+
+def test_success_deposits_ratio_capped_at_max(monkeypatch):
+    budget, _ = _budget(monkeypatch, ratio=0.5)
+    for _ in range(3):
+        budget.try_acquire()
+    budget.record_success()
+    assert not budget.try_acquire()
+    budget.record_success()
+    assert budget.try_acquire()
+
+    for _ in range(100):
+        budget.record_success()
+    assert budget.available == 3
+
+
+def test_refill_over_time(monkeypatch):
+    budget, clock = _budget(monkeypatch, min_per_second=0.5)
+    for _ in range(3):
+        budget.try_acquire()
+    clock.now += 1
+    assert not budget.try_acquire()
+    clock.now += 1
+    assert budget.try_acquire()
+    clock.now += 3600
+    assert budget.available == 3
+
+
+def test_concurrent_acquire_never_overdraws(monkeypatch):
+    budget, _ = _budget(monkeypatch, max_tokens=50)
+    granted = []
+
+    def worker():
+        for _ in range(20):
+            granted.append(budget.try_acquire())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert granted.count(True) == 50
+
+
+def test_get_retry_budget_is_singleton(monkeypatch):
+    monkeypatch.setattr(retry_budget, "_retry_budget", None)
+    first = retry_budget.get_retry_budget()
+    assert retry_budget.get_retry_budget() is first
+    assert first.ratio == retry_budget.config.RETRY_BUDGET_RATIO
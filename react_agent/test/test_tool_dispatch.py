@@ -0,0 +1,133 @@
+"""
+ToolDispatcher 工具调度测试（同一消息中验证与执行合并、单独验证、数据库工具并发上限）
+
+用法（项目根目录）:
+    python -m pytest react_agent/test/test_tool_dispatch.py -q
+"""
+import asyncio
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from langchain_core.messages import ToolMessage
+
+from react_agent.tool_dispatch import VALIDATION_PASSED, ToolDispatcher
+
+CONFIG = {"configurable": {"thread_id": "wang1:20250801120000000"}}
+
+
+class _FakeTool:
+    """记录调用并统计同时执行数的工具"""
+
+    def __init__(self, name, handler, delay=0.05):
+        self.name = name
+        self.handler = handler
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def ainvoke(self, call, config):
+        self.calls.append(call["args"])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return ToolMessage(content=self.handler(call["args"]), name=self.name, tool_call_id=call["id"])
+        finally:
+            self.active -= 1
+
+
+def _run_sql(args):
+    if "missing_col" in args["sql"]:
+        return json.dumps({"status": "error", "error_message": 'column "missing_col" does not exist'},
+                          ensure_ascii=False)
+    return json.dumps([{"cnt": 1}])
+
+
+def _make_tools():
+    return {
+        "valid_sql": _FakeTool("valid_sql", lambda args: "SQL验证通过：LIMIT 0"),
+        "run_sql": _FakeTool("run_sql", _run_sql),
+        "generate_sql": _FakeTool("generate_sql", lambda args: "SELECT 1"),
+    }
+
+
+def _dispatch(dispatcher, calls):
+    return asyncio.run(dispatcher.dispatch(calls, CONFIG))
+
+
+def test_same_message_valid_and_run_execute_once():
+    tools = _make_tools()
+    dispatcher = ToolDispatcher(list(tools.values()))
+    messages = _dispatch(dispatcher, [
+        {"name": "valid_sql", "args": {"sql": "SELECT count(*) FROM bss_service_area;"}, "id": "v1"},
+        {"name": "run_sql", "args": {"sql": "SELECT  count(*)\nFROM bss_service_area"}, "id": "r1"},
+    ])
+    assert [m.tool_call_id for m in messages] == ["v1", "r1"]
+    assert messages[0].content == VALIDATION_PASSED
+    assert tools["valid_sql"].calls == []
+    assert len(tools["run_sql"].calls) == 1
+
+
+def test_same_message_merge_reports_sql_error_as_validation_failure():
+    tools = _make_tools()
+    dispatcher = ToolDispatcher(list(tools.values()))
+    messages = _dispatch(dispatcher, [
+        {"name": "valid_sql", "args": {"sql": "SELECT missing_col FROM t"}, "id": "v1"},
+        {"name": "run_sql", "args": {"sql": "SELECT missing_col FROM t"}, "id": "r1"},
+    ])
+    assert messages[0].content.startswith("SQL验证失败")
+    assert "missing_col" in messages[0].content
+
+
+def test_standalone_valid_sql_uses_validation_tool():
+    tools = _make_tools()
+    dispatcher = ToolDispatcher(list(tools.values()))
+    messages = _dispatch(dispatcher, [{"name": "valid_sql", "args": {"sql": "SELECT 1"}, "id": "v1"}])
+    assert messages[0].content == "SQL验证通过：LIMIT 0"
+    assert tools["run_sql"].calls == []
+
+    # 下一轮 run_sql 正常执行，不复用任何暂存结果
+    _dispatch(dispatcher, [{"name": "run_sql", "args": {"sql": "SELECT 1"}, "id": "r1"}])
+    assert len(tools["run_sql"].calls) == 1
+
+
+def test_merge_disabled_executes_both():
+    tools = _make_tools()
+    dispatcher = ToolDispatcher(list(tools.values()), merge_validate_and_run=False)
+    _dispatch(dispatcher, [
+        {"name": "valid_sql", "args": {"sql": "SELECT 1"}, "id": "v1"},
+        {"name": "run_sql", "args": {"sql": "SELECT 1"}, "id": "r1"},
+    ])
+    assert len(tools["valid_sql"].calls) == 1
+    assert len(tools["run_sql"].calls) == 1
+
+
+def test_db_tools_limited_to_per_user_cap():
+    tools = _make_tools()
+    dispatcher = ToolDispatcher(list(tools.values()), max_concurrency=4, db_concurrency=2)
+    assert dispatcher.db_concurrency == 2
+    calls = [{"name": "run_sql", "args": {"sql": f"SELECT {i}"}, "id": f"r{i}"} for i in range(5)]
+    calls += [{"name": "generate_sql", "args": {"question": f"q{i}"}, "id": f"g{i}"} for i in range(4)]
+    messages = _dispatch(dispatcher, calls)
+    assert [m.tool_call_id for m in messages] == [c["id"] for c in calls]
+    assert tools["run_sql"].max_active == 2
+    assert tools["generate_sql"].max_active >= 2
+
+
+def test_db_concurrency_never_exceeds_request_limit():
+    tools = _make_tools()
+    assert ToolDispatcher(list(tools.values()), max_concurrency=2, db_concurrency=8).db_concurrency == 2
+    assert ToolDispatcher(list(tools.values()), max_concurrency=3, db_concurrency=0).db_concurrency == 3
+    assert ToolDispatcher(list(tools.values()), max_concurrency=3, db_concurrency=None).db_concurrency == 3
+
+
+def test_unknown_tool_returns_error_message():
+    dispatcher = ToolDispatcher(list(_make_tools().values()))
+    messages = _dispatch(dispatcher, [{"name": "drop_table", "args": {}, "id": "x1"}])
+    assert messages[0].status == "error"
+    assert "not a valid tool" in messages[0].content
@@ -0,0 +1,123 @@
+"""
+React Agent 工具调度
+
+代替 ToolNode 执行 AIMessage 中的工具调用：
+- 同一条消息中的多个工具调用并发执行，每个请求最多 TOOL_MAX_CONCURRENCY_PER_REQUEST 个；
+  访问业务数据库的工具（run_sql / valid_sql）另外不超过单用户SQL上限（BUSINESS_DB_MAX_QUERIES_PER_USER），
+  避免同一请求的并发调用自己占满用户配额而返回"繁忙"
+- 同一条消息中 valid_sql 和 run_sql 针对同一SQL时只执行 run_sql，验证结果由执行结果得出
+- valid_sql 单独调用时照常执行（LIMIT 0 / PREPARE 验证，不返回数据）
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+try:
+    from .sql_tools import _format_validation_error
+except ImportError:
+    from sql_tools import _format_validation_error
+from core.logging import get_react_agent_logger
+
+logger = get_react_agent_logger("ToolDispatch")
+
+VALIDATION_PASSED = "SQL验证通过：语法正确且字段存在"
+# 这些执行错误与SQL本身无关（排队满、超时）
+_TRANSIENT_ERROR_TYPES = {"database_busy", "sql_statement_timeout"}
+# 访问业务数据库的工具，受单用户SQL上限约束
+DB_BOUND_TOOLS = {"run_sql", "valid_sql"}
+
+
+def normalize_sql(sql: Any) -> str:
+    """用于比较的SQL（去掉首尾空白、末尾分号，合并连续空白）"""
+    return " ".join(str(sql or "").strip().rstrip(";").split())
+
+
+def _run_sql_error(content: Any) -> Optional[Dict[str, Any]]:
+    """run_sql 返回错误JSON时返回错误字典，成功时返回None"""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(data, dict) and data.get("status") == "error":
+        return data
+    return None
+
+
+class ToolDispatcher:
+    """按请求并发执行工具调用，并合并同一消息中同一SQL的验证和执行"""
+
+    def __init__(self, tools, max_concurrency: int = 4, merge_validate_and_run: bool = True,
+                 db_concurrency: Optional[int] = None):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.max_concurrency = max(1, max_concurrency)
+        # 访问数据库的工具并发数（None 或 0 表示只受 max_concurrency 限制）
+        self.db_concurrency = min(self.max_concurrency, db_concurrency) if db_concurrency else self.max_concurrency
+        self.merge_validate_and_run = merge_validate_and_run and {"valid_sql", "run_sql"} <= set(self.tools_by_name)
+
+    async def dispatch(self, tool_calls: List[Dict[str, Any]], config: RunnableConfig) -> List[ToolMessage]:
+        """执行一条 AIMessage 中的全部工具调用，按调用顺序返回 ToolMessage"""
+        # 同一消息中已有 run_sql 执行同一SQL的 valid_sql 不单独执行
+        run_sql_calls = {normalize_sql(c["args"].get("sql")): c for c in tool_calls if c["name"] == "run_sql"}
+        derived = {
+            c["id"]: run_sql_calls[normalize_sql(c["args"].get("sql"))]["id"]
+            for c in tool_calls
+            if self.merge_validate_and_run and c["name"] == "valid_sql"
+            and normalize_sql(c["args"].get("sql")) in run_sql_calls
+        }
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        db_semaphore = asyncio.Semaphore(self.db_concurrency)
+
+        async def run_one(call):
+            async with semaphore:
+                if call["name"] in DB_BOUND_TOOLS:
+                    async with db_semaphore:
+                        return await self._invoke(call, config)
+                return await self._invoke(call, config)
+
+        pending = [c for c in tool_calls if c["id"] not in derived]
+        if len(pending) > 1:
+            logger.info(f"⚡ 并发执行 {len(pending)} 个工具调用（并发上限 {self.max_concurrency}，"
+                        f"数据库工具上限 {self.db_concurrency}）")
+        results = {c["id"]: m for c, m in zip(pending, await asyncio.gather(*(run_one(c) for c in pending)))}
+
+        for call_id, run_call_id in derived.items():
+            call = next(c for c in tool_calls if c["id"] == call_id)
+            results[call_id] = self._validation_from_run_result(call, results[run_call_id])
+            logger.info("   🔗 valid_sql 与同一SQL的 run_sql 合并执行")
+        return [results[c["id"]] for c in tool_calls]
+
+    async def _invoke(self, call: Dict[str, Any], config: RunnableConfig) -> ToolMessage:
+        """执行单个工具调用（错误处理与 ToolNode 一致：异常作为错误 ToolMessage 返回给LLM）"""
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return ToolMessage(
+                content=f"Error: {call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].",
+                name=call["name"], tool_call_id=call["id"], status="error"
+            )
+        try:
+            result = await tool.ainvoke({**call, "type": "tool_call"}, config)
+        except Exception as e:
+            logger.warning(f"⚠️ 工具 {call['name']} 执行失败: {e}")
+            return ToolMessage(content=f"Error: {e!r}\n Please fix your mistakes.",
+                               name=call["name"], tool_call_id=call["id"], status="error")
+        if isinstance(result, ToolMessage):
+            return result
+        return ToolMessage(content=str(result), name=call["name"], tool_call_id=call["id"])
+
+    @staticmethod
+    def _validation_from_run_result(call: Dict[str, Any], run_message: ToolMessage) -> ToolMessage:
+        """由 run_sql 的执行结果得出 valid_sql 的验证结果"""
+        error = _run_sql_error(run_message.content)
+        if run_message.status == "error":
+            content = f"SQL验证失败：执行失败。详细错误：{run_message.content}"
+        elif error is None:
+            content = VALIDATION_PASSED
+        elif error.get("error_type") in _TRANSIENT_ERROR_TYPES:
+            content = f"SQL验证失败：执行失败。详细错误：{error.get('error_message', '')}"
+        else:
+            content = _format_validation_error(error.get("error_message", ""))
+        return ToolMessage(content=content, name="valid_sql", tool_call_id=call["id"])
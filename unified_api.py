@@ -15,6 +15,8 @@ from datetime import datetime, timedelta, timezone
 import pytz
 from typing import Optional, Dict, Any, TYPE_CHECKING, Union
 import signal
+import threading
+import queue
 from threading import Thread
 from pathlib import Path
 
@@ -27,6 +29,7 @@ initialize_logging()
 
 # 标准 Flask 导入
 from flask import Flask, request, jsonify, session, send_file, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import redis.asyncio as redis
 from werkzeug.utils import secure_filename
 
@@ -46,6 +49,10 @@ import re
 from core.vanna_llm_factory import create_vanna_instance
 from common.redis_conversation_manager import RedisConversationManager
 from common.qa_feedback_manager import QAFeedbackManager
+from common.columnar_result import ColumnarResult, ARROW_STREAM_MIME, json_default
+from common.business_db import bind_query_user, get_business_db_stats
+from common.answer_cache import get_answer_cache
+from common.request_coalescer import get_request_coalescer
 # Data Pipeline 相关导入 - 从 citu_app.py 迁移
 from data_pipeline.api.simple_workflow import SimpleWorkflowManager, SimpleWorkflowExecutor
 from data_pipeline.api.simple_file_manager import SimpleFileManager
@@ -58,12 +65,25 @@ from common.result import (
 )
 from app_config import (
     USER_MAX_CONVERSATIONS, CONVERSATION_CONTEXT_COUNT, 
-    DEFAULT_ANONYMOUS_USER, ENABLE_QUESTION_ANSWER_CACHE
+    DEFAULT_ANONYMOUS_USER, ENABLE_QUESTION_ANSWER_CACHE, AGENT_STREAM_DEFER_SUMMARY
 )
 
 # 创建标准 Flask 应用
 app = Flask(__name__)
 
+
+class _ColumnarJSONProvider(DefaultJSONProvider):
+    """在响应边界把列式查询结果（ColumnarResult）统一序列化为JSON"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, ColumnarResult):
+            return o.to_query_result()
+        return DefaultJSONProvider.default(o)
+
+
+app.json = _ColumnarJSONProvider(app)
+
 # 创建日志记录器
 logger = get_app_logger("UnifiedApp")
 
@@ -89,8 +109,13 @@ redis_conversation_manager = RedisConversationManager()
 
 # ==================== React Agent 全局实例管理 ====================
 
+REACT_AGENT_STREAM_PATH = '/api/v0/ask_react_agent_stream'
+
 _react_agent_instance: Optional[Any] = None  # 同步工具，用于 ask_react_agent
-_react_agent_stream_instance: Optional[Any] = None  # 异步工具，用于 ask_react_agent_stream
+_react_agent_stream_instance: Optional[Any] = None  # 异步工具，用于 ask_react_agent_stream（进程内共享）
+_react_agent_stream_loop: Optional[asyncio.AbstractEventLoop] = None  # 流式Agent所属的事件循环
+_react_agent_stream_loop_lock = threading.Lock()
+_react_agent_stream_init_lock: Optional[asyncio.Lock] = None
 _redis_client: Optional[redis.Redis] = None
 
 def _format_timestamp_to_china_time(timestamp_str):
@@ -322,7 +347,7 @@ async def ensure_agent_ready() -> bool:
         return True
 
 async def create_stream_agent_instance():
-    """为每个流式请求创建新的Agent实例（使用异步工具）"""
+    """创建使用异步工具的流式 React Agent 实例"""
     if CustomReactAgent is None:
         logger.error("❌ CustomReactAgent 未能导入，无法初始化流式Agent")
         raise ImportError("CustomReactAgent 未能导入")
@@ -336,6 +361,8 @@ async def create_stream_agent_instance():
         from react_agent.async_sql_tools import async_sql_tools
         stream_agent.tools = async_sql_tools
         stream_agent.llm_with_tools = stream_agent.llm.bind_tools(async_sql_tools)
+        # 重新编译图，使工具节点执行异步工具
+        stream_agent.agent_executor = stream_agent._create_graph()
         
         logger.info("✅ 流式 React Agent 实例创建完成（配置异步工具）")
         return stream_agent
@@ -344,10 +371,148 @@ async def create_stream_agent_instance():
         logger.error(f"❌ 流式 React Agent 实例创建失败: {e}")
         raise
 
+def bind_stream_agent_loop(loop: asyncio.AbstractEventLoop):
+    """
+    指定流式 React Agent 所属的事件循环（ASGI 启动时绑定到服务器的事件循环）
+    
+    Agent 内的 Redis 连接、checkpointer 和 HTTP 客户端绑定在创建它的事件循环上，之后只能在该循环上使用。
+    """
+    global _react_agent_stream_loop
+    with _react_agent_stream_loop_lock:
+        if _react_agent_stream_loop is not None and _react_agent_stream_loop is not loop:
+            raise RuntimeError("流式 React Agent 已绑定到其他事件循环")
+        _react_agent_stream_loop = loop
+
+def get_stream_agent_loop() -> asyncio.AbstractEventLoop:
+    """获取流式 React Agent 所属的事件循环；未绑定时（直接运行Flask）启动一个常驻的后台事件循环"""
+    global _react_agent_stream_loop
+    if _react_agent_stream_loop is None:
+        with _react_agent_stream_loop_lock:
+            if _react_agent_stream_loop is None:
+                loop = asyncio.new_event_loop()
+                Thread(target=loop.run_forever, name="react-agent-stream-loop", daemon=True).start()
+                _react_agent_stream_loop = loop
+                logger.info("✅ 流式 React Agent 后台事件循环已启动")
+    return _react_agent_stream_loop
+
+async def get_stream_react_agent() -> Any:
+    """获取共享的流式 React Agent（懒加载，每个进程只初始化一次，必须在所属事件循环上调用）"""
+    global _react_agent_stream_instance, _react_agent_stream_init_lock
+    
+    if _react_agent_stream_instance is not None:
+        return _react_agent_stream_instance
+    
+    bind_stream_agent_loop(asyncio.get_running_loop())
+    if _react_agent_stream_init_lock is None:
+        _react_agent_stream_init_lock = asyncio.Lock()
+    async with _react_agent_stream_init_lock:
+        if _react_agent_stream_instance is None:
+            _react_agent_stream_instance = await create_stream_agent_instance()
+            # 流式Agent所在的事件循环长期运行，checkpoint后台压缩和会话索引补录挂在这里
+            _react_agent_stream_instance.start_checkpoint_compactor()
+            _react_agent_stream_instance.start_conversation_index_backfill()
+    return _react_agent_stream_instance
+
+async def close_stream_react_agent():
+    """释放共享的流式 React Agent（在所属事件循环上调用）"""
+    global _react_agent_stream_instance
+    if _react_agent_stream_instance is not None:
+        agent = _react_agent_stream_instance
+        _react_agent_stream_instance = None
+        await agent.close()
+        logger.info("✅ 流式 React Agent 资源已清理")
+
+def parse_react_stream_args(args) -> Dict[str, Any]:
+    """
+    解析并验证流式接口的URL参数（EventSource只支持GET）
+    
+    Raises:
+        ValueError: 参数缺失或验证失败，异常信息可直接返回给客户端
+    """
+    question = args.get('question')
+    if not question:
+        raise ValueError("缺少必需参数：question")
+    
+    # 复用现有validate_request_data逻辑（与ask_react_agent相同）
+    try:
+        return validate_request_data({
+            'question': question,
+            'user_id': args.get('user_id'),
+            'thread_id': args.get('thread_id'),
+            'conversation_id': args.get('conversation_id')
+        })
+    except ValueError as ve:
+        raise ValueError(f"参数验证失败: {str(ve)}")
+
+async def react_agent_stream_events(validated_data: Dict[str, Any]):
+    """
+    在流式 React Agent 所属的事件循环上执行流式问答，逐条产出SSE事件文本
+    
+    Args:
+        validated_data: validate_request_data() 的返回值
+    """
+    try:
+        stream_agent = await get_stream_react_agent()
+    except Exception as e:
+        logger.error(f"流式 Agent 初始化异常: {str(e)}")
+        yield format_sse_error(f"流式 Agent 初始化失败: {str(e)}")
+        return
+    
+    try:
+        async for chunk in stream_agent.chat_stream(
+            message=validated_data['question'],
+            user_id=validated_data['user_id'],
+            thread_id=validated_data['thread_id']
+        ):
+            if chunk["type"] == "progress":
+                yield format_sse_react_progress(chunk)
+            elif chunk["type"] == "completed":
+                yield format_sse_react_completed(chunk)
+                break
+            elif chunk["type"] == "error":
+                yield format_sse_error(chunk.get("error", "未知错误"))
+                break
+    except Exception as e:
+        logger.error(f"流式处理异常: {str(e)}", exc_info=True)
+        yield format_sse_error(f"流式处理异常: {str(e)}")
+
+def _iterate_on_stream_agent_loop(async_gen):
+    """
+    在流式 Agent 所属的事件循环上完整运行异步生成器，同步地逐条返回其产出（供 WSGI 路由使用）
+    
+    整个生成器作为一个任务运行，产出通过队列转交给当前线程；调用方提前结束时取消该任务。
+    """
+    done = object()
+    items = queue.Queue()
+    
+    async def pump():
+        try:
+            async for item in async_gen:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+            raise
+        finally:
+            items.put(done)
+    
+    future = asyncio.run_coroutine_threadsafe(pump(), get_stream_agent_loop())
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        if not future.done():
+            future.cancel()
+
 def get_user_conversations_simple_sync(user_id: str, limit: int = 10):
     """直接从Redis获取用户对话，测试版本"""
     import redis
     import json
+    from react_agent.conversation_index import list_recent_sync
     
     try:
         # 创建Redis连接
@@ -363,6 +528,21 @@ def get_user_conversations_simple_sync(user_id: str, limit: int = 10):
             redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
         redis_client.ping()
         
+        # 优先读取用户会话索引；索引尚未就绪时扫描checkpoint keys
+        summaries = list_recent_sync(redis_client, user_id, limit)
+        if summaries is not None:
+            conversations = [{
+                "conversation_id": summary["thread_id"],
+                "user_id": user_id,
+                "message_count": summary["message_count"],
+                "conversation_title": summary.get("title"),
+                "created_at": summary.get("created_at") or _parse_conversation_created_time(summary["thread_id"]),
+                "updated_at": summary.get("updated_at")
+            } for summary in summaries]
+            redis_client.close()
+            logger.info(f"✅ 从会话索引返回 {len(conversations)} 个对话")
+            return conversations
+        
         # 扫描用户的checkpoint keys
         pattern = f"checkpoint:{user_id}:*"
         logger.info(f"🔍 扫描模式: {pattern}")
@@ -559,6 +739,14 @@ def cleanup_resources():
         asyncio.run(async_cleanup())
     except Exception as e:
         logger.error(f"清理资源失败: {e}")
+    
+    # 流式Agent只能在其所属的事件循环上关闭（后台事件循环仍在运行时）
+    stream_loop = _react_agent_stream_loop
+    if _react_agent_stream_instance is not None and stream_loop is not None and stream_loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(close_stream_react_agent(), stream_loop).result(timeout=5)
+        except Exception as e:
+            logger.error(f"清理流式Agent资源失败: {e}")
 
 atexit.register(cleanup_resources)
 
@@ -709,113 +897,26 @@ async def ask_react_agent():
             "error": "服务暂时不可用，请稍后重试"
         }), 500
 
-@app.route('/api/v0/ask_react_agent_stream', methods=['GET'])
+@app.route(REACT_AGENT_STREAM_PATH, methods=['GET'])
 def ask_react_agent_stream():
-    """React Agent 流式API - 使用异步工具的专用 Agent 实例
+    """React Agent 流式API - 使用异步工具的共享 Agent 实例
     功能与ask_react_agent完全相同，除了采用流式输出
+    通过 asgi_app 启动时，该路径由 ASGI 层直接在服务器事件循环上处理（见 asgi_app.py）
     """
     def generate():
         try:
             # 1. 参数获取和验证（从URL参数，因为EventSource只支持GET）
-            question = request.args.get('question')
-            user_id_input = request.args.get('user_id')
-            thread_id_input = request.args.get('thread_id')
-            conversation_id_input = request.args.get('conversation_id')
-            
-            # 参数验证（复用现有validate_request_data逻辑）
-            if not question:
-                yield format_sse_error("缺少必需参数：question")
-                return
-                
-            # 2. 数据预处理（与ask_react_agent相同）
             try:
-                validated_data = validate_request_data({
-                    'question': question,
-                    'user_id': user_id_input,
-                    'thread_id': thread_id_input,
-                    'conversation_id': conversation_id_input
-                })
+                validated_data = parse_react_stream_args(request.args)
             except ValueError as ve:
-                yield format_sse_error(f"参数验证失败: {str(ve)}")
+                yield format_sse_error(str(ve))
                 return
             
             logger.info(f"📨 收到React Agent流式请求 - User: {validated_data['user_id']}, Question: {validated_data['question'][:50]}...")
             
-            # 3. 为当前请求创建新的事件循环和Agent实例
-            import asyncio
-            
-            # 创建新的事件循环
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # 2. 在共享的流式 Agent 所属事件循环上执行（Agent 每个进程只初始化一次）
+            yield from _iterate_on_stream_agent_loop(react_agent_stream_events(validated_data))
             
-            stream_agent = None
-            try:
-                # 为当前请求创建新的Agent实例
-                stream_agent = loop.run_until_complete(create_stream_agent_instance())
-                
-                if not stream_agent:
-                    yield format_sse_error("流式 React Agent 初始化失败")
-                    return
-            except Exception as e:
-                logger.error(f"流式 Agent 初始化异常: {str(e)}")
-                yield format_sse_error(f"流式 Agent 初始化失败: {str(e)}")
-                return
-            
-            # 4. 在同一个事件循环中执行流式处理
-            try:
-                # 创建异步生成器
-                async def stream_worker():
-                    try:
-                        # 使用当前请求的 Agent 实例（已配置异步工具）
-                        async for chunk in stream_agent.chat_stream(
-                            message=validated_data['question'],
-                            user_id=validated_data['user_id'],
-                            thread_id=validated_data['thread_id']
-                        ):
-                            yield chunk
-                            if chunk.get("type") == "completed":
-                                break
-                    except Exception as e:
-                        logger.error(f"流式处理异常: {str(e)}", exc_info=True)
-                        yield {
-                            "type": "error", 
-                            "error": f"流式处理异常: {str(e)}"
-                        }
-                
-                # 在当前事件循环中运行异步生成器
-                async_gen = stream_worker()
-                
-                # 同步迭代异步生成器
-                while True:
-                    try:
-                        chunk = loop.run_until_complete(async_gen.__anext__())
-                        
-                        if chunk["type"] == "progress":
-                            yield format_sse_react_progress(chunk)
-                        elif chunk["type"] == "completed":
-                            yield format_sse_react_completed(chunk)
-                            break
-                        elif chunk["type"] == "error":
-                            yield format_sse_error(chunk.get("error", "未知错误"))
-                            break
-                            
-                    except StopAsyncIteration:
-                        break
-                    except Exception as e:
-                        logger.error(f"处理流式数据异常: {str(e)}")
-                        yield format_sse_error(f"处理异常: {str(e)}")
-                        break
-                        
-            except Exception as e:
-                logger.error(f"React Agent流式处理异常: {str(e)}")
-                yield format_sse_error(f"流式处理异常: {str(e)}")
-            finally:
-                # 清理：流式处理完成后关闭事件循环
-                try:
-                    loop.close()
-                except Exception as e:
-                    logger.warning(f"关闭事件循环时出错: {e}")
-                    
         except Exception as e:
             logger.error(f"React Agent流式API异常: {str(e)}")
             yield format_sse_error(f"服务异常: {str(e)}")
@@ -1213,6 +1314,33 @@ def get_citu_langraph_agent():
             raise Exception(f"Agent初始化失败: {str(e)}")
     return citu_langraph_agent
 
+def _wants_arrow_stream() -> bool:
+    """判断客户端是否优先接受Arrow IPC流格式"""
+    # JSON放在前面：Accept为 */* 或同等权重时仍返回JSON
+    best = request.accept_mimetypes.best_match(["application/json", ARROW_STREAM_MIME])
+    return best == ARROW_STREAM_MIME
+
+def _arrow_stream_response(query_result, metadata: Dict[str, Any]) -> Optional[Response]:
+    """
+    客户端请求Arrow IPC流时返回列式数据（元数据写入schema metadata），否则返回None
+
+    答案缓存命中、跨进程共享的结果是JSON形式的字典，先重建为列式结果，保证与直接执行的请求一致。
+    """
+    if not query_result or not _wants_arrow_stream():
+        return None
+    try:
+        if not isinstance(query_result, ColumnarResult):
+            query_result = ColumnarResult.from_query_result(query_result)
+        arrow_bytes = query_result.to_arrow_ipc(metadata={
+            **metadata,
+            "total_row_count": query_result.total_row_count,
+            "is_limited": query_result.is_limited
+        })
+        return Response(arrow_bytes, mimetype=ARROW_STREAM_MIME)
+    except Exception as e:
+        logger.warning(f"Arrow IPC序列化失败，回退到JSON响应: {str(e)}")
+        return None
+
 @app.route('/api/v0/ask_agent', methods=['POST'])
 def ask_agent():
     """支持对话上下文的ask_agent API"""
@@ -1222,6 +1350,7 @@ def ask_agent():
     conversation_id_input = req.get("conversation_id", None)
     continue_conversation = req.get("continue_conversation", False)
     api_routing_mode = req.get("routing_mode", None)
+    skip_summary = bool(req.get("skip_summary", False))  # 只需要数据的客户端可跳过摘要生成
     
     VALID_ROUTING_MODES = ["database_direct", "chat_direct", "hybrid", "llm_only"]
     
@@ -1297,8 +1426,52 @@ def ask_agent():
             except Exception as e:
                 logger.warning(f"获取上下文类型失败: {str(e)}")
         
-        # 检查缓存（新逻辑：放宽使用条件，严控存储条件）
-        cached_answer = redis_conversation_manager.get_cached_answer(question, context)
+        # 确定最终使用的路由模式（优先级逻辑）
+        if api_routing_mode:
+            # API传了参数，优先使用
+            effective_routing_mode = api_routing_mode
+            logger.info(f"[AGENT_API] 使用API指定的路由模式: {effective_routing_mode}")
+        else:
+            # API没传参数，使用配置文件
+            try:
+                from app_config import QUESTION_ROUTING_MODE
+                effective_routing_mode = QUESTION_ROUTING_MODE
+                logger.info(f"[AGENT_API] 使用配置文件路由模式: {effective_routing_mode}")
+            except ImportError:
+                effective_routing_mode = "hybrid"
+                logger.info(f"[AGENT_API] 配置文件读取失败，使用默认路由模式: {effective_routing_mode}")
+        
+        # 跳过摘要的答案与完整答案分开缓存/合并
+        answer_mode = f"{effective_routing_mode}:skip_summary" if skip_summary else effective_routing_mode
+        
+        # 答案缓存：只用于无上下文的问题（有上下文时答案依赖对话历史）
+        answer_cache = None if context else get_answer_cache(
+            redis_conversation_manager.redis_client if redis_conversation_manager.is_available() else None
+        )
+        
+        def run_agent_pipeline(target_question=question, target_conversation_id=None):
+            """执行Agent流程（答案缓存的后台刷新也复用此函数）"""
+            import asyncio
+            pipeline_agent = get_citu_langraph_agent()
+            # 绑定当前用户，业务SQL的并发限制按用户计数
+            with bind_query_user(user_id):
+                return asyncio.run(pipeline_agent.process_question(
+                    question=target_question,
+                    conversation_id=target_conversation_id,
+                    context_type=context_type,
+                    routing_mode=effective_routing_mode,
+                    skip_summary=skip_summary
+                ))
+        
+        cached_answer = None
+        if answer_cache:
+            cache_lookup = answer_cache.lookup(question, answer_mode)
+            if cache_lookup:
+                cached_answer, is_stale = cache_lookup
+                if is_stale:
+                    # stale-while-revalidate：先返回旧答案，后台刷新
+                    answer_cache.revalidate_in_background(question, answer_mode, run_agent_pipeline)
+        
         if cached_answer:
             logger.info(f"[AGENT_API] 使用缓存答案")
             
@@ -1338,6 +1511,17 @@ def ask_agent():
             cached_answer["from_cache"] = True
             cached_answer.update(conversation_status)
             
+            arrow_response = _arrow_stream_response(cached_answer.get("query_result"), {
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "type": cached_answer.get("type", "UNKNOWN"),
+                "sql": cached_answer.get("sql"),
+                "summary": cached_answer.get("summary"),
+                "from_cache": True,
+            })
+            if arrow_response is not None:
+                return arrow_response
+            
             # 使用agent_success_response返回标准格式
             return jsonify(agent_success_response(
                 response_type=cached_answer.get("type", "UNKNOWN"),
@@ -1366,24 +1550,9 @@ def ask_agent():
             enhanced_question = question
             logger.info(f"[AGENT_API] 新对话，无上下文")
         
-        # 确定最终使用的路由模式（优先级逻辑）
-        if api_routing_mode:
-            # API传了参数，优先使用
-            effective_routing_mode = api_routing_mode
-            logger.info(f"[AGENT_API] 使用API指定的路由模式: {effective_routing_mode}")
-        else:
-            # API没传参数，使用配置文件
-            try:
-                from app_config import QUESTION_ROUTING_MODE
-                effective_routing_mode = QUESTION_ROUTING_MODE
-                logger.info(f"[AGENT_API] 使用配置文件路由模式: {effective_routing_mode}")
-            except ImportError:
-                effective_routing_mode = "hybrid"
-                logger.info(f"[AGENT_API] 配置文件读取失败，使用默认路由模式: {effective_routing_mode}")
-        
         # Agent处理
         try:
-            agent = get_citu_langraph_agent()
+            get_citu_langraph_agent()
         except Exception as e:
             logger.critical(f"Agent初始化失败: {str(e)}")
             return jsonify(service_unavailable_response(
@@ -1391,14 +1560,21 @@ def ask_agent():
                 can_retry=True
             )), 503
         
-        # 异步调用Agent处理问题
-        import asyncio
-        agent_result = asyncio.run(agent.process_question(
-            question=enhanced_question,  # 使用增强后的问题
-            conversation_id=conversation_id,
-            context_type=context_type,  # 传递上下文类型
-            routing_mode=effective_routing_mode  # 新增：传递路由模式
-        ))
+        # 相同 问题+上下文 的并发请求（含其他进程）只执行一次Agent流程，对话记录仍按用户各自保存
+        coalescer = get_request_coalescer(
+            redis_conversation_manager.redis_client if redis_conversation_manager.is_available() else None
+        )
+        if coalescer:
+            agent_result, result_shared = coalescer.run(
+                question, answer_mode,
+                lambda: run_agent_pipeline(enhanced_question, conversation_id),
+                context=context, context_type=context_type
+            )
+        else:
+            agent_result, result_shared = run_agent_pipeline(enhanced_question, conversation_id), False
+        
+        if answer_cache and not result_shared:
+            answer_cache.store(question, answer_mode, agent_result)
         
         # 处理Agent结果
         if agent_result.get("success", False):
@@ -1434,9 +1610,16 @@ def ask_agent():
                 }
             )
             
-            # 缓存成功的答案（新逻辑：只缓存无上下文的问答）
-            # 直接缓存agent_result，它已经包含所有需要的字段
-            redis_conversation_manager.cache_answer(question, agent_result, context)
+            # 客户端请求Arrow IPC流时，直接返回列式数据
+            arrow_response = _arrow_stream_response(query_result, {
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "type": response_type,
+                "sql": sql,
+                "summary": summary,
+            })
+            if arrow_response is not None:
+                return arrow_response
             
             # 使用agent_success_response的正确方式
             return jsonify(agent_success_response(
@@ -1445,6 +1628,7 @@ def ask_agent():
                 sql=sql,
                 records=query_result,
                 summary=summary,
+                query_profile=agent_result.get("query_profile"),
                 conversation_id=conversation_id,
                 execution_path=execution_path,
                 classification_info=classification_info,
@@ -1488,6 +1672,12 @@ def ask_agent_stream():
             conversation_id_input = request.args.get('conversation_id')
             continue_conversation = request.args.get('continue_conversation', 'false').lower() == 'true'
             api_routing_mode = request.args.get('routing_mode')
+            skip_summary = request.args.get('skip_summary', 'false').lower() == 'true'
+            defer_summary = request.args.get('defer_summary', str(AGENT_STREAM_DEFER_SUMMARY)).lower() == 'true'
+            if skip_summary:
+                summary_mode = "skip"
+            else:
+                summary_mode = "deferred" if defer_summary else "inline"
             
             VALID_ROUTING_MODES = ["database_direct", "chat_direct", "hybrid", "llm_only"]
             
@@ -1676,7 +1866,8 @@ def ask_agent_stream():
                             user_id=user_id,
                             conversation_id=conversation_id,
                             context_type=context_type,  # 🆕 传递上下文类型
-                            routing_mode=effective_routing_mode
+                            routing_mode=effective_routing_mode,
+                            summary_mode=summary_mode
                         ):
                             # 如果是完成的chunk，保存最终结果
                             if chunk.get("type") == "completed":
@@ -1698,6 +1889,10 @@ def ask_agent_stream():
                             
                             if chunk["type"] == "progress":
                                 yield format_sse_progress(chunk)
+                            elif chunk["type"] == "result":
+                                yield format_sse_result(chunk)
+                            elif chunk["type"] == "summary":
+                                yield format_sse_summary(chunk)
                             elif chunk["type"] == "completed":
                                 yield format_sse_completed(chunk)
                                 break  # 完成后退出循环
@@ -1713,8 +1908,9 @@ def ask_agent_stream():
                             yield format_sse_error(f"流式处理异常: {str(e)}")
                             break
                 
-                # 返回同步生成器
-                yield from sync_stream_wrapper()
+                # 返回同步生成器（绑定当前用户，业务SQL的并发限制按用户计数）
+                with bind_query_user(user_id):
+                    yield from sync_stream_wrapper()
                 
                 # 🆕 保存助手消息和缓存结果（与ask_agent相同）
                 if final_result and final_result.get("success", False):
@@ -1752,9 +1948,10 @@ def ask_agent_stream():
                             conversation_id, "assistant", assistant_response, metadata
                         )
                         
-                        # 缓存结果（仅缓存成功的结果）- 与ask_agent相同的调用方式
-                        redis_conversation_manager.cache_answer(question, final_result, context)
-                        logger.info(f"[STREAM_API] 结果已缓存")
+                        # 缓存结果（仅缓存成功的结果）- 与ask_agent相同的调用方式；跳过摘要的结果不缓存
+                        if summary_mode != "skip":
+                            redis_conversation_manager.cache_answer(question, final_result, context)
+                            logger.info(f"[STREAM_API] 结果已缓存")
                         
                     except Exception as e:
                         logger.error(f"保存结果和缓存失败: {str(e)}")
@@ -1817,6 +2014,7 @@ def format_sse_completed(chunk: dict) -> str:
             "response_type": result.get("type", "UNKNOWN"),
             "sql": result.get("sql"),
             "query_result": result.get("query_result"),
+            "query_profile": result.get("query_profile"),
             "summary": result.get("summary"),
             "conversation_id": chunk.get("conversation_id"),
             "execution_path": result.get("execution_path", []),
@@ -1825,6 +2023,48 @@ def format_sse_completed(chunk: dict) -> str:
         }
     }
     
+    import json
+    # query_result可能是列式结果，在此处统一序列化
+    return f"data: {json.dumps(data, ensure_ascii=False, default=json_default)}\n\n"
+
+def format_sse_result(chunk: dict) -> str:
+    """格式化查询结果事件为SSE格式（摘要延后生成时先于summary事件发出）"""
+    result = chunk.get("result", {})
+    
+    data = {
+        "code": 200,
+        "success": True,
+        "message": "查询结果已就绪",
+        "data": {
+            "type": "result",
+            "response_type": result.get("type", "DATABASE"),
+            "sql": result.get("sql"),
+            "query_result": result.get("query_result"),
+            "query_profile": result.get("query_profile"),
+            "summary_pending": result.get("summary_pending", False),
+            "conversation_id": chunk.get("conversation_id"),
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+    
+    import json
+    # query_result可能是列式结果，在此处统一序列化
+    return f"data: {json.dumps(data, ensure_ascii=False, default=json_default)}\n\n"
+
+def format_sse_summary(chunk: dict) -> str:
+    """格式化摘要事件为SSE格式"""
+    data = {
+        "code": 200,
+        "success": True,
+        "message": "摘要生成完成",
+        "data": {
+            "type": "summary",
+            "summary": chunk.get("summary"),
+            "conversation_id": chunk.get("conversation_id"),
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+    
     import json
     return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
@@ -4387,6 +4627,16 @@ def qa_cache_stats():
     """获取问答缓存统计信息（从 citu_app.py 迁移）"""
     try:
         stats = redis_conversation_manager.get_qa_cache_stats()
+        answer_cache = get_answer_cache(
+            redis_conversation_manager.redis_client if redis_conversation_manager.is_available() else None
+        )
+        if answer_cache:
+            stats["agent_answer_cache"] = answer_cache.get_stats()
+        coalescer = get_request_coalescer(
+            redis_conversation_manager.redis_client if redis_conversation_manager.is_available() else None
+        )
+        if coalescer:
+            stats["agent_request_coalescing"] = coalescer.get_stats()
         
         return jsonify(success_response(
             response_text="获取问答缓存统计成功",
@@ -4409,6 +4659,9 @@ def qa_cache_cleanup():
             )), 500
         
         deleted_count = redis_conversation_manager.clear_all_qa_cache()
+        answer_cache = get_answer_cache(redis_conversation_manager.redis_client)
+        if answer_cache:
+            deleted_count += answer_cache.clear()
         
         return jsonify(success_response(
             response_text="问答缓存清理完成",
@@ -4425,6 +4678,124 @@ def qa_cache_cleanup():
             response_text="清空问答缓存失败，请稍后重试"
         )), 500
 
+@app.route('/api/v0/business_db_stats', methods=['GET'])
+def business_db_stats():
+    """获取业务数据库查询保护统计（并发、排队、等待时间）"""
+    try:
+        return jsonify(success_response(
+            response_text="获取业务数据库查询统计成功",
+            data=get_business_db_stats()
+        ))
+
+    except Exception as e:
+        logger.error(f"获取业务数据库查询统计失败: {str(e)}")
+        return jsonify(internal_error_response(
+            response_text="获取业务数据库查询统计失败，请稍后重试"
+        )), 500
+
+@app.route('/api/v0/react/prompt_cache_stats', methods=['GET'])
+def react_prompt_cache_stats():
+    """获取React Agent LLM调用的前缀缓存命中统计（输入token、缓存命中token、命中率）"""
+    try:
+        from react_agent.prompts import get_prompt_cache_stats
+        return jsonify(success_response(
+            response_text="获取前缀缓存命中统计成功",
+            data=get_prompt_cache_stats()
+        ))
+
+    except Exception as e:
+        logger.error(f"获取前缀缓存命中统计失败: {str(e)}")
+        return jsonify(internal_error_response(
+            response_text="获取前缀缓存命中统计失败，请稍后重试"
+        )), 500
+
+@app.route('/api/v0/slow_sql_report', methods=['GET'])
+def slow_sql_report():
+    """
+    获取慢SQL报告（按SQL指纹聚合的Top-N）
+
+    Query参数:
+        top_n: 返回条数，默认20
+        order_by: 排序字段 max_ms | avg_ms | total_ms | count，默认 max_ms
+    """
+    try:
+        from common.query_profiler import get_slow_query_report
+
+        top_n = request.args.get('top_n', 20, type=int)
+        order_by = request.args.get('order_by', 'max_ms')
+        if top_n <= 0 or top_n > 200:
+            return jsonify(bad_request_response(
+                response_text="top_n 必须在 1-200 之间",
+                missing_params=["top_n"]
+            )), 400
+
+        report = get_slow_query_report()
+        return jsonify(success_response(
+            response_text="获取慢SQL报告成功",
+            data={
+                **report.get_summary(),
+                "order_by": order_by,
+                "queries": report.top(top_n, order_by)
+            }
+        ))
+
+    except Exception as e:
+        logger.error(f"获取慢SQL报告失败: {str(e)}")
+        return jsonify(internal_error_response(
+            response_text="获取慢SQL报告失败，请稍后重试"
+        )), 500
+
+@app.route('/api/v0/schema_catalog', methods=['GET'])
+def schema_catalog_status():
+    """获取业务数据库Schema目录状态"""
+    try:
+        from common.schema_catalog import get_schema_catalog
+        catalog = get_schema_catalog()
+        if catalog is None:
+            return jsonify(service_unavailable_response(
+                response_text="Schema目录未启用（ENABLE_SCHEMA_CATALOG=False）",
+                can_retry=False
+            )), 503
+
+        return jsonify(success_response(
+            response_text="获取Schema目录状态成功",
+            data=catalog.get_status()
+        ))
+
+    except Exception as e:
+        logger.error(f"获取Schema目录状态失败: {str(e)}")
+        return jsonify(internal_error_response(
+            response_text="获取Schema目录状态失败，请稍后重试"
+        )), 500
+
+@app.route('/api/v0/schema_catalog/refresh', methods=['POST'])
+def schema_catalog_refresh():
+    """手动刷新业务数据库Schema目录（表结构变更后调用）"""
+    try:
+        from common.schema_catalog import get_schema_catalog
+        catalog = get_schema_catalog()
+        if catalog is None:
+            return jsonify(service_unavailable_response(
+                response_text="Schema目录未启用（ENABLE_SCHEMA_CATALOG=False）",
+                can_retry=False
+            )), 503
+
+        if not catalog.refresh():
+            return jsonify(internal_error_response(
+                response_text="Schema目录刷新失败，请检查业务数据库连接"
+            )), 500
+
+        return jsonify(success_response(
+            response_text="Schema目录刷新完成",
+            data=catalog.get_status()
+        ))
+
+    except Exception as e:
+        logger.error(f"刷新Schema目录失败: {str(e)}")
+        return jsonify(internal_error_response(
+            response_text="刷新Schema目录失败，请稍后重试"
+        )), 500
+
 # ==================== Database API (从 citu_app.py 迁移) ====================
 
 @app.route('/api/v0/database/tables', methods=['POST'])
@@ -6252,5 +6623,8 @@ if __name__ == '__main__':
     logger.info("   优点：避免WsgiToAsgi并发阻塞问题")
     logger.info("   多进程模式请使用：uvicorn asgi_app:asgi_app --workers 4")
     
+    # 在后台事件循环上预热流式 React Agent（失败时首个流式请求会再次初始化）
+    asyncio.run_coroutine_threadsafe(get_stream_react_agent(), get_stream_agent_loop())
+    
     # 启动标准Flask应用（支持异步路由）
     app.run(host="0.0.0.0", port=8084, debug=False, threaded=True)
\ No newline at end of file